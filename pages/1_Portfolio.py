@@ -0,0 +1,109 @@
+import streamlit as st
+from snowflake.snowpark.context import get_active_session
+import pandas as pd
+import sow_portfolio
+import sow_run_store
+
+session = get_active_session()
+
+# Seconds a query result is reused across reruns and sessions; the tables themselves refresh on their target lag
+PORTFOLIO_CACHE_SECONDS = 300
+
+st.set_page_config(page_title="SOW Portfolio", layout="wide")
+st.title("SOW Portfolio")
+
+
+@st.cache_resource
+def get_portfolio():
+    """Process-wide portfolio over the run store (the dynamic tables in Snowflake, see sow_portfolio.py)"""
+    return sow_portfolio.open_portfolio(sow_run_store.open_run_store(session))
+
+
+@st.cache_data(ttl=PORTFOLIO_CACHE_SECONDS)
+def load_portfolio(sow_types, suppliers, since):
+    """Every dashboard query for one set of filters; grouping and counting run in SQL"""
+    portfolio = get_portfolio()
+    return {
+        "totals": portfolio.totals(sow_types, suppliers, since),
+        "sections": portfolio.section_stats(sow_types, suppliers, since),
+        "suppliers": portfolio.group_stats("SUPPLIER", sow_types, suppliers, since),
+        "sow_types": portfolio.group_stats("SOW_TYPE", sow_types, suppliers, since),
+        "months": portfolio.group_stats("MONTH", sow_types, suppliers, since),
+        "refreshed_at": portfolio.refreshed_at(),
+    }
+
+
+@st.cache_data(ttl=PORTFOLIO_CACHE_SECONDS)
+def load_filter_values():
+    return get_portfolio().filter_values()
+
+
+try:
+    filter_values = load_filter_values()
+except Exception as e:
+    st.error(f"Portfolio tables unavailable: {str(e)}. Create them with: python sow_portfolio.py --create")
+    st.stop()
+
+with st.sidebar:
+    st.subheader("Filters")
+    sow_types = st.multiselect("SOW type", filter_values["SOW_TYPE"])
+    suppliers = st.multiselect("Supplier", filter_values["SUPPLIER"])
+    since = st.date_input("Validated since", value=None, help="Counts documents whose latest version was validated in or after this month")
+    if st.button("🔄 Reload"):
+        load_portfolio.clear()
+        load_filter_values.clear()
+
+data = load_portfolio(tuple(sow_types), tuple(suppliers), since.replace(day=1).isoformat() if since else None)
+if data["refreshed_at"]:
+    st.caption(f"Data as of {data['refreshed_at']} (refreshed every {sow_portfolio.PORTFOLIO_TARGET_LAG}). "
+               f"Each SOW counts once, by the latest validated version.")
+else:
+    st.caption("Each SOW counts once, by the latest validated version.")
+
+totals = data["totals"]
+col1, col2, col3, col4 = st.columns(4)
+with col1: st.metric("SOWs validated", totals["DOCUMENTS"])
+with col2: st.metric("Issues", totals["ISSUES"])
+with col3: st.metric("🔴 High-severity issues", totals["HIGH_ISSUES"])
+with col4: st.metric(
+    "SOWs with a high-severity issue",
+    f"{round(100 * totals['DOCUMENTS_WITH_HIGH'] / totals['DOCUMENTS'])}%" if totals["DOCUMENTS"] else "-"
+)
+
+if not totals["DOCUMENTS"]:
+    st.info("No validated SOWs match these filters.")
+    st.stop()
+
+st.markdown("---")
+st.subheader("Sections most often high-severity")
+sections = pd.DataFrame(data["sections"])
+if sections.empty:
+    st.success("No issues found in these SOWs!")
+else:
+    # Snowflake returns rounded numbers as Decimal, which the charts do not plot
+    st.bar_chart(sections.set_index("SECTION")["HIGH_PERCENT"].astype(float))
+    st.dataframe(sections.rename(columns={
+        "SECTION": "Section", "DOCUMENTS_WITH_HIGH": "SOWs with high", "HIGH_PERCENT": "% of SOWs with high",
+        "DOCUMENTS_WITH_ISSUES": "SOWs with issues", "ISSUES": "Issues", "HIGH_ISSUES": "High",
+        "MEDIUM_ISSUES": "Medium", "LOW_ISSUES": "Low",
+    }), use_container_width=True, hide_index=True)
+
+group_columns = {
+    "DOCUMENTS": "SOWs", "ISSUES_PER_DOCUMENT": "Issues per SOW", "DOCUMENTS_WITH_HIGH": "SOWs with high",
+    "HIGH_PERCENT": "% with high", "HIGH_ISSUES": "High", "MEDIUM_ISSUES": "Medium", "LOW_ISSUES": "Low",
+}
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("By supplier")
+    st.dataframe(pd.DataFrame(data["suppliers"]).rename(columns={"SUPPLIER": "Supplier", **group_columns}),
+                 use_container_width=True, hide_index=True)
+with col2:
+    st.subheader("By SOW type")
+    st.dataframe(pd.DataFrame(data["sow_types"]).rename(columns={"SOW_TYPE": "SOW type", **group_columns}),
+                 use_container_width=True, hide_index=True)
+
+st.subheader("Trend by month validated")
+months = pd.DataFrame(data["months"])
+st.line_chart(months.set_index("MONTH")[["ISSUES_PER_DOCUMENT", "HIGH_PERCENT"]].astype(float).rename(
+    columns={"ISSUES_PER_DOCUMENT": "Issues per SOW", "HIGH_PERCENT": "% with high"}
+))
@@ -1,783 +1,72 @@
 import streamlit as st
 import tempfile
 from snowflake.snowpark.context import get_active_session
+import io
 import json
 import pandas as pd
-from snowflake.cortex import Complete
 from PyPDF2 import PdfReader
 from docx import Document
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 import os
 import re
+import time
+from contextlib import nullcontext
+import sow_cortex
+import sow_jobs
+import sow_local_retrieval
+import sow_msa
+import sow_reports
+import sow_rules
+import sow_run_store
+from sow_checkpoints import PipelineCheckpoints, checkpoint_key
+from sow_index import index_coordinator
+from sow_retrieval_cache import retrieval_cache
+from sow_validation_engine import (
+    CONFIG_SECTIONS,
+    RETRIEVAL_BACKEND,
+    SOW_STAGE,
+    build_local_index,
+    build_search_index,
+    carried_section_results,
+    checkpointed,
+    evaluate_retrieval_policies,
+    find_staged_file,
+    get_available_sections_mapping as get_db_sections_mapping,
+    get_section_content_digests,
+    get_validation_config_by_sow_type,
+    identify_sow_type,
+    iter_section_results,
+    merge_section_result,
+    previous_version_matches,
+    retrieve_section_chunks,
+    revalidate_section,
+    sow_type_unchanged,
+    stage_document,
+    staged_file_available,
+    staged_file_name,
+    unfinished_section_result,
+    validation_config_for_type_result,
+)
 
 session = get_active_session()
 
+# Validate in the background job queue (survives reruns and closed tabs); set to 0 to validate
+# inside the script run instead
+USE_BACKGROUND_JOBS = os.environ.get("SOW_BACKGROUND_JOBS", "1") == "1"
+JOB_POLL_SECONDS = 2
+
 st.set_page_config(page_title="SOW Validation", layout="wide")
 st.title("SOW Validation")  
 
 
-def query_cortex_search_service(query, target_section_name):
-    json_payload = json.dumps({
-        "query": query,
-        "columns": ["chunk", "section_name"],
-          #"filter": {
-             # "@eq": { "section_name": target_section_name }
-         # },
-        "limit": 5
-       
-    })
-    
-    # Escape single quotes in JSON payload for SQL
-    escaped_payload = json_payload.replace("'", "''")
-    
-    sql_query = f"""
-        SELECT SNOWFLAKE.CORTEX.SEARCH_PREVIEW(
-            'sow_validation_service_lang_new',
-            '{escaped_payload}'
-        ) AS search_results
-    """
-
-    try:
-        results_df = session.sql(sql_query).collect()
-        raw_results = results_df[0]["SEARCH_RESULTS"]
-        results = json.loads(raw_results)
-       
-
-       
-        
-        return results.get("results", [])
-        
-    except Exception as e:
-        st.error(f"Error querying section {target_section_name}: {e}")
-        return []
-
-# def query_cortex_search_for_type(query):
-#      json_payload = json.dumps({
-#         "query": query,
-#         "columns": ["chunk"],
-        
-#         "limit": 100
-#     })
-    
-#     # Escape single quotes in JSON payload for SQL
-#      escaped_payload = json_payload.replace("'", "''")
-    
-#      sql_query = f"""
-#         SELECT SNOWFLAKE.CORTEX.SEARCH_PREVIEW(
-#             'sow_type_identification',
-#             '{escaped_payload}'
-#         ) AS search_results
-#     """
-
-#      try:
-#         results_df = session.sql(sql_query).collect()
-#         raw_results = results_df[0]["SEARCH_RESULTS"]
-#         results = json.loads(raw_results)
-#         return results.get("results", [])
-#      except Exception as e:
-#         st.error(f"Error querying section Compensation: {e}")
-#         return []
-
-
-def get_available_sections_mapping():
-    """Get mapping between config section names and actual database section names"""
-    sections_df = session.sql("""
-        SELECT DISTINCT section_name
-        FROM doc_chunks_sow
-        ORDER BY section_name
-    """).collect()
-    
-    db_sections = [row['SECTION_NAME'] for row in sections_df]
-    
-    # Create mapping between config names and database section names
-    section_mapping = {}
-    
-    for config_section in [ "Header", "SOW Term", "Scope of Services","Compensation", "Project Assumptions", "McKesson Responsibilities", "Change Control Procedure", "Financial Information", 
-                          "PII or PHI", "Sensitive Information", "Access", 
-                          "Artificial Intelligence", "Exhibits", "Deliverables, Milestones and Compensation", "Statement of Work Characteristic", "McKesson Change Order Template", "Additional Terms", "Project Oversight"]:
-        
-        # Find matching section in database (case-insensitive, partial match)
-        matched_section = None
-        for db_section in db_sections:
-            if config_section.lower() in db_section.lower() or db_section.lower() in config_section.lower():
-                matched_section = db_section
-                break
-            
-            # Special cases for common variations
-            if config_section == "PII or PHI" and ("pii" in db_section.lower() or "phi" in db_section.lower()):
-                matched_section = db_section
-                break
-          
-            elif config_section == "Financial Information" and "financial" in db_section.lower():
-                matched_section = db_section
-                break
-        
-        if matched_section:
-            section_mapping[config_section] = matched_section
-        else:
+def get_available_sections_mapping(document=None):
+    """Section mapping for the indexed document, warning about config sections that were not found"""
+    section_mapping = get_db_sections_mapping(session, document)
+    for config_section in CONFIG_SECTIONS:
+        if config_section not in section_mapping:
             st.warning(f"No matching section found for: {config_section}")
-    
     return section_mapping
-
-def get_validation_config_by_sow_type(sow_type):
-    """
-    Returns the appropriate validation configuration based on SOW type
-    
-    Args:
-        sow_type (str): The type of SOW - "T&M" or "Fixed-Fee"
-    
-    Returns:
-        dict: Validation configuration dictionary for the specified SOW type
-    """
-    
-    # Time & Materials validation configuration
-    TM_validation_config = {
-        "Header": {
-            "search_query": "Retrieve the Header section of the SOW containing Supplier Name, SOW Start Date/Effective Date, Client Name, MSA Start Date",
-            "validation_questions": [
-                "Supplier Name: Does the header section contain a supplier name, and is it consistent with other contract documents?",
-                "SOW Start Date: Does the header section contain a SOW start date? Provide the date if present. Only report issues if dates are missing or if they conflict with other contract documents",
-                "Client Name: Does the header section contain a client name, and is it consistent with other contract documents?",
-                "MSA Start Date: Does the header section contain a MSA start date? Provide the date if present. If value is provided, SOW start date can be same as MSA date or after the MSA date. Only report issues if dates are missing or if they conflict with other contract documents"
-               
-            ],
-
-        "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "SOW Term": {
-            "search_query": "Retrieve the SOW Term section containing SOW End Date/SOW Completion Date",
-            "validation_questions": [
-                "SOW End date: Does the sow term section contain a SOW end date/SOW completion date? Provide the date if present. If value is provided, sow end date should be after the sow start date. Only report issues if dates are missing or they are before the sow start date or if they conflict with other contract documents"
-                
-               
-            ],
-             "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Scope of Services": {
-            "search_query": "Retrieve all Scope of Services related sections",
-            "validation_questions": [
-                "Project Overview: Does the scope of services section contain project overview with clear and precise language? If overview present, does it have a project name?",
-                "Project Scope: Does the scope of services section contain project scope with clear and precise language?",
-                "Out-of-Scope Work: Does the scope of services section contain out-of-scope work with clear and precise language? If it is not present in the section, assign medium severity",
-                "Assumptions: Does the scope of services section contain assumptions which are made in preparing the SOW (that contain dependencies and constraints, risks and mitigation strategies)? If assumptions are not mentioned, assign medium severity",         
-                "Resource Name: Does the scope of service section contain resource name (Person name who will be working). If it is not mentioned, assign low severity",
-                "Role: Does the scope of service section contain role (role title/skill of the resource e.g. BI Developer (Power BI))? If it is not mentioned, assign high severity",
-                "Delivery Location: Does the scope of service section contain delivery location (resource location)? If it is not mentioned, assign medium severity",
-                "Hourly Rate: Does the scope of service section contain hourly rate (resource hourly rate IS MANDATORY for time & material type SOW but billing rates are optional for fixed bid type SOW)? If it is not mentioned in case of T&M SOW, assign high severity",        
-                "Total No Of hours/ No of Hours/Hours: Does the scope of service section contain total no of hours/no of hours/hours? If it is not mentioned, assign high severity.",            
-                "Total Cost: Does the scope of service section contain total cost? If it is not mentioned, assign low severity",            
-                "Monthly run rate: Does the scope of service section contain monthly rate? If it is not mentioned, assign low severity"
-               
-           
-            ],
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },   
-        "Compensation": {
-            "search_query": "Retrieve all compensation-related sections, this could include compensation and Deliverables",
-            "validation_questions": [
-                "Is payment term T&M clearly stated with language Total Not to Exceed Fee basis? If this is not stated clearly, assign high severity",
-                "Are deliverable names listed? If not mentioned, assign high severity",
-                "Is the fee amount clearly listed? It should have language like Total cost of the project should not exceed $.. If it is not mentioned, assign high severity",     
-                "Are invoicing terms - payment schedule, method, invoicing condition, and any exceptions - clearly defined? SOW must have a reference to MSA payment terms called out like payment's terms in the agreement. There should NOT be language like Net60, Net30, payment in 30 days, etc phrases. If it is not clearly stated, assign high severity"
-                
-               
-            ],
-            "tag":"This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Project Assumptions": {
-            "search_query": "Retrieve all Project Assumptions-related sections",
-            "validation_questions": [
-               
-                "Are systems, tools, platforms needed for supplier work mentioned? If not, assign high severity",
-                "Is information about access to McKesson subject matter experts? If not, assign high severity",
-                "Is info about who provides what documentation and in what order given? If not, assign high severity",
-                "Is the process for raising and approving change requests (scope, resources, or deliverables change) clearly defined? If not, assign medium severity."  
-            ],
-
-            "tag":"This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "McKesson Responsibilities": {
-            "search_query": "Retrieve the McKesson responsibilities section",
-            "validation_questions": [
-               
-                "Access and Licenses: Does the McKesson responsibilities section specify required access and licenses? If not, assign medium severity.",
-                "Support from Analysts/SMEs: Does the McKesson responsibilities section list support from analysts or subject matter experts (SMEs)? If not, assign medium severity."
-            ],
-
-            "tag": "This section is optional. If it is not present in the document, assign low severity."
-        },
-        "Change Control Procedure": {
-            "search_query": "Retrieve the change control procedure section",
-            "validation_questions": [
-                "Change Control Process: Is the process for handling scope, pricing, or timeline changes (via Change Order) clearly described? If not, assign high severity."
-                
-               
-            ],
-
-            "tag":  "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Financial Information": {
-            "search_query": "Retrieve only the Financial Information section and verify that exactly one checkbox is selected for Financial Information",
-            "validation_questions": [
-                "Check only the checkbox for financial information if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-                
-                
-            ],
-
-        "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "PII or PHI": {
-            "search_query": "Retrieve only the PII or PHI section and verify that exactly one checkbox is selected for PII or PHI",
-            "validation_questions": [
-                "Check only the checkbox for PII/PHI if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-       
-            ],
-
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Sensitive Information": {
-            "search_query": "Retrieve only the Sensitive Information section and verify that exactly one checkbox is selected for sensitive Information",
-            "validation_questions": [
-                "Check only the checkbox for sensitive information if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-              
-            ],
-
-             "tag" : "This is section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Access": {
-            "search_query": "Retrieve only the Access section and verify that exactly one checkbox is selected for Access",
-            "validation_questions": [
-                "Check only the checkbox for access if checkbox is marked (Yes or No or neither, but not both). No need to verify if it's logical."
-              
-            ],
-            "tag" : "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Artificial Intelligence": {
-            "search_query": "Retrieve only the Artificial Intelligence (AI) section and verify that exactly one checkbox is selected for Artificial Intelligence",
-            "validation_questions": [
-               
-                "Check only the checkbox for artificial intelligence if checkbox is marked (Yes or No or neither, but not both). No need to verify if it's logical.",
-                "If this section is not present, assign low severity."
-            ],
-
-            "tag":"This section is optional. If it is not present in the document, assign low severity."
-        },
-        "Exhibits": {
-            "search_query": "Retrieve all the chunks related to exhibits to SOW section",
-            "validation_questions": [
-                "Are all referenced exhibits included and properly numbered?",
-                "Do exhibit references match the actual exhibits provided?",
-                "Is there consistency in exhibit naming and referencing?"
-            ],
-            "tag": "This section is optional. If it is not present in the document, assign low severity."
-        },
-       
-        "Statement of Work Characteristic": {
-            "search_query": "Retrieve all the chunks related to section Exhibit B-Statement of Work Characteristic",
-            "validation_questions": [
-                "Check if Role, Rate and Location are provided. If not, assign low severity."
-            ],
-
-            "tag":"This section is optional. If it is not present in the document, assign low severity."
-
-            
-
-            
-        },
-        "McKesson Change Order Template": {
-            "search_query": "Retrieve all the chunks related to section Exhibit C-McKesson Change Order Template",
-            "validation_questions": [
-               
-                "Supplier Name: Does it contain a supplier name, and is it consistent with other contract documents? If not, assign low severity.",
-                "Client Name: Does it contain a client name, and is it consistent with other contract documents? If not, assign low severity.", 
-                "Project Name: Does it contain a project name? If not, assign low severity.",
-                "Change Order #: Does it contain a change order number? If not, assign low severity.",
-                "Reason for Change Order: Is the reason for change order clearly defined? If not, assign low severity.",
-                "McKesson Pre Approvers: Does it contain McKesson Pre Approvers (based on Total Dollar Value of Project including this CO)? If not, assign low severity.",
-                "Dollar Amount of Change Order: Is dollar amount of change order clearly stated? If not, assign low severity.",
-                "Total Dollar Value of Project including this CO: Is total dollar value of project including this CO clearly stated? If not, assign low severity.",
-                "Change Order Submission Date: Does it contain a change order submission date? This should not be before or the same dates as SOW effective date. If not, assign low severity.",
-                "Change Order Effective Date: Does it contain a change order effective date? This should not be before or the same date as change order submission date, should not be before or the same dates as SOW effective date. If not, assign low severity.",
-                "Change Detail and Impacts: 1) Does it contain a clear Timeline (if any, explain in detail why there is a change in the timeline and what is affecting it)? 2) Scope (if any, explain in detail what scope was added – bullet points): 3) Budget (if any, explain why the budget is impacted and needs to change. If not stated clearly, assign low severity."         
-            ],
-            "tag": "This section is optional. If it is not present in the document, assign low severity."
-        },
-        "Additional Terms": {
-            "search_query": "Retrieve all the chunks related to Additional Terms",
-            "validation_questions": [
-                "This section is optional, if section presents, check the following otherwise flag it as low severity: ",
-                "Termination Condition: Is the termination condition clearly defined? If not, assign low severity.",
-                "Termination of Specific Resource: Is the termination condition for specific resources clearly defined? If not, assign low severity."
-            ],
-
-            "tag": "This section is optional. If it is not present, assign low severity."
-            
-        },
-        "Project Oversight": {
-            "search_query": "Retrieve all the chunks related to Project Oversight",
-            "validation_questions": [
-                "Supplier Point of Contact: 1) Is contact person name clearly stated? If not, assign high severity. 2) Is email for this contact clearly stated? If not, assign high severity. 3) Is phone number for this contact clearly stated? If not, assign medium severity. 4) Is address for this contact clearly stated? If not, assign medium severity.",
-                "McKesson Point of Contact: 1) Is contact person name clearly stated? If not, assign high severity. 2) Is email for this contact clearly stated? If not, assign high severity. 3) Is phone number for this contact clearly stated? If not, assign medium severity. 4) Is address for this contact clearly stated? If not, assign medium severity."
-            ],
-            "tag": "This section is mandatory. If it is not present, assign high severity."
-        }
-    }
-
-    # Fixed-Fee validation configuration
-    fixedfee_validation_config = {
-        "Header": {
-            "search_query": "Retrieve the Header section of the SOW containing Supplier Name, SOW Start Date/Effective Date, Client Name, MSA Start Date",
-            "validation_questions": [
-                "Supplier Name: Does the header section contain a supplier name, and is it consistent with other contract documents?",
-                "SOW Start Date: Does the header section contain a SOW start date? Provide the date if present. Only report issues if dates are missing or if they conflict with other contract documents",
-                "Client Name: Does the header section contain a client name, and is it consistent with other contract documents?",
-                "MSA Start Date: Does the header section contain a MSA start date? Provide the date if present. If value is provided, SOW start date can be same as MSA date or after the MSA date. Only report issues if dates are missing or if they conflict with other contract documents"
-               
-            ],
-            "tag":" This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "SOW Term": {
-            "search_query": "Retrieve the SOW Term section containing SOW End Date/SOW Completion Date",
-            "validation_questions": [
-                "SOW End date: Does the sow term section contain a SOW end date/SOW completion date? Provide the date if present. If value is provided, sow end date should be after the sow start date. Only report issues if dates are missing or they are before the sow start date or if they conflict with other contract documents",
-                
-            ],
-             "tag" : "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Scope of Services": {
-            "search_query": "Retrieve the most relevant chunks for Scope of Services section",
-            "validation_questions": [
-                "Project Overview: Does the scope of services section contain project overview with clear and precise language? If overview present, does it have a project name?",
-                "Project Scope: Does the scope of services section contain project scope with clear and precise language?",
-                "Out-of-Scope Work: Does the scope of services section contain out-of-scope work with clear and precise language? If it is not present in the section, assign medium severity",
-                "Assumptions: Does the scope of services section contain assumptions which are made in preparing the SOW (that contain dependencies and constraints, risks and mitigation strategies)? If assumptions are not mentioned, assign medium severity", 
-                "Resource Name: Does the scope of service section contain resource name (Person name who will be working). If it is not mentioned, assign low severity",
-                "Role: Does the scope of service section contain role (role title/skill of the resource e.g. BI Developer (Power BI))? If it is not mentioned, assign high severity",
-                "Delivery Location: Does the scope of service section contain delivery location (resource location)? If it is not mentioned, assign medium severity"
-                
-            ],
-
-            "tag":"This section is mandatory. If it is not present in the document, assign high severity."
-        },  
-        "Compensation": {
-            "search_query": "Retrieve the most relevant chunks for section compensation including deliverables, milestones, compensation and acceptance criteria.",
-            "validation_questions": [
-                "Is payment terms fixed cost clearly stated with language Total Not to Exceed Fixed Fee basis and the deliverables and milestone section should have milestones/deliverables listed along with the cost of each deliverable and acceptance criteria. If this is not stated clearly, assign high severity",
-                "Are deliverables and milestones clearly listed and defined? If not mentioned clearly, assign high severity",
-                "Is acceptance criteria - quality standards and metrics, review and testing procedures and quality control measures - clearly stated? If not, assign high severity",
-                "Is payment clearly linked to milestones/deliverables? This should include list of deliverable names, detailed description, specification and criteria for completion. If not mentioned clearly, assign high severity",
-                "Is the total fixed fee amount clearly listed? If it is not mentioned, assign high severity",     
-                "Are invoicing terms - payment schedule, method, invoicing condition, and any exceptions - clearly defined? SOW must have a reference to MSA payment terms called out like payment's terms in the agreement. There should NOT be language like Net60, Net30, payment in 30 days, etc phrases. If it is not clearly stated, assign high severity",
-                "Does the break of cost given in exhibit Deliverables, Milestones and Compensation add up to the total given in compensation section? Is the total given in the exhibit match with that total cost given in the compensation section?"
-               
-            ],
-            "tag":"This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Project Assumptions": {
-            "search_query": "Retrieve all Project Assumptions-related sections",
-            "validation_questions": [
-              
-                "Are systems, tools, platforms needed for supplier work mentioned? If not, assign high severity",
-                "Is information about access to McKesson subject matter experts? If not, assign high severity",
-                "Is info about who provides what documentation and in what order given? If not, assign high severity",
-                "Is the process for raising and approving change requests (scope, resources, or deliverables change) clearly defined? If not, assign medium severity."  
-            ],
-            "tag":"This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "McKesson Responsibilities": {
-            "search_query": "Retrieve the McKesson responsibilities section",
-            "validation_questions": [
-               
-                "Access and Licenses: Does the McKesson responsibilities section specify required access and licenses? If not, assign medium severity.",
-                "Support from Analysts/SMEs: Does the McKesson responsibilities section list support from analysts or subject matter experts (SMEs)? If not, assign medium severity."
-            ],
-
-            "tag":"This section is optional. If it is not present in the document, assign low severity."
-        },
-        "Change Control Procedure": {
-            "search_query": "Retrieve the change control procedure section",
-            "validation_questions": [
-                "Change Control Process: Is the process for handling scope, pricing, or timeline changes (via Change Order) clearly described? If not, assign high severity."
-                
-            ],
-
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Financial Information": {
-            "search_query": "Retrieve only the Financial Information section and verify that exactly one checkbox is selected for Financial Information",
-            "validation_questions": [
-                "Check only the checkbox for financial information if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-               
-            ],
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "PII or PHI": {
-            "search_query": "Retrieve only the PII or PHI section and verify that exactly one checkbox is selected for PII or PHI",
-            "validation_questions": [
-                "Check only the checkbox for PII/PHI if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-                "This is section is mandatory. If it is not present in the document, assign high severity."
-            ],
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Sensitive Information": {
-            "search_query": "Retrieve only the Sensitive Information section and verify that exactly one checkbox is selected for sensitive Information",
-            "validation_questions": [
-                "Check only the checkbox for sensitive information if EXACTLY ONE checkbox is marked (either Yes or No, but not both or neither). No need to verify if it's logical."
-             
-            ],
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Access": {
-            "search_query": "Retrieve only the Access section and verify that exactly one checkbox is selected for Access",
-            "validation_questions": [
-                "Check only the checkbox for access if checkbox is marked (Yes or No or neither, but not both). No need to verify if it's logical."
-              
-            ],
-            "tag": "This section is mandatory. If it is not present in the document, assign high severity."
-        },
-        "Artificial Intelligence": {
-            "search_query": "Retrieve only the Artificial Intelligence (AI) section and verify that exactly one checkbox is selected for Artificial Intelligence",
-            "validation_questions": [
-              
-                "Check only the checkbox for artificial intelligence if checkbox is marked (Yes or No or neither, but not both). No need to verify if it's logical."
-              
-            ],
-            "tag":   "This section is optional. If this section is not present, assign low severity."
-        },
-        "Exhibits": {
-            "search_query": "Retrieve all the chunks related to exhibits to SOW section",
-            "validation_questions": [
-                "Are all referenced exhibits included and properly numbered?",
-                "Do exhibit references match the actual exhibits provided?",
-                "Is there consistency in exhibit naming and referencing?"
-            ],
-            "tag": "This section is optional. If this section is not present, assign low severity."
-        },
-        "Deliverables, Milestones and Compensation": {
-            "search_query": "Retrieve all the chunks related to exhibit section Exhibit A-Deliverables, Milestones and Compensation",
-            "validation_questions": [
-                "This section is MANDATORY for Fixed-Fee SOW, if section presents, check the following otherwise flag it with high severity: ",
-                "Deliverable No.: Are the deliverable numbers provided? If not, assign low severity.",
-                "Deliverable/Milestone: Are the deliverables and milestones clearly defined? If not, assign high severity.",
-                "Due Date: Is the due date provided? It doesn't have to be a date, it can be week 4, month 2, any kinds of time reference. If not, assign high severity.",
-                "Acceptance Criteria: Is acceptance criteria - quality standards and metrics, review and testing procedures and quality control measures - clearly stated? If not, assign high severity.",
-                "Invoice Amount: Is invoice amount clearly defined? If not, assign high severity.",
-                "Does the sum of all deliverable amounts match the total project cost mentioned in the Compensation section? If not, assign medium severity."
-            ],
-            "tag":"This section is MANDATORY for Fixed-Fee SOW. If it is not present in case of Fixed-Fee SOW, assign high severity."
-        },
-        "Statement of Work Characteristic": {
-            "search_query": "Retrieve all the chunks related to section Exhibit B-Statement of Work Characteristic",
-            "validation_questions": [
-                "This section is optional for Fixed-Fee SOW, if section presents, check if Role and Location are provided (Rate is not mandatory for Fixed-Fee). If role or location not provided, assign low severity. If section is not present, flag it with low severity."
-            ],
-
-            "tag":"This section is optional for Fixed-Fee SOW. If not present in the document, assign low severity."
-            
-            
-        },
-        "McKesson Change Order Template": {
-            "search_query": "Retrieve all the chunks related to section Exhibit C-McKesson Change Order Template",
-            "validation_questions": [
-               
-                "Supplier Name: Does it contain a supplier name, and is it consistent with other contract documents? If not, assign low severity.",
-                "Client Name: Does it contain a client name, and is it consistent with other contract documents? If not, assign low severity.", 
-                "Project Name: Does it contain a project name? If not, assign low severity.",
-                "Change Order #: Does it contain a change order number? If not, assign low severity.",
-                "Reason for Change Order: Is the reason for change order clearly defined? If not, assign low severity.",
-                "McKesson Pre Approvers: Does it contain McKesson Pre Approvers (based on Total Dollar Value of Project including this CO)? If not, assign low severity.",
-                "Dollar Amount of Change Order: Is dollar amount of change order clearly stated? If not, assign low severity.",
-                "Total Dollar Value of Project including this CO: Is total dollar value of project including this CO clearly stated? If not, assign low severity.",
-                "Change Order Submission Date: Does it contain a change order submission date? This should not be before or the same dates as SOW effective date. If not, assign low severity.",
-                "Change Order Effective Date: Does it contain a change order effective date? This should not be before or the same date as change order submission date, should not be before or the same dates as SOW effective date. If not, assign low severity.",
-                "Change Detail and Impacts: 1) Does it contain a clear Timeline (if any, explain in detail why there is a change in the timeline and what is affecting it)? 2) Scope (if any, explain in detail what scope was added – bullet points): 3) Budget (if any, explain why the budget is impacted and needs to change. If not stated clearly, assign low severity."         
-            ],
-            "tag":"This section is optional. If it is not present, assign low severity."
-        },
-        "Additional Terms": {
-            "search_query": "Retrieve all the chunks related to Additional Terms",
-            "validation_questions": [
-               
-                "Termination Condition: Is the termination condition clearly defined? If not, assign low severity.",
-                "Termination of Specific Resource: Is the termination condition for specific resources clearly defined? If not, assign low severity."
-            ],
-            "tag":"This section is optional. If it is not present, assign low severity."
-        },
-        "Project Oversight": {
-            "search_query": "Retrieve all the chunks related to Project Oversight",
-            "validation_questions": [
-                "Supplier Point of Contact: 1) Is contact person name clearly stated? If not, assign high severity. 2) Is email for this contact clearly stated? If not, assign high severity. 3) Is phone number for this contact clearly stated? If not, assign medium severity. 4) Is address for this contact clearly stated? If not, assign medium severity.",
-                "McKesson Point of Contact: 1) Is contact person name clearly stated? If not, assign high severity. 2) Is email for this contact clearly stated? If not, assign high severity. 3) Is phone number for this contact clearly stated? If not, assign medium severity. 4) Is address for this contact clearly stated? If not, assign medium severity."
-            ],
-            "tag":"This section is mandatory. If it is not present, assign high severity."
-        }
-    }
-    
-    # Determine which configuration to return based on SOW type
-    if sow_type and ("T&M" in str(sow_type).upper() or "TIME" in str(sow_type).upper() or "MATERIAL" in str(sow_type).upper()):
-        return TM_validation_config
-    elif sow_type and ("FIXED" in str(sow_type).upper() or "FEE" in str(sow_type).upper()):
-        return fixedfee_validation_config
-    else:
-        # Default to T&M if type cannot be determined
-        print(f"Warning: Unknown SOW type '{sow_type}'. Defaulting to T&M validation config.")
-        return TM_validation_config
-
-    
-def complete(model, prompt):
-    return Complete(model, prompt).replace("$", "\$")
-
-def clean_and_parse_json(llm_response):
-    """
-    Robust JSON parsing with multiple fallback strategies
-    """
-    try:
-        # First try: Direct parsing
-        return json.loads(llm_response)
-    except json.JSONDecodeError:
-        pass
-    
-    # Clean the response
-    cleaned_response = llm_response.strip()
-    
-    # Remove any markdown formatting
-    cleaned_response = re.sub(r'```json\s*', '', cleaned_response)
-    cleaned_response = re.sub(r'```\s*$', '', cleaned_response)
-    
-    # Try to find JSON object
-    json_patterns = [
-        r'\{[\s\S]*?"sow_validation"[\s\S]*?\}(?=\s*$)',  # Complete JSON with sow_validation
-        r'\{[\s\S]*?\}(?=\s*$)',  # Any complete JSON object
-        r'\{[\s\S]*?"sow_validation"[\s\S]*?\][\s\S]*?\}',  # JSON with array closure
-    ]
-    
-    for pattern in json_patterns:
-        matches = re.findall(pattern, cleaned_response, re.DOTALL)
-        for match in matches:
-            try:
-                # Clean up common JSON issues
-                json_str = match.strip()
-                # Fix common trailing comma issues
-                json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
-                # Fix missing quotes around keys
-                json_str = re.sub(r'(\w+):', r'"\1":', json_str)
-                # Already quoted keys should not be double-quoted
-                json_str = re.sub(r'""(\w+)"":', r'"\1":', json_str)
-                
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                continue
-    
-    # If all fails, return error structure
-    return None
-
-def validate_sow_with_llm(sow_chunks, section_name, section_specific_questions, severity_tag):
-    """
-    Use Cortex Complete to validate SOW content using retrieved document chunks and section-specific questions.
-    Returns LLM-generated analysis of inconsistencies, violations, or alignment.
-    """
-    sow_content = ""
-    # Fix: Handle the list of chunks directly since we're not passing 'results' wrapper
-    if isinstance(sow_chunks, list):
-        for chunk in sow_chunks:
-            if 'chunk' in chunk:
-                sow_content += chunk['chunk'] + "\n\n"
-    elif isinstance(sow_chunks, dict) and 'results' in sow_chunks:
-        for result in sow_chunks['results']:
-            if 'chunk' in result:
-                sow_content += result['chunk'] + "\n\n"
-
-    # If no content found, return empty validation
-    if not sow_content.strip():
-        severity = "low"
-        if "high" in severity_tag.lower():
-            severity = "high"
-        elif "medium" in severity_tag.lower():
-            severity = "medium"
-        elif "low" in severity_tag.lower():
-            severity = "low"
-        return {       "sow_validation": [{
-                "section": section_name,
-                "issue_number": 1,
-                "description": f"Section '{section_name}' is missing from the document",
-                "severity": severity,
-                "suggested_resolution": f"Add the missing '{section_name}' section to the SOW document"
-            }]}
-
-
-
-    tag = severity_tag
-    # Format section-specific questions for better readability
-    formatted_questions = ""
-    if isinstance(section_specific_questions, list):
-        for i, question in enumerate(section_specific_questions, 1):
-            formatted_questions += f"{i}. {question}\n"
-    else:
-        formatted_questions = section_specific_questions
-
-    #st.markdown(sow_content)
-    #st.markdown(formatted_questions)
-    # Updated prompt with better instructions
-    comparison_prompt = f"""You are an expert contract reviewer tasked with validating a Statement of Work (SOW) for completeness, clarity, consistency, and accuracy.
-    You are validating the {section_name} section of a Statement of Work (SOW). You have been provided document content {sow_content}, {formatted_questions} and {tag}
-    as validation criteria for validating the section. 
-
-    ### Validate {section_name} as per {formatted_questions}.
-
-  ### If you do not find relevant document content for {section_name}, then assign severity according to the provided {tag} and you should give output in JSON format as below. 
-    {{
-    "sow_validation": [
-        {{
-            "section": "{section_name}",
-            "description": "Brief specific issue description",
-            "severity": "high/medium/low according to the {tag}",
-            "suggested_resolution": "Specific action needed",
-            "issue_number": 1
-        }}
-    ]
-}}
-
-   
-
-
-
-
-CHECKBOX VALIDATION RULES(if any):
-- "Yes☒No☐" or "Yes X No ☐" (Yes checked, No unchecked) = VALID
-- "Yes☐No☒" or "Yes ☐ No X" (Yes unchecked, No checked) = VALID  
-- "Yes☒No☒" or "Yes X No X"(both checked) = ISSUE
-- "Yes☐No☐" or "Yes ☐ No ☐" (neither checked) = ISSUE
-- If checkboxes are missing, still Issue
-
-INSTRUCTIONS:
-1. Only flag actual issues, not missing optional information
-2. For checkbox sections: Only report issues if both boxes are checked or both are empty
-3. For compensation: Only flag if amounts are contradictory or completely missing
-4. Be objective and focus on clear violations of the criteria
-5. If content appears compliant, return empty validation array
-6. STRICTLY validate the section based on provided questions and rules, DO NOT MAKE YOUR OWN ASSUMPTIONS/QUESTIONS TO VALIDATE. 
-
-REQUIRED JSON FORMAT (respond with ONLY this JSON, no other text):
-{{
-    "sow_validation": [
-        {{
-            "section": "{section_name}",
-            "description": "Brief specific issue description",
-            "severity": "high/medium/low",
-            "suggested_resolution": "Specific action needed",
-            "issue_number": 1
-        }}
-    ]
-}}
-
-If no issues found, return: {{"sow_validation": []}}
-
-
-
-JSON ONLY - NO OTHER TEXT:"""
-
-    try:
-        llm_response = complete("openai-gpt-4.1", comparison_prompt)
-        
-        # Debug: Show the raw response for troubleshooting (optional, can be removed)
-        # st.write(f"**Debug - Raw LLM Response for {section_name}:**")
-        # st.text(llm_response[:500] + "..." if len(llm_response) > 500 else llm_response)
-        
-        # Use improved JSON parsing
-        validation_result = clean_and_parse_json(llm_response)
-        
-        if validation_result is None:
-            # Fallback: try to determine if section is compliant from response content
-            if any(word in llm_response.lower() for word in ["no issues", "compliant", "valid", "acceptable"]):
-                return {"sow_validation": []}
-            else:
-                return {
-                    "sow_validation": [{
-                        "section": section_name,
-                        "issue_number": 1,
-                        "description": f"JSON parsing failed. Raw response indicates potential issues. Response preview: {llm_response[:200]}...",
-                        "severity": "medium",
-                        "suggested_resolution": "Review the section manually as automated parsing failed"
-                    }]
-                }
-        
-        return validation_result
-            
-    except Exception as e:
-        return {
-            "sow_validation": [{
-                "section": section_name,
-                "issue_number": 1,
-                "description": f"Error during LLM validation: {str(e)}",
-                "severity": "high",
-                "suggested_resolution": "Check system configuration and try again"
-            }]
-        }
-
-def identify_sow_type_with_llm(sow_content):
-    """
-    Use Cortex Complete to identify SOW type from content.
-    Returns LLM-generated identification of SOW type.
-    """
-    if not sow_content.strip():
-        return {"sow_type": "Unable to determine - no content found"}
-
-    identification_prompt = f"""You have been provided document content from a Statement of Work 
-    (SOW). 
-
-Document Content:
-{sow_content}
-
-Analyze this content and determine if the SOW is Time & Materials (T&M) or Fixed-Fee type based on 
-these criteria:
-
-T&M Indicators:
-- Language like "Total Not to Exceed Fee basis"
-- Hourly rates and total hours specified
-- Resource roles with billing rates
-- Payment based on time spent
-
-Fixed-Fee Indicators:
-- Language like "Total Not to Exceed Fixed Fee basis"
-- Deliverables and milestones with specific costs
-- Payment tied to deliverable completion
-- Acceptance criteria for deliverables
-
-Provide your analysis in the following JSON format ONLY:
-
-{{
-    "sow_type": "T&M" or "Fixed-Fee"
-   
-}}
-
-JSON ONLY - NO OTHER TEXT:"""
-
-    try:
-        llm_response = complete("openai-gpt-4.1", identification_prompt)
-        
-        # Use the existing JSON parsing function
-        type_result = clean_and_parse_json(llm_response)
-        
-        if type_result is None:
-            return {
-                "sow_type": "Unable to determine - JSON parsing failed",
-                "confidence": "Low",
-               
-                "reasoning": "Failed to parse LLM response"
-            }
-        
-        return type_result
-            
-    except Exception as e:
-        return {
-            "sow_type": f"Error during analysis: {str(e)}",
-            "confidence": "Low", 
-         
-            "reasoning": "System error occurred"
-        }
-
-
     
 def get_severity_icon(severity):
     if severity.lower() == "high":
@@ -836,18 +125,77 @@ def get_section_header_with_icon(section, issue_count, highest_severity, summary
     else:
         return f"{section}"
 
-def upload_to_stage(file, stage_name):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file.name) as tmp_file:
-        tmp_file.write(file.getvalue())
-        tmp_file_path = tmp_file.name
-
-    put_result = session.file.put(
-        tmp_file_path,
-        stage_name,
-        overwrite=True,
-        auto_compress=False
-    )
-    return file.name
+def render_severity_metrics(issues):
+    """Total / High / Medium / Low issue counters"""
+    total_issues = len(issues)
+    high_issues = sum(1 for item in issues if item.get("severity", "").lower() == "high")
+    medium_issues = sum(1 for item in issues if item.get("severity", "").lower() == "medium")
+    low_issues = sum(1 for item in issues if item.get("severity", "").lower() == "low")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1: st.metric("Total Issues", total_issues)
+    with col2: st.metric("🔴 High", high_issues)
+    with col3: st.metric("🟡 Medium", medium_issues)
+    with col4: st.metric("🟢 Low", low_issues)
+
+def render_section_expander(section, section_issues, pending_reason=None, in_progress=False, carried_from=None,
+                            allow_rerun=False, model=None, rerun_unavailable=None):
+    """
+    Expander with a section's issues and combined resolution (or its pending / in-progress state),
+    and the model that validated it. With allow_rerun it also offers to re-validate just this
+    section (see rerun_section); rerun_unavailable is the reason the button is disabled.
+    """
+    issue_count, highest_severity, summary_text = get_section_summary(section_issues)
+    accordion_header = get_section_header_with_icon(section, issue_count, highest_severity, summary_text)
+    if carried_from:
+        accordion_header = f"{accordion_header} ↩️ carried over"
+    if pending_reason:
+        accordion_header = f"{section} ⏳ (pending / timed out)"
+    elif in_progress:
+        accordion_header = f"{section} ⏳ (in progress)"
+
+    with st.expander(accordion_header):
+        if carried_from:
+            st.caption(f"Carried over from the prior version's run {carried_from}: "
+                       f"this section's content and checks have not changed since.")
+        if in_progress:
+            st.info("⏳ This section has not been validated yet.")
+        elif pending_reason:
+            st.info(f"⏳ Validation is still pending ({pending_reason}); it is being retried in the background.")
+        elif section_issues:
+            for i, issue in enumerate(section_issues, 1):
+                severity_icon = get_severity_icon(issue.get('severity', 'unknown'))
+                st.markdown(
+                    f"<p style='font-size: 12px;'>{severity_icon} <strong>Issue {i}:</strong> {issue.get('description', 'No description')}</p>",
+                    unsafe_allow_html=True
+                )
+            
+            resolutions = []
+            for issue in section_issues:
+                resolution = issue.get('suggested_resolution', 'No resolution provided')
+                if resolution and resolution not in resolutions:
+                    resolutions.append(resolution)
+            
+            combined_resolution = " ".join(resolutions)
+            st.markdown(f"<p style='font-size: 12px;'><strong>Resolution:</strong> {combined_resolution}</p>", unsafe_allow_html=True)
+            if section == "Compensation":
+                st.markdown(f"<p style='font-size: 12px;'>💡 Insights available to review at the bottom of page</p>", unsafe_allow_html=True)
+        else:
+            st.info("✅ No issues found in this section.")
+
+        # Runs stored before section models were recorded only have them on their issues
+        section_models = [model] if model else sorted({issue.get('model') for issue in section_issues if issue.get('model')})
+        if section_models and not (pending_reason or in_progress):
+            st.caption(f"Model: {', '.join(section_models)}")
+
+        if allow_rerun and not (pending_reason or in_progress):
+            if st.button("🔁 Re-run this section", key=f"rerun_section_{section}", disabled=bool(rerun_unavailable),
+                         help="Retrieve and validate only this section again, keeping the rest of the report"):
+                with st.spinner(f"Re-validating {section}..."):
+                    rerun_section(section)
+                st.rerun()
+            if rerun_unavailable:
+                st.caption(f"⚠️ {rerun_unavailable}")
 
 # Function to convert DOCX → PDF
 def convert_docx_to_pdf(docx_path, pdf_path):
@@ -866,6 +214,66 @@ def convert_docx_to_pdf(docx_path, pdf_path):
 
 
 
+def merge_background_results():
+    """Fold sections finished by background retries into the report. Returns the number merged."""
+    pending_sections = st.session_state.get('pending_sections') or {}
+    background_results = st.session_state.get('background_results') or {}
+    merged = 0
+    for section_name in list(pending_sections):
+        section_result = background_results.pop(section_name, None)
+        if section_result is None:
+            continue
+        if section_result["status"] == "timed_out":
+            section_result = unfinished_section_result(section_result)
+        st.session_state['validation_output']["sow_validation"].extend(section_result["issues"])
+        st.session_state['section_chunks'][section_name] = section_result["chunks"]
+        st.session_state.setdefault('section_models', {})[section_name] = section_result.get("model")
+        del pending_sections[section_name]
+        merged += 1
+    return merged
+
+
+def rerun_section(section_name):
+    """
+    Re-run one section's retrieval and LLM validation on the document's existing index and SOW
+    type decision, and merge the result into the report in place. The updated report is saved
+    as a new run, superseding the stored one.
+    """
+    document = current_indexed_document()
+    rerun_unavailable = section_rerun_unavailable()
+    if rerun_unavailable:
+        st.error(rerun_unavailable)
+        return
+    validation_config = st.session_state.get('active_validation_config') or get_validation_config_by_sow_type("T&M")
+    try:
+        # Only the search needs the shared index; release it before the LLM call
+        with indexed_document_searchable():
+            section_mapping = st.session_state.get('section_mapping') or get_available_sections_mapping(document)
+            st.session_state['section_mapping'] = section_mapping
+            section_chunks = retrieve_section_chunks(
+                session, {section_name: validation_config[section_name]}, section_mapping, cortex_call_stats,
+                document=document
+            )
+        section_result = revalidate_section(
+            session, section_name, validation_config[section_name], section_mapping, cortex_call_stats, document,
+            selected_msa, sow_chunks=section_chunks.get(section_name)
+        )
+    except Exception as e:
+        st.error(f"Could not re-run {section_name}: {str(e)}. Use \"Re-run validation on this file\" instead.")
+        return
+
+    validation_output = st.session_state['validation_output']
+    validation_output["sow_validation"] = merge_section_result(
+        validation_output["sow_validation"], section_result, st.session_state.get('categories') or list(validation_config)
+    )
+    st.session_state['section_chunks'][section_name] = section_result["chunks"]
+    st.session_state.setdefault('section_models', {})[section_name] = section_result.get("model")
+    (st.session_state.get('carried_sections') or {}).pop(section_name, None)
+    st.session_state.pop('run_id', None)
+    st.session_state.pop('stored_run_created_at', None)
+    st.session_state.pop('retrieval_evaluation', None)
+
+
 def reset_sow_session_state():
     """Clear all SOW-related session state keys when a new file is uploaded."""
     keys_to_clear = [
@@ -877,13 +285,309 @@ def reset_sow_session_state():
         'validation_output',
         'categories',
         'uploaded_sow_filename',
-        'section_chunks'   # NEW: store chunks safely
+        'section_chunks',   # NEW: store chunks safely
+        'section_models',
+        'retrieval_evaluation',
+        'cortex_call_stats',
+        'pending_sections',
+        'background_results',
+        'document_digest',
+        'run_id',
+        'stored_run_created_at',
+        'stage_timings',
+        'skip_stored_run',
+        'section_mapping',
+        'pipeline_checkpoints',
+        'validation_job_id',
+        'indexed_document',
+        'previous_run',
+        'section_digests',
+        'carried_sections'
     ]
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
 
 
+@st.cache_resource
+def use_snowflake_rules():
+    """Read the active rules version from SOW_RULES, so activating a version needs no redeploy"""
+    try:
+        sow_rules.use_rule_source(sow_rules.SnowflakeRuleSource(session))
+    except Exception as e:
+        st.warning(f"Rules table unavailable, using the bundled rules: {str(e)}")
+
+
+@st.cache_resource
+def get_run_store():
+    """Process-wide run store (Snowflake tables, or SQLite when SOW_RUN_STORE=sqlite)"""
+    return sow_run_store.open_run_store(session)
+
+
+@st.cache_resource
+def use_persistent_retrieval_cache():
+    """Keep cached searches in the run store, so they outlive the process and are shared across it"""
+    try:
+        retrieval_cache.use_store(get_run_store())
+    except Exception as e:
+        st.warning(f"Run store unavailable, searches are cached in memory only: {str(e)}")
+
+
+def load_stored_run(run):
+    """Populate the session from a persisted run so the report renders without re-validating"""
+    st.session_state['sow_type'] = run["sow_type_result"]
+    st.session_state['active_validation_config'] = get_validation_config_by_sow_type(run["sow_type"])
+    st.session_state['validation_output'] = {"sow_validation": run["issues"]}
+    st.session_state['section_chunks'] = run["section_chunks"]
+    st.session_state['section_models'] = run["section_models"]
+    st.session_state['categories'] = run["categories"]
+    st.session_state['pending_sections'] = {}
+    st.session_state['stage_timings'] = run["timings"]
+    st.session_state['run_id'] = run["run_id"]
+    st.session_state['stored_run_created_at'] = run["created_at"]
+    st.session_state['carried_sections'] = run["carried_sections"]
+    st.session_state['section_digests'] = {
+        section_name: digests["content"] for section_name, digests in run["section_digests"].items() if digests.get("content")
+    }
+    st.session_state['processing_complete'] = True
+
+
+def persist_completed_run():
+    """Save the finished report once no section is pending. Returns the run id (None if not saved)."""
+    if st.session_state.get('run_id') or st.session_state.get('pending_sections'):
+        return None
+    if not st.session_state.get('processing_complete') or not st.session_state.get('document_digest'):
+        return None
+    run = sow_run_store.build_run(
+        st.session_state.get('uploaded_sow_filename'),
+        st.session_state['document_digest'],
+        st.session_state.get('sow_type', {"sow_type": "Unknown"}),
+        st.session_state.get('active_validation_config') or get_validation_config_by_sow_type("T&M"),
+        st.session_state.get('validation_output', {"sow_validation": []}),
+        st.session_state.get('section_chunks', {}),
+        st.session_state.get('stage_timings', {}),
+        section_digests=st.session_state.get('section_digests'),
+        previous_run_id=(st.session_state.get('previous_run') or {}).get('run_id'),
+        carried_sections=st.session_state.get('carried_sections'),
+        msa_id=selected_msa_id,
+        section_models=st.session_state.get('section_models')
+    )
+    try:
+        st.session_state['run_id'] = get_run_store().save_run(run)
+    except Exception as e:
+        st.warning(f"Could not save this validation run: {str(e)}")
+        return None
+    checkpoints = st.session_state.get('pipeline_checkpoints')
+    if checkpoints is not None:
+        checkpoints.clear()
+    return st.session_state['run_id']
+
+
+def get_pipeline_checkpoints():
+    """Checkpoints of the uploaded document; None (no resume) if the run store is unavailable"""
+    if 'pipeline_checkpoints' not in st.session_state:
+        try:
+            st.session_state['pipeline_checkpoints'] = PipelineCheckpoints(
+                get_run_store(), st.session_state['document_digest']
+            )
+        except Exception as e:
+            st.warning(f"Checkpoints unavailable, this validation cannot be resumed: {str(e)}")
+            st.session_state['pipeline_checkpoints'] = None
+    return st.session_state['pipeline_checkpoints']
+
+
+def get_stage_manifest():
+    """Run store holding the stage manifest; None (always upload) if the run store is unavailable"""
+    try:
+        return get_run_store()
+    except Exception as e:
+        st.warning(f"Stage manifest unavailable, the document will be uploaded again: {str(e)}")
+        return None
+
+
+def current_indexed_document():
+    """Stage name of this session's document; for reports loaded from storage it is derived from the upload"""
+    if st.session_state.get('indexed_document') is None:
+        # The stage name is content-addressed; indexed_document_searchable rebuilds the index if it lacks it
+        st.session_state['indexed_document'] = staged_file_name(sow_file.name, sow_file.getvalue())
+    return st.session_state['indexed_document']
+
+
+def section_rerun_unavailable():
+    """
+    Why this session's document cannot re-run a section, or None if it can: a Cortex Search
+    rebuild needs the staged file, which the retention purge may have removed since. The
+    local backend indexes the uploaded bytes, so it never needs the stage.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        return None
+    try:
+        if staged_file_available(session, current_indexed_document(), sow_file.getvalue(), SOW_STAGE, get_stage_manifest()):
+            return None
+    except Exception as e:
+        return f"Could not check the stage for this document: {str(e)}"
+    return ("Re-upload required: this document has been removed from the stage since it was validated. "
+            "Use \"Re-run validation on this file\" to stage and validate it again.")
+
+
+def indexed_document_searchable():
+    """
+    Keep this session's document in the shared search index while searching it. Another session
+    may have replaced the index since it was built here; it is then rebuilt first.
+    """
+    document = st.session_state.get('indexed_document')
+    if document is None:
+        return nullcontext()
+    if RETRIEVAL_BACKEND == "local":
+        # Indexed in this process; rebuilt in milliseconds if it was evicted
+        if sow_local_retrieval.get_index(document) is None and sow_file is not None:
+            build_local_index(session, sow_file.name, sow_file.getvalue())
+        return nullcontext()
+    return index_coordinator.searchable(document, lambda: build_search_index(session, document, cortex_call_stats))
+
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide validation job queue shared by every session"""
+    return sow_jobs.JobQueue(session, get_run_store())
+
+
+def current_user():
+    """Name of the signed-in user, used to schedule jobs fairly across users"""
+    try:
+        return st.experimental_user.get("user_name") or st.experimental_user.get("email") or "anonymous"
+    except Exception:
+        return "anonymous"
+
+
+def render_job_progress(job, job_queue):
+    """Status, progress bar, counters and per-section expanders of a queued or running job"""
+    st.markdown("---")
+    st.subheader("SOW Clause Analysis")
+    if job.status == sow_jobs.QUEUED:
+        position = job_queue.queue_position(job)
+        st.info(f"⏳ Validation queued ({position or 0} job(s) ahead). You can leave this page; "
+                f"the job keeps running and its report is saved when it finishes.")
+        return
+
+    sections_done, sections_total = job.progress()
+    if sections_total:
+        st.progress(sections_done / sections_total, text=f"Validated {sections_done} of {sections_total} sections")
+    else:
+        st.progress(0.0, text=f"Running: {job.stage or 'starting'}...")
+    if job.sow_type_result:
+        st.caption(f"SOW type: {job.sow_type_result.get('sow_type', 'Unknown')}")
+
+    section_results = dict(job.section_results)
+    pending_sections = dict(job.pending_sections)
+    if pending_sections:
+        st.warning(f"⏳ {len(pending_sections)} section(s) missed their deadline and are being retried in the background: "
+                   f"{', '.join(pending_sections)}")
+    render_severity_metrics([issue for result in section_results.values() for issue in result["issues"]])
+    for section_name in job.categories:
+        section_result = section_results.get(section_name)
+        if section_name in pending_sections:
+            render_section_expander(section_name, [], pending_sections[section_name])
+        elif section_result is None:
+            render_section_expander(section_name, [], in_progress=True)
+        else:
+            render_section_expander(section_name, section_result["issues"], carried_from=section_result.get("carried_from"),
+                                    model=section_result.get("model"))
+
+
+def render_my_jobs(job_queue):
+    """Sidebar list of the user's queued, running and finished validation jobs"""
+    jobs = job_queue.jobs_for(current_user())
+    if not jobs:
+        return
+    with st.sidebar:
+        st.subheader("My validation jobs")
+        for job in jobs:
+            sections_done, sections_total = job.progress()
+            if job.status == sow_jobs.QUEUED:
+                status = f"⏳ queued ({job_queue.queue_position(job) or 0} ahead)"
+            elif job.status == sow_jobs.RUNNING and job.pending_sections:
+                status = f"⏳ {sections_done}/{sections_total} sections, {len(job.pending_sections)} retrying"
+            elif job.status == sow_jobs.RUNNING:
+                status = f"🔄 {sections_done}/{sections_total or '?'} sections"
+            elif job.status == sow_jobs.DONE:
+                status = "✅ done"
+            else:
+                status = f"❌ failed: {job.error}"
+            st.markdown(f"**{job.document_name}**  \n{status}")
+        st.caption("Upload a finished document again to open its saved report.")
+
+
+def render_msa_selector():
+    """Sidebar to register an MSA and pick the one the SOW falls under; returns the selected MSA or None"""
+    with st.sidebar:
+        st.subheader("Master Services Agreement")
+        msa_file = st.file_uploader("Register an MSA (PDF or DOCX)", type=["pdf", "docx"], key="msa_upload")
+        if msa_file is not None and st.button("Register MSA"):
+            with st.spinner("Extracting the MSA's key terms..."):
+                try:
+                    msa = sow_msa.register_msa(session, get_run_store(), msa_file.name, msa_file.getvalue())
+                    st.session_state['msa_id'] = msa['msa_id']
+                    st.success(f"Registered {msa_file.name} ({len(msa['chunks'])} chunks)")
+                except Exception as e:
+                    st.error(f"Could not register the MSA: {str(e)}")
+        try:
+            msa_names = {row["MSA_ID"]: row["MSA_NAME"] for row in get_run_store().list_msas()}
+        except Exception as e:
+            st.warning(f"Registered MSAs unavailable: {str(e)}")
+            return None
+        msa_id = st.selectbox(
+            "SOW falls under", [None, *msa_names], format_func=lambda msa_id: msa_names.get(msa_id, "No MSA"), key='msa_id'
+        )
+        if msa_id is None:
+            return None
+        msa = sow_msa.load_msa(get_run_store(), msa_id)
+        if msa is not None:
+            st.caption("Cross-document checks compare against: " + "; ".join(
+                f"{term.replace('_', ' ')}: {value}" for term, value in msa["key_terms"].items() if value
+            ))
+        return msa
+
+
+def render_report_downloads(validation_output, categories, sow_type_result, carried_sections):
+    """
+    PDF and Excel downloads of the report. Each is rendered on its first request and cached by
+    the report's digest for every session (sow_reports.py), then streamed from memory.
+    """
+    active_config = st.session_state.get('active_validation_config')
+    report = sow_reports.build_report(
+        sow_file.name if sow_file is not None else None,
+        sow_type_result.get('sow_type', 'Unknown'),
+        categories,
+        validation_output,
+        carried_sections=carried_sections,
+        msa_id=selected_msa_id,
+        config_version=sow_run_store.config_version(active_config) if active_config else None,
+        section_models=st.session_state.get('section_models')
+    )
+    columns = st.columns(len(sow_reports.REPORT_FORMATS))
+    for column, (report_format, (label, _, mime)) in zip(columns, sow_reports.REPORT_FORMATS.items()):
+        with column:
+            requested = sow_reports.report_cache.cached(report["digest"], report_format) or st.button(
+                f"📄 Prepare {label} report", key=f"prepare_report_{report_format}"
+            )
+            if not requested:
+                continue
+            try:
+                with st.spinner(f"Rendering the {label} report..."):
+                    data = sow_reports.get_report(report, report_format)
+            except Exception as e:
+                st.error(f"Could not render the {label} report: {str(e)}")
+                continue
+            st.download_button(
+                f"⬇️ Download {label} report",
+                io.BytesIO(data),
+                file_name=sow_reports.report_file_name(report, report_format),
+                mime=mime,
+                key=f"download_report_{report_format}"
+            )
+
+
 if 'cortex_service_created' not in st.session_state:
     st.session_state['cortex_service_created'] = False
 
@@ -896,12 +600,18 @@ if 'current_file_name' not in st.session_state:
 if 'section_chunks' not in st.session_state:
     st.session_state['section_chunks'] = {}
 
+use_snowflake_rules()
+use_persistent_retrieval_cache()
+selected_msa = render_msa_selector()
+selected_msa_id = selected_msa["msa_id"] if selected_msa else None
+
 # File upload
 sow_file = st.file_uploader("Upload your SOW document (PDF or DOCX)", type=["pdf", "docx"], key="sow")
 
 # Check if a new file is uploaded (different from the previous one)
 if sow_file is not None:
-    current_file_id = f"{sow_file.name}_{sow_file.size}_{hash(sow_file.getvalue())}"
+    # Checking the same SOW against another MSA is a new validation
+    current_file_id = f"{sow_file.name}_{sow_file.size}_{hash(sow_file.getvalue())}_{selected_msa_id}"
     
     if st.session_state.get('current_file_name') != current_file_id:
         # New file detected - reset all processing states
@@ -915,6 +625,11 @@ if sow_file is not None:
     if st.button("🔄 Re-run validation on this file"):
         reset_sow_session_state()
         st.session_state['current_file_name'] = current_file_id
+        st.session_state['skip_stored_run'] = True
+        try:
+            get_run_store().clear_checkpoints(checkpoint_key(sow_file.getvalue()))
+        except Exception as e:
+            st.warning(f"Could not clear checkpoints of the previous run: {str(e)}")
         
         # Clear previous results
         # if 'sow_type' in st.session_state:
@@ -928,7 +643,73 @@ if sow_file is not None:
         # if 'uploaded_sow_filename' in st.session_state:
         #     del st.session_state['uploaded_sow_filename']
 
-if sow_file and not st.session_state.get('processing_complete', False):
+    # Render an earlier report of the same document (same config and models) straight from storage
+    if 'document_digest' not in st.session_state:
+        st.session_state['document_digest'] = sow_run_store.document_digest(sow_file.getvalue())
+        if not st.session_state.get('skip_stored_run'):
+            try:
+                stored_run = sow_run_store.find_current_run(
+                    get_run_store(), st.session_state['document_digest'], selected_msa_id
+                )
+            except Exception as e:
+                stored_run = None
+                st.warning(f"Could not look up stored validation runs: {str(e)}")
+            if stored_run:
+                load_stored_run(stored_run)
+            else:
+                # A revised version of a SOW validated before: carry over the sections that did not change
+                try:
+                    st.session_state['previous_run'] = sow_run_store.find_previous_version(
+                        get_run_store(), sow_file.name, st.session_state['document_digest']
+                    )
+                except Exception as e:
+                    st.warning(f"Could not look up earlier versions of this SOW: {str(e)}")
+
+# Per-session Cortex call statistics (recreated when a new file resets the session state)
+cortex_call_stats = st.session_state.setdefault('cortex_call_stats', sow_cortex.CortexCallStats())
+stage_timings = st.session_state.setdefault('stage_timings', {})
+
+if USE_BACKGROUND_JOBS:
+    render_my_jobs(get_job_queue())
+
+if sow_file and not st.session_state.get('processing_complete', False) and USE_BACKGROUND_JOBS:
+    job_queue = get_job_queue()
+    validation_job = job_queue.get(st.session_state['validation_job_id']) if 'validation_job_id' in st.session_state else None
+    if validation_job is None:
+        validation_job = job_queue.submit(
+            current_user(), sow_file.name, sow_file.getvalue(),
+            previous_run_id=(st.session_state.get('previous_run') or {}).get('run_id'),
+            msa_id=selected_msa_id
+        )
+        st.session_state['validation_job_id'] = validation_job.job_id
+    st.session_state['cortex_call_stats'] = cortex_call_stats = validation_job.call_stats
+
+    if validation_job.status == sow_jobs.DONE:
+        load_stored_run(get_run_store().load_run(validation_job.run_id))
+        st.session_state.pop('stored_run_created_at', None)
+        # The job indexed the document, so section re-runs and the policy evaluation can search it
+        st.session_state['indexed_document'] = validation_job.staged_file
+        st.session_state['uploaded_sow_filename'] = validation_job.staged_file
+        st.session_state['cortex_service_created'] = True
+        st.rerun()
+    elif validation_job.status == sow_jobs.FAILED:
+        st.error(f"Error during validation: {validation_job.error}")
+        st.info("Completed stages are checkpointed; resuming only runs what is left.")
+        if st.button("▶️ Resume validation"):
+            del st.session_state['validation_job_id']
+            st.rerun()
+    else:
+        render_job_progress(validation_job, job_queue)
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
+
+if sow_file and not st.session_state.get('processing_complete', False) and not USE_BACKGROUND_JOBS:
+    # Every stage below checkpoints when it completes; a rerun after an error, restart or
+    # expired session resumes from the last checkpoint
+    pipeline_checkpoints = get_pipeline_checkpoints()
+    if pipeline_checkpoints is not None and pipeline_checkpoints.resumed_stages:
+        st.info(f"Resuming an interrupted validation: {len(pipeline_checkpoints.completed_sections())} section(s) "
+                f"already completed will not be re-validated.")
     st.success("Uploading SOW document...")
 
     # Create a temporary directory
@@ -946,25 +727,72 @@ if sow_file and not st.session_state.get('processing_complete', False):
             file_path = pdf_path
             st.info(f"Converted DOCX to PDF: {os.path.basename(file_path)}")
 
-    uploaded_sow_filename = upload_to_stage(sow_file, "@SOW_STAGE")
-    st.success(f"SOW uploaded as: {uploaded_sow_filename}")
-    
-    st.session_state["uploaded_sow_filename"] = uploaded_sow_filename
+    if RETRIEVAL_BACKEND == "local" and (
+        not st.session_state.get('cortex_service_created', False)
+        or sow_local_retrieval.get_index(st.session_state.get('indexed_document')) is None
+    ):
+        # Chunked and indexed in this process: no upload, index-build procedure or search service to wait for
+        index_started = time.perf_counter()
+        local_document = build_local_index(session, sow_file.name, sow_file.getvalue())
+        st.session_state["uploaded_sow_filename"] = local_document
+        st.session_state['indexed_document'] = local_document
+        st.session_state['section_mapping'] = get_available_sections_mapping(local_document)
+        st.session_state['section_digests'] = get_section_content_digests(
+            session, st.session_state['section_mapping'], local_document
+        )
+        st.session_state['cortex_service_created'] = True
+        stage_timings['index'] = round(time.perf_counter() - index_started, 3)
+        st.success(f"Indexed {sow_file.name} locally: {len(st.session_state['section_mapping'])} sections mapped")
+
+    if RETRIEVAL_BACKEND != "local":
+        upload_started = time.perf_counter()
+        uploaded_sow_filename = checkpointed(
+            pipeline_checkpoints,
+            "upload",
+            lambda: {"uploaded_file": stage_document(session, sow_file.name, sow_file.getvalue(), SOW_STAGE, get_stage_manifest())}
+        )["uploaded_file"]
+        stage_timings.setdefault('upload', round(time.perf_counter() - upload_started, 3))
+        st.success(f"SOW uploaded as: {uploaded_sow_filename}")
+
+        st.session_state["uploaded_sow_filename"] = uploaded_sow_filename
 
     # Only create cortex search service if not already created
+    index_checkpoint = pipeline_checkpoints.get("index") if pipeline_checkpoints is not None else None
+    if not st.session_state.get('cortex_service_created', False) and index_checkpoint:
+        st.session_state['cortex_service_created'] = True
+        st.session_state['section_mapping'] = index_checkpoint["section_mapping"]
+        st.session_state['section_digests'] = index_checkpoint.get("section_digests") or {}
+        st.session_state['indexed_document'] = index_checkpoint["staged_file"]
     if not st.session_state.get('cortex_service_created', False):
         with st.spinner("Processing and creating Cortex Search Service..."):
-            sow_files = [row["name"] for row in session.sql("LIST @SOW_STAGE").collect()]
-            actual_sow_filename = next((f.split('/')[-1] for f in sow_files if uploaded_sow_filename in f), None)
+            index_started = time.perf_counter()
+            actual_sow_filename, sow_files = find_staged_file(session, uploaded_sow_filename, SOW_STAGE)
 
             if actual_sow_filename:
                 st.info(f"Found uploaded SOW: {actual_sow_filename}")
                
-                result_sow = session.sql(
-                    f"CALL CREATE_SOW_VALIDATION_CORTEX_SEARCH_LANG_NEW('{actual_sow_filename}')"
-                ).collect()
-                st.success(result_sow[0][0])
+                # Rebuilds wait for other sessions' searches of the current index to finish
+                index_messages = []
+                with index_coordinator.searchable(
+                    actual_sow_filename,
+                    lambda: index_messages.append(build_search_index(session, actual_sow_filename, cortex_call_stats))
+                ):
+                    st.session_state['section_mapping'] = get_available_sections_mapping(actual_sow_filename)
+                    st.session_state['section_digests'] = get_section_content_digests(
+                        session, st.session_state['section_mapping'], actual_sow_filename
+                    )
+                index_message = index_messages[0] if index_messages else f"{actual_sow_filename} is already indexed."
+                st.success(index_message)
                 st.session_state['cortex_service_created'] = True
+                st.session_state['indexed_document'] = actual_sow_filename
+                if pipeline_checkpoints is not None:
+                    pipeline_checkpoints.save("index", {
+                        "staged_file": actual_sow_filename,
+                        "message": index_message,
+                        "section_mapping": st.session_state['section_mapping'],
+                        "section_digests": st.session_state['section_digests']
+                    })
+                stage_timings['index'] = round(time.perf_counter() - index_started, 3)
 
             else:
                 st.error("Could not find uploaded files in SOW stage.")
@@ -973,137 +801,161 @@ if sow_file and not st.session_state.get('processing_complete', False):
     # SOW type identification (only if not already done)
     if 'sow_type' not in st.session_state:
         with st.spinner("Identifying SOW type..."):
+            type_started = time.perf_counter()
             try:
-                section_mapping = get_available_sections_mapping()
-                
-                compensation_content = ""
-                scope_content = ""
-                
-                if "Compensation" in section_mapping:
-                    db_section_name = section_mapping["Compensation"]
-                    compensation_chunks = query_cortex_search_service(
-                        "Retrieve compensation payment terms deliverables milestones hourly rates", 
-                        db_section_name
-                    )
-                    if compensation_chunks:
-                        for chunk in compensation_chunks:
-                            compensation_content += chunk.get('chunk', '') + "\n\n"
-                
-                if "Scope of Services" in section_mapping:
-                    db_section_name = section_mapping["Scope of Services"]
-                    scope_chunks = query_cortex_search_service(
-                        "Retrieve scope services roles hourly rates deliverables", 
-                        db_section_name
-                    )
-                    if scope_chunks:
-                        for chunk in scope_chunks[:3]:
-                            scope_content += chunk.get('chunk', '') + "\n\n"
-                
-                combined_content = f"Compensation Section:\n{compensation_content}\n\nScope of Services Section:\n{scope_content}"
-
-                if combined_content.strip():
-                    sow_type_result = identify_sow_type_with_llm(combined_content)
-                    sow_type = sow_type_result.get('sow_type', 'Unknown')
-                    
-                    if 'T&M' in sow_type or 'Time' in sow_type:
-                        active_validation_config = get_validation_config_by_sow_type("T&M")
-                    elif 'Fixed' in sow_type:
-                        active_validation_config = get_validation_config_by_sow_type("Fixed-Fee")
-                    else:
-                        st.warning(f"❓ **Type:** {sow_type}")
-                        st.info("Using Time & Materials validation rules as default")
-                        active_validation_config = get_validation_config_by_sow_type("T&M")
+                indexed_document = st.session_state.get('indexed_document')
+                section_mapping = st.session_state.get('section_mapping') or get_available_sections_mapping(indexed_document)
+                previous_run = st.session_state.get('previous_run')
+                if sow_type_unchanged(previous_run, st.session_state.get('section_digests') or {}):
+                    sow_type_result = previous_run["sow_type_result"]
                 else:
-                    st.warning("Could not retrieve content for SOW type identification")
+                    with indexed_document_searchable():
+                        sow_type_result = checkpointed(
+                            pipeline_checkpoints,
+                            "type_identification",
+                            lambda: identify_sow_type(
+                                session, section_mapping, cortex_call_stats, pipeline_checkpoints, indexed_document
+                            )[0]
+                        )
+                active_validation_config = validation_config_for_type_result(sow_type_result)
+                sow_type = sow_type_result.get('sow_type', 'Unknown')
+
+                if not ('T&M' in sow_type or 'Time' in sow_type or 'Fixed' in sow_type):
+                    st.warning(f"❓ **Type:** {sow_type}")
+                    st.info("Using Time & Materials validation rules as default")
 
                 st.session_state['sow_type'] = sow_type_result
                 st.session_state['active_validation_config'] = active_validation_config
+                stage_timings['type_identification'] = round(time.perf_counter() - type_started, 3)
                        
             except Exception as e:
                 st.error(f"Error during SOW type identification: {str(e)}")
                 st.session_state['sow_type'] = {"sow_type": "Unknown"}
                 st.session_state['active_validation_config'] = get_validation_config_by_sow_type("T&M")
 
-    # Validation (only if not already done)
+    # Validation (only if not already done). Each section's expander and the severity counters
+    # are rendered the moment that section finishes; the final report replaces them on rerun.
     if 'validation_output' not in st.session_state:
-        with st.spinner("Running LLM validation checks..."):
-            try:
-                if 'active_validation_config' in st.session_state:
-                    validation_config_to_use = st.session_state['active_validation_config']
-                else:
-                    validation_config_to_use = get_validation_config_by_sow_type("T&M")
-            
-                validation_output = {"sow_validation": []}
-                section_mapping = get_available_sections_mapping()
-                categories = list(validation_config_to_use.keys())
-                section_chunks_dict = {}
-
-                for section_name, config in validation_config_to_use.items():
-                    if section_name in section_mapping:
-                        db_section_name = section_mapping[section_name]
-                        st.info(f"Validating {section_name} section (DB: {db_section_name})...")
-                        
-                        sow_chunks = query_cortex_search_service(config["search_query"], db_section_name)
-
-                        
-                        section_chunks_dict[section_name] = sow_chunks if sow_chunks else []
-                        # if sow_chunks:
-                        #     st.success(f"Found {len(sow_chunks)} chunks for {section_name}")
-                        #     for i, chunk in enumerate(sow_chunks):
-                        #       with st.expander(f"Chunk {i+1} for {section_name}"):
-                        #         st.write(chunk.get('chunk', 'No content'))
-                        # else:
-                        #     st.warning(f"No chunks found for {section_name} section")
-                            
-                        result = validate_sow_with_llm(
-                                sow_chunks, 
-                                section_name, 
-                                config["validation_questions"], 
-                                config["tag"]
-                            )
-                            
-                        if result and "sow_validation" in result:
-                                for issue in result["sow_validation"]:
-                                    if issue.get("section") == section_name:
-                                        validation_output["sow_validation"].append(issue)
-                      
+        validation_finished = False
+        validation_started = time.perf_counter()
+        try:
+            if 'active_validation_config' in st.session_state:
+                validation_config_to_use = st.session_state['active_validation_config']
+            else:
+                validation_config_to_use = get_validation_config_by_sow_type("T&M")
+        
+            validation_output = {"sow_validation": []}
+            indexed_document = st.session_state.get('indexed_document')
+            section_mapping = st.session_state.get('section_mapping') or get_available_sections_mapping(indexed_document)
+            categories = list(validation_config_to_use.keys())
+            section_chunks_dict = {}
+            section_models = {}
+            section_issues_by_name = {}
+            pending_sections = {}
+            background_results = {}
+            previous_run = st.session_state.get('previous_run')
+            if previous_run and not previous_version_matches(previous_run, st.session_state.get('sow_type') or {}, selected_msa_id):
+                # Same file name, but another supplier or MSA: an unrelated document, not an earlier version
+                st.session_state.pop('previous_run')
+            carried_results = carried_section_results(
+                st.session_state.get('previous_run'), validation_config_to_use, st.session_state.get('section_digests') or {},
+                selected_msa_id
+            )
+
+            st.markdown("---")
+            st.subheader("SOW Clause Analysis")
+            validation_progress = st.progress(0.0, text="Running LLM validation checks...")
+            metrics_placeholder = st.empty()
+            with metrics_placeholder.container():
+                render_severity_metrics([])
+
+            # Each section retrieves in its own task and renders as soon as its LLM call finishes.
+            # With searches filtered per document, holding the index blocks no other session's
+            # rebuild, so it is held for the whole loop; when rebuilds replace the index, the
+            # searches run up front instead, so it is only held for them.
+            section_chunks = None
+            if not index_coordinator.namespaced:
+                with indexed_document_searchable():
+                    section_chunks = retrieve_section_chunks(
+                        session,
+                        {name: config for name, config in validation_config_to_use.items() if name not in carried_results},
+                        section_mapping, cortex_call_stats, pipeline_checkpoints, indexed_document
+                    )
+
+            with indexed_document_searchable() if section_chunks is None else nullcontext():
+                for sections_done, section_result in enumerate(
+                    iter_section_results(
+                        session, validation_config_to_use, section_mapping, background_results, cortex_call_stats,
+                        prefetched_chunks=section_chunks, checkpoints=pipeline_checkpoints, document=indexed_document,
+                        carried_results=carried_results, msa=selected_msa
+                    ), 1
+                ):
+                    section_name = section_result["section"]
+                    if section_result["status"] == "pending":
+                        pending_sections[section_name] = section_result["pending_reason"]
                     else:
-                        st.warning(f"Section '{section_name}' not found in document")
-                        severity_tag = config.get("tag", "")
-                        severity = "low"
-                        if "high" in severity_tag.lower():
-                            severity = "high"
-                        elif "medium" in severity_tag.lower():
-                            severity = "medium"
-                        elif "low" in severity_tag.lower():
-                            severity = "low"
-            
-                        missing_section_issue = {
-                            "section": section_name,
-                            "issue_number": 1,
-                            "description": f"Section '{section_name}' is completely missing from the document",
-                            "severity": severity,
-                            "suggested_resolution": f"Add the missing '{section_name}' section to the SOW document with all required information"
-                        }
-                        section_chunks_dict[section_name] = []
-                        validation_output["sow_validation"].append(missing_section_issue)
-
-                st.session_state['section_chunks'] = section_chunks_dict
-                st.session_state['validation_output'] = validation_output
-                st.session_state['categories'] = categories
-                st.session_state['processing_complete'] = True
+                        section_issues_by_name[section_name] = section_result["issues"]
+                        section_chunks_dict[section_name] = section_result["chunks"]
+                        section_models[section_name] = section_result.get("model")
+                        validation_output["sow_validation"].extend(section_result["issues"])
+
+                    with metrics_placeholder.container():
+                        render_severity_metrics(validation_output["sow_validation"])
+                    render_section_expander(
+                        section_name, section_result["issues"], pending_sections.get(section_name),
+                        carried_from=section_result.get("carried_from"), model=section_result.get("model")
+                    )
+                    validation_progress.progress(
+                        sections_done / len(categories),
+                        text=f"Validated {sections_done} of {len(categories)} sections"
+                    )
 
-            except Exception as e:
-                st.error(f"Error during validation: {str(e)}")
-                import traceback
-                st.error(traceback.format_exc())
-                validation_output = {"sow_validation": []}
+            # Keep the stored report in config order regardless of completion order
+            validation_output["sow_validation"] = [
+                issue for section_name in categories for issue in section_issues_by_name.get(section_name, [])
+            ]
+
+            st.session_state['section_chunks'] = section_chunks_dict
+            st.session_state['section_models'] = section_models
+            st.session_state['validation_output'] = validation_output
+            st.session_state['categories'] = categories
+            st.session_state['pending_sections'] = pending_sections
+            st.session_state['background_results'] = background_results
+            st.session_state['carried_sections'] = {
+                section_name: result["carried_from"] for section_name, result in carried_results.items()
+            }
+            st.session_state['processing_complete'] = True
+            stage_timings['validation'] = round(time.perf_counter() - validation_started, 3)
+            validation_finished = True
+
+        except Exception as e:
+            st.error(f"Error during validation: {str(e)}")
+            import traceback
+            st.error(traceback.format_exc())
+            validation_output = {"sow_validation": []}
+            if pipeline_checkpoints is not None:
+                st.info(f"{len(pipeline_checkpoints.completed_sections())} completed section(s) are checkpointed; "
+                        f"resuming only validates the remaining sections.")
+                st.button("▶️ Resume validation")
+
+        if validation_finished:
+            st.rerun()
 
 # Display results (only show if processing is complete)
 #if st.session_state.get('processing_complete', False):
+if st.session_state.get('pending_sections'):
+    merge_background_results()
+persist_completed_run()
+
 validation_output = st.session_state.get('validation_output', {"sow_validation": []})
 categories = st.session_state.get('categories', [])
+pending_sections = st.session_state.get('pending_sections') or {}
 sow_type_result = st.session_state.get('sow_type', {"sow_type": "Unknown"})
+carried_sections = st.session_state.get('carried_sections') or {}
+
+if st.session_state.get('stored_run_created_at'):
+    st.info(f"Loaded the stored report from {st.session_state['stored_run_created_at']} UTC "
+            f"(run {st.session_state['run_id']}). Use \"Re-run validation on this file\" to validate again.")
 
 st.markdown("---")
 st.subheader("SOW Type Identified")
@@ -1117,6 +969,8 @@ with st.expander("**SOW Type**", expanded=True):
                 st.success(f"Type: {sow_type}")
             else: 
                 st.info(f"SOW Type is neither T&M nor Fixed-fee")
+            if sow_type_result.get('model'):
+                st.caption(f"Identified by {sow_type_result['model']}")
                        
         
 if validation_output:
@@ -1124,16 +978,12 @@ if validation_output:
         st.subheader("SOW Clause Analysis")
 
         if "sow_validation" in validation_output:
-            total_issues = len(validation_output["sow_validation"])
-            high_issues = sum(1 for item in validation_output["sow_validation"] if item.get("severity", "").lower() == "high")
-            medium_issues = sum(1 for item in validation_output["sow_validation"] if item.get("severity", "").lower() == "medium")
-            low_issues = sum(1 for item in validation_output["sow_validation"] if item.get("severity", "").lower() == "low")
-            
-            col1, col2, col3, col4 = st.columns(4)
-            with col1: st.metric("Total Issues", total_issues)
-            with col2: st.metric("🔴 High", high_issues)
-            with col3: st.metric("🟡 Medium", medium_issues)
-            with col4: st.metric("🟢 Low", low_issues)
+            render_severity_metrics(validation_output["sow_validation"])
+
+        if pending_sections:
+            st.warning(f"⏳ {len(pending_sections)} section(s) pending / timed out and being retried in the background: "
+                       f"{', '.join(pending_sections)}")
+            st.button("🔄 Refresh pending sections")
 
         st.markdown("---")
         
@@ -1191,38 +1041,23 @@ if validation_output:
 
 
 
-        for section in sections_to_display:
-            section_issues = get_section_issues(validation_output, section)
-            issue_count, highest_severity, summary_text = get_section_summary(section_issues)
-            accordion_header = get_section_header_with_icon(section, issue_count, highest_severity, summary_text)
-
-            with st.expander(accordion_header):
-
-               
+        if carried_sections:
+            revalidated_sections = [section for section in categories if section not in carried_sections]
+            st.info(f"↩️ Revised version: {len(carried_sections)} unchanged section(s) carried over from the prior "
+                    f"version's report, {len(revalidated_sections)} re-validated.")
+            st.caption(f"Re-validated: {', '.join(revalidated_sections) or 'none'}  \n"
+                       f"Carried over: {', '.join(section for section in categories if section in carried_sections)}")
 
-
-
-                
-                if section_issues:
-                    for i, issue in enumerate(section_issues, 1):
-                        severity_icon = get_severity_icon(issue.get('severity', 'unknown'))
-                        st.markdown(
-                            f"<p style='font-size: 12px;'>{severity_icon} <strong>Issue {i}:</strong> {issue.get('description', 'No description')}</p>",
-                            unsafe_allow_html=True
-                        )
-                    
-                    resolutions = []
-                    for issue in section_issues:
-                        resolution = issue.get('suggested_resolution', 'No resolution provided')
-                        if resolution and resolution not in resolutions:
-                            resolutions.append(resolution)
-                    
-                    combined_resolution = " ".join(resolutions)
-                    st.markdown(f"<p style='font-size: 12px;'><strong>Resolution:</strong> {combined_resolution}</p>", unsafe_allow_html=True)
-                    if section == "Compensation":
-                        st.markdown(f"<p style='font-size: 12px;'>💡 Insights available to review at the bottom of page</p>", unsafe_allow_html=True)
-                else:
-                    st.info("✅ No issues found in this section.")
+        allow_rerun = st.session_state.get('processing_complete', False) and sow_file is not None
+        # Checked once per page render, not per section
+        rerun_unavailable = section_rerun_unavailable() if allow_rerun else None
+        for section in sections_to_display:
+            render_section_expander(
+                section, get_section_issues(validation_output, section), pending_sections.get(section),
+                carried_from=carried_sections.get(section),
+                model=(st.session_state.get('section_models') or {}).get(section),
+                allow_rerun=allow_rerun, rerun_unavailable=rerun_unavailable
+            )
 
         if validation_output and "sow_validation" in validation_output:
             st.markdown("---")
@@ -1234,7 +1069,8 @@ if validation_output:
                     "Section": item.get("section", "Unknown"),
                     "Severity": item.get("severity", "Unknown").title(),
                     "Description": item.get("description", "No description"),
-                    "Resolution": item.get("suggested_resolution", "No resolution provided")
+                    "Resolution": item.get("suggested_resolution", "No resolution provided"),
+                    "Model": item.get("model") or "-"
                 })
             
             if issues_data:
@@ -1242,4 +1078,61 @@ if validation_output:
             else:
                 st.success("No issues found in the SOW!")
 
+            if st.session_state.get('processing_complete', False) and not pending_sections:
+                render_report_downloads(validation_output, categories, sow_type_result, carried_sections)
+
+        if st.session_state.get('processing_complete', False):
+            st.markdown("---")
+            with st.expander("Retrieval policy evaluation"):
+                st.caption("Re-runs retrieval and LLM validation for every section under each retrieval policy "
+                           "and compares estimated prompt tokens sent against issues found. This issues one LLM call per section per policy.")
+                if st.button("Run retrieval policy evaluation"):
+                    indexed_document = current_indexed_document()
+                    try:
+                        with st.spinner("Evaluating retrieval policies..."), indexed_document_searchable():
+                            st.session_state['retrieval_evaluation'] = evaluate_retrieval_policies(
+                                session,
+                                st.session_state.get('active_validation_config') or get_validation_config_by_sow_type("T&M"),
+                                get_available_sections_mapping(indexed_document),
+                                call_stats=cortex_call_stats,
+                                document=indexed_document
+                            )
+                    except Exception as e:
+                        st.error(f"Could not evaluate retrieval policies: {str(e)}. Re-run validation on this file to index it first.")
+                if st.session_state.get('retrieval_evaluation'):
+                    st.dataframe(pd.DataFrame(st.session_state['retrieval_evaluation']), use_container_width=True)
+
+            with st.expander("Cortex call statistics"):
+                call_stats_rows = [
+                    {
+                        "Call type": kind,
+                        "Attempts": counters["calls"],
+                        "Retries": counters["retries"],
+                        "Failures": counters["failures"],
+                        "Avg queue wait (s)": round(counters["queue_wait_avg"], 3),
+                        "Max queue wait (s)": round(counters["queue_wait_max"], 3),
+                        "Hedged requests": counters["hedges"],
+                        "Hedge wins": counters["hedge_wins"],
+                        "Deadlines missed": counters["deadlines_exceeded"],
+                    }
+                    for kind, counters in cortex_call_stats.snapshot().items()
+                ]
+                st.dataframe(pd.DataFrame(call_stats_rows), use_container_width=True)
+                limiter_state = sow_cortex.limiter_status()
+                st.caption(
+                    f"Process-wide Cortex requests in flight: {limiter_state['in_flight']} / {limiter_state['max_concurrent']} "
+                    f"(peak {limiter_state['peak_in_flight']})"
+                )
+                cache_state = retrieval_cache.stats()
+                hit_rate = "-" if cache_state["hit_rate"] is None else f"{round(100 * cache_state['hit_rate'])}%"
+                st.caption(
+                    f"Search result cache: {cache_state['memory_hits']} memory hit(s), {cache_state['store_hits']} "
+                    f"stored hit(s), {cache_state['misses']} miss(es), hit rate {hit_rate}"
+                )
+                index_state = index_coordinator.status()
+                st.caption(
+                    f"Shared search index: {index_state['rebuilds']} rebuild(s), {index_state['indexed_documents']} document(s) "
+                    f"searchable, {index_state['wait_seconds']}s spent waiting for other sessions"
+                )
+
         st.markdown("---")
\ No newline at end of file
@@ -0,0 +1,142 @@
+"""
+Replay benchmark for the validation pipeline.
+
+    python sow_benchmark.py [FIXTURE ...] [--repeat 5] [--latency-scale 1.0] [--save results.json]
+                            [--compare baseline.json] [--tolerance 0.10]
+
+Replays each fixture recorded by sow_replay.py (default: every file in benchmarks/fixtures, the
+sample T&M and Fixed-Fee SOWs in benchmarks/corpus) --repeat times after --warmup runs. It
+reports the median, min and max seconds of each pipeline stage (upload, index,
+type_identification, retrieval, validation) and of the end-to-end run. Recorded latencies are
+replayed at --latency-scale. 1.0 shows the effect of changes to concurrency and call counts; 0
+isolates the pipeline's own CPU time.
+
+A benchmark fails when a replay asks for a call the fixture does not have, or when its issues
+differ from the recorded report, so an optimization cannot quietly change the output. With
+--compare, a stage whose median is slower than the baseline's by more than --tolerance (and
+--min-delta seconds) counts as a regression. Exits 1 on any failure or regression.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+
+from sow_replay import FIXTURES_DIR, replay
+
+STAGES = ["upload", "index", "type_identification", "retrieval", "validation", "end_to_end"]
+
+
+def bench_fixture(fixture_path, repeat, warmup, latency_scale):
+    """Replay one fixture repeatedly. Returns ({stage: [seconds]}, list of problems)."""
+    samples = {stage: [] for stage in STAGES}
+    problems = []
+    for run in range(warmup + repeat):
+        started = time.perf_counter()
+        result, session, matches = replay(fixture_path, latency_scale)
+        end_to_end = time.perf_counter() - started
+        if session.misses:
+            problems.append(f"{len(session.misses)} call(s) missing from the fixture, e.g. {session.misses[0]}")
+        if not matches:
+            problems.append("issues differ from the recorded report")
+        if problems:
+            break
+        if run < warmup:
+            continue
+        for stage in STAGES[:-1]:
+            samples[stage].append(result["timings"].get(stage, 0.0))
+        samples["end_to_end"].append(end_to_end)
+    return samples, problems
+
+
+def summarize(samples):
+    return {
+        stage: {
+            "median": round(statistics.median(values), 4),
+            "min": round(min(values), 4),
+            "max": round(max(values), 4),
+        }
+        for stage, values in samples.items() if values
+    }
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """Rows of (fixture, stage, baseline median, median, change) and the regressed subset"""
+    rows = []
+    regressions = []
+    for fixture, stages in results.items():
+        for stage, summary in stages.items():
+            before = baseline.get(fixture, {}).get(stage)
+            if before is None:
+                continue
+            delta = summary["median"] - before["median"]
+            threshold = max(min_delta, tolerance * before["median"])
+            change = "regressed" if delta > threshold else "improved" if delta < -threshold else "same"
+            row = (fixture, stage, before["median"], summary["median"], change)
+            rows.append(row)
+            if change == "regressed":
+                regressions.append(row)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each pipeline stage by replaying recorded fixtures")
+    parser.add_argument("fixtures", nargs="*", help=f"Fixture files (default: {FIXTURES_DIR}/*.json)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Fraction of recorded call latency to replay")
+    parser.add_argument("--save", help="Write the results to this JSON file, e.g. to use as a baseline")
+    parser.add_argument("--compare", help="Baseline results file from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown of a stage median (fraction)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore changes smaller than this many seconds")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    fixture_paths = args.fixtures or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json")))
+    if not fixture_paths:
+        parser.error(f"no fixtures found in {FIXTURES_DIR}; record some with sow_replay.py record")
+
+    results = {}
+    failures = 0
+    print(f"{'fixture':<28} {'stage':<20} {'median s':>9} {'min s':>8} {'max s':>8}")
+    for fixture_path in fixture_paths:
+        fixture = os.path.splitext(os.path.basename(fixture_path))[0]
+        samples, problems = bench_fixture(fixture_path, args.repeat, args.warmup, args.latency_scale)
+        if problems:
+            print(f"{fixture:<28} FAILED: {'; '.join(problems)}")
+            failures += 1
+            continue
+        results[fixture] = summarize(samples)
+        for stage, summary in results[fixture].items():
+            print(f"{fixture:<28} {stage:<20} {summary['median']:>9} {summary['min']:>8} {summary['max']:>8}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "latency_scale": args.latency_scale,
+                "results": results,
+            }, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("latency_scale") != args.latency_scale:
+            print(f"Warning: baseline was run with --latency-scale {baseline.get('latency_scale')}, not {args.latency_scale}")
+        rows, regressions = compare(results, baseline.get("results", {}), args.tolerance, args.min_delta)
+        print(f"\n{'fixture':<28} {'stage':<20} {'baseline s':>10} {'now s':>8} {'change':>10}")
+        for fixture, stage, before, now, change in rows:
+            print(f"{fixture:<28} {stage:<20} {before:>10} {now:>8} {change:>10}")
+
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
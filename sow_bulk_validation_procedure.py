@@ -0,0 +1,368 @@
+"""
+Warehouse-side bulk validation.
+
+bulk_validate() runs inside a Snowpark stored procedure and validates every document found in
+doc_chunks_sow without pulling chunks to a client. Section content is aggregated in the
+warehouse, the same prompts as validate_sow_with_llm() are written to a work table, and Cortex
+COMPLETE runs set-based over that table (one statement per model pass), so throughput scales
+with the warehouse rather than with client round trips. Issues are written to the results table
+in a single bulk insert.
+
+Register the procedure:
+    python sow_bulk_validation_procedure.py --register --connection my_conn --stage @SOW_CODE_STAGE
+
+Run it nightly:
+    CALL SOW_BULK_VALIDATE(NULL, NULL, 'SOW_VALIDATION_RESULTS');
+
+Try it against a local Snowpark stand-in (no Snowflake account or Cortex needed):
+    python sow_bulk_validation_procedure.py --local
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import uuid
+
+import sow_rules
+
+from sow_validation_engine import (
+    DOC_CHUNKS_DOCUMENT_COLUMN,
+    TYPE_IDENTIFICATION_RETRIEVAL,
+    TYPE_IDENTIFICATION_ROUTING,
+    apply_section_overrides,
+    build_sow_type_prompt,
+    build_validation_prompt,
+    check_sow_type_result,
+    check_validation_result,
+    clean_and_parse_json,
+    fallback_validation_result,
+    get_validation_config_by_sow_type,
+    map_config_sections,
+    missing_section_result,
+    prompt_questions,
+    resolve_model_routing,
+    type_identification_content,
+)
+
+PROCEDURE_NAME = "SOW_BULK_VALIDATE"
+DOC_CHUNKS_TABLE = "doc_chunks_sow"
+RESULTS_TABLE = "SOW_VALIDATION_RESULTS"
+PROMPT_WORK_TABLE = "SOW_BULK_PROMPTS"
+# Stage the procedures' code is uploaded to. It is kept apart from the document stage, which the
+# retention job lists and purges (see sow_stage.py).
+CODE_STAGE = "@SOW_CODE_STAGE"
+
+RESULT_COLUMNS = [
+    "RUN_ID", "DOCUMENT", "SOW_TYPE", "SECTION", "ISSUE_NUMBER", "SEVERITY",
+    "DESCRIPTION", "SUGGESTED_RESOLUTION", "MODEL",
+]
+
+# Sections whose content is used to classify a document, as in identify_sow_type()
+TYPE_IDENTIFICATION_SECTIONS = tuple(TYPE_IDENTIFICATION_RETRIEVAL)
+
+
+def cortex_complete_responses(prompts_df):
+    """Add a RESPONSE column by running Cortex over every (MODEL, PROMPT) row in one statement.
+    TRY_COMPLETE returns NULL for a failed row instead of failing the whole statement."""
+    from snowflake.snowpark.functions import call_function, col
+
+    return prompts_df.with_column(
+        "RESPONSE", call_function("SNOWFLAKE.CORTEX.TRY_COMPLETE", col("MODEL"), col("PROMPT"))
+    )
+
+
+def load_section_content(session, documents=None, source_table=DOC_CHUNKS_TABLE,
+                         document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    """
+    Concatenated chunk text per (document, section), aggregated in the warehouse.
+    Returns {document: {section_name: content}}.
+    """
+    from snowflake.snowpark.functions import col, listagg
+
+    chunks = session.table(source_table).select(
+        col(document_column).alias("DOCUMENT"), col("SECTION_NAME"), col("CHUNK")
+    )
+    if documents:
+        chunks = chunks.filter(col("DOCUMENT").isin(list(documents)))
+    grouped = chunks.group_by("DOCUMENT", "SECTION_NAME").agg(listagg(col("CHUNK"), "\n\n").alias("CONTENT"))
+
+    content = {}
+    for row in grouped.collect():
+        content.setdefault(row["DOCUMENT"], {})[row["SECTION_NAME"]] = row["CONTENT"] or ""
+    return content
+
+
+def run_completion_pass(session, prompt_rows, complete_fn, work_table=PROMPT_WORK_TABLE):
+    """
+    Write (KEY, MODEL, PROMPT) rows to a temporary work table and complete them set-based.
+    Returns {key: raw response or None}.
+    """
+    if not prompt_rows:
+        return {}
+    session.create_dataframe(
+        [[row["KEY"], row["MODEL"], row["PROMPT"]] for row in prompt_rows],
+        schema=["KEY", "MODEL", "PROMPT"]
+    ).write.save_as_table(work_table, mode="overwrite", table_type="temporary")
+    completed = complete_fn(session.table(work_table)).select("KEY", "RESPONSE").collect()
+    return {row["KEY"]: row["RESPONSE"] for row in completed}
+
+
+def complete_with_escalation(session, prompt_rows, check_result, complete_fn):
+    """
+    Set-based counterpart of complete_with_routing(): every row runs on the first model of its
+    routing, then rows whose response is missing or fails check_result(key, parsed) run again on
+    the escalation model in a second pass.
+    Returns {key: (response, parsed, model, escalation_reason)}.
+    """
+    outcomes = {}
+    pending = list(prompt_rows)
+    while pending:
+        responses = run_completion_pass(
+            session, [dict(row, MODEL=row["MODELS"][0]) for row in pending], complete_fn
+        )
+        next_pass = []
+        for row in pending:
+            model = row["MODELS"][0]
+            response = responses.get(row["KEY"])
+            parsed = clean_and_parse_json(response) if response else None
+            if response is None:
+                problems = [f"{model} call failed"]
+            else:
+                problems = check_result(row["KEY"], parsed)
+            escalation_reason = row.get("ESCALATION_REASON")
+            if problems and len(row["MODELS"]) > 1:
+                reason = problems[0] if response is None else f"{model} output failed checks: {'; '.join(problems[:3])}"
+                next_pass.append(dict(row, MODELS=row["MODELS"][1:], ESCALATION_REASON=reason))
+                continue
+            outcomes[row["KEY"]] = (response, parsed, model, escalation_reason)
+        pending = next_pass
+    return outcomes
+
+
+def identify_sow_types(session, section_content, complete_fn):
+    """Classify every document from its TYPE_IDENTIFICATION_SECTIONS content in one pass"""
+    prompt_rows = []
+    for document, sections in section_content.items():
+        mapping = map_config_sections(list(sections))
+        parts = {name: sections.get(mapping[name], "") if name in mapping else "" for name in TYPE_IDENTIFICATION_SECTIONS}
+        if not any(part.strip() for part in parts.values()):
+            continue
+        combined_content = type_identification_content(parts)
+        prompt_rows.append({
+            "KEY": document,
+            "MODELS": resolve_model_routing(TYPE_IDENTIFICATION_ROUTING),
+            "PROMPT": build_sow_type_prompt(combined_content),
+        })
+
+    outcomes = complete_with_escalation(
+        session, prompt_rows, lambda key, parsed: check_sow_type_result(parsed), complete_fn
+    )
+    sow_types = {}
+    for document in section_content:
+        parsed = outcomes.get(document, (None, None, None, None))[1]
+        sow_types[document] = parsed.get("sow_type", "Unknown") if isinstance(parsed, dict) else "Unknown"
+    return sow_types
+
+
+def issue_row(run_id, document, sow_type, issue, model):
+    return [
+        run_id,
+        document,
+        sow_type,
+        issue.get("section"),
+        issue.get("issue_number"),
+        str(issue.get("severity", "")).lower(),
+        issue.get("description"),
+        issue.get("suggested_resolution"),
+        issue.get("model", model),
+    ]
+
+
+def bulk_validate(session, documents=None, sow_type=None, results_table=RESULTS_TABLE, run_id=None,
+                  complete_fn=cortex_complete_responses, source_table=DOC_CHUNKS_TABLE,
+                  document_column=DOC_CHUNKS_DOCUMENT_COLUMN, section_overrides=None):
+    """
+    Validate every document in source_table (or only the listed documents) and append their
+    issues to results_table.
+
+    Args:
+        documents (list): Optional document names to restrict the run to
+        sow_type (str): Force "T&M" or "Fixed-Fee" for all documents instead of identifying each one
+        complete_fn (callable): Takes the prompt work-table DataFrame and returns it with a RESPONSE column
+        section_overrides (dict): Optional "routing" applied to every section (see apply_section_overrides);
+            retrieval settings do not apply, each section's whole content is validated
+
+    Returns:
+        dict: Run summary (run id, documents, prompts, escalations and issues written)
+    """
+    from snowflake.snowpark.functions import current_timestamp
+
+    run_id = run_id or uuid.uuid4().hex
+    section_content = load_section_content(session, documents, source_table, document_column)
+    if sow_type:
+        sow_types = {document: sow_type for document in section_content}
+    else:
+        sow_types = identify_sow_types(session, section_content, complete_fn)
+
+    issue_rows = []
+    prompt_rows = []
+    section_configs = {}
+    for document, sections in section_content.items():
+        validation_config = apply_section_overrides(get_validation_config_by_sow_type(sow_types[document]), section_overrides)
+        mapping = map_config_sections(list(sections))
+        for section_name, config in validation_config.items():
+            content = sections.get(mapping[section_name], "") if section_name in mapping else ""
+            if not content.strip():
+                for issue in missing_section_result(section_name, config)["issues"]:
+                    issue_rows.append(issue_row(run_id, document, sow_types[document], issue, None))
+                continue
+            key = json.dumps([document, section_name])
+            section_configs[key] = (document, section_name)
+            prompt_rows.append({
+                "KEY": key,
+                "MODELS": resolve_model_routing(config.get("routing")),
+                "PROMPT": build_validation_prompt(content, section_name, prompt_questions(config), config["tag"]),
+            })
+
+    outcomes = complete_with_escalation(
+        session,
+        prompt_rows,
+        lambda key, parsed: check_validation_result(parsed, section_configs[key][1]),
+        complete_fn
+    )
+
+    escalations = 0
+    for key, (response, parsed, model, escalation_reason) in outcomes.items():
+        document, section_name = section_configs[key]
+        escalations += 1 if escalation_reason else 0
+        if response is None:
+            result = {"sow_validation": [{
+                "section": section_name,
+                "issue_number": 1,
+                "description": "Error during LLM validation: Cortex returned no response",
+                "severity": "high",
+                "suggested_resolution": "Check system configuration and try again"
+            }]}
+        else:
+            result = fallback_validation_result(response, parsed, section_name)
+        for issue in result.get("sow_validation", []):
+            if isinstance(issue, dict) and issue.get("section") == section_name:
+                issue_rows.append(issue_row(run_id, document, sow_types[document], issue, model))
+
+    if issue_rows:
+        (session.create_dataframe(issue_rows, schema=RESULT_COLUMNS)
+            .with_column("VALIDATED_AT", current_timestamp())
+            .write.save_as_table(results_table, mode="append", column_order="name"))
+
+    return {
+        "run_id": run_id,
+        "results_table": results_table,
+        "documents": len(section_content),
+        "sow_types": sow_types,
+        "prompts": len(prompt_rows),
+        "escalations": escalations,
+        "issues": len(issue_rows),
+    }
+
+
+def bulk_validate_handler(session, documents, sow_type, results_table):
+    """Stored procedure entry point; NULL arguments fall back to all documents / identified types / RESULTS_TABLE"""
+    # The active rules version is read from SOW_RULES, falling back to the rules files uploaded with the procedure
+    sow_rules.use_rule_source(sow_rules.SnowflakeRuleSource(session))
+    return bulk_validate(session, documents or None, sow_type or None, results_table or RESULTS_TABLE)
+
+
+def create_code_stage(session, stage_location=CODE_STAGE):
+    """Create the stage named by stage_location ("@name" or "@name/path") if it does not exist"""
+    stage_name = stage_location.lstrip("@").split("/")[0]
+    session.sql(f"CREATE STAGE IF NOT EXISTS {stage_name}").collect()
+
+
+def register_procedure(session, stage_location=CODE_STAGE, name=PROCEDURE_NAME):
+    """Register bulk_validate_handler as a permanent stored procedure, uploading the engine modules"""
+    from snowflake.snowpark.types import ArrayType, StringType, VariantType
+
+    create_code_stage(session, stage_location)
+    here = os.path.dirname(os.path.abspath(__file__))
+    return session.sproc.register(
+        bulk_validate_handler,
+        name=name,
+        return_type=VariantType(),
+        input_types=[ArrayType(StringType()), StringType(), StringType()],
+        packages=["snowflake-snowpark-python", "pyyaml"],
+        imports=[
+            os.path.join(here, "sow_bulk_validation_procedure.py"),
+            os.path.join(here, "sow_validation_engine.py"),
+            os.path.join(here, "sow_cortex.py"),
+            os.path.join(here, "sow_local_retrieval.py"),
+            os.path.join(here, "sow_retrieval_cache.py"),
+            os.path.join(here, "sow_rules.py"),
+            *sorted(glob.glob(os.path.join(here, "rules", "v*.yaml"))),
+        ],
+        is_permanent=True,
+        stage_location=stage_location,
+        replace=True,
+    )
+
+
+def _local_demo_complete(prompts_df):
+    """Stand-in for Cortex in local testing mode: every section comes back with one low issue"""
+    session = prompts_df.session
+    rows = []
+    for row in prompts_df.collect():
+        if "Analyze this content and determine if the SOW" in row["PROMPT"]:
+            response = json.dumps({"sow_type": "T&M"})
+        else:
+            section_name = re.search(r"You are validating the (.+?) section", row["PROMPT"]).group(1)
+            response = json.dumps({"sow_validation": [{
+                "section": section_name,
+                "issue_number": 1,
+                "description": "Local stand-in issue",
+                "severity": "low",
+                "suggested_resolution": "None - local testing run"
+            }]})
+        rows.append([row["KEY"], row["MODEL"], row["PROMPT"], response])
+    return session.create_dataframe(rows, schema=["KEY", "MODEL", "PROMPT", "RESPONSE"])
+
+
+def run_local_demo():
+    """Validate two synthetic documents against Snowpark's local testing mode"""
+    from snowflake.snowpark import Session
+
+    session = Session.builder.config("local_testing", True).create()
+    chunks = []
+    for document in ("sow_a.docx", "sow_b.docx"):
+        for section_name in ("Compensation", "Scope of Services", "Term"):
+            chunks.append([document, section_name, f"{section_name} text of {document}"])
+    session.create_dataframe(chunks, schema=[DOC_CHUNKS_DOCUMENT_COLUMN, "SECTION_NAME", "CHUNK"]) \
+        .write.save_as_table(DOC_CHUNKS_TABLE, mode="overwrite")
+
+    summary = bulk_validate(session, complete_fn=_local_demo_complete)
+    print(json.dumps(summary, indent=2))
+    for row in session.table(RESULTS_TABLE).limit(10).collect():
+        print(row["DOCUMENT"], row["SECTION"], row["SEVERITY"], row["DESCRIPTION"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Register or locally exercise the bulk SOW validation procedure.")
+    parser.add_argument("--register", action="store_true", help="Register the stored procedure")
+    parser.add_argument("--local", action="store_true", help="Run against Snowpark local testing with a stand-in for Cortex")
+    parser.add_argument("--connection", default=None, help="Connection name from connections.toml")
+    parser.add_argument("--stage", default=CODE_STAGE, help=f"Stage to upload the procedure code to (default {CODE_STAGE})")
+    parser.add_argument("--name", default=PROCEDURE_NAME, help="Procedure name")
+    args = parser.parse_args()
+
+    if args.local:
+        run_local_demo()
+    elif args.register:
+        from sow_validation_cli import create_session
+
+        register_procedure(create_session(args.connection), args.stage, args.name)
+        print(f"Registered {args.name}")
+    else:
+        parser.error("pass --register or --local")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Resumable pipeline checkpoints.
+
+Each stage of a validation checkpoints its output as soon as it completes: "upload" (staged
+file name), "index" (index message and section mapping), "type_retrieval:<section>" and
+"type_identification" (the SOW type result), then "retrieval:<section>" (retrieved chunks) and "section:<section>" (the finished
+section result) for every section. Section checkpoints are written from the worker thread that
+produced them, so work finished before an exception, an app restart or an expired session is
+kept. A rerun with the same checkpoint key resumes from there and only does what is missing.
+
+Checkpoints live in the run store (sow_run_store.py) and are cleared once the run is saved.
+The "index" checkpoint assumes the search service still holds this document's chunks.
+"""
+import threading
+
+import sow_run_store
+
+
+def checkpoint_key(file_bytes=None, staged_path=None):
+    """Checkpoint key of a document: its content digest, or the stage path when only that is known"""
+    if file_bytes is not None:
+        return sow_run_store.document_digest(file_bytes)
+    return f"stage:{staged_path}"
+
+
+class PipelineCheckpoints:
+    """Write-through checkpoints for one document, shared by the pipeline's worker threads"""
+
+    def __init__(self, store, key):
+        self.store = store
+        self.key = key
+        self._lock = threading.Lock()
+        self._stages = store.load_checkpoints(key)
+        # Stages that were already complete when this object was created
+        self.resumed_stages = set(self._stages)
+
+    def get(self, stage):
+        with self._lock:
+            return self._stages.get(stage)
+
+    def save(self, stage, payload):
+        self.store.save_checkpoint(self.key, stage, payload)
+        with self._lock:
+            self._stages[stage] = payload
+
+    def completed_sections(self):
+        with self._lock:
+            return [stage.split(":", 1)[1] for stage in self._stages if stage.startswith("section:")]
+
+    def clear(self):
+        self.store.clear_checkpoints(self.key)
+        with self._lock:
+            self._stages = {}
@@ -0,0 +1,308 @@
+"""
+Shared call layer for Snowflake Cortex requests.
+
+Every Complete, Cortex Search and index-build call goes through call_cortex(). It bounds the
+number of in-flight Cortex requests across all Streamlit sessions served by this process
+(the module is imported once per process, so the limiter below is shared) and retries
+throttling / transient errors with jittered exponential backoff. Index builds are only
+retried when they were throttled or refused, never after a timeout.
+
+call_with_deadline() adds a per-call deadline on top and, once enough latencies have been
+observed, fires a hedged second request when a call runs past the HEDGE_PERCENTILE latency.
+"""
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+
+MAX_CONCURRENT_CORTEX_CALLS = int(os.environ.get("SOW_MAX_CORTEX_CONCURRENCY", "8"))
+MAX_ATTEMPTS = int(os.environ.get("SOW_CORTEX_MAX_ATTEMPTS", "5"))
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+HEDGED_REQUESTS = os.environ.get("SOW_HEDGED_REQUESTS", "1") == "1"
+HEDGE_PERCENTILE = 95
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+# Substrings (lower-case) of error messages that indicate a retryable failure
+RETRYABLE_ERROR_MARKERS = (
+    "429",
+    "too many requests",
+    "throttl",
+    "rate limit",
+    "concurrency limit",
+    "capacity",
+    "timeout",
+    "timed out",
+    "502",
+    "503",
+    "504",
+    "service unavailable",
+    "temporarily unavailable",
+    "try again",
+    "connection reset",
+    "connection aborted",
+)
+
+
+# Kinds whose calls are not safe to issue twice: the index build runs a procedure that keeps
+# going server-side after a client timeout. They are only retried on errors that mean the
+# request never started.
+NON_IDEMPOTENT_KINDS = ("index",)
+PRE_EXECUTION_ERROR_MARKERS = (
+    "429",
+    "too many requests",
+    "throttl",
+    "rate limit",
+    "concurrency limit",
+    "connection refused",
+)
+
+
+class CortexDeadlineExceeded(Exception):
+    """Raised when a Cortex call (including any hedged request) misses its deadline"""
+
+
+def is_retryable_error(error, kind=None):
+    """
+    True if the exception looks like throttling or a transient service failure. For
+    NON_IDEMPOTENT_KINDS only errors raised before the request ran qualify.
+    """
+    message = f"{type(error).__name__}: {error}".lower()
+    markers = PRE_EXECUTION_ERROR_MARKERS if kind in NON_IDEMPOTENT_KINDS else RETRYABLE_ERROR_MARKERS
+    return any(marker in message for marker in markers)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given (1-based) failed attempt"""
+    ceiling = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+class CortexCallStats:
+    """Thread-safe counters for Cortex calls, retries, failures and limiter queue waits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_kind = {}
+
+    def _kind(self, kind):
+        return self._by_kind.setdefault(kind, {
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadlines_exceeded": 0,
+        })
+
+    def record_attempt(self, kind, queue_wait):
+        with self._lock:
+            counters = self._kind(kind)
+            counters["calls"] += 1
+            counters["queue_wait_total"] += queue_wait
+            counters["queue_wait_max"] = max(counters["queue_wait_max"], queue_wait)
+
+    def record_retry(self, kind):
+        with self._lock:
+            self._kind(kind)["retries"] += 1
+
+    def record_failure(self, kind):
+        with self._lock:
+            self._kind(kind)["failures"] += 1
+
+    def record_event(self, kind, counter):
+        """Increment one of the hedging/deadline counters"""
+        with self._lock:
+            self._kind(kind)[counter] += 1
+
+    def snapshot(self):
+        """Per-kind counters plus a "total" row, with average queue wait in seconds"""
+        with self._lock:
+            rows = {kind: dict(counters) for kind, counters in self._by_kind.items()}
+        summed = ("calls", "retries", "failures", "queue_wait_total", "hedges", "hedge_wins", "deadlines_exceeded")
+        total = {key: 0 for key in summed}
+        total["queue_wait_max"] = 0.0
+        for counters in rows.values():
+            for key in summed:
+                total[key] += counters[key]
+            total["queue_wait_max"] = max(total["queue_wait_max"], counters["queue_wait_max"])
+        rows["total"] = total
+        for counters in rows.values():
+            counters["queue_wait_avg"] = counters["queue_wait_total"] / counters["calls"] if counters["calls"] else 0.0
+        return rows
+
+
+class CortexCallLimiter:
+    """Process-wide cap on in-flight Cortex requests"""
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @contextmanager
+    def slot(self):
+        """Hold one request slot; yields the seconds spent waiting for it"""
+        queued_at = time.monotonic()
+        self._semaphore.acquire()
+        queue_wait = time.monotonic() - queued_at
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield queue_wait
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per call kind"""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=LATENCY_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, kind, pct):
+        """Latency percentile in seconds, or None until min_samples calls have been seen"""
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = max(0, math.ceil(pct / 100 * len(samples)) - 1)
+        return samples[index]
+
+
+limiter = CortexCallLimiter(MAX_CONCURRENT_CORTEX_CALLS)
+process_stats = CortexCallStats()
+latency_tracker = LatencyTracker()
+
+# Runs deadline-bound and hedged calls so the caller can stop waiting without cancelling them
+_deadline_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CORTEX_CALLS * 4, thread_name_prefix="cortex-call")
+
+
+def configure_limiter(max_concurrent):
+    """Replace the process-wide limiter, e.g. to give each batch worker process its own cap"""
+    global limiter
+    limiter = CortexCallLimiter(max_concurrent)
+
+
+def call_cortex(kind, fn, *args, call_stats=None, **kwargs):
+    """
+    Call fn(*args, **kwargs) under the shared limiter, retrying retryable errors.
+
+    Args:
+        kind (str): Label used in the statistics, e.g. "complete" or "search"
+        fn (callable): The Cortex call to make
+        call_stats (CortexCallStats): Optional per-session stats recorded alongside the process-wide ones
+
+    Returns:
+        Whatever fn returns. The last error is re-raised once retries are exhausted or
+        the error is not retryable.
+    """
+    stats = [process_stats] + ([call_stats] if call_stats is not None else [])
+    attempt = 0
+    while True:
+        attempt += 1
+        with limiter.slot() as queue_wait:
+            for s in stats:
+                s.record_attempt(kind, queue_wait)
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+            else:
+                latency_tracker.record(kind, time.monotonic() - started)
+                return result
+
+        if attempt >= MAX_ATTEMPTS or not is_retryable_error(error, kind):
+            for s in stats:
+                s.record_failure(kind)
+            raise error
+
+        for s in stats:
+            s.record_retry(kind)
+        # Back off outside the slot so a waiting caller does not hold capacity
+        time.sleep(backoff_delay(attempt))
+
+
+def call_with_deadline(kind, fn, *args, deadline=None, hedge=HEDGED_REQUESTS, call_stats=None, **kwargs):
+    """
+    call_cortex() with an optional deadline and hedged second request.
+
+    If the call is still running after the HEDGE_PERCENTILE latency observed for this kind,
+    an identical request is started and whichever succeeds first is returned. Requests still
+    running when the deadline passes are left to finish in the background.
+
+    Raises:
+        CortexDeadlineExceeded: if no request succeeded within deadline seconds
+    """
+    if deadline is None and not hedge:
+        return call_cortex(kind, fn, *args, call_stats=call_stats, **kwargs)
+
+    stats = [process_stats] + ([call_stats] if call_stats is not None else [])
+    hedge_after = latency_tracker.percentile(kind, HEDGE_PERCENTILE) if hedge else None
+    started = time.monotonic()
+    first = _deadline_executor.submit(call_cortex, kind, fn, *args, call_stats=call_stats, **kwargs)
+    pending = {first}
+    hedged = False
+    last_error = None
+
+    while pending:
+        elapsed = time.monotonic() - started
+        remaining = None if deadline is None else deadline - elapsed
+        if remaining is not None and remaining <= 0:
+            for s in stats:
+                s.record_event(kind, "deadlines_exceeded")
+            raise CortexDeadlineExceeded(f"Cortex {kind} call exceeded its {deadline:g}s deadline")
+
+        wait_for = remaining
+        if hedge_after is not None and not hedged:
+            until_hedge = max(0.0, hedge_after - elapsed)
+            wait_for = until_hedge if wait_for is None else min(wait_for, until_hedge)
+
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None:
+                if future is not first:
+                    for s in stats:
+                        s.record_event(kind, "hedge_wins")
+                return future.result()
+            last_error = error
+
+        if pending and hedge_after is not None and not hedged and time.monotonic() - started >= hedge_after:
+            hedged = True
+            for s in stats:
+                s.record_event(kind, "hedges")
+            pending.add(_deadline_executor.submit(call_cortex, kind, fn, *args, call_stats=call_stats, **kwargs))
+
+    raise last_error
+
+
+def limiter_status():
+    """Current and peak in-flight Cortex requests for this process"""
+    return {
+        "max_concurrent": limiter.max_concurrent,
+        "in_flight": limiter.in_flight,
+        "peak_in_flight": limiter.peak_in_flight,
+    }
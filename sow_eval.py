@@ -0,0 +1,402 @@
+"""
+Accuracy versus latency evaluation of validation configurations.
+
+    python sow_eval.py --connection my_conn [--configs configs.json] [--json results.json]
+    python sow_eval.py --fake          # offline; FakeCortex answers from the labels
+
+Each labelled SOW in benchmarks/labelled names its corpus document, SOW type and expected
+issues: section, severity, and keywords of which at least one must appear in a reported
+description. Every configuration validates every labelled document. A configuration is a model
+choice ("routed" for each section's shipped routing, "small" or "large"), a retrieval top-k
+(null for the shipped policies) and a batching mode. "sections" batching makes one Complete call
+per section from the interactive engine. "bulk" completes every section in one set-based pass in
+the warehouse (sow_bulk_validation_procedure); it validates whole sections, so top-k does not
+apply.
+
+For each configuration the report gives issue precision and recall, severity agreement on
+matched issues, mean validation latency (type identification through the last section,
+excluding upload and indexing), estimated prompt and completion tokens per model, and their
+estimated cost in credits at each model's price (MODEL_CREDITS_PER_MILLION_TOKENS, or --prices,
+as the same tokens cost more on a larger model). The run
+fails (exit 1) if any configuration is below --min-precision, --min-recall or
+--min-severity-agreement, or if its recall is more than --max-recall-drop below the first
+(reference) configuration.
+
+In --fake mode the labels' "evidence" text is planted in the fake index, and each fake model
+recalls a fixed share of the findings (FAKE_MODEL_RECALL, --fake-recall and --fake-large-recall).
+Those shares stand in for a weaker and a stronger model and are not chosen against the gate, so
+a --fake run can fail it. The numbers exercise the harness and the gate, not real model quality.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Hedged requests would double-count tokens; turn them off before sow_cortex is imported
+os.environ["SOW_HEDGED_REQUESTS"] = "0"
+
+import sow_bulk_validation_procedure as bulk  # noqa: E402
+import sow_validation_engine  # noqa: E402
+from sow_fakes import FakeCortex  # noqa: E402
+from sow_index import IndexCoordinator  # noqa: E402
+from sow_replay import read_corpus, render_corpus_pdf  # noqa: E402
+from sow_validation_engine import (  # noqa: E402
+    LARGE_MODEL,
+    LARGE_MODEL_ROUTING,
+    SMALL_MODEL,
+    SOW_STAGE,
+    build_search_index,
+    estimate_tokens,
+    find_staged_file,
+    upload_to_stage,
+)
+
+LABELLED_DIR = os.path.join("benchmarks", "labelled")
+EVAL_RESULTS_TABLE = "SOW_EVAL_RESULTS"
+
+MODEL_ROUTINGS = {
+    "routed": None,
+    "small": {"tier": "small", "escalate_on_failure": False},
+    "large": LARGE_MODEL_ROUTING,
+}
+# The first configuration is the reference the others are compared with
+EVAL_CONFIGS = [
+    {"name": "large", "model": "large", "top_k": None, "batching": "sections"},
+    {"name": "routed", "model": "routed", "top_k": None, "batching": "sections"},
+    {"name": "small", "model": "small", "top_k": None, "batching": "sections"},
+    {"name": "routed-top2", "model": "routed", "top_k": 2, "batching": "sections"},
+    {"name": "routed-bulk", "model": "routed", "top_k": None, "batching": "bulk"},
+]
+
+# Share of the planted findings each fake model reports; independent of the gate's thresholds
+FAKE_MODEL_RECALL = {SMALL_MODEL: 0.8, LARGE_MODEL: 0.95}
+# (prompt, completion) credits per million tokens, from Snowflake's service consumption table;
+# pass --prices to use current ones. Models without a price are reported without a cost.
+MODEL_CREDITS_PER_MILLION_TOKENS = {
+    SMALL_MODEL: (1.21, 1.21),
+    LARGE_MODEL: (1.38, 5.52),
+}
+FAKE_MODEL_LATENCY = {SMALL_MODEL: 0.05, LARGE_MODEL: 0.2}
+FAKE_CALL_LATENCY = {"put": 0.0, "index": 0.1, "search": 0.02}
+
+
+def load_labelled_set(directory=LABELLED_DIR):
+    """Labelled documents with their corpus path resolved"""
+    labelled = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path) as f:
+            label = json.load(f)
+        label["name"] = os.path.splitext(os.path.basename(path))[0]
+        label["document_path"] = os.path.normpath(os.path.join(os.path.dirname(path), label["document"]))
+        labelled.append(label)
+    return labelled
+
+
+def issue_matches(expected, issue):
+    if issue.get("section") != expected["section"]:
+        return False
+    description = str(issue.get("description", "")).lower()
+    keywords = expected.get("keywords") or []
+    return not keywords or any(keyword.lower() in description for keyword in keywords)
+
+
+def match_issues(expected_issues, reported_issues):
+    """Greedy one-to-one matching. Returns (matched (expected, reported) pairs, missed expected, unexpected reported)."""
+    unmatched = list(reported_issues)
+    pairs = []
+    missed = []
+    for expected in expected_issues:
+        match = next((issue for issue in unmatched if issue_matches(expected, issue)), None)
+        if match is None:
+            missed.append(expected)
+        else:
+            unmatched.remove(match)
+            pairs.append((expected, match))
+    return pairs, missed, unmatched
+
+
+class TokenMeter:
+    """Estimated prompt and completion tokens per model, for either batching mode"""
+
+    def __init__(self):
+        self.prompt_tokens = Counter()
+        self.completion_tokens = Counter()
+        self.calls = Counter()
+
+    def add(self, model, prompt, response):
+        self.calls[model] += 1
+        self.prompt_tokens[model] += estimate_tokens(prompt)
+        self.completion_tokens[model] += estimate_tokens(response or "")
+
+    def complete_backend(self, inner):
+        def complete(model, prompt, session=None, **kwargs):
+            response = inner(model, prompt, session=session, **kwargs)
+            self.add(model, prompt, response)
+            return response
+        return complete
+
+    def credits(self, prices=MODEL_CREDITS_PER_MILLION_TOKENS):
+        """Estimated cost of the metered tokens, None if any model has no price"""
+        if any(model not in prices for model in self.calls):
+            return None
+        return sum(
+            (self.prompt_tokens[model] * prices[model][0] + self.completion_tokens[model] * prices[model][1]) / 1e6
+            for model in self.calls
+        )
+
+    def complete_fn(self, inner):
+        """Wrap a bulk complete_fn; reads the prompts back to count them, which only an evaluation can afford"""
+        def complete(prompts_df):
+            completed = inner(prompts_df)
+            for row in completed.select("MODEL", "PROMPT", "RESPONSE").collect():
+                self.add(row["MODEL"], row["PROMPT"], row["RESPONSE"])
+            return completed
+        return complete
+
+
+class LiveBackend:
+    """Runs configurations against a Snowflake account"""
+
+    def __init__(self, session):
+        self.session = session
+        self.coordinator = IndexCoordinator()
+
+    def prepare(self, label, tmpdir):
+        """Upload and index the labelled document once; returns its staged name"""
+        pdf_path = os.path.join(tmpdir, label["name"] + ".pdf")
+        render_corpus_pdf(read_corpus(label["document_path"]), pdf_path)
+        with open(pdf_path, "rb") as f:
+            uploaded = upload_to_stage(self.session, os.path.basename(pdf_path), f.read(), SOW_STAGE)
+        staged, _ = find_staged_file(self.session, uploaded, SOW_STAGE)
+        with self.coordinator.searchable(staged, lambda: build_search_index(self.session, staged)):
+            pass
+        return staged
+
+    def complete(self, model, prompt, session=None, **kwargs):
+        from snowflake.cortex import Complete
+        return Complete(model, prompt, session=session, **kwargs)
+
+    def run_sections(self, label, staged, overrides, meter):
+        sow_validation_engine.set_complete_backend(meter.complete_backend(self.complete))
+        try:
+            record = sow_validation_engine.validate_document(
+                self.session, staged_filename=staged, index_coordinator=self.coordinator, section_overrides=overrides
+            )
+        finally:
+            sow_validation_engine.set_complete_backend(None)
+        timings = record["timings"]
+        return record["sow_validation"], timings["total"] - timings.get("upload", 0.0) - timings.get("index", 0.0)
+
+    def run_bulk(self, label, staged, overrides, meter):
+        from snowflake.snowpark.functions import col
+
+        # The bulk pass reads doc_chunks_sow, which another document's indexing may have replaced
+        with self.coordinator.searchable(staged, lambda: build_search_index(self.session, staged)):
+            started = time.perf_counter()
+            summary = bulk.bulk_validate(
+                self.session, documents=[staged], results_table=EVAL_RESULTS_TABLE,
+                complete_fn=meter.complete_fn(bulk.cortex_complete_responses), section_overrides=overrides
+            )
+            elapsed = time.perf_counter() - started
+        rows = self.session.table(EVAL_RESULTS_TABLE).filter(col("RUN_ID") == summary["run_id"]).collect()
+        return [{"section": row["SECTION"], "severity": row["SEVERITY"], "description": row["DESCRIPTION"]} for row in rows], elapsed
+
+
+class FakeBackend:
+    """Runs configurations against FakeCortex answering from the labels, and Snowpark local testing for bulk"""
+
+    def __init__(self, model_recall=None):
+        self.model_recall = FAKE_MODEL_RECALL if model_recall is None else model_recall
+        self.fakes = {}
+        self._local_session = None
+
+    def prepare(self, label, tmpdir):
+        findings = {}
+        for issue in label["expected_issues"]:
+            if issue.get("evidence"):
+                findings.setdefault(issue["section"], []).append(issue)
+        self.fakes[label["name"]] = FakeCortex(
+            sow_type=label["sow_type"], section_text=read_corpus(label["document_path"]), findings=findings,
+            model_recall=self.model_recall, latency=lambda kind: FAKE_CALL_LATENCY.get(kind, 0.0)
+        )
+        path = os.path.join(tmpdir, label["name"] + ".pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4 evaluation stand-in")
+        return path
+
+    def run_sections(self, label, document_path, overrides, meter):
+        fake = self.fakes[label["name"]]
+
+        def complete(model, prompt, session=None, **kwargs):
+            time.sleep(FAKE_MODEL_LATENCY.get(model, 0.0))
+            return fake.complete(model, prompt)
+
+        sow_validation_engine.set_complete_backend(meter.complete_backend(complete))
+        try:
+            record = sow_validation_engine.validate_document(
+                fake.session(), file_path=document_path, section_overrides=overrides
+            )
+        finally:
+            sow_validation_engine.set_complete_backend(None)
+        timings = record["timings"]
+        return record["sow_validation"], timings["total"] - timings.get("upload", 0.0) - timings.get("index", 0.0)
+
+    def run_bulk(self, label, document_path, overrides, meter):
+        from snowflake.snowpark import Session
+        from snowflake.snowpark.functions import col
+
+        fake = self.fakes[label["name"]]
+        if self._local_session is None:
+            self._local_session = Session.builder.config("local_testing", True).create()
+        session = self._local_session
+        document = os.path.basename(document_path)
+        session.create_dataframe(
+            [[document, section_name, text] for section_name, text in fake.section_text.items()],
+            schema=[bulk.DOC_CHUNKS_DOCUMENT_COLUMN, "SECTION_NAME", "CHUNK"]
+        ).write.save_as_table(bulk.DOC_CHUNKS_TABLE, mode="overwrite")
+
+        def complete_responses(prompts_df):
+            rows = prompts_df.collect()
+            # One set-based pass: as slow as its slowest model
+            time.sleep(max((FAKE_MODEL_LATENCY.get(row["MODEL"], 0.0) for row in rows), default=0.0))
+            return session.create_dataframe(
+                [[row["KEY"], row["MODEL"], row["PROMPT"], fake.complete_response(row["PROMPT"], row["MODEL"])]
+                 for row in rows],
+                schema=["KEY", "MODEL", "PROMPT", "RESPONSE"]
+            )
+
+        started = time.perf_counter()
+        summary = bulk.bulk_validate(
+            session, documents=[document], results_table=EVAL_RESULTS_TABLE,
+            complete_fn=meter.complete_fn(complete_responses), section_overrides=overrides
+        )
+        elapsed = time.perf_counter() - started
+        rows = session.table(EVAL_RESULTS_TABLE).filter(col("RUN_ID") == summary["run_id"]).collect()
+        return [{"section": row["SECTION"], "severity": row["SEVERITY"], "description": row["DESCRIPTION"]} for row in rows], elapsed
+
+
+def evaluate_config(backend, config, labelled, prepared, prices=MODEL_CREDITS_PER_MILLION_TOKENS):
+    """Run one configuration over the labelled set. Returns its result dict."""
+    overrides = {"top_k": config.get("top_k"), "routing": MODEL_ROUTINGS[config.get("model", "routed")]}
+    run = backend.run_bulk if config.get("batching") == "bulk" else backend.run_sections
+    meter = TokenMeter()
+    matched = expected_total = reported_total = severity_agreed = 0
+    latencies = []
+    documents = []
+    for label in labelled:
+        reported, seconds = run(label, prepared[label["name"]], overrides, meter)
+        pairs, missed, unexpected = match_issues(label["expected_issues"], reported)
+        matched += len(pairs)
+        expected_total += len(label["expected_issues"])
+        reported_total += len(reported)
+        severity_agreed += sum(
+            1 for expected, issue in pairs if str(issue.get("severity", "")).lower() == expected["severity"]
+        )
+        latencies.append(seconds)
+        documents.append({
+            "document": label["name"],
+            "seconds": round(seconds, 3),
+            "missed": [f"{issue['section']}: {issue.get('description', issue.get('keywords'))}" for issue in missed],
+            "unexpected": [f"{issue.get('section')}: {issue.get('description')}" for issue in unexpected],
+        })
+    return {
+        **config,
+        "precision": round(matched / reported_total, 3) if reported_total else 1.0,
+        "recall": round(matched / expected_total, 3) if expected_total else 1.0,
+        "severity_agreement": round(severity_agreed / matched, 3) if matched else None,
+        "mean_latency_seconds": round(sum(latencies) / len(latencies), 3),
+        "prompt_tokens": dict(meter.prompt_tokens),
+        "completion_tokens": dict(meter.completion_tokens),
+        "credits": None if meter.credits(prices) is None else round(meter.credits(prices), 4),
+        "llm_calls": sum(meter.calls.values()),
+        "documents": documents,
+    }
+
+
+def gate(results, min_precision, min_recall, min_severity_agreement, max_recall_drop):
+    """Failure messages for configurations below the accuracy floor"""
+    failures = []
+    reference = results[0]
+    for result in results:
+        name = result["name"]
+        if result["precision"] < min_precision:
+            failures.append(f"{name}: precision {result['precision']} < {min_precision}")
+        if result["recall"] < min_recall:
+            failures.append(f"{name}: recall {result['recall']} < {min_recall}")
+        if result["severity_agreement"] is not None and result["severity_agreement"] < min_severity_agreement:
+            failures.append(f"{name}: severity agreement {result['severity_agreement']} < {min_severity_agreement}")
+        # Recalls are rounded to 3 places; so is their difference, or 1.0 - 0.95 would exceed 0.05
+        if result is not reference and round(reference["recall"] - result["recall"], 3) > max_recall_drop:
+            failures.append(f"{name}: recall {result['recall']} is more than {max_recall_drop} below {reference['name']} "
+                            f"({reference['recall']})")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare accuracy, latency and token cost of validation configurations")
+    parser.add_argument("--labelled", default=LABELLED_DIR, help="Directory of labelled SOW files")
+    parser.add_argument("--configs", help="JSON file with a list of configurations (default: EVAL_CONFIGS)")
+    parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    parser.add_argument("--fake", action="store_true", help="Run offline against FakeCortex")
+    parser.add_argument("--fake-recall", type=float, default=FAKE_MODEL_RECALL[SMALL_MODEL],
+                        help="With --fake, share of the findings the small model reports")
+    parser.add_argument("--fake-large-recall", type=float, default=FAKE_MODEL_RECALL[LARGE_MODEL],
+                        help="With --fake, share of the findings the large model reports")
+    parser.add_argument("--prices", help="JSON file of {model: [prompt, completion] credits per million tokens}")
+    parser.add_argument("--min-precision", type=float, default=0.8)
+    parser.add_argument("--min-recall", type=float, default=0.85)
+    parser.add_argument("--min-severity-agreement", type=float, default=0.8)
+    parser.add_argument("--max-recall-drop", type=float, default=0.05, help="Allowed recall drop against the first configuration")
+    parser.add_argument("--json", help="Also write full results, including missed and unexpected issues, to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    labelled = load_labelled_set(args.labelled)
+    if not labelled:
+        parser.error(f"no labelled SOWs in {args.labelled}")
+    configs = EVAL_CONFIGS
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    prices = MODEL_CREDITS_PER_MILLION_TOKENS
+    if args.prices:
+        with open(args.prices) as f:
+            prices = {model: tuple(price) for model, price in json.load(f).items()}
+
+    if args.fake:
+        backend = FakeBackend({SMALL_MODEL: args.fake_recall, LARGE_MODEL: args.fake_large_recall})
+    else:
+        from sow_validation_cli import create_session
+        backend = LiveBackend(create_session(args.connection))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        prepared = {label["name"]: backend.prepare(label, tmpdir) for label in labelled}
+        print(f"{'config':<14} {'batching':<9} {'top_k':>5} {'precision':>9} {'recall':>7} {'severity':>8} "
+              f"{'latency s':>9} {'calls':>6} {'tokens (prompt+completion)':>28} {'credits':>8}")
+        for config in configs:
+            result = evaluate_config(backend, config, labelled, prepared, prices)
+            results.append(result)
+            tokens = sum(result["prompt_tokens"].values()) + sum(result["completion_tokens"].values())
+            print(f"{result['name']:<14} {result.get('batching', 'sections'):<9} {result.get('top_k')!s:>5} "
+                  f"{result['precision']:>9} {result['recall']:>7} {result['severity_agreement']!s:>8} "
+                  f"{result['mean_latency_seconds']:>9} {result['llm_calls']:>6} {tokens:>28} {result['credits']!s:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failures = gate(results, args.min_precision, args.min_recall, args.min_severity_agreement, args.max_recall_drop)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+In-process stand-in for Snowflake and Cortex used by the fault-injection and load harnesses.
+
+FakeCortex answers the calls the engine makes: stage PUT/LIST/REMOVE, the index-build procedure, the
+section listing and chunk read, MSA text extraction, Cortex Search and Cortex Complete (install it with
+sow_validation_engine.set_complete_backend(fake.complete)). Responses are deterministic, every
+Cortex call is counted per (kind, request) as started and as completed, and latency, random
+errors and targeted faults can be injected.
+
+Like the real service there is one search index. By default builds add to it and searches honour
+the document filter, as the engine's searches do unless SOW_SEARCH_BY_DOCUMENT=0; with
+namespaced=False each build replaces it, so searches return whichever document was indexed last.
+Every chunk names its document, so a harness can tell when a validation read another document's
+chunks.
+"""
+import email.utils
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from sow_validation_engine import DOC_CHUNKS_DOCUMENT_COLUMN
+
+# Section names the fake index reports for every document
+FAKE_SECTIONS = [
+    "Header", "SOW Term", "Scope of Services", "Compensation", "Project Assumptions",
+    "McKesson Responsibilities", "Change Control Procedure", "PII or PHI", "Access",
+]
+
+
+class SimulatedCrash(BaseException):
+    """Raised by an injected fault to stand in for the process dying mid-call.
+    A BaseException so the pipeline's `except Exception` handlers do not swallow it."""
+
+
+class FakeRow(dict):
+    """Row that, like a Snowpark Row, can be indexed by column name or position"""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return dict.__getitem__(self, key)
+
+
+class _FakeResult:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def collect(self):
+        return self._rows() if callable(self._rows) else self._rows
+
+
+class _FakeFileOperation:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def put(self, local_path, stage_location, **kwargs):
+        name = local_path.replace("\\", "/").split("/")[-1]
+        if self._fake.latency is not None:
+            time.sleep(self._fake.latency("put"))
+        with self._fake._lock:
+            if kwargs.get("overwrite", True) or name not in self._fake.staged_files:
+                self._fake.staged_files[name] = time.time()
+        return []
+
+
+def _sql_literal(text):
+    """Value of a single-quoted SQL string body"""
+    return text.replace("''", "'").replace("\\\\", "\\")
+
+
+def _parse_stage_command(query):
+    """LIST/REMOVE -> (command, stage location, PATTERN regex or None)"""
+    match = re.match(
+        r"\s*(LIST|REMOVE)\s+('((?:[^']|'')*)'|\S+)(?:\s+PATTERN\s*=\s*'((?:[^']|'')*)')?", query, re.IGNORECASE
+    )
+    location = _sql_literal(match.group(3)) if match.group(3) is not None else match.group(2)
+    pattern = _sql_literal(match.group(4)) if match.group(4) is not None else None
+    return match.group(1).upper(), location, pattern
+
+
+class FakeSession:
+    """The subset of a Snowpark session the validation engine uses"""
+
+    def __init__(self, fake):
+        self._fake = fake
+        self.file = _FakeFileOperation(fake)
+
+    def sql(self, query, params=None):
+        fake = self._fake
+        if "SEARCH_PREVIEW" in query:
+            payload = json.loads(re.search(r"'(\{.*\})'", query, re.DOTALL).group(1).replace("''", "'"))
+            return _FakeResult(lambda: fake._call("search", payload["query"], lambda: fake.search_rows(payload)))
+        if query.lstrip().upper().startswith("CALL"):
+            staged_file = re.search(r"\('([^']*)'\)", query).group(1)
+            return _FakeResult(lambda: fake._call("index", staged_file, lambda: fake.index_document(staged_file)))
+        if query.lstrip().upper().startswith(("LIST", "REMOVE")):
+            command, location, pattern = _parse_stage_command(query)
+            if command == "LIST":
+                return _FakeResult(lambda: fake.list_rows(location, pattern))
+            return _FakeResult(lambda: fake.remove_rows(location, pattern))
+        if "PARSE_DOCUMENT" in query:
+            staged_file = _sql_literal(re.search(r"PARSE_DOCUMENT\([^,]+,\s*'((?:[^']|'')*)'", query).group(1))
+            return _FakeResult(lambda: fake._call("index", staged_file, lambda: fake.msa_chunk_rows(staged_file)))
+        if "DISTINCT section_name" in query:
+            return _FakeResult([FakeRow(SECTION_NAME=section_name) for section_name in fake.sections])
+        if "section_name, chunk" in query:
+            return _FakeResult([
+                FakeRow(SECTION_NAME=section_name, CHUNK=fake.section_text.get(section_name, f"{section_name} content"))
+                for section_name in fake.sections
+            ])
+        raise NotImplementedError(f"FakeSession does not handle: {query.strip()[:80]}")
+
+
+class FakeCortex:
+    """
+    Deterministic Cortex with call accounting and fault injection.
+
+    Args:
+        sections (list): Section names every indexed document has
+        sow_type (str): Answer to SOW type identification prompts
+        supplier_name (str): Supplier name those prompts extract from the Header (None: not stated)
+        latency (callable): latency(kind) -> seconds to sleep per call, e.g. lambda kind: 0.2; kind is
+            "complete", "search", "index" or "put" (stage uploads, which are not counted as Cortex calls)
+        error_rate (float or dict): Probability that a call fails with a retryable throttling error,
+            for every call or per kind ({"complete": 0.05})
+        seed (int): Seed for the error draws
+        namespaced (bool): Index builds add documents instead of replacing the index
+        document_column (str): Search attribute holding each chunk's document
+        section_text (dict): Text appended to the chunks of each section, e.g. from a sample SOW
+        findings (dict): {section: [issue]} answers for validation prompts instead of one fake finding
+            per section. An issue is reported only if its "evidence" text is in the prompt, i.e. was
+            retrieved, and the model recalls it.
+        model_recall (dict): {model: fraction of findings it reports}, 1.0 for unlisted models;
+            which findings are missed is deterministic
+        msa_terms (dict): Answer to MSA key term extraction prompts, {term: value}
+    """
+
+    def __init__(self, sections=None, sow_type="T&M", supplier_name=None, latency=None, error_rate=0.0, seed=None, namespaced=True,
+                 document_column=DOC_CHUNKS_DOCUMENT_COLUMN, section_text=None, findings=None, model_recall=None, msa_terms=None):
+        self.section_text = section_text or {}
+        self.findings = findings
+        self.model_recall = model_recall or {}
+        self.msa_terms = msa_terms or {"supplier_name": "Fake Supplier Inc.", "client_name": "McKesson Corporation",
+                                       "msa_effective_date": "2024-01-01", "payment_terms": "Net 60"}
+        self.sections = list(sections or self.section_text or FAKE_SECTIONS)
+        self.sow_type = sow_type
+        self.supplier_name = supplier_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.namespaced = namespaced
+        self.document_column = document_column
+        # Staged file name -> upload time (seconds since the epoch)
+        self.staged_files = {}
+        # Documents the search index currently holds, oldest first
+        self.indexed_documents = []
+        # fault(kind, key, call_number) -> exception to raise instead of answering, or None
+        self.fault = None
+        self.started = Counter()
+        self.completed = Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._call_number = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def session(self):
+        return FakeSession(self)
+
+    def complete(self, model, prompt, session=None, **kwargs):
+        """Drop-in for snowflake.cortex.Complete"""
+        key = f"{model}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]}"
+        return self._call("complete", key, lambda: self.complete_response(prompt, model))
+
+    def recalls(self, model, section_name, issue):
+        draw = hashlib.sha256(f"{model}|{section_name}|{issue['description']}".encode("utf-8")).digest()
+        return int.from_bytes(draw[:4], "big") / 2 ** 32 < self.model_recall.get(model, 1.0)
+
+    def complete_response(self, prompt, model=None):
+        if "determine if the SOW" in prompt:
+            return json.dumps({"sow_type": self.sow_type, "supplier_name": self.supplier_name})
+        if "key terms of this Master Services Agreement" in prompt:
+            return json.dumps({"key_terms": self.msa_terms})
+        section_name = re.search(r"You are validating the (.+?) section", prompt).group(1)
+        if self.findings is not None:
+            reported = [
+                issue for issue in self.findings.get(section_name, [])
+                if issue.get("evidence", "") in prompt and self.recalls(model, section_name, issue)
+            ]
+            return json.dumps({"sow_validation": [
+                {"section": section_name, "issue_number": number, "description": issue["description"],
+                 "severity": issue["severity"], "suggested_resolution": issue.get("suggested_resolution", "")}
+                for number, issue in enumerate(reported, 1)
+            ]})
+        return json.dumps({"sow_validation": [{
+            "section": section_name,
+            "issue_number": 1,
+            "description": f"Fake finding for {section_name}",
+            "severity": "low",
+            "suggested_resolution": "No action - generated by FakeCortex"
+        }]})
+
+    def _matching_files(self, location, pattern):
+        """Staged names under a stage location ("@STAGE/prefix") whose path fully matches pattern"""
+        prefix = location.partition("/")[2]
+        return [
+            name for name in self.staged_files
+            if name.startswith(prefix) and (pattern is None or re.fullmatch(pattern, f"sow_stage/{name}"))
+        ]
+
+    def list_rows(self, location, pattern=None):
+        """LIST of a stage location, with a size, md5 and last_modified per file like the real command"""
+        with self._lock:
+            staged = [(name, self.staged_files[name]) for name in self._matching_files(location, pattern)]
+        return [
+            FakeRow(name=f"sow_stage/{name}", size=1024, md5=hashlib.md5(name.encode("utf-8")).hexdigest(),
+                    last_modified=email.utils.formatdate(uploaded, usegmt=True))
+            for name, uploaded in sorted(staged)
+        ]
+
+    def remove_rows(self, location, pattern=None):
+        """REMOVE of a stage location: deletes the files LIST would return"""
+        with self._lock:
+            removed = self._matching_files(location, pattern)
+            for name in removed:
+                del self.staged_files[name]
+        return [FakeRow(name=f"sow_stage/{name}", result="removed") for name in sorted(removed)]
+
+    def msa_chunk_rows(self, staged_file):
+        """Chunks of a staged MSA, one per key term"""
+        return [
+            FakeRow(CHUNK=f"{term.replace('_', ' ')} of {staged_file}: {value}")
+            for term, value in self.msa_terms.items()
+        ]
+
+    def index_document(self, staged_file):
+        """The index-build procedure; the new index replaces the old one only once it is built"""
+        with self._lock:
+            if not self.namespaced:
+                self.indexed_documents = []
+            if staged_file not in self.indexed_documents:
+                self.indexed_documents.append(staged_file)
+        return [FakeRow(message=f"Indexed {staged_file}")]
+
+    def chunk_text(self, section_name, document, query):
+        text = f"{section_name} content of {document} matching '{query}'"
+        if section_name in self.section_text:
+            text += "\n" + self.section_text[section_name]
+        return text
+
+    def search_rows(self, payload):
+        with self._lock:
+            documents = list(self.indexed_documents)
+        wanted = payload.get("filter", {}).get("@eq", {}).get(self.document_column)
+        if wanted is not None:
+            documents = [document for document in documents if document == wanted]
+        # Sections named in the query rank first
+        ranked = sorted(self.sections, key=lambda section_name: section_name.lower() not in payload["query"].lower())
+        results = [
+            {"chunk": self.chunk_text(section_name, document, payload["query"]), "section_name": section_name,
+             self.document_column: document, "@scores": {"cosine_similarity": round(0.9 - 0.05 * position, 3)}}
+            for position, section_name in enumerate(ranked)
+            for document in documents
+        ]
+        return [FakeRow(SEARCH_RESULTS=json.dumps({"results": results[:payload.get("limit", 5)]}))]
+
+    def _call(self, kind, key, answer):
+        with self._lock:
+            self._call_number += 1
+            call_number = self._call_number
+            self.started[(kind, key)] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency is not None:
+                time.sleep(self.latency(kind))
+            fault = self.fault(kind, key, call_number) if self.fault is not None else None
+            if fault is not None:
+                raise fault
+            error_rate = self.error_rate.get(kind, 0.0) if isinstance(self.error_rate, dict) else self.error_rate
+            if error_rate and self._random.random() < error_rate:
+                raise RuntimeError("429 Too Many Requests (injected by FakeCortex)")
+            result = answer()
+            with self._lock:
+                self.completed[(kind, key)] += 1
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def repeated_calls(self):
+        """Calls that completed more than once, {(kind, key): times}"""
+        with self._lock:
+            return {call: count for call, count in self.completed.items() if count > 1}
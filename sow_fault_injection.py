@@ -0,0 +1,126 @@
+"""
+Fault-injection check for resumable checkpoints.
+
+    python sow_fault_injection.py [--runs N] [--seed S] [--coordinator]
+
+Validates a document once without faults to count its Cortex calls. Then, for every call
+position (or N random ones), it crashes the pipeline at that call and resumes from the
+checkpoints until the document finishes. A crash is modelled as a SimulatedCrash: once it
+fires, every further Cortex call in that attempt fails as well, as if the process had died.
+With --coordinator every attempt goes through its own sow_index.IndexCoordinator, as a
+background job resumed after a restart or on another worker does.
+Each scenario passes when:
+
+  * no Cortex call that completed is ever made again on resume, and
+  * the resumed report has the same issues as the uninterrupted one.
+
+Runs entirely on sow_fakes.FakeCortex and a SQLite run store; exits 1 on any failure.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Hedged requests deliberately duplicate calls; turn them off before sow_cortex is imported
+os.environ["SOW_HEDGED_REQUESTS"] = "0"
+
+import sow_validation_engine  # noqa: E402
+from sow_checkpoints import PipelineCheckpoints, checkpoint_key  # noqa: E402
+from sow_fakes import FakeCortex, SimulatedCrash  # noqa: E402
+from sow_index import IndexCoordinator  # noqa: E402
+from sow_run_store import SQLiteRunStore  # noqa: E402
+
+DOCUMENT_BYTES = b"%PDF-1.4 fault injection fixture"
+MAX_RESUMES = 5
+
+
+def wait_until_idle(fake, settle_seconds=0.05, timeout=10.0):
+    """Wait for the section threads of a crashed attempt to finish failing"""
+    deadline = time.monotonic() + timeout
+    idle_since = None
+    while time.monotonic() < deadline:
+        if fake.in_flight == 0:
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since >= settle_seconds:
+                return
+        else:
+            idle_since = None
+        time.sleep(0.005)
+
+
+def run_scenario(document_path, crash_at, coordinator=False):
+    """
+    Crash at Cortex call number crash_at (None for no crash), resume to the end. With coordinator,
+    each attempt indexes through a new IndexCoordinator. Returns (record, fake, attempts).
+    """
+    fake = FakeCortex()
+    sow_validation_engine.set_complete_backend(fake.complete)
+    store = SQLiteRunStore(":memory:")
+    key = checkpoint_key(DOCUMENT_BYTES)
+    crashed = {"now": False}
+
+    def fault(kind, call_key, call_number):
+        if crash_at is not None and call_number == crash_at:
+            crashed["now"] = True
+        return SimulatedCrash(f"crash at call {call_number}") if crashed["now"] else None
+
+    fake.fault = fault
+    for attempt in range(1, MAX_RESUMES + 1):
+        try:
+            record = sow_validation_engine.validate_document(
+                fake.session(), file_path=document_path, checkpoints=PipelineCheckpoints(store, key),
+                index_coordinator=IndexCoordinator() if coordinator else None
+            )
+            return record, fake, attempt
+        except SimulatedCrash:
+            wait_until_idle(fake)
+            crashed["now"] = False
+    raise RuntimeError(f"document did not finish after {MAX_RESUMES} attempts")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crash the pipeline at each Cortex call and check resume never repeats a completed call")
+    parser.add_argument("--runs", type=int, default=None, help="Random crash positions to try (default: every position)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--coordinator", action="store_true", help="Index through a new IndexCoordinator on every attempt")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        document_path = os.path.join(tmpdir, "fault_injection_sow.pdf")
+        with open(document_path, "wb") as f:
+            f.write(DOCUMENT_BYTES)
+
+        baseline, baseline_fake, _ = run_scenario(document_path, None, args.coordinator)
+        total_calls = sum(baseline_fake.completed.values())
+        baseline_issues = baseline["sow_validation"]
+        print(f"Uninterrupted run: {total_calls} Cortex calls, {len(baseline_issues)} issues")
+
+        positions = list(range(1, total_calls + 1))
+        if args.runs is not None:
+            positions = sorted(random.Random(args.seed).sample(positions, min(args.runs, len(positions))))
+
+        failures = 0
+        for crash_at in positions:
+            record, fake, attempts = run_scenario(document_path, crash_at, args.coordinator)
+            problems = []
+            repeated = fake.repeated_calls()
+            if repeated:
+                problems.append(f"repeated completed calls: {sorted(repeated.items())[:3]}")
+            if record["sow_validation"] != baseline_issues:
+                problems.append("report differs from the uninterrupted run")
+            status = "FAIL " + "; ".join(problems) if problems else "ok"
+            print(f"crash at call {crash_at:3d}: {attempts} attempt(s), "
+                  f"resumed {len(record['resumed_stages'])} stage(s), {sum(fake.completed.values())} calls completed - {status}")
+            failures += bool(problems)
+
+    sow_validation_engine.set_complete_backend(None)
+    print(f"{len(positions) - failures}/{len(positions)} crash scenarios passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
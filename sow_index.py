@@ -0,0 +1,139 @@
+"""
+Concurrency control for the shared Cortex Search Service.
+
+Every upload rebuilds sow_validation_service_lang_new through
+CREATE_SOW_VALIDATION_CORTEX_SEARCH_LANG_NEW. IndexCoordinator is a reader/writer lock around
+those rebuilds. Searching a document is a read and a rebuild is a write, so no search runs
+while the service is being replaced. Waiting rebuilds go ahead of new readers, so a busy
+document cannot starve the others.
+
+By default searches are filtered per document (SEARCH_DOCUMENT_COLUMN in sow_validation_engine)
+and a rebuild adds a document instead of replacing the others. The service keeps answering from
+its previous version until the new one is swapped in, so readers of already indexed documents
+carry on during a rebuild; only rebuilds exclude each other. The filter is what isolates
+documents, so this holds across processes, app replicas and the bulk procedure.
+
+With SOW_SEARCH_BY_DOCUMENT=0, each rebuild replaces the index, so only readers of the document
+currently indexed can share it. This lock is process-local: it cannot stop another process from
+replacing the index, so that mode only suits a single app instance.
+
+Which documents are indexed is only known in process memory. A validation resumed after a
+restart, or on another worker, seeds it with mark_indexed from its "index" checkpoint, so the
+document is not indexed again; that only holds when searches are filtered per document, since a
+replacing rebuild elsewhere may have dropped it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from sow_validation_engine import SEARCH_DOCUMENT_COLUMN
+
+
+class IndexCoordinator:
+    """Reader/writer lock over the search service, aware of which documents it currently holds"""
+
+    def __init__(self, namespaced=None):
+        self.namespaced = SEARCH_DOCUMENT_COLUMN is not None if namespaced is None else namespaced
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+        self._indexed = set()
+        self.rebuilds = 0
+        self.wait_seconds = 0.0
+
+    def _searchable(self, document):
+        return document in self._indexed
+
+    def _can_read(self, document):
+        if self.namespaced:
+            return self._searchable(document)
+        return self._searchable(document) and not self._writing and not self._writers_waiting
+
+    def _can_write(self):
+        return not self._writing and (self.namespaced or not self._readers)
+
+    @contextmanager
+    def searchable(self, document, rebuild):
+        """
+        Hold document searchable for the duration of the block.
+
+        rebuild() is called, with the service held exclusively, when the index does not hold the
+        document; any rebuild that would replace it waits until the block exits.
+        """
+        queued_at = time.monotonic()
+        with self._condition:
+            while True:
+                if self._can_read(document):
+                    self._readers += 1
+                    must_rebuild = False
+                    break
+                if not self._searchable(document):
+                    self._writers_waiting += 1
+                    while not self._can_write():
+                        self._condition.wait()
+                    self._writers_waiting -= 1
+                    if self._searchable(document):
+                        # Another session indexed it while we waited
+                        self._readers += 1
+                        must_rebuild = False
+                    else:
+                        self._writing = True
+                        must_rebuild = True
+                    break
+                self._condition.wait()
+            self.wait_seconds += time.monotonic() - queued_at
+
+        if must_rebuild:
+            try:
+                rebuild()
+            except BaseException:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                if not self.namespaced:
+                    self._indexed.clear()
+                self._indexed.add(document)
+                self.rebuilds += 1
+                # Downgrade to a reader of the freshly built index
+                self._writing = False
+                self._readers += 1
+                self._condition.notify_all()
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    def mark_indexed(self, document):
+        """
+        Record that the service already holds document, e.g. from an index checkpoint written
+        before a restart. Returns whether it was recorded: without per-document filtering
+        another rebuild may have replaced it, so it is not.
+        """
+        if not self.namespaced:
+            return False
+        with self._condition:
+            self._indexed.add(document)
+            self._condition.notify_all()
+        return True
+
+    def status(self):
+        with self._condition:
+            return {
+                "namespaced": self.namespaced,
+                "readers": self._readers,
+                "rebuilding": self._writing,
+                "rebuilds_waiting": self._writers_waiting,
+                "indexed_documents": len(self._indexed),
+                "rebuilds": self.rebuilds,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+# Shared by every session and job in this process
+index_coordinator = IndexCoordinator()
@@ -0,0 +1,133 @@
+"""
+Concurrent-session load test for the shared Cortex Search Service.
+
+    python sow_isolation_loadtest.py [--documents N] [--concurrency 1 2 4 8] [--index-latency S]
+
+Validates N distinct documents from concurrent sessions against one sow_fakes.FakeCortex,
+which, like the real service, has a single search index. Each mode is run at each concurrency:
+
+  none         no coordination; the control, expected to read other documents' chunks
+  exclusive    one lock held from upload through retrieval (what the CLI and jobs used to do)
+  coordinator  sow_index.IndexCoordinator: rebuilds are exclusive, searches of the indexed document are shared
+  namespaced   coordinator plus SEARCH_DOCUMENT_COLUMN: the index holds every document and searches are
+               filtered (the default deployment)
+
+The first three model SOW_SEARCH_BY_DOCUMENT=0, where each rebuild replaces the index.
+
+A section is contaminated when any of its retrieved chunks belongs to another document. Reports
+documents per second, index rebuilds, peak concurrent Cortex calls (capped by
+SOW_MAX_CORTEX_CONCURRENCY) and contaminated sections; exits 1 if any coordinated mode is
+contaminated.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sow_validation_engine
+from sow_fakes import FakeCortex
+from sow_index import IndexCoordinator
+
+MODES = ["none", "exclusive", "coordinator", "namespaced"]
+COORDINATED_MODES = {"exclusive", "coordinator", "namespaced"}
+
+
+def contaminated_sections(document, section_results):
+    """Sections whose retrieved chunks name a document other than this one"""
+    return sorted(
+        section_name for section_name, result in section_results.items()
+        if any(f"content of {document} " not in chunk.get("chunk", "") for chunk in result["chunks"])
+    )
+
+
+def run_mode(mode, document_paths, concurrency, index_latency, call_latency):
+    """Validate every document with the given coordination. Returns a result dict."""
+    latencies = {"index": index_latency}
+    fake = FakeCortex(latency=lambda kind: latencies.get(kind, call_latency), namespaced=(mode == "namespaced"))
+    sow_validation_engine.set_complete_backend(fake.complete)
+    sow_validation_engine.SEARCH_DOCUMENT_COLUMN = fake.document_column if mode == "namespaced" else None
+
+    index_lock = threading.Lock() if mode == "exclusive" else None
+    coordinator = IndexCoordinator(namespaced=(mode == "namespaced")) if mode in ("coordinator", "namespaced") else None
+
+    def validate(document_path):
+        section_results = {}
+        staged = {}
+
+        def on_progress(stage, payload):
+            if stage == "upload":
+                staged["document"] = payload
+            elif stage == "section":
+                section_results[payload["section"]] = payload
+
+        started = time.perf_counter()
+        sow_validation_engine.validate_document(
+            fake.session(), file_path=document_path, index_lock=index_lock, on_progress=on_progress,
+            index_coordinator=coordinator
+        )
+        return time.perf_counter() - started, contaminated_sections(staged["document"], section_results)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(validate, document_paths))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "documents": len(document_paths),
+        "seconds": round(elapsed, 2),
+        "documents_per_second": round(len(document_paths) / elapsed, 2),
+        "slowest_document_seconds": round(max(seconds for seconds, _ in outcomes), 2),
+        "peak_cortex_calls": fake.peak_in_flight,
+        "rebuilds": sum(fake.completed[key] for key in fake.completed if key[0] == "index"),
+        "contaminated_sections": sum(len(sections) for _, sections in outcomes),
+        "contaminated_documents": sum(1 for _, sections in outcomes if sections),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent validations against one shared search index")
+    parser.add_argument("--documents", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--index-latency", type=float, default=0.2, help="Seconds per index rebuild")
+    parser.add_argument("--call-latency", type=float, default=0.1, help="Seconds per search and completion call")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    failures = 0
+    original_column = sow_validation_engine.SEARCH_DOCUMENT_COLUMN
+    with tempfile.TemporaryDirectory() as tmpdir:
+        document_paths = []
+        for i in range(args.documents):
+            path = os.path.join(tmpdir, f"loadtest_sow_{i:03d}.pdf")
+            with open(path, "wb") as f:
+                f.write(f"%PDF-1.4 load test document {i}".encode("utf-8"))
+            document_paths.append(path)
+
+        print(f"{'mode':<12} {'conc':>4} {'docs/s':>7} {'seconds':>8} {'slowest':>8} {'rebuilds':>8} {'peak':>5} {'contaminated':>12}")
+        try:
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    result = run_mode(mode, document_paths, concurrency, args.index_latency, args.call_latency)
+                    contaminated = f"{result['contaminated_sections']} ({result['contaminated_documents']} docs)"
+                    print(f"{mode:<12} {concurrency:>4} {result['documents_per_second']:>7} {result['seconds']:>8} "
+                          f"{result['slowest_document_seconds']:>8} {result['rebuilds']:>8} {result['peak_cortex_calls']:>5} {contaminated:>12}")
+                    if mode in COORDINATED_MODES and result["contaminated_sections"]:
+                        failures += 1
+        finally:
+            sow_validation_engine.set_complete_backend(None)
+            sow_validation_engine.SEARCH_DOCUMENT_COLUMN = original_column
+
+    if failures:
+        print(f"{failures} coordinated run(s) read another document's chunks")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
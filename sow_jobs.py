@@ -0,0 +1,255 @@
+"""
+Background validation jobs.
+
+Uploads are submitted as jobs to a process-wide JobQueue instead of running inside the
+Streamlit script run, so widget interactions, reruns and closed tabs do not interrupt them.
+A pool of worker threads runs jobs through sow_validation_engine.validate_document with
+checkpoints (a restarted job resumes) and saves each finished report to the run store. Jobs
+keep the interactive section and document deadlines: a section that misses one is shown as
+pending while it is retried in the background, and the report is saved once it is in.
+
+Each user has their own FIFO of queued jobs; workers take the next job from users in
+round-robin order, so one user queueing many documents does not starve the others. Jobs expose
+their status and per-section progress for the UI to poll.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import sow_cortex
+import sow_msa
+import sow_run_store
+from sow_checkpoints import PipelineCheckpoints
+from sow_index import index_coordinator as process_index_coordinator
+from sow_validation_engine import DOCUMENT_DEADLINE_SECONDS, SECTION_DEADLINE_SECONDS, SOW_STAGE, validate_document
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("SOW_JOB_WORKERS", "2"))
+# Finished jobs kept per user for the "My validation jobs" list
+FINISHED_JOBS_PER_USER = 20
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ValidationJob:
+    """One document's validation; fields are updated by the worker and read by the UI"""
+
+    def __init__(self, user, document_name, file_bytes, previous_run_id=None, msa_id=None):
+        self.job_id = uuid.uuid4().hex
+        self.user = user
+        self.document_name = document_name
+        self.document_digest = sow_run_store.document_digest(file_bytes)
+        self.file_bytes = file_bytes
+        self.previous_run_id = previous_run_id
+        self.msa_id = msa_id
+        self.status = QUEUED
+        self.stage = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.sow_type_result = None
+        self.categories = []
+        self.validation_config = None
+        self.section_results = {}
+        self.pending_sections = {}
+        self.staged_file = None
+        self.call_stats = sow_cortex.CortexCallStats()
+        self.run_id = None
+        self.error = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def progress(self):
+        """(sections finished, sections total); total is 0 until the SOW type is known"""
+        return len(self.section_results), len(self.categories)
+
+    def summary(self):
+        done, total = self.progress()
+        return {
+            "job_id": self.job_id,
+            "document": self.document_name,
+            "status": self.status,
+            "stage": self.stage,
+            "sections_done": done,
+            "sections_total": total,
+            "sections_pending": sorted(self.pending_sections),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "run_id": self.run_id,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Per-user job queues served round-robin by a pool of worker threads.
+
+    Args:
+        session: Snowpark session the workers validate with
+        run_store: Where finished reports and checkpoints are kept (see sow_run_store)
+        workers (int): Worker threads, i.e. documents validated at the same time
+        index_coordinator (sow_index.IndexCoordinator): Serialises index rebuilds against searches;
+            defaults to the process-wide coordinator shared with interactive sessions
+        section_deadline, document_deadline (float): Deadlines passed to validate_document
+    """
+
+    def __init__(self, session, run_store, workers=JOB_WORKERS, index_coordinator=None, stage_name=SOW_STAGE,
+                 section_deadline=SECTION_DEADLINE_SECONDS, document_deadline=DOCUMENT_DEADLINE_SECONDS):
+        self.session = session
+        self.run_store = run_store
+        self.stage_name = stage_name
+        self.section_deadline = section_deadline
+        self.document_deadline = document_deadline
+        self.index_coordinator = index_coordinator or process_index_coordinator
+        self._condition = threading.Condition()
+        self._queued = OrderedDict()  # user -> deque of queued jobs, in round-robin order
+        self._jobs = {}
+        self._jobs_by_user = {}
+        self._workers = [
+            threading.Thread(target=self._work, name=f"sow-job-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, user, document_name, file_bytes, previous_run_id=None, msa_id=None):
+        """
+        Queue a document for validation. An active job for the same document and MSA is reused.
+        previous_run_id links it to the stored run of its prior version, whose unchanged sections are carried over.
+        msa_id is the registered MSA (sow_msa.py) cross-document questions are checked against.
+        """
+        digest = sow_run_store.document_digest(file_bytes)
+        with self._condition:
+            for job in self._jobs.values():
+                if job.document_digest == digest and job.msa_id == msa_id and job.active:
+                    if job not in self._jobs_by_user.setdefault(user, []):
+                        self._jobs_by_user[user].append(job)
+                    return job
+            job = ValidationJob(user, document_name, file_bytes, previous_run_id, msa_id)
+            self._jobs[job.job_id] = job
+            self._jobs_by_user.setdefault(user, []).append(job)
+            self._queued.setdefault(user, deque()).append(job)
+            self._condition.notify()
+        return job
+
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def jobs_for(self, user):
+        """The user's jobs, newest first"""
+        with self._condition:
+            return list(reversed(self._jobs_by_user.get(user, [])))
+
+    def queue_position(self, job):
+        """How many jobs will be started before this queued job (0 when it is next), None if not queued"""
+        with self._condition:
+            if job.status != QUEUED:
+                return None
+            queues = [list(jobs) for jobs in self._queued.values()]
+        # Simulate the round-robin order
+        position = 0
+        while any(queues):
+            for jobs in queues:
+                if not jobs:
+                    continue
+                if jobs.pop(0) is job:
+                    return position
+                position += 1
+        return None
+
+    def _next_job(self):
+        """Oldest queued job of the next user in rotation; that user then moves to the back"""
+        for user in list(self._queued):
+            jobs = self._queued.pop(user)
+            job = jobs.popleft()
+            if jobs:
+                self._queued[user] = jobs
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                self._run(job)
+            except Exception as e:
+                logger.exception("Validation job %s failed", job.job_id)
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = FAILED
+            finally:
+                job.finished_at = time.time()
+                job.file_bytes = None
+                self._forget_old_jobs(job.user)
+
+    def _run(self, job):
+        checkpoints = PipelineCheckpoints(self.run_store, job.document_digest)
+        previous_run = self.run_store.load_run(job.previous_run_id) if job.previous_run_id else None
+        msa = sow_msa.load_msa(self.run_store, job.msa_id) if job.msa_id else None
+
+        def on_progress(stage, payload):
+            job.stage = stage
+            if stage == "type_identification":
+                job.sow_type_result, validation_config = payload
+                job.categories = list(validation_config)
+                job.validation_config = validation_config
+            elif stage == "section" and payload["status"] == "pending":
+                job.pending_sections[payload["section"]] = payload["pending_reason"]
+            elif stage == "section":
+                job.section_results[payload["section"]] = payload
+                job.pending_sections.pop(payload["section"], None)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file_path = os.path.join(tmpdir, job.document_name)
+            with open(file_path, "wb") as f:
+                f.write(job.file_bytes)
+            record = validate_document(
+                self.session, file_path=file_path, stage_name=self.stage_name, call_stats=job.call_stats,
+                checkpoints=checkpoints, on_progress=on_progress, index_coordinator=self.index_coordinator,
+                previous_run=previous_run, stage_manifest=self.run_store, msa=msa,
+                section_deadline=self.section_deadline, document_deadline=self.document_deadline
+            )
+        job.staged_file = record["staged_file"]
+
+        run = sow_run_store.build_run(
+            job.document_name,
+            job.document_digest,
+            job.sow_type_result,
+            job.validation_config,
+            {"sow_validation": record["sow_validation"]},
+            {section_name: result["chunks"] for section_name, result in job.section_results.items()},
+            record["timings"],
+            section_digests=record["section_digests"],
+            previous_run_id=record["previous_run_id"],
+            carried_sections=record["carried_sections"],
+            msa_id=record["msa_id"],
+            section_models={section_name: result.get("model") for section_name, result in job.section_results.items()}
+        )
+        job.run_id = self.run_store.save_run(run)
+        checkpoints.clear()
+        job.status = DONE
+
+    def _forget_old_jobs(self, user):
+        with self._condition:
+            jobs = self._jobs_by_user.get(user, [])
+            finished = [job for job in jobs if not job.active]
+            for job in finished[:-FINISHED_JOBS_PER_USER]:
+                jobs.remove(job)
+                if not any(job in other for other in self._jobs_by_user.values()):
+                    self._jobs.pop(job.job_id, None)
@@ -0,0 +1,241 @@
+"""
+Load test: simulated concurrent reviewers against one app instance.
+
+    python sow_loadtest.py --sessions 1 5 10 20 [--driver jobs|inline] [--complete-latency lognormal:0.3,0.4]
+                           [--error-rate 0.02] [--error-rate index=0.1] [--max-p95 SECONDS] [--json results.json]
+
+Each simulated reviewer uploads a distinct document at a random moment within --ramp-seconds and
+waits for its report. The "jobs" driver submits to a sow_jobs.JobQueue as the app does; the
+"inline" driver validates in the reviewer's own thread, as with SOW_BACKGROUND_JOBS=0. Every run
+uses a fresh sow_fakes.FakeCortex standing in for session.sql, session.file.put and Complete.
+Searches are filtered by document as in production; --no-namespaced models SOW_SEARCH_BY_DOCUMENT=0.
+
+Latency distributions (seconds): "fixed:S", "uniform:LOW,HIGH", "exp:MEAN" and
+"lognormal:MEDIAN,SIGMA". Error rates apply to every Cortex call, or to one kind with
+KIND=RATE (complete, search or index); failed calls are retried by sow_cortex as in production.
+
+For each number of sessions the report gives throughput, p50/p95/p99 end-to-end latency, peak
+traced Python memory, and peak Cortex concurrency, both as seen by the service and in the
+process-wide limiter (SOW_MAX_CORTEX_CONCURRENCY). Exits 1 if a p95 exceeds --max-p95, so the
+tool can guard the hot path against regressions.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import sow_cortex
+import sow_jobs
+import sow_validation_engine
+from sow_fakes import FakeCortex
+from sow_index import IndexCoordinator
+from sow_run_store import SQLiteRunStore
+
+DRIVERS = ["jobs", "inline"]
+JOB_POLL_SECONDS = 0.05
+
+
+def latency_sampler(spec, rng, lock):
+    """Parse a latency spec into a function returning one sample in seconds"""
+    name, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    distributions = {
+        "fixed": (1, lambda: values[0]),
+        "uniform": (2, lambda: rng.uniform(values[0], values[1])),
+        "exp": (1, lambda: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0),
+        "lognormal": (2, lambda: values[0] * math.exp(rng.gauss(0.0, values[1]))),
+    }
+    if name not in distributions or len(values) != distributions[name][0]:
+        raise argparse.ArgumentTypeError(f"invalid latency spec: {spec}")
+    draw = distributions[name][1]
+
+    def sample():
+        with lock:
+            return max(0.0, draw())
+    return sample
+
+
+def parse_error_rates(values):
+    """["0.02", "index=0.1"] -> a single rate, or {kind: rate} when any kind is named"""
+    overall = 0.0
+    by_kind = {}
+    for value in values or []:
+        kind, _, rate = value.rpartition("=")
+        if kind:
+            by_kind[kind] = float(rate)
+        else:
+            overall = float(rate)
+    if not by_kind:
+        return overall
+    return {kind: by_kind.get(kind, overall) for kind in ("complete", "search", "index")}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, or None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def write_documents(tmpdir, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(tmpdir, f"loadtest_reviewer_{i:03d}.pdf")
+        with open(path, "wb") as f:
+            f.write(f"%PDF-1.4 load test SOW {i}".encode("utf-8"))
+        paths.append(path)
+    return paths
+
+
+def run_inline(fake, coordinator, document_path):
+    """One reviewer validating inside their own script run. Returns seconds to the finished report."""
+    started = time.perf_counter()
+    sow_validation_engine.validate_document(
+        fake.session(), file_path=document_path, call_stats=sow_cortex.CortexCallStats(), index_coordinator=coordinator
+    )
+    return time.perf_counter() - started
+
+
+def run_job(job_queue, user, document_path):
+    """One reviewer submitting a background job and polling it. Returns seconds to the finished report."""
+    with open(document_path, "rb") as f:
+        file_bytes = f.read()
+    started = time.perf_counter()
+    job = job_queue.submit(user, os.path.basename(document_path), file_bytes)
+    while job.active:
+        time.sleep(JOB_POLL_SECONDS)
+    if job.status != sow_jobs.DONE:
+        raise RuntimeError(job.error)
+    return time.perf_counter() - started
+
+
+def run_load(sessions, document_paths, args, latency, error_rate):
+    """Drive one batch of concurrent reviewers. Returns a result dict."""
+    fake = FakeCortex(latency=latency, error_rate=error_rate, seed=args.seed, namespaced=args.namespaced)
+    sow_validation_engine.set_complete_backend(fake.complete)
+    sow_validation_engine.SEARCH_DOCUMENT_COLUMN = fake.document_column if args.namespaced else None
+    coordinator = IndexCoordinator(namespaced=args.namespaced)
+    retries_before = sow_cortex.process_stats.snapshot()["total"]["retries"]
+    sow_cortex.limiter.peak_in_flight = sow_cortex.limiter.in_flight
+
+    if args.driver == "jobs":
+        job_queue = sow_jobs.JobQueue(
+            fake.session(), SQLiteRunStore(":memory:"), workers=args.job_workers, index_coordinator=coordinator
+        )
+        reviewer = lambda i: run_job(job_queue, f"reviewer-{i}", document_paths[i])
+    else:
+        reviewer = lambda i: run_inline(fake, coordinator, document_paths[i])
+
+    arrivals = sorted(random.Random(args.seed).uniform(0, args.ramp_seconds) for _ in range(sessions))
+    started = time.perf_counter()
+
+    def arrive_and_review(i):
+        time.sleep(max(0.0, arrivals[i] - (time.perf_counter() - started)))
+        try:
+            return reviewer(i)
+        except Exception as e:
+            logging.getLogger(__name__).error("Reviewer %d failed: %s", i, e)
+            return None
+
+    tracemalloc.start()
+    try:
+        with ThreadPoolExecutor(max_workers=sessions) as pool:
+            outcomes = list(pool.map(arrive_and_review, range(sessions)))
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds in outcomes if seconds is not None]
+    return {
+        "driver": args.driver,
+        "sessions": sessions,
+        "completed": len(latencies),
+        "failed": sessions - len(latencies),
+        "seconds": round(elapsed, 3),
+        "throughput_per_minute": round(60 * len(latencies) / elapsed, 2),
+        "p50_seconds": round(percentile(latencies, 50), 3) if latencies else None,
+        "p95_seconds": round(percentile(latencies, 95), 3) if latencies else None,
+        "p99_seconds": round(percentile(latencies, 99), 3) if latencies else None,
+        "peak_memory_mb": round(peak_memory / 2 ** 20, 2),
+        "peak_cortex_in_flight": fake.peak_in_flight,
+        "peak_limiter_in_flight": sow_cortex.limiter.peak_in_flight,
+        "cortex_calls": sum(fake.started.values()),
+        "retries": sow_cortex.process_stats.snapshot()["total"]["retries"] - retries_before,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent reviewers against a Cortex stand-in")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--driver", choices=DRIVERS, default="jobs")
+    parser.add_argument("--job-workers", type=int, default=sow_jobs.JOB_WORKERS)
+    parser.add_argument("--ramp-seconds", type=float, default=0.0, help="Reviewers arrive uniformly within this window")
+    parser.add_argument("--complete-latency", default="lognormal:0.3,0.4")
+    parser.add_argument("--search-latency", default="uniform:0.02,0.08")
+    parser.add_argument("--index-latency", default="fixed:0.5")
+    parser.add_argument("--put-latency", default="fixed:0.05")
+    parser.add_argument("--error-rate", action="append", help="RATE or KIND=RATE; repeatable")
+    parser.add_argument("--namespaced", action=argparse.BooleanOptionalAction, default=True,
+                        help="Searches filtered by document (the default); --no-namespaced models SOW_SEARCH_BY_DOCUMENT=0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-p95", type=float, default=None, help="Fail if any p95 latency exceeds this many seconds")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    rng = random.Random(args.seed)
+    lock = threading.Lock()
+    try:
+        samplers = {
+            "complete": latency_sampler(args.complete_latency, rng, lock),
+            "search": latency_sampler(args.search_latency, rng, lock),
+            "index": latency_sampler(args.index_latency, rng, lock),
+            "put": latency_sampler(args.put_latency, rng, lock),
+        }
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+    latency = lambda kind: samplers[kind]()
+    error_rate = parse_error_rates(args.error_rate)
+
+    results = []
+    original_column = sow_validation_engine.SEARCH_DOCUMENT_COLUMN
+    with tempfile.TemporaryDirectory() as tmpdir:
+        document_paths = write_documents(tmpdir, max(args.sessions))
+        print(f"{'sessions':>8} {'done':>5} {'failed':>6} {'docs/min':>9} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+              f"{'peak MB':>8} {'cortex':>7} {'limiter':>8} {'retries':>8}")
+        try:
+            for sessions in args.sessions:
+                result = run_load(sessions, document_paths, args, latency, error_rate)
+                results.append(result)
+                print(f"{sessions:>8} {result['completed']:>5} {result['failed']:>6} {result['throughput_per_minute']:>9} "
+                      f"{result['p50_seconds']!s:>7} {result['p95_seconds']!s:>7} {result['p99_seconds']!s:>7} "
+                      f"{result['peak_memory_mb']:>8} {result['peak_cortex_in_flight']:>7} "
+                      f"{result['peak_limiter_in_flight']:>8} {result['retries']:>8}")
+        finally:
+            sow_validation_engine.set_complete_backend(None)
+            sow_validation_engine.SEARCH_DOCUMENT_COLUMN = original_column
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_p95 is not None:
+        slow = [result for result in results if result["p95_seconds"] is None or result["p95_seconds"] > args.max_p95]
+        for result in slow:
+            print(f"p95 {result['p95_seconds']}s with {result['sessions']} sessions exceeds {args.max_p95}s")
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
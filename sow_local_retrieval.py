@@ -0,0 +1,257 @@
+"""
+In-process retrieval: a BM25 index over one document's chunks.
+
+With SOW_RETRIEVAL_BACKEND=local, validate_document neither stages the document nor calls the
+index-build procedure or the Cortex Search Service. Instead:
+
+  1. The text is extracted here: PyPDF2 for PDF, python-docx for DOCX, plain text otherwise.
+  2. It is split into sections at its headings. A heading is a markdown or numbered heading, an
+     all-caps line, or a line that is exactly a known section name. The sections are then chunked.
+  3. The chunks are indexed into an inverted index with BM25 scoring.
+
+This takes milliseconds. query_cortex_search_service then answers each section's search_query
+from the index, and the section listing and content digests read its chunks, all through the
+same interface as the Cortex backend.
+
+BM25 scores are mapped onto [0, 1) and returned as Cortex's similarity score. The mapping is
+absolute, score / (score + BM25_SATURATION), and does not depend on the query's other results,
+so the retrieval policies' min_score cutoffs keep their meaning: a query with only weak matches
+returns only low scores, which the cutoffs drop. A chunk scoring BM25_SATURATION maps to 0.5.
+
+With SOW_LOCAL_EMBEDDING_MODEL set to a sentence-transformers model (an optional dependency,
+e.g. all-MiniLM-L6-v2), chunks are also embedded locally. The score is then an even blend of the
+mapped BM25 score and cosine similarity.
+
+Indexes are kept per document in a small LRU (LOCAL_INDEX_CAPACITY).
+
+    python sow_retrieval_compare.py --fake    # latency and recall against Cortex Search
+"""
+import heapq
+import io
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+LOCAL_CHUNK_SIZE = int(os.environ.get("SOW_LOCAL_CHUNK_SIZE", "1000"))
+LOCAL_CHUNK_OVERLAP = 100
+LOCAL_INDEX_CAPACITY = 32
+LOCAL_EMBEDDING_MODEL = os.environ.get("SOW_LOCAL_EMBEDDING_MODEL") or None
+EMBEDDING_WEIGHT = 0.5
+# BM25 term frequency saturation and length normalisation
+BM25_K1 = 1.2
+BM25_B = 0.75
+# BM25 score mapped to a similarity of 0.5. On benchmarks/corpus the best chunk of each section
+# present scores 2-9 for its search query (0.4-0.75, above every policy's min_score), while a
+# chunk matching one common query term scores about 1 (0.25).
+BM25_SATURATION = 3.0
+# Section name of text before the first heading
+LEADING_SECTION = "Header"
+# Longest line treated as a heading
+HEADING_MAX_WORDS = 10
+
+# Heading terms count this many times in their chunks, as a search service boosts a title field
+HEADING_WEIGHT = 2
+
+# Words that carry no content, including the phrasing of the configs' search queries ("Retrieve all ... related sections")
+STOPWORDS = frozenset("""
+a all an and any are as at be by could for from has have if in include including into is it its of on
+or related retrieve section sections such that the their them then there these this to under was were
+will with within without
+""".split())
+
+MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+(.+)$")
+NUMBERED_HEADING = re.compile(r"^(?:section\s+|article\s+)?\d+(?:\.\d+)*[.)]?\s+([A-Za-z].*)$", re.IGNORECASE)
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+
+def stem(term):
+    """Light suffix stripping so "payments", "payment" and "paying" share a term"""
+    for suffix, replacement in (("ies", "y"), ("ations", "ate"), ("ation", "ate"), ("ments", "ment"),
+                                ("ings", ""), ("ing", ""), ("es", ""), ("s", ""), ("ed", "")):
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)] + replacement
+    return term
+
+
+def tokenize(text):
+    return [stem(term) for term in re.findall(r"[a-z0-9]+", text.lower()) if term not in STOPWORDS and len(term) > 1]
+
+
+def extract_text(file_name, file_bytes):
+    """Plain text of a PDF, DOCX or text document"""
+    extension = os.path.splitext(file_name.lower())[1]
+    if extension == ".pdf":
+        from PyPDF2 import PdfReader
+        return "\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(file_bytes)).pages)
+    if extension == ".docx":
+        from docx import Document
+        return "\n".join(paragraph.text for paragraph in Document(io.BytesIO(file_bytes)).paragraphs)
+    return file_bytes.decode("utf-8", errors="replace")
+
+
+def heading_name(line, known_sections):
+    """The section name if line is a heading, else None"""
+    line = line.strip()
+    if not line or len(line.split()) > HEADING_MAX_WORDS:
+        return None
+    match = MARKDOWN_HEADING.match(line) or NUMBERED_HEADING.match(line)
+    name = (match.group(1) if match else line).strip().rstrip(":").strip()
+    if not name or name.endswith((".", ",", ";")):
+        return None
+    if match or name.lower() in known_sections:
+        return name
+    letters = [character for character in name if character.isalpha()]
+    if len(letters) > 3 and all(character.isupper() for character in letters):
+        return name.title()
+    return None
+
+
+def split_sections(text, known_sections=()):
+    """[(section name, text)] in document order; text before the first heading is LEADING_SECTION"""
+    known = {section_name.lower() for section_name in known_sections}
+    sections = [[LEADING_SECTION, []]]
+    for line in text.splitlines():
+        name = heading_name(line, known)
+        if name is not None:
+            sections.append([name, []])
+        else:
+            sections[-1][1].append(line)
+    return [(name, "\n".join(lines).strip()) for name, lines in sections if "".join(lines).strip()]
+
+
+def split_text(text, size=LOCAL_CHUNK_SIZE, overlap=LOCAL_CHUNK_OVERLAP, separators=SEPARATORS):
+    """Recursive character splitting, as SPLIT_TEXT_RECURSIVE_CHARACTER does: chunks of at most size characters"""
+    if len(text) <= size:
+        return [text] if text.strip() else []
+    separator = next((separator for separator in separators if separator in text), "")
+    pieces = text.split(separator) if separator else list(text)
+    chunks, current = [], ""
+    for piece in pieces:
+        if len(piece) > size:
+            if current.strip():
+                chunks.append(current)
+            chunks.extend(split_text(piece, size, overlap, separators[separators.index(separator) + 1:] if separator else ()))
+            current = ""
+            continue
+        candidate = current + separator + piece if current else piece
+        if len(candidate) <= size:
+            current = candidate
+            continue
+        chunks.append(current)
+        # Start the next chunk with the tail of this one
+        tail = current[-overlap:] if overlap else ""
+        current = (tail + separator + piece) if tail and len(tail) + len(separator) + len(piece) <= size else piece
+    if current.strip():
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+_embedding_models = {}
+_embedding_lock = threading.Lock()
+
+
+def embed(texts, model_name=LOCAL_EMBEDDING_MODEL):
+    """Unit-length embeddings of texts from a local sentence-transformers model (loaded once per process)"""
+    from sentence_transformers import SentenceTransformer
+
+    with _embedding_lock:
+        model = _embedding_models.get(model_name)
+        if model is None:
+            model = _embedding_models[model_name] = SentenceTransformer(model_name)
+    return [list(vector) for vector in model.encode(texts, normalize_embeddings=True)]
+
+
+class LocalIndex:
+    """BM25 inverted index over (section name, chunk) pairs, optionally with chunk embeddings"""
+
+    def __init__(self, chunks, embedding_model=LOCAL_EMBEDDING_MODEL):
+        self.chunks = chunks
+        self.postings = {}
+        self.lengths = []
+        for chunk_id, (section_name, chunk) in enumerate(chunks):
+            # The heading is indexed with each of its chunks
+            terms = Counter(tokenize(chunk))
+            for term in tokenize(section_name):
+                terms[term] += HEADING_WEIGHT
+            self.lengths.append(sum(terms.values()))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, []).append((chunk_id, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.idf = {
+            term: math.log(1 + (len(chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        self.embedding_model = embedding_model
+        self.embeddings = embed([chunk for _, chunk in chunks], embedding_model) if embedding_model and chunks else None
+
+    def section_names(self):
+        return sorted({section_name for section_name, _ in self.chunks})
+
+    def bm25_scores(self, query):
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for chunk_id, frequency in self.postings[term]:
+                length_norm = 1 - BM25_B + BM25_B * self.lengths[chunk_id] / self.average_length
+                scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+        return scores
+
+    def search(self, query, limit, score_field="cosine_similarity"):
+        """Top limit chunks as Cortex Search result dicts ("chunk", "section_name", "@scores")"""
+        relevance = {
+            chunk_id: score / (score + BM25_SATURATION) for chunk_id, score in self.bm25_scores(query).items()
+        }
+        if self.embeddings is not None:
+            query_vector = embed([query], self.embedding_model)[0]
+            relevance = {
+                chunk_id: (1 - EMBEDDING_WEIGHT) * relevance.get(chunk_id, 0.0)
+                + EMBEDDING_WEIGHT * sum(a * b for a, b in zip(query_vector, vector))
+                for chunk_id, vector in enumerate(self.embeddings)
+            }
+        top = heapq.nlargest(limit, relevance.items(), key=lambda item: (item[1], -item[0]))
+        return [
+            {"chunk": self.chunks[chunk_id][1], "section_name": self.chunks[chunk_id][0],
+             "@scores": {score_field: round(score, 4)}}
+            for chunk_id, score in top
+        ]
+
+
+def index_document(file_name, file_bytes, known_sections=()):
+    """LocalIndex of a document's sections, chunked"""
+    chunks = [
+        (section_name, chunk)
+        for section_name, text in split_sections(extract_text(file_name, file_bytes), known_sections)
+        for chunk in split_text(text)
+    ]
+    index = LocalIndex(chunks)
+    logger.info("Indexed %s locally: %d sections, %d chunks", file_name, len(index.section_names()), len(chunks))
+    return index
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def register_index(document, index):
+    """Make index the one searches of document use, dropping the least recently used beyond LOCAL_INDEX_CAPACITY"""
+    with _indexes_lock:
+        _indexes[document] = index
+        _indexes.move_to_end(document)
+        while len(_indexes) > LOCAL_INDEX_CAPACITY:
+            _indexes.popitem(last=False)
+
+
+def get_index(document):
+    """The local index of document, or None if it is not indexed in this process"""
+    with _indexes_lock:
+        index = _indexes.get(document)
+        if index is not None:
+            _indexes.move_to_end(document)
+        return index
@@ -0,0 +1,184 @@
+"""
+Master Services Agreements shared by the SOWs written under them.
+
+Several validation questions ask whether a value (supplier name, client name, MSA start date,
+payment terms) is consistent with other contract documents, but only the SOW is indexed. An
+MSA is registered once:
+
+  1. It is staged like any document (content-addressed, recorded in the stage manifest).
+  2. Cortex PARSE_DOCUMENT extracts its text, which SPLIT_TEXT_RECURSIVE_CHARACTER chunks.
+  3. One Complete call extracts its key terms (KEY_TERMS).
+
+The MSA, its key terms and chunks are saved in the run store under the MSA's digest, so the
+same file is never processed twice. A SOW validated under the MSA loads it with one lookup,
+cached for the life of the process. Cross-document sections then get the key terms and the
+best-matching MSA excerpts in their prompts (sow_validation_engine.msa_reference_context).
+MSA chunks are not added to the Cortex Search Service, which holds one SOW at a time.
+
+    python sow_msa.py register "Acme MSA.pdf" --connection my_conn
+    python sow_msa.py list --connection my_conn
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+from datetime import datetime, timezone
+
+import sow_cortex
+import sow_run_store
+from sow_stage import sql_string
+from sow_validation_engine import (
+    LARGE_MODEL_ROUTING,
+    SOW_STAGE,
+    complete_with_routing,
+    stage_document,
+)
+
+logger = logging.getLogger(__name__)
+
+# Key terms extracted from every MSA, with what the extraction prompt asks for
+KEY_TERMS = {
+    "supplier_name": "Legal name of the supplier / service provider",
+    "client_name": "Legal name of the client / customer",
+    "msa_effective_date": "Effective date (start date) of the MSA",
+    "msa_end_date": "Expiry or end date of the MSA, if stated",
+    "payment_terms": "Payment terms, e.g. the number of days after invoice",
+    "governing_law": "Governing law / jurisdiction",
+    "msa_reference": "Title, number or other identifier of the agreement",
+}
+MSA_CHUNK_SIZE = 1800
+MSA_CHUNK_OVERLAP = 200
+# Characters of MSA text sent to key term extraction; key terms sit in the opening pages and definitions
+KEY_TERMS_PROMPT_CHARACTERS = 40000
+
+# Registered MSAs loaded by this process, {msa_id: msa}; an MSA never changes once registered
+_msa_cache = {}
+_msa_cache_lock = threading.Lock()
+
+
+def extract_msa_chunks(session, staged_file, stage_name=SOW_STAGE, call_stats=None):
+    """Text chunks of a staged MSA, in document order"""
+    rows = sow_cortex.call_cortex(
+        "index",
+        lambda: session.sql(f"""
+            SELECT chunk.value::VARCHAR AS CHUNK
+            FROM LATERAL FLATTEN(SNOWFLAKE.CORTEX.SPLIT_TEXT_RECURSIVE_CHARACTER(
+                SNOWFLAKE.CORTEX.PARSE_DOCUMENT({stage_name}, '{sql_string(staged_file)}', {{'mode': 'LAYOUT'}}):content::VARCHAR,
+                'markdown', {MSA_CHUNK_SIZE}, {MSA_CHUNK_OVERLAP}
+            )) chunk
+            ORDER BY chunk.index
+        """).collect(),
+        call_stats=call_stats
+    )
+    return [row["CHUNK"] for row in rows if row["CHUNK"]]
+
+
+def build_key_terms_prompt(chunks):
+    msa_text = ""
+    for chunk in chunks:
+        if len(msa_text) + len(chunk) > KEY_TERMS_PROMPT_CHARACTERS:
+            break
+        msa_text += chunk + "\n\n"
+    terms = "\n".join(f'    "{term}": "{description}"' for term, description in KEY_TERMS.items())
+    return f"""You are an expert contract reviewer. Extract the key terms of this Master Services Agreement (MSA).
+
+MSA TEXT:
+{msa_text}
+
+Return the value of each term exactly as written in the MSA, or null if the MSA does not state it:
+{terms}
+
+REQUIRED JSON FORMAT (respond with ONLY this JSON, no other text):
+{{"key_terms": {{{", ".join(f'"{term}": "..."' for term in KEY_TERMS)}}}}}
+
+JSON ONLY - NO OTHER TEXT:"""
+
+
+def check_key_terms_result(result):
+    """Schema problems in a parsed key terms result (empty if usable)"""
+    if not isinstance(result, dict) or not isinstance(result.get("key_terms"), dict):
+        return ["missing 'key_terms' object"]
+    return []
+
+
+def extract_key_terms(session, chunks, call_stats=None):
+    """{term: value or None} for every KEY_TERMS term"""
+    _, result, _, _ = complete_with_routing(
+        session, build_key_terms_prompt(chunks), LARGE_MODEL_ROUTING, check_key_terms_result, call_stats=call_stats
+    )
+    key_terms = (result or {}).get("key_terms") or {}
+    return {term: key_terms.get(term) or None for term in KEY_TERMS}
+
+
+def _remember(msa):
+    with _msa_cache_lock:
+        _msa_cache[msa["msa_id"]] = msa
+    return msa
+
+
+def register_msa(session, store, file_name, file_bytes, stage_name=SOW_STAGE, call_stats=None):
+    """
+    Register an MSA and return it as {msa_id, msa_name, staged_file, key_terms, chunks, created_at}.
+    An MSA registered before (same bytes) is returned from the store without being processed again.
+    """
+    msa_id = sow_run_store.document_digest(file_bytes)
+    msa = load_msa(store, msa_id)
+    if msa is not None:
+        return msa
+
+    staged_file = stage_document(session, file_name, file_bytes, stage_name, store)
+    chunks = extract_msa_chunks(session, staged_file, stage_name, call_stats)
+    if not chunks:
+        raise ValueError(f"No text could be extracted from {file_name}")
+    msa = {
+        "msa_id": msa_id,
+        "msa_name": file_name,
+        "staged_file": staged_file,
+        "key_terms": extract_key_terms(session, chunks, call_stats),
+        "chunks": chunks,
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"),
+    }
+    store.save_msa(msa)
+    logger.info("Registered MSA %s (%d chunks)", file_name, len(chunks))
+    return _remember(msa)
+
+
+def load_msa(store, msa_id):
+    """A registered MSA by id, from the process cache or the store; None if it is not registered"""
+    with _msa_cache_lock:
+        msa = _msa_cache.get(msa_id)
+    if msa is not None:
+        return msa
+    msa = store.load_msa(msa_id)
+    return _remember(msa) if msa is not None else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Register the MSAs SOWs are validated against")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register_parser = commands.add_parser("register", help="Extract and store an MSA's key terms and chunks")
+    register_parser.add_argument("path", help="MSA PDF/DOCX")
+    register_parser.add_argument("--stage", default=SOW_STAGE)
+    commands.add_parser("list", help="List registered MSAs")
+    for command_parser in commands.choices.values():
+        command_parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from sow_validation_cli import create_session
+    session = create_session(args.connection)
+    store = sow_run_store.open_run_store(session)
+    if args.command == "register":
+        with open(args.path, "rb") as f:
+            file_bytes = f.read()
+        msa = register_msa(session, store, args.path.replace("\\", "/").split("/")[-1], file_bytes, args.stage)
+        print(json.dumps({"msa_id": msa["msa_id"], "chunks": len(msa["chunks"]), "key_terms": msa["key_terms"]}, indent=2))
+    else:
+        for row in store.list_msas():
+            print(f"{row['MSA_ID']}  {row['CREATED_AT']}  {row['MSA_NAME']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
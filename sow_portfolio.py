@@ -0,0 +1,269 @@
+"""
+Portfolio analytics over stored validation runs.
+
+Every question is answered in SQL, grouped and counted where the runs are stored; Python only
+formats the result. A document's supplier is the supplier name of the MSA it was checked
+against, else the supplier name its type identification read from the SOW's Header (NO_SUPPLIER
+if neither is known). Each document counts once: the latest run of its document family and
+supplier. The family alone comes from the file name, so keying on the supplier too keeps
+unrelated SOWs with the same file name (say "SOW.pdf") apart.
+
+In Snowflake two dynamic tables materialise the grain the dashboard groups further:
+
+  SOW_PORTFOLIO_RUNS          latest run per document family and supplier, with its SOW type and month
+  SOW_PORTFOLIO_RUN_SECTIONS  issue counts by severity per (run, section)
+
+Both refresh incrementally (REFRESH_MODE = INCREMENTAL): a new run only touches its own family's
+and its own issues' rows. The section table has a target lag of PORTFOLIO_TARGET_LAG and the runs
+table refreshes with it, so the two always agree. Dashboard queries group a few rows per
+document instead of scanning the issue table. With the SQLite run store the same queries run over
+the two relations computed inline.
+
+    python sow_portfolio.py --create --connection my_conn [--warehouse WH] [--target-lag "15 minutes"]
+    python sow_portfolio.py --refresh --connection my_conn
+    python sow_portfolio.py --connection my_conn                 # print the section and supplier tables
+"""
+import argparse
+import logging
+import os
+import sys
+
+from sow_run_store import ISSUES_TABLE, MSA_TABLE, RUNS_TABLE, SQLiteRunStore
+
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_RUNS_TABLE = "SOW_PORTFOLIO_RUNS"
+PORTFOLIO_SECTIONS_TABLE = "SOW_PORTFOLIO_RUN_SECTIONS"
+PORTFOLIO_TARGET_LAG = os.environ.get("SOW_PORTFOLIO_TARGET_LAG", "15 minutes")
+NO_SUPPLIER = "Unknown supplier"
+# Columns the dashboard can group documents by
+GROUP_DIMENSIONS = ("SUPPLIER", "SOW_TYPE", "MONTH")
+
+# Supplier name from the MSA's key terms and from the SOW's type identification result, and the
+# first day of the run's month, per SQL dialect
+DIALECTS = {
+    "snowflake": {
+        "msa_supplier": "PARSE_JSON(m.KEY_TERMS):supplier_name::VARCHAR",
+        "sow_supplier": "PARSE_JSON(r.SOW_TYPE_RESULT):supplier_name::VARCHAR",
+        "month": "DATE_TRUNC('MONTH', r.CREATED_AT)::DATE",
+    },
+    "sqlite": {
+        "msa_supplier": "json_extract(m.KEY_TERMS, '$.supplier_name')",
+        "sow_supplier": "json_extract(r.SOW_TYPE_RESULT, '$.supplier_name')",
+        "month": "substr(r.CREATED_AT, 1, 7) || '-01'",
+    },
+}
+
+
+def latest_runs_sql(dialect):
+    """One row per document family and supplier: its latest run with the dimensions the dashboard filters on"""
+    expressions = DIALECTS[dialect]
+    return f"""
+        SELECT RUN_ID, DOCUMENT_FAMILY, DOCUMENT_NAME, SOW_TYPE, SUPPLIER, MONTH, CREATED_AT
+        FROM (
+            SELECT RUN_ID, DOCUMENT_FAMILY, DOCUMENT_NAME, SOW_TYPE, SUPPLIER, MONTH, CREATED_AT,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY DOCUMENT_FAMILY, UPPER(TRIM(SUPPLIER)) ORDER BY CREATED_AT DESC, RUN_ID DESC
+                   ) AS VERSION_RANK
+            FROM (
+                SELECT r.RUN_ID, COALESCE(r.DOCUMENT_FAMILY, r.DOCUMENT_DIGEST) AS DOCUMENT_FAMILY, r.DOCUMENT_NAME,
+                       r.SOW_TYPE,
+                       COALESCE({expressions['msa_supplier']}, {expressions['sow_supplier']}, '{NO_SUPPLIER}') AS SUPPLIER,
+                       {expressions['month']} AS MONTH, r.CREATED_AT
+                FROM {RUNS_TABLE} r
+                LEFT JOIN {MSA_TABLE} m ON m.MSA_ID = r.MSA_ID
+            )
+        )
+        WHERE VERSION_RANK = 1
+    """
+
+
+def run_sections_sql(runs):
+    """Issue counts by severity per (run, section) of the latest runs; sections without issues have no row"""
+    return f"""
+        SELECT r.RUN_ID, r.SOW_TYPE, r.SUPPLIER, r.MONTH, i.SECTION,
+               COUNT(*) AS ISSUES,
+               SUM(CASE WHEN LOWER(i.SEVERITY) = 'high' THEN 1 ELSE 0 END) AS HIGH_ISSUES,
+               SUM(CASE WHEN LOWER(i.SEVERITY) = 'medium' THEN 1 ELSE 0 END) AS MEDIUM_ISSUES,
+               SUM(CASE WHEN LOWER(i.SEVERITY) = 'low' THEN 1 ELSE 0 END) AS LOW_ISSUES
+        FROM {runs} r
+        JOIN {ISSUES_TABLE} i ON i.RUN_ID = r.RUN_ID
+        GROUP BY r.RUN_ID, r.SOW_TYPE, r.SUPPLIER, r.MONTH, i.SECTION
+    """
+
+
+def _filters(alias="", sow_types=None, suppliers=None, since=None):
+    """(WHERE clause, params) for the dashboard filters; since is the first month included"""
+    clauses, params = [], []
+    if sow_types:
+        clauses.append(f"{alias}SOW_TYPE IN ({', '.join('?' * len(sow_types))})")
+        params.extend(sow_types)
+    if suppliers:
+        clauses.append(f"{alias}SUPPLIER IN ({', '.join('?' * len(suppliers))})")
+        params.extend(suppliers)
+    if since:
+        clauses.append(f"{alias}MONTH >= ?")
+        params.append(str(since))
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+class Portfolio:
+    """Dashboard queries over the latest-run and run-section relations of a run store"""
+
+    def __init__(self, store, runs, run_sections):
+        self.store = store
+        self.runs = runs
+        self.run_sections = run_sections
+
+    def filter_values(self):
+        """{"SOW_TYPE": [...], "SUPPLIER": [...]} present in the portfolio"""
+        return {
+            column: [row["VALUE"] for row in self.store.query(
+                f"SELECT DISTINCT {column} AS VALUE FROM {self.runs} WHERE {column} IS NOT NULL ORDER BY VALUE"
+            )]
+            for column in ("SOW_TYPE", "SUPPLIER")
+        }
+
+    def totals(self, sow_types=None, suppliers=None, since=None):
+        """Documents, issues by severity and documents with a high-severity issue"""
+        where, params = _filters("r.", sow_types, suppliers, since)
+        return self.store.query(f"""
+            SELECT COUNT(*) AS DOCUMENTS,
+                   COALESCE(SUM(s.ISSUES), 0) AS ISSUES,
+                   COALESCE(SUM(s.HIGH_ISSUES), 0) AS HIGH_ISSUES,
+                   COALESCE(SUM(s.MEDIUM_ISSUES), 0) AS MEDIUM_ISSUES,
+                   COALESCE(SUM(s.LOW_ISSUES), 0) AS LOW_ISSUES,
+                   COALESCE(SUM(CASE WHEN s.HIGH_ISSUES > 0 THEN 1 ELSE 0 END), 0) AS DOCUMENTS_WITH_HIGH
+            FROM {self.runs} r
+            LEFT JOIN (
+                SELECT RUN_ID, SUM(ISSUES) AS ISSUES, SUM(HIGH_ISSUES) AS HIGH_ISSUES,
+                       SUM(MEDIUM_ISSUES) AS MEDIUM_ISSUES, SUM(LOW_ISSUES) AS LOW_ISSUES
+                FROM {self.run_sections} GROUP BY RUN_ID
+            ) s ON s.RUN_ID = r.RUN_ID
+            {where}
+        """, params)[0]
+
+    def section_stats(self, sow_types=None, suppliers=None, since=None):
+        """
+        Per section: documents with issues, documents with a high-severity issue (and their share of
+        all documents), issues by severity. Sections most often high-severity first.
+        """
+        where, params = _filters("", sow_types, suppliers, since)
+        return self.store.query(f"""
+            SELECT s.SECTION,
+                   SUM(CASE WHEN s.HIGH_ISSUES > 0 THEN 1 ELSE 0 END) AS DOCUMENTS_WITH_HIGH,
+                   ROUND(100.0 * SUM(CASE WHEN s.HIGH_ISSUES > 0 THEN 1 ELSE 0 END) / MAX(t.DOCUMENTS), 1) AS HIGH_PERCENT,
+                   COUNT(*) AS DOCUMENTS_WITH_ISSUES,
+                   SUM(s.ISSUES) AS ISSUES,
+                   SUM(s.HIGH_ISSUES) AS HIGH_ISSUES,
+                   SUM(s.MEDIUM_ISSUES) AS MEDIUM_ISSUES,
+                   SUM(s.LOW_ISSUES) AS LOW_ISSUES
+            FROM (SELECT * FROM {self.run_sections} {where}) s
+            CROSS JOIN (SELECT COUNT(*) AS DOCUMENTS FROM {self.runs} {where}) t
+            GROUP BY s.SECTION
+            ORDER BY DOCUMENTS_WITH_HIGH DESC, ISSUES DESC, s.SECTION
+        """, params + params)
+
+    def group_stats(self, dimension, sow_types=None, suppliers=None, since=None):
+        """Per supplier, SOW type or month: documents, issues per document and high-severity counts"""
+        if dimension not in GROUP_DIMENSIONS:
+            raise ValueError(f"Cannot group by {dimension}; expected one of {GROUP_DIMENSIONS}")
+        where, params = _filters("r.", sow_types, suppliers, since)
+        order = "r.MONTH" if dimension == "MONTH" else "DOCUMENTS DESC, r." + dimension
+        return self.store.query(f"""
+            SELECT r.{dimension},
+                   COUNT(*) AS DOCUMENTS,
+                   ROUND(1.0 * COALESCE(SUM(s.ISSUES), 0) / COUNT(*), 2) AS ISSUES_PER_DOCUMENT,
+                   SUM(CASE WHEN s.HIGH_ISSUES > 0 THEN 1 ELSE 0 END) AS DOCUMENTS_WITH_HIGH,
+                   ROUND(100.0 * SUM(CASE WHEN s.HIGH_ISSUES > 0 THEN 1 ELSE 0 END) / COUNT(*), 1) AS HIGH_PERCENT,
+                   COALESCE(SUM(s.HIGH_ISSUES), 0) AS HIGH_ISSUES,
+                   COALESCE(SUM(s.MEDIUM_ISSUES), 0) AS MEDIUM_ISSUES,
+                   COALESCE(SUM(s.LOW_ISSUES), 0) AS LOW_ISSUES
+            FROM {self.runs} r
+            LEFT JOIN (
+                SELECT RUN_ID, SUM(ISSUES) AS ISSUES, SUM(HIGH_ISSUES) AS HIGH_ISSUES,
+                       SUM(MEDIUM_ISSUES) AS MEDIUM_ISSUES, SUM(LOW_ISSUES) AS LOW_ISSUES
+                FROM {self.run_sections} GROUP BY RUN_ID
+            ) s ON s.RUN_ID = r.RUN_ID
+            {where}
+            GROUP BY r.{dimension}
+            ORDER BY {order}
+        """, params)
+
+    def refreshed_at(self):
+        """When the materialised tables were last refreshed; None when they are computed inline"""
+        if isinstance(self.store, SQLiteRunStore):
+            return None
+        rows = self.store.query(f"SHOW DYNAMIC TABLES LIKE '{PORTFOLIO_SECTIONS_TABLE}'")
+        return rows[0].get("data_timestamp") if rows else None
+
+
+def open_portfolio(store):
+    """Portfolio of a run store: the dynamic tables in Snowflake, inline relations in SQLite"""
+    if isinstance(store, SQLiteRunStore):
+        runs = f"({latest_runs_sql('sqlite')})"
+        return Portfolio(store, runs, f"({run_sections_sql(runs)})")
+    return Portfolio(store, PORTFOLIO_RUNS_TABLE, PORTFOLIO_SECTIONS_TABLE)
+
+
+def create_portfolio_tables(session, warehouse=None, target_lag=PORTFOLIO_TARGET_LAG, refresh_mode="INCREMENTAL"):
+    """
+    Create (or replace) the two dynamic tables. The runs table refreshes whenever the section
+    table does (TARGET_LAG = DOWNSTREAM). Creation fails, rather than silently falling back to
+    full refreshes, if Snowflake cannot refresh them incrementally; pass refresh_mode="AUTO" to allow it.
+    """
+    warehouse = warehouse or session.get_current_warehouse()
+    for name, lag, query in (
+        (PORTFOLIO_RUNS_TABLE, "DOWNSTREAM", latest_runs_sql("snowflake")),
+        (PORTFOLIO_SECTIONS_TABLE, f"'{target_lag}'", run_sections_sql(PORTFOLIO_RUNS_TABLE)),
+    ):
+        session.sql(f"""
+            CREATE OR REPLACE DYNAMIC TABLE {name}
+                TARGET_LAG = {lag}
+                WAREHOUSE = {warehouse}
+                REFRESH_MODE = {refresh_mode}
+            AS {query}
+        """).collect()
+        logger.info("Created dynamic table %s", name)
+
+
+def refresh_portfolio(session):
+    """Refresh now instead of waiting for the target lag; refreshing the section table refreshes the runs table first"""
+    session.sql(f"ALTER DYNAMIC TABLE {PORTFOLIO_SECTIONS_TABLE} REFRESH").collect()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Portfolio analytics over stored validation runs")
+    parser.add_argument("--create", action="store_true", help="Create the portfolio dynamic tables")
+    parser.add_argument("--refresh", action="store_true", help="Refresh the portfolio dynamic tables now")
+    parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    parser.add_argument("--warehouse", help="Warehouse that refreshes the dynamic tables (default: the connection's)")
+    parser.add_argument("--target-lag", default=PORTFOLIO_TARGET_LAG, help="How stale the dashboard may be")
+    parser.add_argument("--refresh-mode", default="INCREMENTAL", choices=["INCREMENTAL", "AUTO", "FULL"])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    import sow_run_store
+    from sow_validation_cli import create_session
+
+    session = create_session(args.connection)
+    if args.create:
+        create_portfolio_tables(session, args.warehouse, args.target_lag, args.refresh_mode)
+    if args.refresh:
+        refresh_portfolio(session)
+    if not (args.create or args.refresh):
+        portfolio = open_portfolio(sow_run_store.open_run_store(session))
+        totals = portfolio.totals()
+        print(f"{totals['DOCUMENTS']} document(s), {totals['ISSUES']} issue(s), "
+              f"{totals['DOCUMENTS_WITH_HIGH']} with a high-severity issue")
+        print(f"\n{'section':<40} {'docs high':>10} {'% high':>7} {'issues':>7}")
+        for row in portfolio.section_stats():
+            print(f"{row['SECTION']:<40} {row['DOCUMENTS_WITH_HIGH']:>10} {row['HIGH_PERCENT']:>7} {row['ISSUES']:>7}")
+        print(f"\n{'supplier':<40} {'docs':>6} {'issues/doc':>11} {'% high':>7}")
+        for row in portfolio.group_stats("SUPPLIER"):
+            print(f"{row['SUPPLIER']:<40} {row['DOCUMENTS']:>6} {row['ISSUES_PER_DOCUMENT']:>11} {row['HIGH_PERCENT']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+Record and replay the Snowflake and Cortex calls made by the validation pipeline.
+
+    python sow_replay.py record benchmarks/corpus/tm_sample_sow.txt --connection my_conn
+    python sow_replay.py record benchmarks/corpus/tm_sample_sow.txt --fake --sow-type T&M
+    python sow_replay.py replay benchmarks/fixtures/tm_sample_sow.json
+
+Recording wraps a Snowpark session (session.sql and session.file.put, which covers stage
+uploads and listings, the index-build procedure, the section listing and Cortex Search) and
+the Complete backend. Every successful response is saved to a JSON fixture together with how
+long it took. Corpus .txt files are rendered to PDF before upload, with "## " lines as section
+headings. With --fake the responses come from sow_fakes.FakeCortex loaded with the corpus
+text and FAKE_RECORDING_LATENCY, so fixtures can be made without an account.
+
+ReplaySession answers the same calls from a fixture. The random staged file name is replaced by
+a placeholder in the recording and filled back in on replay. Latencies are replayed scaled by
+latency_scale; the default of 0 measures only the pipeline's own overhead. A call missing from
+the fixture raises ReplayMiss and is counted in ReplaySession.misses, because the engine
+swallows search errors.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# Hedged requests would record (and replay) duplicate calls; turn them off before sow_cortex is imported
+os.environ["SOW_HEDGED_REQUESTS"] = "0"
+
+import sow_validation_engine  # noqa: E402
+from sow_fakes import FakeCortex, FakeRow  # noqa: E402
+
+FIXTURE_FORMAT = 1
+DOCUMENT_PLACEHOLDER = "{staged_document}"
+FIXTURES_DIR = os.path.join("benchmarks", "fixtures")
+# Seconds per call kind when recording from the fake, so replayed latencies resemble a live account
+FAKE_RECORDING_LATENCY = {"put": 0.1, "index": 1.0, "search": 0.05, "complete": 0.4}
+
+
+class ReplayMiss(KeyError):
+    """The fixture has no recorded response for a call"""
+
+
+def _normalize(text, staged_document):
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.replace(staged_document, DOCUMENT_PLACEHOLDER) if staged_document else text
+
+
+def call_key(kind, text, staged_document):
+    """Stable key of a call with the staged file name factored out"""
+    return f"{kind}:{hashlib.sha256(_normalize(text, staged_document).encode('utf-8')).hexdigest()[:20]}"
+
+
+def _row_dict(row):
+    return row.as_dict() if hasattr(row, "as_dict") else dict(row)
+
+
+def _factor_out(value, staged_document):
+    """Replace the staged file name in rows or responses with the placeholder"""
+    if not staged_document:
+        return value
+    return json.loads(json.dumps(value, default=str).replace(staged_document, DOCUMENT_PLACEHOLDER))
+
+
+def _fill(value, staged_document):
+    """Put the staged file name back into recorded rows or responses"""
+    return json.loads(json.dumps(value).replace(DOCUMENT_PLACEHOLDER, staged_document or DOCUMENT_PLACEHOLDER))
+
+
+class Cassette:
+    """Recorded calls of one document's validation, in call order"""
+
+    def __init__(self, document, source, sow_type=None, calls=None, report=None, recorded_at=None):
+        self.document = document
+        self.source = source
+        self.sow_type = sow_type
+        self.calls = calls or []
+        self.report = report
+        self.recorded_at = recorded_at
+        self.staged_document = None
+        self._lock = threading.Lock()
+
+    def record(self, kind, key_text, result, seconds):
+        with self._lock:
+            self.calls.append({
+                "kind": kind,
+                "key": call_key(kind, key_text, self.staged_document),
+                "label": _normalize(key_text, self.staged_document)[:100],
+                "result": _factor_out(result, self.staged_document),
+                "seconds": round(seconds, 4),
+            })
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "format": FIXTURE_FORMAT,
+                "document": self.document,
+                "source": self.source,
+                "sow_type": self.sow_type,
+                "recorded_at": self.recorded_at or datetime.now(timezone.utc).isoformat(),
+                "report": self.report,
+                "calls": self.calls,
+            }, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("format") != FIXTURE_FORMAT:
+            raise ValueError(f"{path}: unsupported fixture format {data.get('format')}")
+        return cls(data["document"], data["source"], data.get("sow_type"), data["calls"], data.get("report"),
+                   data.get("recorded_at"))
+
+
+class _RecordedResult:
+    def __init__(self, collect):
+        self._collect = collect
+
+    def collect(self):
+        return self._collect()
+
+
+class _RecordingFileOperation:
+    def __init__(self, recording):
+        self._recording = recording
+
+    def put(self, local_path, stage_location, **kwargs):
+        cassette = self._recording.cassette
+        cassette.staged_document = os.path.basename(local_path)
+        started = time.perf_counter()
+        result = self._recording.session.file.put(local_path, stage_location, **kwargs)
+        cassette.record("put", f"PUT {DOCUMENT_PLACEHOLDER} {stage_location}", [], time.perf_counter() - started)
+        return result
+
+
+class RecordingSession:
+    """Wraps a Snowpark session and records every session.sql and session.file.put result"""
+
+    def __init__(self, session, cassette):
+        self.session = session
+        self.cassette = cassette
+        self.file = _RecordingFileOperation(self)
+
+    def sql(self, query, params=None):
+        def collect():
+            started = time.perf_counter()
+            if params is None:
+                rows = self.session.sql(query).collect()
+            else:
+                rows = self.session.sql(query, params=params).collect()
+            key_text = query + ("" if params is None else json.dumps(params, default=str))
+            self.cassette.record("sql", key_text, [_row_dict(row) for row in rows], time.perf_counter() - started)
+            return rows
+        return _RecordedResult(collect)
+
+    def complete_backend(self, inner):
+        """Complete backend that records inner's responses"""
+        def complete(model, prompt, session=None, **kwargs):
+            started = time.perf_counter()
+            response = inner(model, prompt, session=session, **kwargs)
+            self.cassette.record("complete", f"{model}\n{prompt}", response, time.perf_counter() - started)
+            return response
+        return complete
+
+
+class _ReplayFileOperation:
+    def __init__(self, replay):
+        self._replay = replay
+
+    def put(self, local_path, stage_location, **kwargs):
+        self._replay.staged_document = os.path.basename(local_path)
+        return self._replay.answer("put", f"PUT {DOCUMENT_PLACEHOLDER} {stage_location}")
+
+
+class ReplaySession:
+    """
+    Session (and Complete backend) answering from a Cassette.
+
+    Args:
+        cassette (Cassette): Recorded calls
+        latency_scale (float): Sleep this fraction of each call's recorded duration
+    """
+
+    def __init__(self, cassette, latency_scale=0.0):
+        self.latency_scale = latency_scale
+        self.staged_document = None
+        self.file = _ReplayFileOperation(self)
+        self.misses = []
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._responses = defaultdict(list)
+        for call in cassette.calls:
+            self._responses[call["key"]].append(call)
+        self._next = defaultdict(int)
+
+    def answer(self, kind, key_text):
+        key = call_key(kind, key_text, self.staged_document)
+        with self._lock:
+            self.calls += 1
+            recorded = self._responses.get(key)
+            if not recorded:
+                self.misses.append(_normalize(key_text, self.staged_document)[:100])
+                raise ReplayMiss(f"no recorded {kind} call {key}")
+            # Repeated calls get the recorded responses in order, then the last one again
+            call = recorded[min(self._next[key], len(recorded) - 1)]
+            self._next[key] += 1
+        if self.latency_scale:
+            time.sleep(call["seconds"] * self.latency_scale)
+        return _fill(call["result"], self.staged_document)
+
+    def sql(self, query, params=None):
+        key_text = query + ("" if params is None else json.dumps(params, default=str))
+        return _RecordedResult(lambda: [FakeRow(row) for row in self.answer("sql", key_text)])
+
+    def complete(self, model, prompt, session=None, **kwargs):
+        return self.answer("complete", f"{model}\n{prompt}")
+
+
+def read_corpus(path):
+    """{section heading: text} from a corpus .txt file with "## " headings"""
+    sections = {}
+    heading = None
+    with open(path) as f:
+        for line in f:
+            if line.startswith("## "):
+                heading = line[3:].strip()
+                sections[heading] = ""
+            elif heading is not None and line.strip():
+                sections[heading] = (sections[heading] + " " + line.strip()).strip()
+    return sections
+
+
+def render_corpus_pdf(sections, pdf_path):
+    """Render corpus sections to a PDF with one heading per section"""
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    styles = getSampleStyleSheet()
+    story = []
+    for heading, text in sections.items():
+        story += [Paragraph(heading, styles["Heading2"]), Paragraph(text, styles["Normal"]), Spacer(1, 12)]
+    SimpleDocTemplate(pdf_path).build(story)
+
+
+def record(corpus_path, session, complete, source, sow_type=None, fixture_path=None):
+    """Validate a corpus document through a recording session and save the fixture. Returns the fixture path."""
+    document = os.path.splitext(os.path.basename(corpus_path))[0] + ".pdf"
+    cassette = Cassette(document, source, sow_type)
+    recording = RecordingSession(session, cassette)
+    sow_validation_engine.set_complete_backend(recording.complete_backend(complete))
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, document)
+            if source == "fake":
+                shutil.copyfile(corpus_path, pdf_path)
+            else:
+                render_corpus_pdf(read_corpus(corpus_path), pdf_path)
+            result = sow_validation_engine.validate_document(recording, file_path=pdf_path)
+    finally:
+        sow_validation_engine.set_complete_backend(None)
+    cassette.sow_type = result["sow_type"]
+    cassette.report = _factor_out(result["sow_validation"], cassette.staged_document)
+    fixture_path = fixture_path or os.path.join(FIXTURES_DIR, os.path.splitext(document)[0] + ".json")
+    cassette.save(fixture_path)
+    return fixture_path
+
+
+def replay(fixture_path, latency_scale=0.0):
+    """
+    Validate a fixture's document from its recording.
+    Returns (validate_document record, ReplaySession, whether the issues match the recorded report).
+    """
+    cassette = Cassette.load(fixture_path)
+    session = ReplaySession(cassette, latency_scale)
+    sow_validation_engine.set_complete_backend(session.complete)
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pdf_path = os.path.join(tmpdir, cassette.document)
+            with open(pdf_path, "wb") as f:
+                f.write(b"%PDF-1.4 replayed")
+            result = sow_validation_engine.validate_document(session, file_path=pdf_path)
+    finally:
+        sow_validation_engine.set_complete_backend(None)
+    return result, session, result["sow_validation"] == _fill(cassette.report, session.staged_document)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record pipeline calls to fixtures, or replay a fixture")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="Validate a corpus document and save its calls")
+    record_parser.add_argument("corpus", nargs="+", help="Corpus .txt files")
+    record_parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    record_parser.add_argument("--fake", action="store_true", help="Record from sow_fakes.FakeCortex instead of Snowflake")
+    record_parser.add_argument("--sow-type", default="T&M", help="SOW type the fake answers (with --fake)")
+    record_parser.add_argument("--output-dir", default=FIXTURES_DIR)
+    replay_parser = commands.add_parser("replay", help="Validate from a fixture and report misses")
+    replay_parser.add_argument("fixture", nargs="+")
+    replay_parser.add_argument("--latency-scale", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.command == "record":
+        for corpus_path in args.corpus:
+            fixture_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(corpus_path))[0] + ".json")
+            if args.fake:
+                fake = FakeCortex(
+                    sow_type=args.sow_type, section_text=read_corpus(corpus_path), latency=FAKE_RECORDING_LATENCY.get
+                )
+                record(corpus_path, fake.session(), fake.complete, "fake", fixture_path=fixture_path)
+            else:
+                from snowflake.cortex import Complete
+                from sow_validation_cli import create_session
+                record(corpus_path, create_session(args.connection), Complete, "snowflake", fixture_path=fixture_path)
+            print(f"Recorded {corpus_path} -> {fixture_path}")
+        return 0
+
+    failures = 0
+    for fixture_path in args.fixture:
+        result, session, matches = replay(fixture_path, args.latency_scale)
+        print(f"{fixture_path}: {session.calls} calls replayed, {len(session.misses)} missing, "
+              f"{len(result['sow_validation'])} issues ({'matches' if matches else 'DIFFERS from'} the recording)")
+        for miss in session.misses[:5]:
+            print(f"  missing: {miss}")
+        failures += bool(session.misses) or not matches
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Report export benchmark.
+
+    python sow_report_benchmark.py [--issues 50 200 500 1000] [--repeat 3] [--json results.json]
+
+Builds synthetic reports over the T&M sections with N issues each (descriptions and resolutions
+the length the validation prompt produces, markup characters included) and times, per format:
+
+  render  sow_reports.render_pdf / render_xlsx from scratch (median of --repeat)
+  cached  sow_reports.ReportCache.get for a report already rendered, what every download after
+          the first costs
+
+and reports the rendered size.
+"""
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+
+from sow_reports import RENDERERS, ReportCache, build_report
+from sow_validation_engine import get_validation_config_by_sow_type
+
+WORDS = ("the supplier shall provide deliverables milestone rate card invoice payment within days of "
+         "acceptance criteria <signature> & \"client\" approval term start date end date resource").split()
+
+
+def synthetic_report(issue_count, rng):
+    sections = list(get_validation_config_by_sow_type("T&M"))
+    issues = [
+        {
+            "section": rng.choice(sections),
+            "issue_number": i + 1,
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))).capitalize() + ".",
+            "severity": rng.choice(("high", "medium", "low")),
+            "suggested_resolution": " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 30))).capitalize() + ".",
+            "model": rng.choice(("llama3.1-70b", "openai-gpt-4.1")),
+        }
+        for i in range(issue_count)
+    ]
+    return build_report(f"Benchmark SOW {issue_count}.pdf", "T&M", sections, {"sow_validation": issues})
+
+
+def bench(issue_count, repeat, seed):
+    report = synthetic_report(issue_count, random.Random(seed))
+    results = []
+    for report_format, render in RENDERERS.items():
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = render(report)
+            samples.append((time.perf_counter() - started) * 1000)
+        cache = ReportCache()
+        cache.get(report, report_format)
+        started = time.perf_counter()
+        cache.get(report, report_format)
+        cached_ms = (time.perf_counter() - started) * 1000
+        results.append({
+            "issues": issue_count, "format": report_format, "render_ms": round(statistics.median(samples), 1),
+            "cached_ms": round(cached_ms, 3), "kilobytes": round(len(data) / 1024, 1),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time PDF/XLSX report rendering as reports grow")
+    parser.add_argument("--issues", type=int, nargs="+", default=[50, 200, 500, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    print(f"{'issues':>7} {'format':<6} {'render ms':>10} {'cached ms':>10} {'KB':>8}")
+    for issue_count in args.issues:
+        for result in bench(issue_count, args.repeat, args.seed):
+            results.append(result)
+            print(f"{issue_count:>7} {result['format']:<6} {result['render_ms']:>10} "
+                  f"{result['cached_ms']:>10} {result['kilobytes']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Downloadable validation reports, as PDF (reportlab) and XLSX (openpyxl).
+
+A report is built from the run's validation_output and its per-section summaries: severity
+counts, then per section its issue count, highest severity, combined resolution and models,
+then every issue. build_report() collects those into one plain dict. Its digest is the content
+hash of everything the report shows. get_report() renders a format on first request and keeps
+the bytes in a process-wide LRU keyed by (digest, format), so downloads by this or any other
+session of the same run are served without rendering again. The app streams them from an
+in-memory buffer.
+
+    python sow_report_benchmark.py --issues 100 500 1000   # render times as reports grow
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+logger = logging.getLogger(__name__)
+
+# {format: (label, file extension, MIME type)}
+REPORT_FORMATS = {
+    "pdf": ("PDF", "pdf", "application/pdf"),
+    "xlsx": ("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+SEVERITIES = ("high", "medium", "low")
+# Rendered bytes kept across sessions before the least recently downloaded report is dropped
+REPORT_CACHE_BYTES = int(os.environ.get("SOW_REPORT_CACHE_MB", "64")) * 1024 * 1024
+# The PDF lays issues out as tables of this many rows: reportlab re-measures every remaining row
+# of a table each time it splits it across a page, which grows quadratically with one long table
+PDF_ROWS_PER_TABLE = 25
+# A section's combined resolution in the PDF section table; every resolution is in the issue table
+PDF_SECTION_RESOLUTION_CHARACTERS = 600
+# Longest text an Excel cell holds
+XLSX_CELL_CHARACTERS = 32767
+
+
+def highest_severity(issues):
+    severities = {(issue.get("severity") or "").lower() for issue in issues}
+    return next((severity for severity in SEVERITIES if severity in severities), None)
+
+
+def section_summary(section_name, issues, carried_from=None, model=None):
+    """
+    The per-section summary the report shows, as the app's section expander does. model is the
+    model that validated the section; without one, the models of its issues are shown.
+    """
+    resolutions = []
+    for issue in issues:
+        resolution = issue.get("suggested_resolution")
+        if resolution and resolution not in resolutions:
+            resolutions.append(resolution)
+    return {
+        "section": section_name,
+        "issues": len(issues),
+        "highest_severity": highest_severity(issues),
+        "resolution": " ".join(resolutions),
+        "models": [model] if model else sorted({issue.get("model") for issue in issues if issue.get("model")}),
+        "carried_from": carried_from,
+    }
+
+
+def build_report(document_name, sow_type, categories, validation_output, carried_sections=None, msa_id=None,
+                 config_version=None, section_models=None):
+    """
+    Everything a report shows, with its digest. Sections follow categories (config order);
+    issues of a section missing from categories are reported after them. section_models maps
+    sections to the model that validated them.
+    """
+    issues = validation_output.get("sow_validation", []) if validation_output else []
+    carried_sections = carried_sections or {}
+    section_models = section_models or {}
+    section_names = list(categories)
+    section_names += [name for name in dict.fromkeys(issue.get("section") for issue in issues)
+                      if name not in section_names]
+    issues_by_section = {section_name: [] for section_name in section_names}
+    for issue in issues:
+        issues_by_section[issue.get("section")].append(issue)
+
+    report = {
+        "document_name": document_name or "Uploaded SOW",
+        "sow_type": sow_type or "Unknown",
+        "msa_id": msa_id,
+        "config_version": config_version,
+        "severity_counts": {
+            severity: sum(1 for issue in issues if (issue.get("severity") or "").lower() == severity)
+            for severity in SEVERITIES
+        },
+        "sections": [
+            section_summary(
+                section_name, issues_by_section[section_name], carried_sections.get(section_name),
+                section_models.get(section_name)
+            )
+            for section_name in section_names
+        ],
+        "issues": [
+            {
+                "section": issue.get("section") or "Unknown",
+                "severity": (issue.get("severity") or "unknown").title(),
+                "description": issue.get("description") or "No description",
+                "suggested_resolution": issue.get("suggested_resolution") or "No resolution provided",
+                "model": issue.get("model") or "-",
+            }
+            for section_name in section_names for issue in issues_by_section[section_name]
+        ],
+    }
+    report["digest"] = report_digest(report)
+    return report
+
+
+def report_digest(report):
+    canonical = json.dumps({key: value for key, value in report.items() if key != "digest"}, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _generated_at():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+
+def render_pdf(report):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    cell = styles["BodyText"].clone("Cell", fontSize=8, leading=10)
+    header_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#29B5E8")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ])
+
+    def text(value):
+        return Paragraph(escape(str(value)), cell)
+
+    def tables(header, rows, widths, wrapped):
+        """Tables of PDF_ROWS_PER_TABLE rows; only the columns in wrapped are laid out as paragraphs"""
+        result = []
+        for start in range(0, max(len(rows), 1), PDF_ROWS_PER_TABLE):
+            data = [header] + [
+                [text(value) if column in wrapped else str(value) for column, value in enumerate(row)]
+                for row in rows[start:start + PDF_ROWS_PER_TABLE]
+            ]
+            block = Table(data, colWidths=[width * mm for width in widths], repeatRows=1)
+            block.setStyle(header_style)
+            result.append(block)
+        return result
+
+    def shortened(resolution):
+        if len(resolution) <= PDF_SECTION_RESOLUTION_CHARACTERS:
+            return resolution
+        return resolution[:PDF_SECTION_RESOLUTION_CHARACTERS].rsplit(" ", 1)[0] + " ... (see All issues)"
+
+    counts = report["severity_counts"]
+    details = [f"SOW type: {report['sow_type']}", f"Generated {_generated_at()}"]
+    if report["msa_id"]:
+        details.append(f"Checked against MSA {report['msa_id']}")
+    elements = [
+        Paragraph(escape(f"SOW Validation Report: {report['document_name']}"), styles["Title"]),
+        Paragraph(escape(" | ".join(details)), styles["Normal"]),
+        Spacer(1, 4 * mm),
+        *tables(["Total issues", "High", "Medium", "Low"],
+                [[len(report["issues"]), counts["high"], counts["medium"], counts["low"]]], [40, 40, 40, 40], ()),
+        Spacer(1, 6 * mm),
+        Paragraph("Sections", styles["Heading2"]),
+        *tables(
+            ["Section", "Issues", "Highest severity", "Resolution", "Model"],
+            [
+                [
+                    section["section"] + (" (carried over)" if section["carried_from"] else ""),
+                    section["issues"], (section["highest_severity"] or "-").title(),
+                    shortened(section["resolution"]) or "-", ", ".join(section["models"]) or "-",
+                ]
+                for section in report["sections"]
+            ],
+            [55, 15, 25, 130, 40], (0, 3, 4),
+        ),
+    ]
+    if report["issues"]:
+        elements += [
+            Spacer(1, 6 * mm),
+            Paragraph("All issues", styles["Heading2"]),
+            *tables(
+                ["Section", "Severity", "Description", "Resolution", "Model"],
+                [
+                    [issue["section"], issue["severity"], issue["description"], issue["suggested_resolution"], issue["model"]]
+                    for issue in report["issues"]
+                ],
+                [45, 18, 90, 80, 32], (0, 2, 3),
+            ),
+        ]
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(
+        buffer, pagesize=landscape(A4), leftMargin=12 * mm, rightMargin=12 * mm, topMargin=12 * mm, bottomMargin=12 * mm,
+        title=f"SOW Validation Report: {report['document_name']}"
+    ).build(elements)
+    return buffer.getvalue()
+
+
+def render_xlsx(report):
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    bold = Font(bold=True)
+
+    def add_sheet(title, header, rows, widths):
+        sheet = workbook.create_sheet(title)
+        for column, width in zip("ABCDEFG", widths):
+            sheet.column_dimensions[column].width = width
+        header_cells = []
+        for value in header:
+            header_cell = WriteOnlyCell(sheet, value=value)
+            header_cell.font = bold
+            header_cells.append(header_cell)
+        sheet.append(header_cells)
+        for row in rows:
+            sheet.append([value[:XLSX_CELL_CHARACTERS] if isinstance(value, str) else value for value in row])
+
+    counts = report["severity_counts"]
+    add_sheet("Summary", ["Field", "Value"], [
+        ["Document", report["document_name"]],
+        ["SOW type", report["sow_type"]],
+        ["MSA", report["msa_id"] or "-"],
+        ["Rules version", report["config_version"] or "-"],
+        ["Generated", _generated_at()],
+        ["Total issues", len(report["issues"])],
+        ["High", counts["high"]],
+        ["Medium", counts["medium"]],
+        ["Low", counts["low"]],
+    ], [18, 60])
+    add_sheet("Sections", ["Section", "Issues", "Highest severity", "Resolution", "Model", "Carried over from"], [
+        [
+            section["section"], section["issues"], (section["highest_severity"] or "-").title(),
+            section["resolution"] or "-", ", ".join(section["models"]) or "-", section["carried_from"] or "",
+        ]
+        for section in report["sections"]
+    ], [35, 8, 16, 90, 30, 34])
+    add_sheet("Issues", ["Section", "Severity", "Description", "Resolution", "Model"], [
+        [issue["section"], issue["severity"], issue["description"], issue["suggested_resolution"], issue["model"]]
+        for issue in report["issues"]
+    ], [35, 10, 80, 70, 30])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+RENDERERS = {"pdf": render_pdf, "xlsx": render_xlsx}
+
+
+class ReportCache:
+    """
+    Rendered reports by (digest, format), least recently used dropped beyond max_bytes. A report
+    is rendered by one caller at a time; concurrent requests for it wait and share the result.
+    """
+
+    def __init__(self, max_bytes=REPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._reports = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._render_locks = {}
+        self.stats = {"hits": 0, "renders": 0, "render_seconds": 0.0, "evictions": 0}
+
+    def _lookup(self, key):
+        with self._lock:
+            data = self._reports.get(key)
+            if data is not None:
+                self._reports.move_to_end(key)
+                self.stats["hits"] += 1
+            return data
+
+    def cached(self, digest, report_format):
+        with self._lock:
+            return (digest, report_format) in self._reports
+
+    def get(self, report, report_format):
+        """The report rendered as report_format, rendering it on the first request"""
+        key = (report["digest"], report_format)
+        data = self._lookup(key)
+        if data is not None:
+            return data
+        with self._lock:
+            render_lock = self._render_locks.setdefault(key, threading.Lock())
+        with render_lock:
+            data = self._lookup(key)
+            if data is not None:
+                return data
+            started = time.perf_counter()
+            data = RENDERERS[report_format](report)
+            elapsed = time.perf_counter() - started
+            logger.info("Rendered %s report %s (%d issues, %d bytes) in %.2fs",
+                        report_format, report["digest"], len(report["issues"]), len(data), elapsed)
+            with self._lock:
+                self.stats["renders"] += 1
+                self.stats["render_seconds"] += elapsed
+                self._reports[key] = data
+                self._size += len(data)
+                while self._size > self.max_bytes and len(self._reports) > 1:
+                    _, evicted = self._reports.popitem(last=False)
+                    self._size -= len(evicted)
+                    self.stats["evictions"] += 1
+                self._render_locks.pop(key, None)
+        return data
+
+
+# Shared by every session of the app process
+report_cache = ReportCache()
+
+
+def get_report(report, report_format):
+    return report_cache.get(report, report_format)
+
+
+def report_file_name(report, report_format):
+    base = os.path.splitext(os.path.basename(report["document_name"]))[0] or "sow"
+    return f"{base} validation report.{REPORT_FORMATS[report_format][1]}"
@@ -0,0 +1,229 @@
+"""
+Cache of Cortex Search results.
+
+The same searches are issued again and again. Type identification searches Compensation and
+Scope of Services, and the validation loop then searches them again; every rerun and every
+reviewer opening the same document repeats them all. query_cortex_search_service looks each
+search up here first, keyed by:
+- the document (its content-addressed stage name, i.e. its digest);
+- the query text, columns and limit of the search request;
+- the document's index version.
+
+The index version is a new token each time the document is indexed (build_search_index calls
+record_index), so re-indexing a document invalidates its cached results without touching them.
+A document whose index version is unknown is never cached, because nothing says what the
+service holds for it.
+
+With a store, the store's index version is authoritative. This process keeps the version it
+last read or recorded and checks it against the store again only once it is older than
+RETRIEVAL_CACHE_VERSION_TTL_SECONDS, or after a miss, so a memory hit never touches the
+warehouse. A re-index by another process or app replica, or the store's clear_retrievals (which
+gives every document a new version), therefore invalidates this process's LRU within the TTL;
+clear_retrievals here also drops the local versions at once. Documents are content-addressed,
+so a result served under a stale version still searched the same text. Without a store the
+versions recorded in this process are used. With caching disabled no version is looked up.
+
+Two tiers:
+- a process-wide LRU of the raw SEARCH_PREVIEW results (RETRIEVAL_CACHE_ENTRIES);
+- optionally a persistent tier in the run store (use_store).
+
+The first lookup of a document version loads every stored result of that version in one query,
+so beyond the version lookups a process pays one warehouse query per document version. New
+results are written behind, on a single thread, so a miss never waits for the store. Store
+errors are logged and only cost the persistent tier.
+
+stats() reports hits by tier, misses and the hit rate.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_ENTRIES = int(os.environ.get("SOW_RETRIEVAL_CACHE_ENTRIES", "2048"))
+# Set to 0 to search Cortex on every call
+RETRIEVAL_CACHE_ENABLED = os.environ.get("SOW_RETRIEVAL_CACHE", "1") == "1"
+# How long a document's index version is trusted before it is checked against the store again
+RETRIEVAL_CACHE_VERSION_TTL_SECONDS = float(os.environ.get("SOW_RETRIEVAL_CACHE_VERSION_TTL", "60"))
+
+
+def cache_key(document, query, columns, limit, index_version):
+    """Short hash of everything a search result depends on"""
+    canonical = json.dumps([document, query, sorted(columns), limit, index_version])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+class RetrievalCache:
+    """Search results by cache_key in memory, backed by an optional run store"""
+
+    def __init__(self, capacity=RETRIEVAL_CACHE_ENTRIES, store=None, enabled=RETRIEVAL_CACHE_ENABLED,
+                 version_ttl=RETRIEVAL_CACHE_VERSION_TTL_SECONDS):
+        self.capacity = capacity
+        self.store = store
+        self.enabled = enabled
+        self.version_ttl = version_ttl
+        self._results = OrderedDict()
+        self._versions = {}
+        # {document: monotonic time its version was last read from or written to the store}
+        self._version_checked = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-cache")
+        self._stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                       "store_errors": 0}
+
+    def use_store(self, store):
+        """Keep results in store (a run store) as well, from now on"""
+        with self._lock:
+            self.store = store
+            self._loaded.clear()
+            self._version_checked.clear()
+
+    def record_index(self, document):
+        """Start a new index version of document, invalidating its cached results. Returns the version."""
+        index_version = uuid.uuid4().hex[:16]
+        with self._lock:
+            previous = self._versions.get(document)
+            self._versions[document] = index_version
+            self._version_checked[document] = time.monotonic()
+            if previous is not None:
+                self._stats["invalidations"] += 1
+            store = self.store
+        if store is not None:
+            try:
+                store.save_index_version(document, index_version)
+            except Exception as e:
+                self._store_error("record the index version of", document, e)
+        return index_version
+
+    def index_version(self, document):
+        """
+        Current index version of document: the last one read or recorded here, checked against
+        the store's once older than version_ttl or after a miss. None (do not cache) when
+        caching is disabled, the version is unknown or the store cannot be read.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            index_version = self._versions.get(document)
+            store = self.store
+            checked = self._version_checked.get(document)
+        if store is None:
+            return index_version
+        if index_version is not None and checked is not None and time.monotonic() - checked < self.version_ttl:
+            return index_version
+        try:
+            stored_version = store.load_index_version(document)
+        except Exception as e:
+            self._store_error("look up the index version of", document, e)
+            return None
+        with self._lock:
+            self._version_checked[document] = time.monotonic()
+            if stored_version is None:
+                self._versions.pop(document, None)
+            elif self._versions.get(document) != stored_version:
+                if document in self._versions:
+                    # Re-indexed or cleared elsewhere; entries of the old version are no longer looked up
+                    self._stats["invalidations"] += 1
+                self._versions[document] = stored_version
+        return stored_version
+
+    def get(self, document, index_version, key):
+        """Raw results cached under key, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            raw_results = self._results.get(key)
+            if raw_results is not None:
+                self._results.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return raw_results
+            store = self.store
+            must_load = store is not None and (document, index_version) not in self._loaded
+            self._loaded.add((document, index_version))
+        if must_load:
+            try:
+                stored = store.load_retrievals(document, index_version)
+            except Exception as e:
+                self._store_error("load the cached searches of", document, e)
+                stored = {}
+            with self._lock:
+                for stored_key, stored_results in stored.items():
+                    self._remember(stored_key, stored_results)
+                raw_results = stored.get(key)
+                if raw_results is not None:
+                    self._stats["store_hits"] += 1
+                    return raw_results
+        with self._lock:
+            self._stats["misses"] += 1
+            # The document may have been re-indexed elsewhere; check its version on the next lookup
+            self._version_checked.pop(document, None)
+        return None
+
+    def put(self, document, index_version, key, raw_results):
+        """Cache the raw SEARCH_PREVIEW results of a search, writing them to the store in the background"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._versions.get(document) != index_version:
+                # Re-indexed while this search ran
+                return
+            self._remember(key, raw_results)
+            store = self.store
+        if store is not None:
+            self._writer.submit(self._save, store, document, index_version, key, raw_results)
+
+    def _remember(self, key, raw_results):
+        self._results[key] = raw_results
+        self._results.move_to_end(key)
+        while len(self._results) > self.capacity:
+            self._results.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _save(self, store, document, index_version, key, raw_results):
+        try:
+            store.save_retrieval(document, index_version, key, raw_results)
+        except Exception as e:
+            self._store_error("save a cached search of", document, e)
+
+    def _store_error(self, action, document, error):
+        with self._lock:
+            self._stats["store_errors"] += 1
+        logger.warning("Retrieval cache could not %s %s: %s", action, document, error)
+
+    def flush(self):
+        """Wait for pending store writes"""
+        self._writer.submit(lambda: None).result()
+
+    def clear_retrievals(self):
+        """Drop every cached search here and in the store, which gives every document a new version"""
+        with self._lock:
+            store = self.store
+        if store is not None:
+            self.flush()
+            store.clear_retrievals()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._versions.clear()
+            self._version_checked.clear()
+            self._loaded.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._results))
+        lookups = stats["memory_hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["store_hits"]) / lookups, 3) if lookups else None
+        return stats
+
+
+# Shared by every session and worker of the process
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,187 @@
+"""
+Local retrieval versus Cortex Search.
+
+    python sow_retrieval_compare.py --connection my_conn [--json results.json]
+    python sow_retrieval_compare.py --fake
+
+Every corpus document (benchmarks/corpus, rendered to PDF) is indexed by both retrieval backends,
+and each answers every section's search_query under the section's retrieval policy:
+
+  cortex  stage upload, CREATE_SOW_VALIDATION_CORTEX_SEARCH_LANG_NEW, then SEARCH_PREVIEW per section
+  local   sow_local_retrieval: text extraction, chunking and BM25 in this process
+
+For each backend and document the report gives:
+- the time until the document is searchable (upload plus index build);
+- the median and p95 latency of a section search;
+- section recall: the share of the corpus's sections whose results contain text of that section;
+- evidence recall: the share of labelled issues (benchmarks/labelled, those with "evidence")
+  whose evidence text is in their section's results.
+
+In --fake mode the Cortex side is sow_fakes.FakeCortex with the corpus planted as section text,
+so its recall is 1 by construction and its latencies are the fake's. The numbers then exercise
+the comparison, not Cortex.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+from sow_fakes import FakeCortex
+from sow_replay import read_corpus, render_corpus_pdf
+from sow_validation_engine import (
+    SOW_STAGE,
+    build_local_index,
+    build_search_index,
+    get_available_sections_mapping,
+    get_validation_config_by_sow_type,
+    map_config_sections,
+    query_cortex_search_service,
+    stage_document,
+)
+
+CORPUS_DIR = os.path.join("benchmarks", "corpus")
+LABELLED_DIR = os.path.join("benchmarks", "labelled")
+# Shortest sentence of a section used to recognise that section's text in a result
+MIN_SENTENCE_CHARACTERS = 20
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def contains_section_text(chunk, section_text):
+    """Whether a result chunk holds text of the section: a sentence of either is found in the other"""
+    chunk, section_text = normalize(chunk), normalize(section_text)
+    if len(chunk) >= MIN_SENTENCE_CHARACTERS and chunk in section_text:
+        return True
+    sentences = [sentence.strip() for sentence in re.split(r"(?<=[.;:])\s", section_text)]
+    return any(len(sentence) >= MIN_SENTENCE_CHARACTERS and sentence in chunk for sentence in sentences)
+
+
+def load_labels():
+    """{corpus file name: labelled document} from benchmarks/labelled"""
+    labels = {}
+    for path in sorted(glob.glob(os.path.join(LABELLED_DIR, "*.json"))):
+        with open(path) as f:
+            labelled = json.load(f)
+        labels[os.path.basename(labelled["document"])] = labelled
+    return labels
+
+
+def search_sections(session, validation_config, section_mapping, document):
+    """({section: results}, [search milliseconds]) for every mapped section"""
+    results, latencies = {}, []
+    for section_name, config in validation_config.items():
+        if section_name not in section_mapping:
+            continue
+        started = time.perf_counter()
+        results[section_name] = query_cortex_search_service(
+            session, config["search_query"], section_mapping[section_name], config.get("retrieval"), document=document
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def run_cortex(session, document_name, file_bytes, validation_config):
+    started = time.perf_counter()
+    staged_file = stage_document(session, document_name, file_bytes, SOW_STAGE)
+    build_search_index(session, staged_file)
+    section_mapping = get_available_sections_mapping(session, staged_file)
+    index_seconds = time.perf_counter() - started
+    return (index_seconds,) + search_sections(session, validation_config, section_mapping, staged_file)
+
+
+def run_local(session, document_name, file_bytes, validation_config):
+    started = time.perf_counter()
+    document = build_local_index(session, document_name, file_bytes)
+    section_mapping = get_available_sections_mapping(session, document)
+    index_seconds = time.perf_counter() - started
+    return (index_seconds,) + search_sections(session, validation_config, section_mapping, document)
+
+
+def score(results, corpus_sections, labelled, validation_config):
+    """(section recall, evidence recall or None) of one backend's results for one document"""
+    truth = map_config_sections(list(corpus_sections))
+    found = [
+        any(contains_section_text(result.get("chunk"), corpus_sections[heading]) for result in results.get(section_name, []))
+        for section_name, heading in truth.items() if section_name in validation_config
+    ]
+    evidence = [
+        normalize(issue["evidence"]) in " ".join(normalize(result.get("chunk")) for result in results.get(issue["section"], []))
+        for issue in (labelled or {}).get("expected_issues", []) if issue.get("evidence")
+    ]
+    return (sum(found) / len(found) if found else None), (sum(evidence) / len(evidence) if evidence else None)
+
+
+def compare(corpus_path, session, labelled, backends):
+    corpus_sections = read_corpus(corpus_path)
+    document_name = os.path.splitext(os.path.basename(corpus_path))[0] + ".pdf"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdf_path = os.path.join(tmpdir, document_name)
+        render_corpus_pdf(corpus_sections, pdf_path)
+        with open(pdf_path, "rb") as f:
+            file_bytes = f.read()
+    validation_config = get_validation_config_by_sow_type((labelled or {}).get("sow_type", "T&M"))
+
+    rows = []
+    # Cortex first: once indexed locally, searches of the same document name are answered locally
+    for backend in backends:
+        run = run_cortex if backend == "cortex" else run_local
+        index_seconds, results, latencies = run(session, document_name, file_bytes, validation_config)
+        section_recall, evidence_recall = score(results, corpus_sections, labelled, validation_config)
+        rows.append({
+            "document": document_name,
+            "backend": backend,
+            "index_ms": round(index_seconds * 1000, 1),
+            "search_median_ms": round(statistics.median(latencies), 2) if latencies else None,
+            "search_p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+            "sections_searched": len(latencies),
+            "section_recall": round(section_recall, 3) if section_recall is not None else None,
+            "evidence_recall": round(evidence_recall, 3) if evidence_recall is not None else None,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare local BM25 retrieval with Cortex Search")
+    parser.add_argument("documents", nargs="*", help="Corpus .txt files (default: benchmarks/corpus)")
+    parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    parser.add_argument("--fake", action="store_true", help="Compare against sow_fakes.FakeCortex instead of Snowflake")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    labels = load_labels()
+    session = None
+    if not args.fake:
+        from sow_validation_cli import create_session
+        session = create_session(args.connection)
+
+    results = []
+    print(f"{'document':<28} {'backend':<7} {'index ms':>10} {'search p50':>11} {'search p95':>11} "
+          f"{'section recall':>15} {'evidence recall':>16}")
+    for corpus_path in args.documents or sorted(glob.glob(os.path.join(CORPUS_DIR, "*.txt"))):
+        labelled = labels.get(os.path.basename(corpus_path))
+        if args.fake:
+            session = FakeCortex(
+                section_text=read_corpus(corpus_path), sow_type=(labelled or {}).get("sow_type", "T&M")
+            ).session()
+        for row in compare(corpus_path, session, labelled, ("cortex", "local")):
+            results.append(row)
+            print(f"{row['document']:<28} {row['backend']:<7} {row['index_ms']:>10} {row['search_median_ms']:>11} "
+                  f"{row['search_p95_ms']:>11} {row['section_recall']!s:>15} {row['evidence_recall']!s:>16}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
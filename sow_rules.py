@@ -0,0 +1,349 @@
+"""
+Versioned validation rules compiled into prompt plans.
+
+The rules live outside the code as YAML, one document per version: named retrieval policies and
+routing rules, then per SOW type the sections with their search query, policy, routing,
+questions and severity tag (see rules/v1.yaml). compile_rules() turns a version into one
+PromptPlan per SOW type. A plan is immutable: the questions are pre-rendered as the numbered list
+the prompt uses, the default severity is resolved from the tag and the named policies are
+resolved. Each plan carries a digest, the content hash of its validation config, which is the
+config version stored runs are keyed on (sow_run_store.config_version).
+
+Rules come from a rule source:
+  FileRuleSource       rules/v<N>.yaml next to this module; the highest N is active unless
+                       SOW_RULES_VERSION pins one.
+  SnowflakeRuleSource  the SOW_RULES table. A version is published and then activated, and
+                       running apps pick up the activated version within RULES_REFRESH_SECONDS,
+                       without a redeploy. Until a version is activated the bundled files are used.
+
+    python sow_rules.py compile [rules/v2.yaml]                 # check a rules file, print plan digests
+    python sow_rules.py publish rules/v2.yaml --connection my_conn
+    python sow_rules.py activate v2 --connection my_conn
+    python sow_rules.py list --connection my_conn
+
+Compiled plans are cached per (version, rules digest); the active version is looked up again
+after RULES_REFRESH_SECONDS. The lookup runs outside the module lock, by one thread at a time
+while the others keep the current plans, and a failed lookup keeps the last good version.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Bundled rule files; a stored procedure receives them flat next to this module
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules")
+RULES_TABLE = "SOW_RULES"
+RULES_VERSION = os.environ.get("SOW_RULES_VERSION") or None
+RULES_REFRESH_SECONDS = int(os.environ.get("SOW_RULES_REFRESH_SECONDS", "60"))
+
+SECTION_KEYS = ("search_query", "retrieval", "routing", "validation_questions", "tag")
+
+
+def severity_from_tag(severity_tag):
+    severity = "low"
+    if "high" in severity_tag.lower():
+        severity = "high"
+    elif "medium" in severity_tag.lower():
+        severity = "medium"
+    elif "low" in severity_tag.lower():
+        severity = "low"
+    return severity
+
+
+def render_questions(questions):
+    """Questions as the numbered list the validation prompt shows"""
+    return "".join(f"{i}. {question}\n" for i, question in enumerate(questions, 1))
+
+
+class SectionPlan(namedtuple("SectionPlan", "search_query retrieval routing questions prompt_questions tag default_severity")):
+    """One section of a prompt plan; retrieval and routing are tuples of (key, value) pairs"""
+    __slots__ = ()
+
+    def config(self):
+        """The section's validation config, a new dict each call"""
+        return {
+            "search_query": self.search_query,
+            "retrieval": dict(self.retrieval),
+            "routing": dict(self.routing),
+            "validation_questions": list(self.questions),
+            "prompt_questions": self.prompt_questions,
+            "tag": self.tag,
+            "default_severity": self.default_severity,
+        }
+
+
+class PromptPlan(namedtuple("PromptPlan", "rules_version sow_type digest sections")):
+    """The compiled rules of one SOW type; sections is a tuple of (section name, SectionPlan)"""
+    __slots__ = ()
+
+    def validation_config(self):
+        """{section: config} in rule order, a new dict each call so callers may modify it"""
+        return {section_name: section.config() for section_name, section in self.sections}
+
+
+def plan_digest(validation_config):
+    """Content hash of a compiled validation config (the same hash as sow_run_store.config_version)"""
+    canonical = json.dumps(validation_config, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_rules(text):
+    """Rules document from YAML text; duplicate keys are an error rather than a silent overwrite"""
+    import yaml
+
+    class UniqueKeyLoader(yaml.SafeLoader):
+        pass
+
+    def construct_mapping(loader, node, deep=False):
+        keys = [loader.construct_object(key_node, deep=deep) for key_node, _ in node.value]
+        duplicates = sorted({key for key in keys if keys.count(key) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate rule keys {duplicates} at line {node.start_mark.line + 1}")
+        return loader.construct_mapping(node, deep=deep)
+
+    UniqueKeyLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, construct_mapping)
+    return yaml.load(text, Loader=UniqueKeyLoader)
+
+
+def compile_section(section_name, section, policies, routing_rules):
+    missing = [key for key in SECTION_KEYS if key not in section]
+    unknown = sorted(set(section) - set(SECTION_KEYS))
+    if missing or unknown:
+        raise ValueError(f"Section '{section_name}': missing {missing}, unknown {unknown}")
+    if section["retrieval"] not in policies:
+        raise ValueError(f"Section '{section_name}': unknown retrieval policy '{section['retrieval']}'")
+    if section["routing"] not in routing_rules:
+        raise ValueError(f"Section '{section_name}': unknown routing rule '{section['routing']}'")
+    questions = section["validation_questions"]
+    if not questions or not all(isinstance(question, str) and question.strip() for question in questions):
+        raise ValueError(f"Section '{section_name}': validation_questions must be a list of non-empty strings")
+    return SectionPlan(
+        search_query=section["search_query"],
+        retrieval=tuple(policies[section["retrieval"]].items()),
+        routing=tuple(routing_rules[section["routing"]].items()),
+        questions=tuple(questions),
+        prompt_questions=render_questions(questions),
+        tag=section["tag"],
+        default_severity=severity_from_tag(section["tag"]),
+    )
+
+
+def compile_rules(version, text):
+    """{sow type: PromptPlan} for a rules document; raises ValueError on invalid rules"""
+    rules = parse_rules(text)
+    if not isinstance(rules, dict) or not isinstance(rules.get("sow_types"), dict):
+        raise ValueError(f"Rules {version}: expected a 'sow_types' mapping")
+    policies = rules.get("retrieval_policies") or {}
+    routing_rules = rules.get("routing") or {}
+    plans = {}
+    for sow_type, sections in rules["sow_types"].items():
+        compiled = tuple(
+            (section_name, compile_section(section_name, section, policies, routing_rules))
+            for section_name, section in sections.items()
+        )
+        digest = plan_digest({section_name: section.config() for section_name, section in compiled})
+        plans[sow_type] = PromptPlan(version, sow_type, digest, compiled)
+    return plans
+
+
+class FileRuleSource:
+    """Rules versions as v<N>.yaml files in a directory"""
+
+    def __init__(self, directory=RULES_DIR):
+        # A stored procedure gets its imports flat next to this module rather than in rules/
+        self.directory = directory if os.path.isdir(directory) else os.path.dirname(directory)
+
+    def versions(self):
+        names = [re.fullmatch(r"v(\d+)\.yaml", name) for name in os.listdir(self.directory)]
+        return [f"v{number}" for number in sorted(int(match.group(1)) for match in names if match)]
+
+    def active_version(self):
+        versions = self.versions()
+        if not versions:
+            raise ValueError(f"No rules files (v<N>.yaml) in {self.directory}")
+        return RULES_VERSION or versions[-1]
+
+    def load(self, version):
+        with open(os.path.join(self.directory, f"{version}.yaml"), encoding="utf-8") as f:
+            return f.read()
+
+
+class SnowflakeRuleSource:
+    """Rules versions in the SOW_RULES table; the most recently activated one is active"""
+
+    def __init__(self, session, fallback=None):
+        self.session = session
+        self.fallback = fallback or FileRuleSource()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {RULES_TABLE} (
+                VERSION VARCHAR, RULES VARCHAR, PUBLISHED_AT TIMESTAMP_NTZ, ACTIVATED_AT TIMESTAMP_NTZ
+            )
+        """).collect()
+
+    def versions(self):
+        rows = self.session.sql(
+            f"SELECT VERSION, PUBLISHED_AT, ACTIVATED_AT FROM {RULES_TABLE} ORDER BY PUBLISHED_AT"
+        ).collect()
+        return [row.as_dict() for row in rows]
+
+    def active_version(self):
+        if RULES_VERSION:
+            return RULES_VERSION
+        rows = self.session.sql(f"""
+            SELECT VERSION FROM {RULES_TABLE} WHERE ACTIVATED_AT IS NOT NULL ORDER BY ACTIVATED_AT DESC LIMIT 1
+        """).collect()
+        return rows[0]["VERSION"] if rows else self.fallback.active_version()
+
+    def load(self, version):
+        rows = self.session.sql(f"SELECT RULES FROM {RULES_TABLE} WHERE VERSION = ?", params=[version]).collect()
+        return rows[0]["RULES"] if rows else self.fallback.load(version)
+
+    def publish(self, version, text):
+        """Add a rules version (compiled first, so invalid rules are never published); it is not active yet"""
+        compile_rules(version, text)
+        if self.session.sql(f"SELECT 1 FROM {RULES_TABLE} WHERE VERSION = ?", params=[version]).collect():
+            raise ValueError(f"Rules version {version} is already published; versions are immutable")
+        self.session.sql(
+            f"INSERT INTO {RULES_TABLE} (VERSION, RULES, PUBLISHED_AT) VALUES (?, ?, ?::TIMESTAMP_NTZ)",
+            params=[version, text, _now()]
+        ).collect()
+
+    def activate(self, version):
+        rows = self.session.sql(
+            f"UPDATE {RULES_TABLE} SET ACTIVATED_AT = ?::TIMESTAMP_NTZ WHERE VERSION = ?", params=[_now(), version]
+        ).collect()
+        if not rows or not rows[0][0]:
+            raise ValueError(f"Rules version {version} is not published")
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+_source = FileRuleSource()
+_lock = threading.Lock()
+# (version, rules digest) -> {sow type: PromptPlan}
+_compiled = {}
+# ((version, rules digest), rules text, checked at) of the active version
+_active = None
+# Whether a thread is looking up the active version
+_refreshing = False
+
+
+def use_rule_source(source):
+    """Read rules from source from now on, e.g. SnowflakeRuleSource(session)"""
+    global _source, _active
+    with _lock:
+        _source = source
+        _active = None
+
+
+def _load_active(source):
+    version = source.active_version()
+    text = source.load(version)
+    return (version, hashlib.sha256(text.encode("utf-8")).hexdigest()), text, time.monotonic()
+
+
+def active_plans():
+    """
+    {sow type: PromptPlan} of the active rules version. Once it is older than
+    RULES_REFRESH_SECONDS one caller looks it up again, without holding the lock; if that fails
+    the previous version is kept (and looked up again after another interval).
+    """
+    global _active, _refreshing
+    with _lock:
+        source, active = _source, _active
+        refresh = active is None or (time.monotonic() - active[2] > RULES_REFRESH_SECONDS and not _refreshing)
+        if refresh and active is not None:
+            _refreshing = True
+    if refresh:
+        try:
+            loaded = _load_active(source)
+        except Exception as e:
+            if active is None:
+                raise
+            logger.warning("Could not look up the active rules version, keeping %s: %s", active[0][0], e)
+            loaded = (active[0], active[1], time.monotonic())
+        finally:
+            if active is not None:
+                with _lock:
+                    _refreshing = False
+        with _lock:
+            if _source is source:
+                _active = loaded
+        active = loaded
+
+    key, text, _ = active
+    with _lock:
+        plans = _compiled.get(key)
+    if plans is None:
+        plans = compile_rules(key[0], text)
+        with _lock:
+            if key not in _compiled:
+                _compiled[key] = plans
+                logger.info("Compiled rules %s", key[0])
+            plans = _compiled[key]
+    return plans
+
+
+def prompt_plan(sow_type):
+    """Active prompt plan of one SOW type ("T&M" or "Fixed-Fee")"""
+    plans = active_plans()
+    if sow_type not in plans:
+        raise ValueError(f"Rules {next(iter(plans.values())).rules_version} have no '{sow_type}' SOW type")
+    return plans[sow_type]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile, publish and activate validation rules versions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="Compile a rules file and print its plan digests")
+    compile_parser.add_argument("path", nargs="?", help="Rules file (default: the active bundled version)")
+    publish_parser = commands.add_parser("publish", help="Add a rules file to the SOW_RULES table")
+    publish_parser.add_argument("path", help="Rules file; its name (e.g. v2) is the version")
+    activate_parser = commands.add_parser("activate", help="Make a published version the active one")
+    activate_parser.add_argument("version")
+    list_parser = commands.add_parser("list", help="List published versions")
+    for command_parser in (publish_parser, activate_parser, list_parser):
+        command_parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "compile":
+        if args.path:
+            version = os.path.splitext(os.path.basename(args.path))[0]
+            with open(args.path, encoding="utf-8") as f:
+                plans = compile_rules(version, f.read())
+        else:
+            plans = active_plans()
+        for sow_type, plan in plans.items():
+            print(f"{plan.rules_version}  {sow_type:<10} {plan.digest}  {len(plan.sections)} sections")
+        return 0
+
+    from sow_validation_cli import create_session
+    source = SnowflakeRuleSource(create_session(args.connection))
+    if args.command == "publish":
+        with open(args.path, encoding="utf-8") as f:
+            source.publish(os.path.splitext(os.path.basename(args.path))[0], f.read())
+        print(f"Published {args.path}; activate it with: python sow_rules.py activate <version>")
+    elif args.command == "activate":
+        source.activate(args.version)
+        print(f"Activated rules {args.version}; running apps switch within {RULES_REFRESH_SECONDS}s")
+    else:
+        print(f"Active: {source.active_version()}")
+        for row in source.versions():
+            print(f"{row['VERSION']}  published {row['PUBLISHED_AT']}  activated {row['ACTIVATED_AT']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
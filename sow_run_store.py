@@ -0,0 +1,705 @@
+"""
+Persisted validation runs.
+
+A run is keyed by the document digest (SHA-256 of the uploaded bytes), the SOW type, the config
+version (hash of the validation config used) and the models the config routes to. It holds the
+issues, the retrieved chunks per section and the stage timings, so a document that has already
+been validated under the current config renders straight from storage.
+
+SnowflakeRunStore keeps runs in three tables clustered by document and date; SQLiteRunStore is
+the local stand-in with the same interface and indexes on (document digest, created at) and
+created at. open_run_store() picks one from SOW_RUN_STORE ("snowflake" or "sqlite").
+
+Both stores also hold the pipeline checkpoints of validations still in progress (see
+sow_checkpoints.py), one row per (checkpoint key, stage), and the manifest of documents on the
+stage, one row per (document digest, stage) with the content-addressed file name and when it
+was last used (see sow_stage.py).
+
+Revised versions of a SOW are linked by document family, the file name without version markers
+("Acme SOW v3 redline.pdf" -> "acme sow"). Each run keeps a digest of every section's indexed
+content and of its config, so a run of the next version can carry over the sections neither
+changed in (see sow_validation_engine.carried_section_results); carried sections record the run
+they came from. Each section's row also records the model that produced its result.
+
+Registered MSAs (see sow_msa.py) are kept one row per MSA digest with their key terms and
+chunks; a run records the MSA its cross-document questions were checked against.
+
+The persistent tier of the retrieval cache (see sow_retrieval_cache.py) is kept here too. Each
+document's current index version is one row. Cached search results are one row per (document,
+index version, cache key). Recording a new index version deletes the results of the older ones;
+clear_retrievals deletes them all and gives every document a new version.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from sow_rules import plan_digest
+from sow_validation_engine import get_validation_config_by_sow_type, resolve_model_routing, section_config_digest
+
+RUNS_TABLE = "SOW_VALIDATION_RUNS"
+ISSUES_TABLE = "SOW_VALIDATION_RUN_ISSUES"
+CHUNKS_TABLE = "SOW_VALIDATION_RUN_CHUNKS"
+CHECKPOINTS_TABLE = "SOW_VALIDATION_CHECKPOINTS"
+STAGE_MANIFEST_TABLE = "SOW_STAGE_MANIFEST"
+MSA_TABLE = "SOW_MSAS"
+RETRIEVAL_CACHE_TABLE = "SOW_RETRIEVAL_CACHE"
+INDEX_VERSIONS_TABLE = "SOW_INDEX_VERSIONS"
+
+SQLITE_PATH = os.environ.get("SOW_RUN_STORE_PATH", "sow_runs.db")
+
+# SOW types with their own validation config; stored runs are current if they match either one
+KNOWN_SOW_TYPES = ("T&M", "Fixed-Fee")
+
+RUN_COLUMNS = [
+    "RUN_ID", "DOCUMENT_DIGEST", "DOCUMENT_NAME", "SOW_TYPE", "CONFIG_VERSION", "MODEL",
+    "CREATED_AT", "SOW_TYPE_RESULT", "TIMINGS", "CATEGORIES", "DOCUMENT_FAMILY", "PREVIOUS_RUN_ID", "MSA_ID",
+]
+ISSUE_COLUMNS = [
+    "RUN_ID", "SECTION", "ISSUE_NUMBER", "SEVERITY", "DESCRIPTION", "SUGGESTED_RESOLUTION", "MODEL",
+]
+CHUNK_COLUMNS = ["RUN_ID", "SECTION", "CHUNKS", "CONTENT_DIGEST", "CONFIG_DIGEST", "CARRIED_FROM", "MODEL"]
+# Columns added after the tables were first created; stores add them to existing tables when opened
+ADDED_COLUMNS = {
+    RUNS_TABLE: ["DOCUMENT_FAMILY", "PREVIOUS_RUN_ID", "MSA_ID"],
+    CHUNKS_TABLE: ["CONTENT_DIGEST", "CONFIG_DIGEST", "CARRIED_FROM", "MODEL"],
+}
+
+# Version markers trailing a file name: "v2", "rev 3", "(1)", "redline", "final", ...
+VERSION_MARKERS = re.compile(
+    r"(\s(v|ver|version|rev|revision|r)\s?\d+|\s\(?\d+\)|\s(redline|redlined|clean|draft|final|updated|signed))+$"
+)
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def document_digest(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def document_family(document_name):
+    """Name shared by every version of a document: lowercased, without extension or version markers"""
+    name = (document_name or "").replace("\\", "/").split("/")[-1]
+    name = re.sub(r"\.(pdf|docx?)$", "", name.lower())
+    name = " " + " ".join(re.split(r"[\s_.\-]+", name)).strip()
+    return VERSION_MARKERS.sub("", name).strip() or name.strip()
+
+
+def config_version(validation_config):
+    """
+    Short content hash of a validation config; changes whenever a question, tag or policy changes.
+    For an unmodified config it is the digest of the prompt plan it came from (sow_rules.py).
+    """
+    return plan_digest(validation_config)
+
+
+def model_signature(validation_config):
+    """Every model the config's routing rules can call, e.g. "llama3.1-70b,openai-gpt-4.1" """
+    models = set()
+    for config in validation_config.values():
+        models.update(resolve_model_routing(config.get("routing")))
+    return ",".join(sorted(models))
+
+
+def current_run_keys():
+    """(config version, model signature) pairs a stored run must match to be reused"""
+    keys = set()
+    for sow_type in KNOWN_SOW_TYPES:
+        validation_config = get_validation_config_by_sow_type(sow_type)
+        keys.add((config_version(validation_config), model_signature(validation_config)))
+    return keys
+
+
+def build_run(document_name, digest, sow_type_result, validation_config, validation_output, section_chunks, timings,
+              section_digests=None, previous_run_id=None, carried_sections=None, msa_id=None, section_models=None):
+    """
+    Assemble a run record from the pipeline outputs (the shape save_run and load_run use).
+    section_digests are the engine's content digests, {section: digest}; carried_sections maps
+    sections carried over from the prior version's run previous_run_id to the run they came from.
+    msa_id is the registered MSA the run was checked against, if any. section_models maps each
+    section to the model that produced its result ({section: model}, None for sections no model
+    answered, such as missing ones).
+    """
+    section_digests = section_digests or {}
+    return {
+        "run_id": uuid.uuid4().hex,
+        "document_digest": digest,
+        "document_name": document_name,
+        "sow_type": sow_type_result.get("sow_type", "Unknown"),
+        "config_version": config_version(validation_config),
+        "model": model_signature(validation_config),
+        "created_at": _now(),
+        "sow_type_result": sow_type_result,
+        "timings": timings or {},
+        "categories": list(validation_config),
+        "issues": validation_output.get("sow_validation", []),
+        "section_chunks": section_chunks or {},
+        "document_family": document_family(document_name),
+        "previous_run_id": previous_run_id,
+        "section_digests": {
+            section_name: {"content": section_digests[section_name], "config": section_config_digest(config)}
+            for section_name, config in validation_config.items() if section_name in section_digests
+        },
+        "carried_sections": carried_sections or {},
+        "msa_id": msa_id,
+        "section_models": section_models or {},
+    }
+
+
+def _run_rows(run):
+    run_row = [
+        run["run_id"], run["document_digest"], run["document_name"], run["sow_type"],
+        run["config_version"], run["model"], run["created_at"],
+        json.dumps(run["sow_type_result"]),
+        json.dumps(run["timings"]),
+        json.dumps(run["categories"]),
+        run["document_family"], run["previous_run_id"], run.get("msa_id"),
+    ]
+    issue_rows = [
+        [
+            run["run_id"], issue.get("section"), issue.get("issue_number"), issue.get("severity"),
+            issue.get("description"), issue.get("suggested_resolution"), issue.get("model"),
+        ]
+        for issue in run["issues"]
+    ]
+    chunk_rows = [
+        [
+            run["run_id"], section_name, json.dumps(chunks),
+            run["section_digests"].get(section_name, {}).get("content"),
+            run["section_digests"].get(section_name, {}).get("config"),
+            run["carried_sections"].get(section_name),
+            run.get("section_models", {}).get(section_name),
+        ]
+        for section_name, chunks in run["section_chunks"].items()
+    ]
+    return run_row, issue_rows, chunk_rows
+
+
+def _run_from_rows(run_row, issue_rows, chunk_rows):
+    categories = json.loads(run_row["CATEGORIES"] or "[]")
+    # Issues come back in config order, as the pipeline reports them
+    section_order = {section_name: position for position, section_name in enumerate(categories)}
+    issue_rows = sorted(
+        issue_rows, key=lambda row: (section_order.get(row["SECTION"], len(section_order)), row["ISSUE_NUMBER"] or 0)
+    )
+    return {
+        "run_id": run_row["RUN_ID"],
+        "document_digest": run_row["DOCUMENT_DIGEST"],
+        "document_name": run_row["DOCUMENT_NAME"],
+        "sow_type": run_row["SOW_TYPE"],
+        "config_version": run_row["CONFIG_VERSION"],
+        "model": run_row["MODEL"],
+        "created_at": str(run_row["CREATED_AT"]),
+        "sow_type_result": json.loads(run_row["SOW_TYPE_RESULT"] or "{}"),
+        "timings": json.loads(run_row["TIMINGS"] or "{}"),
+        "categories": categories,
+        "issues": [
+            {
+                "section": row["SECTION"],
+                "issue_number": row["ISSUE_NUMBER"],
+                "severity": row["SEVERITY"],
+                "description": row["DESCRIPTION"],
+                "suggested_resolution": row["SUGGESTED_RESOLUTION"],
+                "model": row["MODEL"],
+            }
+            for row in issue_rows
+        ],
+        "section_chunks": {row["SECTION"]: json.loads(row["CHUNKS"]) for row in chunk_rows},
+        "document_family": run_row["DOCUMENT_FAMILY"],
+        "previous_run_id": run_row["PREVIOUS_RUN_ID"],
+        "section_digests": {
+            row["SECTION"]: {"content": row["CONTENT_DIGEST"], "config": row["CONFIG_DIGEST"]}
+            for row in chunk_rows if row["CONTENT_DIGEST"]
+        },
+        "carried_sections": {row["SECTION"]: row["CARRIED_FROM"] for row in chunk_rows if row["CARRIED_FROM"]},
+        "msa_id": run_row["MSA_ID"],
+        "section_models": {row["SECTION"]: row["MODEL"] for row in chunk_rows if row["MODEL"]},
+    }
+
+
+def _msa_from_row(row):
+    return {
+        "msa_id": row["MSA_ID"],
+        "msa_name": row["MSA_NAME"],
+        "staged_file": row["STAGED_FILE"],
+        "key_terms": json.loads(row["KEY_TERMS"] or "{}"),
+        "chunks": json.loads(row["CHUNKS"] or "[]"),
+        "created_at": str(row["CREATED_AT"]),
+    }
+
+
+class SQLiteRunStore:
+    """Local run store in a single SQLite file"""
+
+    def __init__(self, path=SQLITE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                    RUN_ID TEXT PRIMARY KEY, DOCUMENT_DIGEST TEXT, DOCUMENT_NAME TEXT, SOW_TYPE TEXT,
+                    CONFIG_VERSION TEXT, MODEL TEXT, CREATED_AT TEXT, SOW_TYPE_RESULT TEXT, TIMINGS TEXT,
+                    CATEGORIES TEXT, DOCUMENT_FAMILY TEXT, PREVIOUS_RUN_ID TEXT, MSA_ID TEXT
+                );
+                CREATE TABLE IF NOT EXISTS {ISSUES_TABLE} (
+                    RUN_ID TEXT, SECTION TEXT, ISSUE_NUMBER INTEGER, SEVERITY TEXT,
+                    DESCRIPTION TEXT, SUGGESTED_RESOLUTION TEXT, MODEL TEXT
+                );
+                CREATE TABLE IF NOT EXISTS {CHUNKS_TABLE} (
+                    RUN_ID TEXT, SECTION TEXT, CHUNKS TEXT, CONTENT_DIGEST TEXT, CONFIG_DIGEST TEXT, CARRIED_FROM TEXT,
+                    MODEL TEXT
+                );
+                CREATE INDEX IF NOT EXISTS IX_RUNS_DOCUMENT ON {RUNS_TABLE} (DOCUMENT_DIGEST, CREATED_AT);
+                CREATE INDEX IF NOT EXISTS IX_RUNS_CREATED ON {RUNS_TABLE} (CREATED_AT);
+                CREATE INDEX IF NOT EXISTS IX_ISSUES_RUN ON {ISSUES_TABLE} (RUN_ID);
+                CREATE INDEX IF NOT EXISTS IX_CHUNKS_RUN ON {CHUNKS_TABLE} (RUN_ID);
+                CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                    CHECKPOINT_KEY TEXT, STAGE TEXT, PAYLOAD TEXT, CREATED_AT TEXT,
+                    PRIMARY KEY (CHECKPOINT_KEY, STAGE)
+                );
+                CREATE TABLE IF NOT EXISTS {STAGE_MANIFEST_TABLE} (
+                    DOCUMENT_DIGEST TEXT, STAGE_NAME TEXT, STAGED_FILE TEXT, DOCUMENT_NAME TEXT,
+                    SIZE_BYTES INTEGER, UPLOADED_AT TEXT, LAST_USED_AT TEXT,
+                    PRIMARY KEY (DOCUMENT_DIGEST, STAGE_NAME)
+                );
+                CREATE INDEX IF NOT EXISTS IX_MANIFEST_LAST_USED ON {STAGE_MANIFEST_TABLE} (STAGE_NAME, LAST_USED_AT);
+                CREATE TABLE IF NOT EXISTS {MSA_TABLE} (
+                    MSA_ID TEXT PRIMARY KEY, MSA_NAME TEXT, STAGED_FILE TEXT, KEY_TERMS TEXT, CHUNKS TEXT, CREATED_AT TEXT
+                );
+                CREATE TABLE IF NOT EXISTS {INDEX_VERSIONS_TABLE} (
+                    DOCUMENT TEXT PRIMARY KEY, INDEX_VERSION TEXT, INDEXED_AT TEXT
+                );
+                CREATE TABLE IF NOT EXISTS {RETRIEVAL_CACHE_TABLE} (
+                    DOCUMENT TEXT, INDEX_VERSION TEXT, CACHE_KEY TEXT, RESULTS TEXT, CREATED_AT TEXT,
+                    PRIMARY KEY (DOCUMENT, INDEX_VERSION, CACHE_KEY)
+                );
+            """)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                for column in columns:
+                    if column not in existing:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS IX_RUNS_FAMILY ON {RUNS_TABLE} (DOCUMENT_FAMILY, CREATED_AT)")
+
+    def save_run(self, run):
+        run_row, issue_rows, chunk_rows = _run_rows(run)
+        with self._lock, self._conn:
+            for table, columns, rows in (
+                (RUNS_TABLE, RUN_COLUMNS, [run_row]), (ISSUES_TABLE, ISSUE_COLUMNS, issue_rows),
+                (CHUNKS_TABLE, CHUNK_COLUMNS, chunk_rows),
+            ):
+                self._conn.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                )
+        return run["run_id"]
+
+    def list_runs(self, document_digest=None, since=None, limit=50, document_family=None):
+        """Run headers, newest first, optionally for one document or document family and/or created on or after since"""
+        clauses, params = [], []
+        if document_digest:
+            clauses.append("DOCUMENT_DIGEST = ?")
+            params.append(document_digest)
+        if document_family:
+            clauses.append("DOCUMENT_FAMILY = ?")
+            params.append(document_family)
+        if since:
+            clauses.append("CREATED_AT >= ?")
+            params.append(str(since))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                f"SELECT * FROM {RUNS_TABLE} {where} ORDER BY CREATED_AT DESC LIMIT {int(limit)}", params
+            )]
+
+    def load_run(self, run_id):
+        with self._lock:
+            run_row = self._conn.execute(f"SELECT * FROM {RUNS_TABLE} WHERE RUN_ID = ?", [run_id]).fetchone()
+            if run_row is None:
+                return None
+            issue_rows = self._conn.execute(
+                f"SELECT * FROM {ISSUES_TABLE} WHERE RUN_ID = ?", [run_id]
+            ).fetchall()
+            chunk_rows = self._conn.execute(f"SELECT * FROM {CHUNKS_TABLE} WHERE RUN_ID = ?", [run_id]).fetchall()
+        return _run_from_rows(run_row, issue_rows, chunk_rows)
+
+    def save_checkpoint(self, checkpoint_key, stage, payload):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {CHECKPOINTS_TABLE} VALUES (?, ?, ?, ?)",
+                [checkpoint_key, stage, json.dumps(payload), _now()]
+            )
+
+    def load_checkpoints(self, checkpoint_key):
+        """{stage: payload} of every checkpoint saved under checkpoint_key"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT STAGE, PAYLOAD FROM {CHECKPOINTS_TABLE} WHERE CHECKPOINT_KEY = ?", [checkpoint_key]
+            ).fetchall()
+        return {row["STAGE"]: json.loads(row["PAYLOAD"]) for row in rows}
+
+    def clear_checkpoints(self, checkpoint_key):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {CHECKPOINTS_TABLE} WHERE CHECKPOINT_KEY = ?", [checkpoint_key])
+
+    def lookup_staged_file(self, document_digest, stage_name):
+        """Staged file name of the document on stage_name, or None if the manifest has no record of it"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT STAGED_FILE FROM {STAGE_MANIFEST_TABLE} WHERE DOCUMENT_DIGEST = ? AND STAGE_NAME = ?",
+                [document_digest, stage_name]
+            ).fetchone()
+        return row["STAGED_FILE"] if row else None
+
+    def record_staged_file(self, document_digest, stage_name, staged_file, document_name, size_bytes):
+        """Add the document to the manifest, or mark it as used now if it is already there"""
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                INSERT INTO {STAGE_MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (DOCUMENT_DIGEST, STAGE_NAME) DO UPDATE SET LAST_USED_AT = excluded.LAST_USED_AT
+            """, [document_digest, stage_name, staged_file, document_name, size_bytes, now, now])
+
+    def list_staged_files(self, stage_name, last_used_before=None):
+        """Manifest rows of stage_name, least recently used first, optionally only those last used before a time"""
+        clauses, params = ["STAGE_NAME = ?"], [stage_name]
+        if last_used_before:
+            clauses.append("LAST_USED_AT < ?")
+            params.append(str(last_used_before))
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                f"SELECT * FROM {STAGE_MANIFEST_TABLE} WHERE {' AND '.join(clauses)} ORDER BY LAST_USED_AT", params
+            )]
+
+    def forget_staged_files(self, stage_name, staged_files):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"DELETE FROM {STAGE_MANIFEST_TABLE} WHERE STAGE_NAME = ? AND STAGED_FILE = ?",
+                [[stage_name, staged_file] for staged_file in staged_files]
+            )
+
+    def save_msa(self, msa):
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO {MSA_TABLE} VALUES (?, ?, ?, ?, ?, ?)", [
+                msa["msa_id"], msa["msa_name"], msa["staged_file"], json.dumps(msa["key_terms"]),
+                json.dumps(msa["chunks"]), msa["created_at"],
+            ])
+
+    def load_msa(self, msa_id):
+        with self._lock:
+            row = self._conn.execute(f"SELECT * FROM {MSA_TABLE} WHERE MSA_ID = ?", [msa_id]).fetchone()
+        return _msa_from_row(row) if row else None
+
+    def list_msas(self):
+        """(MSA_ID, MSA_NAME, CREATED_AT) rows of every registered MSA, newest first"""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                f"SELECT MSA_ID, MSA_NAME, CREATED_AT FROM {MSA_TABLE} ORDER BY CREATED_AT DESC"
+            )]
+
+    def save_index_version(self, document, index_version):
+        """Record the document's current index version and drop the cached searches of earlier ones"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {INDEX_VERSIONS_TABLE} VALUES (?, ?, ?)", [document, index_version, _now()]
+            )
+            self._conn.execute(
+                f"DELETE FROM {RETRIEVAL_CACHE_TABLE} WHERE DOCUMENT = ? AND INDEX_VERSION <> ?", [document, index_version]
+            )
+
+    def load_index_version(self, document):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT INDEX_VERSION FROM {INDEX_VERSIONS_TABLE} WHERE DOCUMENT = ?", [document]
+            ).fetchone()
+        return row["INDEX_VERSION"] if row else None
+
+    def save_retrieval(self, document, index_version, cache_key, results):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {RETRIEVAL_CACHE_TABLE} VALUES (?, ?, ?, ?, ?)",
+                [document, index_version, cache_key, results, _now()]
+            )
+
+    def load_retrievals(self, document, index_version):
+        """{cache key: raw search results} cached for the document's index version"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT CACHE_KEY, RESULTS FROM {RETRIEVAL_CACHE_TABLE} WHERE DOCUMENT = ? AND INDEX_VERSION = ?",
+                [document, index_version]
+            ).fetchall()
+        return {row["CACHE_KEY"]: row["RESULTS"] for row in rows}
+
+    def clear_retrievals(self):
+        """Drop every cached search and give every document a new index version, so no process keeps serving its own"""
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE {INDEX_VERSIONS_TABLE} SET INDEX_VERSION = lower(hex(randomblob(8)))")
+            self._conn.execute(f"DELETE FROM {RETRIEVAL_CACHE_TABLE}")
+
+    def query(self, sql, params=()):
+        """Rows of a read-only query as dicts (see sow_portfolio.py)"""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, list(params))]
+
+
+class SnowflakeRunStore:
+    """Run store in Snowflake tables, clustered by document digest and creation date"""
+
+    def __init__(self, session):
+        self.session = session
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                RUN_ID VARCHAR, DOCUMENT_DIGEST VARCHAR, DOCUMENT_NAME VARCHAR, SOW_TYPE VARCHAR,
+                CONFIG_VERSION VARCHAR, MODEL VARCHAR, CREATED_AT TIMESTAMP_NTZ,
+                SOW_TYPE_RESULT VARCHAR, TIMINGS VARCHAR, CATEGORIES VARCHAR,
+                DOCUMENT_FAMILY VARCHAR, PREVIOUS_RUN_ID VARCHAR, MSA_ID VARCHAR
+            ) CLUSTER BY (DOCUMENT_DIGEST, TO_DATE(CREATED_AT))
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {ISSUES_TABLE} (
+                RUN_ID VARCHAR, SECTION VARCHAR, ISSUE_NUMBER NUMBER, SEVERITY VARCHAR,
+                DESCRIPTION VARCHAR, SUGGESTED_RESOLUTION VARCHAR, MODEL VARCHAR
+            ) CLUSTER BY (RUN_ID)
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {CHUNKS_TABLE} (
+                RUN_ID VARCHAR, SECTION VARCHAR, CHUNKS VARCHAR,
+                CONTENT_DIGEST VARCHAR, CONFIG_DIGEST VARCHAR, CARRIED_FROM VARCHAR, MODEL VARCHAR
+            ) CLUSTER BY (RUN_ID)
+        """).collect()
+        for table, columns in ADDED_COLUMNS.items():
+            for column in columns:
+                self.session.sql(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} VARCHAR").collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+                CHECKPOINT_KEY VARCHAR, STAGE VARCHAR, PAYLOAD VARCHAR, CREATED_AT TIMESTAMP_NTZ
+            ) CLUSTER BY (CHECKPOINT_KEY)
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {STAGE_MANIFEST_TABLE} (
+                DOCUMENT_DIGEST VARCHAR, STAGE_NAME VARCHAR, STAGED_FILE VARCHAR, DOCUMENT_NAME VARCHAR,
+                SIZE_BYTES NUMBER, UPLOADED_AT TIMESTAMP_NTZ, LAST_USED_AT TIMESTAMP_NTZ
+            ) CLUSTER BY (DOCUMENT_DIGEST)
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {MSA_TABLE} (
+                MSA_ID VARCHAR, MSA_NAME VARCHAR, STAGED_FILE VARCHAR, KEY_TERMS VARCHAR, CHUNKS VARCHAR,
+                CREATED_AT TIMESTAMP_NTZ
+            )
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {INDEX_VERSIONS_TABLE} (
+                DOCUMENT VARCHAR, INDEX_VERSION VARCHAR, INDEXED_AT TIMESTAMP_NTZ
+            )
+        """).collect()
+        self.session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {RETRIEVAL_CACHE_TABLE} (
+                DOCUMENT VARCHAR, INDEX_VERSION VARCHAR, CACHE_KEY VARCHAR, RESULTS VARCHAR, CREATED_AT TIMESTAMP_NTZ
+            ) CLUSTER BY (DOCUMENT)
+        """).collect()
+
+    def save_run(self, run):
+        run_row, issue_rows, chunk_rows = _run_rows(run)
+        # Child rows first so a run header never points at a partially written run
+        for table, columns, rows in ((ISSUES_TABLE, ISSUE_COLUMNS, issue_rows), (CHUNKS_TABLE, CHUNK_COLUMNS, chunk_rows)):
+            if rows:
+                self.session.create_dataframe(rows, schema=columns).write.save_as_table(
+                    table, mode="append", column_order="name"
+                )
+        self.session.sql(
+            f"INSERT INTO {RUNS_TABLE} ({', '.join(RUN_COLUMNS)}) VALUES ({', '.join('?' * len(RUN_COLUMNS))})",
+            params=run_row
+        ).collect()
+        return run["run_id"]
+
+    def list_runs(self, document_digest=None, since=None, limit=50, document_family=None):
+        """Run headers, newest first, optionally for one document or document family and/or created on or after since"""
+        clauses, params = [], []
+        if document_digest:
+            clauses.append("DOCUMENT_DIGEST = ?")
+            params.append(document_digest)
+        if document_family:
+            clauses.append("DOCUMENT_FAMILY = ?")
+            params.append(document_family)
+        if since:
+            clauses.append("CREATED_AT >= ?")
+            params.append(str(since))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.session.sql(
+            f"SELECT * FROM {RUNS_TABLE} {where} ORDER BY CREATED_AT DESC LIMIT {int(limit)}", params=params
+        ).collect()
+        return [row.as_dict() for row in rows]
+
+    def load_run(self, run_id):
+        run_rows = self.session.sql(f"SELECT * FROM {RUNS_TABLE} WHERE RUN_ID = ?", params=[run_id]).collect()
+        if not run_rows:
+            return None
+        issue_rows = self.session.sql(
+            f"SELECT * FROM {ISSUES_TABLE} WHERE RUN_ID = ?", params=[run_id]
+        ).collect()
+        chunk_rows = self.session.sql(f"SELECT * FROM {CHUNKS_TABLE} WHERE RUN_ID = ?", params=[run_id]).collect()
+        return _run_from_rows(run_rows[0], issue_rows, chunk_rows)
+
+    def save_checkpoint(self, checkpoint_key, stage, payload):
+        self.session.sql(f"""
+            MERGE INTO {CHECKPOINTS_TABLE} t
+            USING (SELECT ? AS CHECKPOINT_KEY, ? AS STAGE, ? AS PAYLOAD, ?::TIMESTAMP_NTZ AS CREATED_AT) s
+            ON t.CHECKPOINT_KEY = s.CHECKPOINT_KEY AND t.STAGE = s.STAGE
+            WHEN MATCHED THEN UPDATE SET PAYLOAD = s.PAYLOAD, CREATED_AT = s.CREATED_AT
+            WHEN NOT MATCHED THEN INSERT (CHECKPOINT_KEY, STAGE, PAYLOAD, CREATED_AT)
+                VALUES (s.CHECKPOINT_KEY, s.STAGE, s.PAYLOAD, s.CREATED_AT)
+        """, params=[checkpoint_key, stage, json.dumps(payload), _now()]).collect()
+
+    def load_checkpoints(self, checkpoint_key):
+        """{stage: payload} of every checkpoint saved under checkpoint_key"""
+        rows = self.session.sql(
+            f"SELECT STAGE, PAYLOAD FROM {CHECKPOINTS_TABLE} WHERE CHECKPOINT_KEY = ?", params=[checkpoint_key]
+        ).collect()
+        return {row["STAGE"]: json.loads(row["PAYLOAD"]) for row in rows}
+
+    def clear_checkpoints(self, checkpoint_key):
+        self.session.sql(
+            f"DELETE FROM {CHECKPOINTS_TABLE} WHERE CHECKPOINT_KEY = ?", params=[checkpoint_key]
+        ).collect()
+
+    def lookup_staged_file(self, document_digest, stage_name):
+        """Staged file name of the document on stage_name, or None if the manifest has no record of it"""
+        rows = self.session.sql(
+            f"SELECT STAGED_FILE FROM {STAGE_MANIFEST_TABLE} WHERE DOCUMENT_DIGEST = ? AND STAGE_NAME = ?",
+            params=[document_digest, stage_name]
+        ).collect()
+        return rows[0]["STAGED_FILE"] if rows else None
+
+    def record_staged_file(self, document_digest, stage_name, staged_file, document_name, size_bytes):
+        """Add the document to the manifest, or mark it as used now if it is already there"""
+        self.session.sql(f"""
+            MERGE INTO {STAGE_MANIFEST_TABLE} t
+            USING (SELECT ? AS DOCUMENT_DIGEST, ? AS STAGE_NAME, ? AS STAGED_FILE, ? AS DOCUMENT_NAME,
+                          ? AS SIZE_BYTES, ?::TIMESTAMP_NTZ AS USED_AT) s
+            ON t.DOCUMENT_DIGEST = s.DOCUMENT_DIGEST AND t.STAGE_NAME = s.STAGE_NAME
+            WHEN MATCHED THEN UPDATE SET LAST_USED_AT = s.USED_AT
+            WHEN NOT MATCHED THEN INSERT
+                (DOCUMENT_DIGEST, STAGE_NAME, STAGED_FILE, DOCUMENT_NAME, SIZE_BYTES, UPLOADED_AT, LAST_USED_AT)
+                VALUES (s.DOCUMENT_DIGEST, s.STAGE_NAME, s.STAGED_FILE, s.DOCUMENT_NAME, s.SIZE_BYTES, s.USED_AT, s.USED_AT)
+        """, params=[document_digest, stage_name, staged_file, document_name, size_bytes, _now()]).collect()
+
+    def list_staged_files(self, stage_name, last_used_before=None):
+        """Manifest rows of stage_name, least recently used first, optionally only those last used before a time"""
+        clauses, params = ["STAGE_NAME = ?"], [stage_name]
+        if last_used_before:
+            clauses.append("LAST_USED_AT < ?")
+            params.append(str(last_used_before))
+        rows = self.session.sql(
+            f"SELECT * FROM {STAGE_MANIFEST_TABLE} WHERE {' AND '.join(clauses)} ORDER BY LAST_USED_AT", params=params
+        ).collect()
+        return [row.as_dict() for row in rows]
+
+    def forget_staged_files(self, stage_name, staged_files):
+        staged_files = list(staged_files)
+        if not staged_files:
+            return
+        self.session.sql(
+            f"DELETE FROM {STAGE_MANIFEST_TABLE} WHERE STAGE_NAME = ? AND STAGED_FILE IN ({', '.join('?' * len(staged_files))})",
+            params=[stage_name, *staged_files]
+        ).collect()
+
+    def save_msa(self, msa):
+        self.session.sql(f"""
+            MERGE INTO {MSA_TABLE} t
+            USING (SELECT ? AS MSA_ID, ? AS MSA_NAME, ? AS STAGED_FILE, ? AS KEY_TERMS, ? AS CHUNKS,
+                          ?::TIMESTAMP_NTZ AS CREATED_AT) s
+            ON t.MSA_ID = s.MSA_ID
+            WHEN MATCHED THEN UPDATE SET MSA_NAME = s.MSA_NAME, STAGED_FILE = s.STAGED_FILE, KEY_TERMS = s.KEY_TERMS,
+                CHUNKS = s.CHUNKS, CREATED_AT = s.CREATED_AT
+            WHEN NOT MATCHED THEN INSERT (MSA_ID, MSA_NAME, STAGED_FILE, KEY_TERMS, CHUNKS, CREATED_AT)
+                VALUES (s.MSA_ID, s.MSA_NAME, s.STAGED_FILE, s.KEY_TERMS, s.CHUNKS, s.CREATED_AT)
+        """, params=[
+            msa["msa_id"], msa["msa_name"], msa["staged_file"], json.dumps(msa["key_terms"]),
+            json.dumps(msa["chunks"]), msa["created_at"],
+        ]).collect()
+
+    def load_msa(self, msa_id):
+        rows = self.session.sql(f"SELECT * FROM {MSA_TABLE} WHERE MSA_ID = ?", params=[msa_id]).collect()
+        return _msa_from_row(rows[0]) if rows else None
+
+    def list_msas(self):
+        """(MSA_ID, MSA_NAME, CREATED_AT) rows of every registered MSA, newest first"""
+        rows = self.session.sql(f"SELECT MSA_ID, MSA_NAME, CREATED_AT FROM {MSA_TABLE} ORDER BY CREATED_AT DESC").collect()
+        return [row.as_dict() for row in rows]
+
+    def save_index_version(self, document, index_version):
+        """Record the document's current index version and drop the cached searches of earlier ones"""
+        self.session.sql(f"""
+            MERGE INTO {INDEX_VERSIONS_TABLE} t
+            USING (SELECT ? AS DOCUMENT, ? AS INDEX_VERSION, ?::TIMESTAMP_NTZ AS INDEXED_AT) s
+            ON t.DOCUMENT = s.DOCUMENT
+            WHEN MATCHED THEN UPDATE SET INDEX_VERSION = s.INDEX_VERSION, INDEXED_AT = s.INDEXED_AT
+            WHEN NOT MATCHED THEN INSERT (DOCUMENT, INDEX_VERSION, INDEXED_AT)
+                VALUES (s.DOCUMENT, s.INDEX_VERSION, s.INDEXED_AT)
+        """, params=[document, index_version, _now()]).collect()
+        self.session.sql(
+            f"DELETE FROM {RETRIEVAL_CACHE_TABLE} WHERE DOCUMENT = ? AND INDEX_VERSION <> ?", params=[document, index_version]
+        ).collect()
+
+    def load_index_version(self, document):
+        rows = self.session.sql(
+            f"SELECT INDEX_VERSION FROM {INDEX_VERSIONS_TABLE} WHERE DOCUMENT = ?", params=[document]
+        ).collect()
+        return rows[0]["INDEX_VERSION"] if rows else None
+
+    def save_retrieval(self, document, index_version, cache_key, results):
+        # Concurrent misses of one search may both insert it; loading keeps either copy
+        self.session.sql(
+            f"INSERT INTO {RETRIEVAL_CACHE_TABLE} VALUES (?, ?, ?, ?, ?::TIMESTAMP_NTZ)",
+            params=[document, index_version, cache_key, results, _now()]
+        ).collect()
+
+    def load_retrievals(self, document, index_version):
+        """{cache key: raw search results} cached for the document's index version"""
+        rows = self.session.sql(
+            f"SELECT CACHE_KEY, RESULTS FROM {RETRIEVAL_CACHE_TABLE} WHERE DOCUMENT = ? AND INDEX_VERSION = ?",
+            params=[document, index_version]
+        ).collect()
+        return {row["CACHE_KEY"]: row["RESULTS"] for row in rows}
+
+    def clear_retrievals(self):
+        """Drop every cached search and give every document a new index version, so no process keeps serving its own"""
+        self.session.sql(
+            f"UPDATE {INDEX_VERSIONS_TABLE} SET INDEX_VERSION = SUBSTR(REPLACE(UUID_STRING(), '-', ''), 1, 16)"
+        ).collect()
+        self.session.sql(f"DELETE FROM {RETRIEVAL_CACHE_TABLE}").collect()
+
+    def query(self, sql, params=()):
+        """Rows of a read-only query as dicts (see sow_portfolio.py)"""
+        return [row.as_dict() for row in self.session.sql(sql, params=list(params) or None).collect()]
+
+
+def find_current_run(store, document_digest, msa_id=None):
+    """Newest stored run of the document made with the current configs and models against msa_id, or None"""
+    keys = current_run_keys()
+    for run_row in store.list_runs(document_digest=document_digest, limit=20):
+        if (run_row["CONFIG_VERSION"], run_row["MODEL"]) in keys and run_row.get("MSA_ID") == msa_id:
+            return store.load_run(run_row["RUN_ID"])
+    return None
+
+
+def find_previous_version(store, document_name, document_digest):
+    """Newest stored run of an earlier version of the document (same family, other content), or None"""
+    for run_row in store.list_runs(document_family=document_family(document_name), limit=20):
+        if run_row["DOCUMENT_DIGEST"] != document_digest:
+            return store.load_run(run_row["RUN_ID"])
+    return None
+
+
+def open_run_store(session=None, backend=None):
+    """Run store selected by backend or SOW_RUN_STORE; Snowflake needs a session"""
+    backend = backend or os.environ.get("SOW_RUN_STORE", "snowflake" if session is not None else "sqlite")
+    if backend == "sqlite":
+        return SQLiteRunStore()
+    return SnowflakeRunStore(session)
@@ -0,0 +1,123 @@
+"""
+Lifecycle of the documents on @SOW_STAGE.
+
+Documents are staged under content-addressed names (sow_validation_engine.staged_file_name), so
+the same bytes always get the same name and a lookup is an exact match. The run store keeps a
+manifest of staged documents: digest, staged file and when it was last used.
+sow_validation_engine.stage_document() checks it before uploading and updates the last-used time.
+
+purge_stale_files() is the retention job. It removes files that have not been used for
+RETENTION_DAYS (SOW_STAGE_RETENTION_DAYS) together with their manifest rows. Documents with a
+validation still in progress (pipeline checkpoints) are kept. Uploads from before content
+addressing are not in the manifest; their temporary-file names ("tmp" and 8 characters before
+the file name) identify them, and they are removed by the last-modified time LIST reports.
+Anything else on the stage, such as folders staged for the batch CLI, is never touched.
+
+    python sow_stage.py purge [--retention-days 30] [--stage @SOW_STAGE] [--dry-run] [--connection NAME]
+
+Run it daily, e.g. from cron. sow_stage_benchmark.py times stage lookups as the stage grows.
+"""
+import argparse
+import email.utils
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import sow_run_store
+from sow_validation_engine import SOW_STAGE
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get("SOW_STAGE_RETENTION_DAYS", "30"))
+
+# Uploads made before content addressing: NamedTemporaryFile names at the top of the stage
+LEGACY_UPLOAD_PATTERN = "[^/]*/tmp[a-z0-9_]{8}[^/]+"
+
+
+def sql_string(value):
+    """value as the body of a single-quoted SQL string literal"""
+    return value.replace("\\", "\\\\").replace("'", "''")
+
+
+def exact_pattern(file_name):
+    """PATTERN regex matching a path that ends in exactly file_name"""
+    escaped = "".join(
+        char if char.isalnum() else f"\\{char}" if char in "^]\\" else f"[{char}]" for char in file_name
+    )
+    return f".*/{escaped}"
+
+
+def list_stage(session, stage_name, pattern=None):
+    """[(path relative to the stage, last modified datetime)] of the files LIST reports"""
+    query = f"LIST {stage_name}"
+    if pattern:
+        query += f" PATTERN = '{sql_string(pattern)}'"
+    return [
+        (row["name"].split("/", 1)[1], email.utils.parsedate_to_datetime(row["last_modified"]))
+        for row in session.sql(query).collect()
+    ]
+
+
+def remove_staged_file(session, stage_name, staged_file):
+    """REMOVE one file; without the pattern REMOVE would also delete every file its path is a prefix of"""
+    session.sql(
+        f"REMOVE '{sql_string(f'{stage_name}/{staged_file}')}' PATTERN = '{sql_string(exact_pattern(staged_file))}'"
+    ).collect()
+
+
+def purge_stale_files(session, store, stage_name=SOW_STAGE, retention_days=RETENTION_DAYS, dry_run=False):
+    """
+    Remove the staged files of stage_name that have not been used for retention_days.
+    Returns {"removed": [...], "legacy_removed": [...], "in_progress": [...]} file names; with
+    dry_run nothing is removed.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    summary = {"removed": [], "legacy_removed": [], "in_progress": []}
+
+    for row in store.list_staged_files(stage_name, last_used_before=cutoff.strftime("%Y-%m-%d %H:%M:%S.%f")):
+        if store.load_checkpoints(row["DOCUMENT_DIGEST"]):
+            summary["in_progress"].append(row["STAGED_FILE"])
+        else:
+            summary["removed"].append(row["STAGED_FILE"])
+    summary["legacy_removed"] = [
+        staged_file for staged_file, last_modified in list_stage(session, stage_name, LEGACY_UPLOAD_PATTERN)
+        if last_modified < cutoff
+    ]
+
+    if dry_run:
+        return summary
+    for staged_file in summary["removed"] + summary["legacy_removed"]:
+        remove_staged_file(session, stage_name, staged_file)
+    store.forget_staged_files(stage_name, summary["removed"])
+    logger.info("Purged %d staged file(s) and %d legacy upload(s) from %s",
+                len(summary["removed"]), len(summary["legacy_removed"]), stage_name)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the documents staged for validation")
+    commands = parser.add_subparsers(dest="command", required=True)
+    purge_parser = commands.add_parser("purge", help="Remove staged files not used within the retention period")
+    purge_parser.add_argument("--stage", default=SOW_STAGE)
+    purge_parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    purge_parser.add_argument("--dry-run", action="store_true", help="List what would be removed")
+    purge_parser.add_argument("--connection", help="Snowflake connection name from connections.toml")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from sow_validation_cli import create_session
+    session = create_session(args.connection)
+    summary = purge_stale_files(
+        session, sow_run_store.open_run_store(session), args.stage, args.retention_days, args.dry_run
+    )
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {len(summary['removed'])} staged file(s) and {len(summary['legacy_removed'])} legacy upload(s) "
+          f"unused for {args.retention_days} days; kept {len(summary['in_progress'])} with a validation in progress")
+    for staged_file in summary["removed"] + summary["legacy_removed"]:
+        print(f"  {staged_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Stage lookup benchmark.
+
+    python sow_stage_benchmark.py [--files 100 1000 10000 50000] [--lookups 20] [--json results.json]
+
+Fills a sow_fakes.FakeCortex stage and a SQLite stage manifest with N files each, then times
+finding one uploaded document three ways:
+
+  list+substring  LIST of the whole stage, then the first path containing the file name (the old lookup)
+  prefix-list     LIST of only the paths starting with the content-addressed name, exact match
+                  (sow_validation_engine.find_staged_file)
+  manifest        primary-key lookup in the run store's stage manifest (stage_document)
+
+Half of the stage holds uploads from before content addressing, "tmpXXXXXXXX" + file name; the
+old lookup is timed finding those by file name. Their names often contain each other ("SOW.pdf"
+is in "tmpab12cd34Acme SOW.pdf"), and the same name is uploaded many times, so "wrong" counts
+the lookups that returned another upload's file. The fake LIST costs what building its rows
+costs, so a real stage, which also sends every row over the network, grows faster.
+"""
+import argparse
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+
+from sow_fakes import FakeCortex
+from sow_run_store import SQLiteRunStore, document_digest
+from sow_validation_engine import SOW_STAGE, find_staged_file, staged_file_name
+
+CLIENTS = ["Acme", "Globex", "Initech", "Umbrella", "Stark", "Wayne", "Hooli", "Vandelay"]
+DOCUMENT_NAMES = ["SOW.pdf", "{client} SOW.pdf", "{client} SOW v2.pdf", "{client} SOW Amendment.pdf"]
+
+
+def populate(files, rng):
+    """
+    A fake stage and manifest with the given number of files.
+    Returns (fake, store, [(name, bytes)] of content-addressed uploads, [(name, staged file)] of legacy uploads).
+    """
+    fake = FakeCortex()
+    store = SQLiteRunStore(":memory:")
+    uploaded_at = time.time()
+    documents = []
+    legacy_documents = []
+    for i in range(files):
+        document_name = rng.choice(DOCUMENT_NAMES).format(client=rng.choice(CLIENTS))
+        if i % 2:
+            legacy_name = "tmp" + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789_") for _ in range(8))
+            fake.staged_files[legacy_name + document_name] = uploaded_at
+            legacy_documents.append((document_name, legacy_name + document_name))
+            continue
+        file_bytes = f"SOW document {i}".encode("utf-8")
+        staged_name = staged_file_name(document_name, file_bytes)
+        fake.staged_files[staged_name] = uploaded_at
+        store.record_staged_file(document_digest(file_bytes), SOW_STAGE, staged_name, document_name, len(file_bytes))
+        documents.append((document_name, file_bytes))
+    return fake, store, documents, legacy_documents
+
+
+def list_and_substring(session, document_name):
+    """The lookup this benchmark replaces: the whole stage, first path containing the name"""
+    sow_files = [row["name"] for row in session.sql(f"LIST {SOW_STAGE}").collect()]
+    return next((f.split('/')[-1] for f in sow_files if document_name in f), None)
+
+
+def time_lookups(lookup, targets):
+    """(median milliseconds per lookup, lookups that found the wrong file or none)"""
+    samples = []
+    wrong = 0
+    for expected, args in targets:
+        started = time.perf_counter()
+        found = lookup(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+        wrong += found != expected
+    return round(statistics.median(samples), 3), wrong
+
+
+def bench(files, lookups, seed):
+    rng = random.Random(seed)
+    fake, store, documents, legacy_documents = populate(files, rng)
+    session = fake.session()
+    picked = [rng.choice(documents) for _ in range(lookups)]
+    picked_legacy = [rng.choice(legacy_documents) for _ in range(lookups)]
+    methods = {
+        "list+substring": (list_and_substring, [
+            (staged_file, (session, name)) for name, staged_file in picked_legacy
+        ]),
+        "prefix-list": (lambda name: find_staged_file(session, name)[0], [
+            (staged_file_name(name, data), (staged_file_name(name, data),)) for name, data in picked
+        ]),
+        "manifest": (store.lookup_staged_file, [
+            (staged_file_name(name, data), (document_digest(data), SOW_STAGE)) for name, data in picked
+        ]),
+    }
+    results = []
+    for method, (lookup, targets) in methods.items():
+        median_ms, wrong = time_lookups(lookup, targets)
+        results.append({"files": files, "method": method, "median_ms": median_ms, "wrong": wrong, "lookups": lookups})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time staged-file lookups as the stage grows")
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--lookups", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    print(f"{'files':>7} {'method':<15} {'median ms':>10} {'wrong':>6}")
+    for files in args.files:
+        for result in bench(files, args.lookups, args.seed):
+            results.append(result)
+            print(f"{files:>7} {result['method']:<15} {result['median_ms']:>10} {result['wrong']:>6}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+Lifecycle management for doc_chunks_sow.
+
+The index-build procedure appends every indexed document's chunks to doc_chunks_sow, and the
+search service and section mapping read that table. maintain() keeps it bounded and pruned:
+
+  1. Clusters the table by (document, section), so the per-document mapping, digest and bulk
+     queries prune to the micro-partitions of one document.
+  2. Applies the stage retention (sow_stage.purge_stale_files): documents not used for
+     retention_days are removed from the stage, except those with a validation in progress.
+  3. Deletes the chunks of every document no longer on the stage. These are the documents
+     purged in step 2 and any removed by hand.
+  4. Compacts duplicate chunks, which appear when the same document is indexed again. One row
+     is kept per (document, section, chunk text).
+  5. Refreshes the Cortex Search Service if anything was deleted, so the index shrinks with
+     the table. It also drops the cached searches (sow_retrieval_cache.py), which may hold
+     deleted chunks.
+
+Register it as a stored procedure and a daily task (or run it once from a client):
+    python sow_table_maintenance.py --register --connection my_conn --stage @SOW_CODE_STAGE
+    python sow_table_maintenance.py --run --dry-run --connection my_conn
+
+The task calls SOW_TABLE_MAINTENANCE(<retention days>, FALSE) on --schedule.
+"""
+import argparse
+import json
+import logging
+import os
+
+from sow_bulk_validation_procedure import CODE_STAGE, DOC_CHUNKS_TABLE, create_code_stage
+from sow_run_store import SnowflakeRunStore
+from sow_stage import RETENTION_DAYS, list_stage, purge_stale_files
+from sow_validation_engine import DOC_CHUNKS_DOCUMENT_COLUMN, SOW_STAGE
+
+logger = logging.getLogger(__name__)
+
+PROCEDURE_NAME = "SOW_TABLE_MAINTENANCE"
+TASK_NAME = "SOW_TABLE_MAINTENANCE_TASK"
+DEFAULT_SCHEDULE = "USING CRON 0 3 * * * UTC"
+SEARCH_SERVICE = "sow_validation_service_lang_new"
+CHUNK_RETENTION_DAYS = int(os.environ.get("SOW_CHUNK_RETENTION_DAYS", str(RETENTION_DAYS)))
+# Documents per DELETE statement
+DELETE_BATCH_SIZE = 500
+
+
+def cluster_chunks_table(session, table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    """Set the clustering key; automatic clustering then keeps each document's chunks together"""
+    session.sql(f"ALTER TABLE {table} CLUSTER BY ({document_column}, SECTION_NAME)").collect()
+
+
+def orphaned_documents(session, staged_files, table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    """Documents that have chunks in the table but are not among staged_files"""
+    rows = session.sql(f"SELECT DISTINCT {document_column} AS DOCUMENT FROM {table}").collect()
+    return sorted(row["DOCUMENT"] for row in rows if row["DOCUMENT"] is not None and row["DOCUMENT"] not in staged_files)
+
+
+def delete_document_chunks(session, documents, table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    for start in range(0, len(documents), DELETE_BATCH_SIZE):
+        batch = documents[start:start + DELETE_BATCH_SIZE]
+        session.sql(
+            f"DELETE FROM {table} WHERE {document_column} IN ({', '.join('?' * len(batch))})", params=batch
+        ).collect()
+
+
+def duplicate_chunk_count(session, table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    """Rows beyond the first for each (document, section, chunk text)"""
+    row = session.sql(f"""
+        SELECT COUNT(*) AS TOTAL_ROWS, COUNT(DISTINCT HASH({document_column}, SECTION_NAME, CHUNK)) AS DISTINCT_ROWS
+        FROM {table}
+    """).collect()[0]
+    return row["TOTAL_ROWS"] - row["DISTINCT_ROWS"]
+
+
+def compact_chunks(session, table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN):
+    """Rewrite the table without duplicate chunks. INSERT OVERWRITE keeps its clustering key and grants."""
+    session.sql(f"""
+        INSERT OVERWRITE INTO {table}
+        SELECT * FROM {table}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY {document_column}, SECTION_NAME, CHUNK ORDER BY {document_column}) = 1
+    """).collect()
+
+
+def refresh_search_service(session, search_service=SEARCH_SERVICE):
+    session.sql(f"ALTER CORTEX SEARCH SERVICE {search_service} REFRESH").collect()
+
+
+def maintain(session, retention_days=CHUNK_RETENTION_DAYS, stage_name=SOW_STAGE, dry_run=False,
+             table=DOC_CHUNKS_TABLE, document_column=DOC_CHUNKS_DOCUMENT_COLUMN, search_service=SEARCH_SERVICE,
+             run_store=None):
+    """
+    One maintenance pass over doc_chunks_sow (see the module docstring). With dry_run nothing is
+    changed and the summary reports what would be. run_store holds the stage manifest and the
+    cached searches (default: the session's SnowflakeRunStore). Returns a JSON-serialisable summary.
+    """
+    if not dry_run:
+        cluster_chunks_table(session, table, document_column)
+
+    run_store = run_store or SnowflakeRunStore(session)
+    stage_summary = purge_stale_files(session, run_store, stage_name, retention_days, dry_run)
+    purged = set(stage_summary["removed"] + stage_summary["legacy_removed"])
+    staged_files = {staged_file for staged_file, _ in list_stage(session, stage_name)} - purged
+    if staged_files:
+        orphaned = orphaned_documents(session, staged_files, table, document_column)
+    else:
+        # An empty listing more likely means a wrong stage name than an empty stage
+        logger.warning("%s lists no files; not deleting any chunks as orphaned", stage_name)
+        orphaned = []
+    duplicates = duplicate_chunk_count(session, table, document_column)
+
+    refreshed = False
+    if not dry_run:
+        delete_document_chunks(session, orphaned, table, document_column)
+        if duplicates:
+            compact_chunks(session, table, document_column)
+        if orphaned or duplicates:
+            try:
+                refresh_search_service(session, search_service)
+                refreshed = True
+            except Exception as e:
+                logger.warning("Could not refresh %s: %s", search_service, e)
+            # Searches cached before the rewrite may include chunks it removed (see sow_retrieval_cache.py)
+            run_store.clear_retrievals()
+
+    return {
+        "dry_run": dry_run,
+        "retention_days": retention_days,
+        "staged_files_removed": len(stage_summary["removed"]),
+        "legacy_uploads_removed": len(stage_summary["legacy_removed"]),
+        "kept_in_progress": len(stage_summary["in_progress"]),
+        "documents_purged": orphaned,
+        "duplicate_chunks": duplicates,
+        "search_service_refreshed": refreshed,
+    }
+
+
+def maintenance_handler(session, retention_days, dry_run):
+    """Stored procedure entry point; NULL arguments fall back to CHUNK_RETENTION_DAYS and a real run"""
+    return maintain(session, retention_days or CHUNK_RETENTION_DAYS, dry_run=bool(dry_run))
+
+
+def register_procedure(session, stage_location=CODE_STAGE, name=PROCEDURE_NAME):
+    """
+    Register maintenance_handler as a permanent stored procedure, uploading the modules it needs.
+    The code goes to its own stage: the pass purges the document stage.
+    """
+    from snowflake.snowpark.types import BooleanType, IntegerType, VariantType
+
+    if stage_location.lstrip("@").split("/")[0].upper() == SOW_STAGE.lstrip("@").upper():
+        raise ValueError(f"{stage_location} is the document stage, which maintenance purges; use a code stage")
+    create_code_stage(session, stage_location)
+    here = os.path.dirname(os.path.abspath(__file__))
+    return session.sproc.register(
+        maintenance_handler,
+        name=name,
+        return_type=VariantType(),
+        input_types=[IntegerType(), BooleanType()],
+        packages=["snowflake-snowpark-python"],
+        imports=[
+            os.path.join(here, module)
+            for module in (
+                "sow_table_maintenance.py", "sow_stage.py", "sow_run_store.py", "sow_bulk_validation_procedure.py",
+                "sow_validation_engine.py", "sow_cortex.py", "sow_local_retrieval.py", "sow_retrieval_cache.py",
+                "sow_rules.py",
+            )
+        ],
+        is_permanent=True,
+        stage_location=stage_location,
+        replace=True,
+    )
+
+
+def create_task(session, schedule=DEFAULT_SCHEDULE, retention_days=CHUNK_RETENTION_DAYS, warehouse=None,
+                name=TASK_NAME, procedure_name=PROCEDURE_NAME):
+    """Create (or replace) and resume the task that calls the maintenance procedure on schedule"""
+    warehouse = warehouse or session.get_current_warehouse()
+    session.sql(f"""
+        CREATE OR REPLACE TASK {name}
+            WAREHOUSE = {warehouse}
+            SCHEDULE = '{schedule}'
+        AS
+            CALL {procedure_name}({int(retention_days)}, FALSE)
+    """).collect()
+    session.sql(f"ALTER TASK {name} RESUME").collect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retention, clustering and compaction for doc_chunks_sow")
+    parser.add_argument("--register", action="store_true", help="Register the stored procedure and the daily task")
+    parser.add_argument("--run", action="store_true", help="Run one maintenance pass from this client")
+    parser.add_argument("--dry-run", action="store_true", help="With --run, report without changing anything")
+    parser.add_argument("--connection", default=None, help="Connection name from connections.toml")
+    parser.add_argument("--stage", default=CODE_STAGE, help=f"Stage to upload the procedure code to (default {CODE_STAGE})")
+    parser.add_argument("--retention-days", type=int, default=CHUNK_RETENTION_DAYS)
+    parser.add_argument("--schedule", default=DEFAULT_SCHEDULE, help="Task schedule")
+    parser.add_argument("--warehouse", default=None, help="Task warehouse (default: the connection's)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from sow_validation_cli import create_session
+
+    session = create_session(args.connection)
+    if args.register:
+        register_procedure(session, args.stage)
+        create_task(session, args.schedule, args.retention_days, args.warehouse)
+        print(f"Registered {PROCEDURE_NAME} and scheduled {TASK_NAME} ({args.schedule})")
+    elif args.run:
+        print(json.dumps(maintain(session, args.retention_days, dry_run=args.dry_run), indent=2))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Headless batch validation of SOW documents.
+
+    python sow_validation_cli.py ./sows --connection my_conn --workers 4 --output results.jsonl
+    python sow_validation_cli.py @SOW_STAGE/2025-q3/ --connection my_conn
+    python sow_validation_cli.py ./acme-sows --msa <MSA id from sow_msa.py> --connection my_conn
+
+Documents are validated across a process pool. Each worker opens its own Snowpark session and
+caps its in-flight Cortex calls with --cortex-concurrency. All documents share one Cortex Search
+Service, so upload, indexing and retrieval are serialised through a lock shared by the workers;
+LLM validation runs in parallel. One JSON record per document (issues, timings, Cortex call
+counts, or an error) is written as soon as that document finishes. With --msa every document is
+checked against that registered MSA, which is loaded once and shared with the workers.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Manager
+
+import sow_cortex
+import sow_msa
+import sow_rules
+import sow_run_store
+from sow_checkpoints import PipelineCheckpoints, checkpoint_key
+from sow_validation_engine import SOW_STAGE, validate_document
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+
+# Set in each worker process by _init_worker
+_worker_session = None
+_worker_index_lock = None
+_worker_run_store = None
+
+
+def create_session(connection_name=None):
+    """Snowpark session from connections.toml (the default connection when no name is given)"""
+    from snowflake.snowpark import Session
+
+    builder = Session.builder
+    if connection_name:
+        builder = builder.config("connection_name", connection_name)
+    return builder.create()
+
+
+def discover_documents(target, connection_name=None, recursive=False):
+    """
+    Resolve the CLI target into (stage_name, sources).
+    sources are ("file", local path) tuples for a directory, or ("stage", path relative to
+    the stage) tuples for a stage path such as @SOW_STAGE/2025-q3/.
+    """
+    if target.startswith("@"):
+        session = create_session(connection_name)
+        try:
+            staged = [row["name"] for row in session.sql(f"LIST {target}").collect()]
+        finally:
+            session.close()
+        stage_name = target.rstrip("/").split("/")[0]
+        # LIST returns "<stage>/<relative path>"
+        return stage_name, [
+            ("stage", name.split("/", 1)[1]) for name in staged if name.lower().endswith(SUPPORTED_EXTENSIONS)
+        ]
+
+    if not os.path.isdir(target):
+        raise ValueError(f"{target} is neither a directory nor a stage path")
+    if recursive:
+        paths = [os.path.join(root, f) for root, _, files in os.walk(target) for f in files]
+    else:
+        paths = [os.path.join(target, f) for f in os.listdir(target)]
+    return None, [("file", path) for path in sorted(paths) if path.lower().endswith(SUPPORTED_EXTENSIONS)]
+
+
+def _init_worker(connection_name, cortex_concurrency, index_lock, resume=False):
+    global _worker_session, _worker_index_lock, _worker_run_store
+    sow_cortex.configure_limiter(cortex_concurrency)
+    _worker_session = create_session(connection_name)
+    _worker_index_lock = index_lock
+    try:
+        sow_rules.use_rule_source(sow_rules.SnowflakeRuleSource(_worker_session))
+    except Exception as e:
+        logger.warning("Rules table unavailable, using the bundled rules: %s", e)
+    if resume:
+        _worker_run_store = sow_run_store.open_run_store(_worker_session)
+
+
+def _checkpoints_for(kind, value, stage_name):
+    """Checkpoints of one document when --resume is on, else None"""
+    if _worker_run_store is None:
+        return None
+    if kind == "file":
+        with open(value, "rb") as f:
+            return PipelineCheckpoints(_worker_run_store, checkpoint_key(f.read()))
+    return PipelineCheckpoints(_worker_run_store, checkpoint_key(staged_path=f"{stage_name}/{value}"))
+
+
+def _validate_one(source, stage_name, msa=None):
+    """Worker task: validate one document and return its JSONL record (errors included, never raised)"""
+    kind, value = source
+    call_stats = sow_cortex.CortexCallStats()
+    try:
+        checkpoints = _checkpoints_for(kind, value, stage_name)
+        if kind == "file":
+            record = validate_document(
+                _worker_session, file_path=value, stage_name=stage_name,
+                index_lock=_worker_index_lock, call_stats=call_stats, checkpoints=checkpoints,
+                stage_manifest=_worker_run_store, msa=msa
+            )
+        else:
+            record = validate_document(
+                _worker_session, staged_filename=value, stage_name=stage_name,
+                index_lock=_worker_index_lock, call_stats=call_stats, checkpoints=checkpoints, msa=msa
+            )
+        if checkpoints is not None:
+            checkpoints.clear()
+        return record
+    except Exception as e:
+        return {
+            "document": os.path.basename(value),
+            "error": f"{type(e).__name__}: {e}",
+            "cortex_calls": call_stats.snapshot()["total"],
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a folder or stage path of SOW documents")
+    parser.add_argument("target", help="Local directory of PDF/DOCX files, or a stage path such as @SOW_STAGE/2025-q3/")
+    parser.add_argument("--connection", help="Snowflake connection name from connections.toml (default connection if omitted)")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes (default 4)")
+    parser.add_argument("--cortex-concurrency", type=int, default=4, help="Max in-flight Cortex calls per worker (default 4)")
+    parser.add_argument("--stage", default=SOW_STAGE, help=f"Stage local files are uploaded to (default {SOW_STAGE})")
+    parser.add_argument("--recursive", action="store_true", help="Include sub-directories of a local target")
+    parser.add_argument("--output", help="JSONL output file (default stdout)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Checkpoint every stage in the run store and resume documents interrupted by an earlier run")
+    parser.add_argument("--msa", help="Id of a registered MSA (sow_msa.py) to check cross-document questions against")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    stage_name, sources = discover_documents(args.target, args.connection, args.recursive)
+    if not sources:
+        print(f"No PDF/DOCX documents found in {args.target}", file=sys.stderr)
+        return 1
+    stage_name = stage_name or args.stage
+
+    msa = None
+    if args.msa:
+        session = create_session(args.connection)
+        try:
+            msa = sow_msa.load_msa(sow_run_store.open_run_store(session), args.msa)
+        finally:
+            session.close()
+        if msa is None:
+            print(f"No registered MSA {args.msa}; register it with sow_msa.py register", file=sys.stderr)
+            return 1
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failures = 0
+    started = time.perf_counter()
+    try:
+        with Manager() as manager:
+            index_lock = manager.Lock()
+            with ProcessPoolExecutor(
+                max_workers=args.workers,
+                initializer=_init_worker,
+                initargs=(args.connection, args.cortex_concurrency, index_lock, args.resume)
+            ) as pool:
+                futures = [pool.submit(_validate_one, source, stage_name, msa) for source in sources]
+                for future in as_completed(futures):
+                    record = future.result()
+                    if record.get("error"):
+                        failures += 1
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"Validated {len(sources)} document(s), {failures} failed, in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
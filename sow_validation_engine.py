@@ -0,0 +1,1511 @@
+"""
+SOW validation engine.
+
+Everything needed to validate a Statement of Work without Streamlit: stage upload, index
+build, section mapping, Cortex Search retrieval, prompt building, model routing, LLM
+validation, SOW type identification and the per-section pipeline. Functions take the Snowpark
+session explicitly so the Streamlit app, the batch CLI and worker processes share one code path.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+import sow_cortex
+import sow_local_retrieval
+import sow_rules
+from sow_retrieval_cache import cache_key, retrieval_cache
+from sow_rules import severity_from_tag
+
+logger = logging.getLogger(__name__)
+
+SOW_STAGE = "@SOW_STAGE"
+
+# Section names used by the validation configs, matched against section_name in doc_chunks_sow
+CONFIG_SECTIONS = [
+    "Header", "SOW Term", "Scope of Services", "Compensation", "Project Assumptions",
+    "McKesson Responsibilities", "Change Control Procedure", "Financial Information",
+    "PII or PHI", "Sensitive Information", "Access", "Artificial Intelligence", "Exhibits",
+    "Deliverables, Milestones and Compensation", "Statement of Work Characteristic",
+    "McKesson Change Order Template", "Additional Terms", "Project Oversight",
+]
+
+# Retrieval policies referenced by the validation configs. "k" is the number of chunks
+# sent to the LLM, "min_score" drops chunks whose Cortex Search similarity falls below
+# the cutoff and "rerank" fetches a wider candidate set and re-orders it before taking k.
+DEFAULT_RETRIEVAL_POLICY = {"k": 5, "min_score": None, "rerank": False}
+CHECKBOX_RETRIEVAL_POLICY = {"k": 2, "min_score": 0.35, "rerank": False}
+FOCUSED_RETRIEVAL_POLICY = {"k": 3, "min_score": 0.3, "rerank": False}
+STANDARD_RETRIEVAL_POLICY = {"k": 5, "min_score": 0.25, "rerank": False}
+BROAD_RETRIEVAL_POLICY = {"k": 10, "min_score": 0.2, "rerank": True}
+
+# Cortex models used by the routing layer. Sections go to the small model by default and
+# are escalated to the large model when the small model's output fails schema or
+# consistency checks; complex sections are routed straight to the large model.
+SMALL_MODEL = "llama3.1-70b"
+LARGE_MODEL = "openai-gpt-4.1"
+MODEL_TIERS = {"small": SMALL_MODEL, "large": LARGE_MODEL}
+
+SMALL_MODEL_ROUTING = {"tier": "small", "escalate_on_failure": True}
+LARGE_MODEL_ROUTING = {"tier": "large", "escalate_on_failure": False}
+TYPE_IDENTIFICATION_ROUTING = SMALL_MODEL_ROUTING
+
+VALID_SEVERITIES = ("high", "medium", "low")
+VALID_SOW_TYPES = ("T&M", "Fixed-Fee")
+
+# Sections, search queries and policies used to pull content for SOW type identification (before
+# any config is active). The same call extracts the supplier name from the Header.
+TYPE_IDENTIFICATION_RETRIEVAL = {
+    "Compensation": {"k": 5, "min_score": 0.2, "rerank": False},
+    "Scope of Services": {"k": 3, "min_score": 0.2, "rerank": False},
+    "Header": {"k": 2, "min_score": 0.2, "rerank": False},
+}
+TYPE_IDENTIFICATION_QUERIES = {
+    "Compensation": "Retrieve compensation payment terms deliverables milestones hourly rates",
+    "Scope of Services": "Retrieve scope services roles hourly rates deliverables",
+    "Header": "Retrieve the Header section of the SOW containing Supplier Name and Client Name",
+}
+
+# Deadlines (seconds). Sections whose LLM call misses SECTION_DEADLINE_SECONDS, or that are
+# still running at DOCUMENT_DEADLINE_SECONDS, are shown as pending and retried in the
+# background with BACKGROUND_SECTION_DEADLINE_SECONDS.
+SEARCH_DEADLINE_SECONDS = 30
+SECTION_DEADLINE_SECONDS = 90
+DOCUMENT_DEADLINE_SECONDS = 240
+BACKGROUND_SECTION_DEADLINE_SECONDS = 300
+# How long validate_document waits for the background retries of pending sections
+BACKGROUND_WAIT_SECONDS = SECTION_DEADLINE_SECONDS + BACKGROUND_SECTION_DEADLINE_SECONDS
+BACKGROUND_POLL_SECONDS = 0.5
+SECTION_WORKERS = 16
+
+RERANK_CANDIDATE_MULTIPLIER = 3
+SEARCH_SCORE_FIELD = "cosine_similarity"
+
+# Column of doc_chunks_sow (and attribute of the search service) naming each chunk's document:
+# the staged file name. The bulk procedure and the table maintenance read the same column.
+DOC_CHUNKS_DOCUMENT_COLUMN = "RELATIVE_PATH"
+# Searches and the section listing are filtered to the document being validated, so documents
+# indexed side by side never read each other's chunks, whichever session, app replica or
+# procedure indexed them. Set SOW_SEARCH_BY_DOCUMENT=0 only for a search service without the
+# document attribute; each build then replaces the index, and sow_index.py serialises the
+# sessions of one process around it.
+SEARCH_BY_DOCUMENT = os.environ.get("SOW_SEARCH_BY_DOCUMENT", "1") == "1"
+SEARCH_DOCUMENT_COLUMN = DOC_CHUNKS_DOCUMENT_COLUMN if SEARCH_BY_DOCUMENT else None
+
+# "cortex": documents are staged, chunked into doc_chunks_sow and searched through the Cortex
+# Search Service. "local": each document is chunked and indexed in process (sow_local_retrieval)
+# and searched there, skipping the stage, the index-build procedure and the service.
+RETRIEVAL_BACKEND = os.environ.get("SOW_RETRIEVAL_BACKEND", "cortex")
+
+
+def resolve_retrieval_policy(policy=None):
+    """Merge a (possibly partial) retrieval policy over the defaults"""
+    resolved = dict(DEFAULT_RETRIEVAL_POLICY)
+    if policy:
+        resolved.update(policy)
+    resolved["k"] = max(1, int(resolved["k"]))
+    return resolved
+
+
+def get_result_score(result):
+    """Relevance score Cortex Search attached to a result, or None if it was not returned"""
+    scores = result.get("@scores") or {}
+    score = scores.get(SEARCH_SCORE_FIELD)
+    try:
+        return float(score) if score is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def rerank_search_results(results, query, target_section_name):
+    """
+    Second-pass rerank of Cortex Search candidates.
+    Blends the first-pass similarity with query term coverage of the chunk and a bonus
+    for chunks tagged with the section being validated.
+    """
+    query_terms = {term for term in re.findall(r"[a-z0-9]+", query.lower()) if len(term) > 3}
+
+    def rerank_score(result):
+        chunk_text = result.get("chunk", "").lower()
+        coverage = (sum(1 for term in query_terms if term in chunk_text) / len(query_terms)) if query_terms else 0.0
+        section = str(result.get("section_name", "")).lower()
+        target = str(target_section_name or "").lower()
+        section_match = 1.0 if target and (target in section or (section and section in target)) else 0.0
+        first_pass = get_result_score(result) or 0.0
+        return 0.5 * first_pass + 0.3 * coverage + 0.2 * section_match
+
+    return sorted(results, key=rerank_score, reverse=True)
+
+
+def apply_retrieval_policy(results, policy, query, target_section_name):
+    """Apply score cutoff, optional rerank and top-k to raw Cortex Search results"""
+    if policy["min_score"] is not None:
+        # Results without a score are kept so older service versions still return content
+        results = [r for r in results if get_result_score(r) is None or get_result_score(r) >= policy["min_score"]]
+    if policy["rerank"]:
+        results = rerank_search_results(results, query, target_section_name)
+    return results[:policy["k"]]
+
+
+def query_cortex_search_service(session, query, target_section_name, retrieval_policy=None, call_stats=None, document=None):
+    """
+    Search the document index for a section and apply the retrieval policy.
+    A document indexed in process (build_local_index) is searched there; otherwise the Cortex
+    Search Service is, filtered to the chunks of document unless SOW_SEARCH_BY_DOCUMENT=0.
+    Service results are cached per document and index version (sow_retrieval_cache.py).
+    Returns a list of result dicts ("chunk", "section_name", "@scores"); errors yield [],
+    a missed search deadline raises sow_cortex.CortexDeadlineExceeded.
+    """
+    policy = resolve_retrieval_policy(retrieval_policy)
+    candidate_limit = policy["k"] * RERANK_CANDIDATE_MULTIPLIER if policy["rerank"] else policy["k"]
+    local_index = sow_local_retrieval.get_index(document) if document is not None else None
+    if local_index is not None:
+        results = local_index.search(query, candidate_limit, SEARCH_SCORE_FIELD)
+        return apply_retrieval_policy(results, policy, query, target_section_name)
+    search_request = {
+        "query": query,
+        "columns": ["chunk", "section_name"],
+          #"filter": {
+             # "@eq": { "section_name": target_section_name }
+         # },
+        "limit": candidate_limit
+       
+    }
+    if SEARCH_DOCUMENT_COLUMN and document is not None:
+        search_request["columns"].append(SEARCH_DOCUMENT_COLUMN)
+        search_request["filter"] = {"@eq": {SEARCH_DOCUMENT_COLUMN: document}}
+    index_version = retrieval_cache.index_version(document) if retrieval_cache.enabled and document is not None else None
+    search_key = None
+    if index_version is not None:
+        search_key = cache_key(document, query, search_request["columns"], candidate_limit, index_version)
+        raw_results = retrieval_cache.get(document, index_version, search_key)
+        if raw_results is not None:
+            return apply_retrieval_policy(json.loads(raw_results).get("results", []), policy, query, target_section_name)
+    json_payload = json.dumps(search_request)
+    
+    # Escape single quotes in JSON payload for SQL
+    escaped_payload = json_payload.replace("'", "''")
+    
+    sql_query = f"""
+        SELECT SNOWFLAKE.CORTEX.SEARCH_PREVIEW(
+            'sow_validation_service_lang_new',
+            '{escaped_payload}'
+        ) AS search_results
+    """
+
+    try:
+        results_df = sow_cortex.call_with_deadline(
+            "search",
+            lambda: session.sql(sql_query).collect(),
+            deadline=SEARCH_DEADLINE_SECONDS,
+            call_stats=call_stats
+        )
+        raw_results = results_df[0]["SEARCH_RESULTS"]
+        results = json.loads(raw_results)
+        if search_key is not None:
+            retrieval_cache.put(document, index_version, search_key, raw_results)
+        
+        return apply_retrieval_policy(results.get("results", []), policy, query, target_section_name)
+        
+    except sow_cortex.CortexDeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error("Error querying section %s: %s", target_section_name, e)
+        return []
+
+# def query_cortex_search_for_type(query):
+#      json_payload = json.dumps({
+#         "query": query,
+#         "columns": ["chunk"],
+        
+#         "limit": 100
+#     })
+    
+#     # Escape single quotes in JSON payload for SQL
+#      escaped_payload = json_payload.replace("'", "''")
+    
+#      sql_query = f"""
+#         SELECT SNOWFLAKE.CORTEX.SEARCH_PREVIEW(
+#             'sow_type_identification',
+#             '{escaped_payload}'
+#         ) AS search_results
+#     """
+
+#      try:
+#         results_df = session.sql(sql_query).collect()
+#         raw_results = results_df[0]["SEARCH_RESULTS"]
+#         results = json.loads(raw_results)
+#         return results.get("results", [])
+#      except Exception as e:
+#         st.error(f"Error querying section Compensation: {e}")
+#         return []
+
+
+def get_available_sections_mapping(session, document=None):
+    """Get mapping between config section names and actual database section names"""
+    local_index = sow_local_retrieval.get_index(document) if document is not None else None
+    if local_index is not None:
+        sections_df = [{"SECTION_NAME": section_name} for section_name in local_index.section_names()]
+    elif document is not None:
+        sections_df = session.sql(f"""
+            SELECT DISTINCT section_name
+            FROM doc_chunks_sow
+            WHERE {DOC_CHUNKS_DOCUMENT_COLUMN} = ?
+            ORDER BY section_name
+        """, params=[document]).collect()
+    else:
+        sections_df = session.sql("""
+            SELECT DISTINCT section_name
+            FROM doc_chunks_sow
+            ORDER BY section_name
+        """).collect()
+    
+    db_sections = [row['SECTION_NAME'] for row in sections_df]
+    section_mapping = map_config_sections(db_sections)
+    for config_section in CONFIG_SECTIONS:
+        if config_section not in section_mapping:
+            logger.warning("No matching section found for: %s", config_section)
+    return section_mapping
+
+def get_section_content_digests(session, section_mapping, document=None):
+    """
+    SHA-256 of each mapped section's indexed chunks, {config section: digest}. Chunks are hashed
+    in sorted order, so a digest changes only when the text of its section does. Without a
+    document the chunks cannot be told apart from other documents', so no digests are returned
+    and nothing is carried over from a previous run.
+    """
+    if document is None:
+        logger.warning("No document to scope the section digests to; sections will not be carried over")
+        return {}
+    local_index = sow_local_retrieval.get_index(document)
+    if local_index is not None:
+        chunk_rows = [{"SECTION_NAME": section_name, "CHUNK": chunk} for section_name, chunk in local_index.chunks]
+    else:
+        chunk_rows = session.sql(f"""
+            SELECT section_name, chunk
+            FROM doc_chunks_sow
+            WHERE {DOC_CHUNKS_DOCUMENT_COLUMN} = ?
+        """, params=[document]).collect()
+
+    chunks_by_section = {}
+    for row in chunk_rows:
+        chunks_by_section.setdefault(row['SECTION_NAME'], []).append(row['CHUNK'] or "")
+    section_digests = {}
+    for section_name, db_section_name in section_mapping.items():
+        digest = hashlib.sha256(db_section_name.encode("utf-8"))
+        for chunk in sorted(chunks_by_section.get(db_section_name, [])):
+            digest.update(b"\0" + chunk.encode("utf-8"))
+        section_digests[section_name] = digest.hexdigest()
+    return section_digests
+
+def map_config_sections(db_sections):
+    """Match config section names to section_name values found in doc_chunks_sow"""
+    # Create mapping between config names and database section names
+    section_mapping = {}
+    
+    for config_section in CONFIG_SECTIONS:
+        
+        # Find matching section in database (case-insensitive, partial match)
+        matched_section = None
+        for db_section in db_sections:
+            if config_section.lower() in db_section.lower() or db_section.lower() in config_section.lower():
+                matched_section = db_section
+                break
+            
+            # Special cases for common variations
+            if config_section == "PII or PHI" and ("pii" in db_section.lower() or "phi" in db_section.lower()):
+                matched_section = db_section
+                break
+          
+            elif config_section == "Financial Information" and "financial" in db_section.lower():
+                matched_section = db_section
+                break
+        
+        if matched_section:
+            section_mapping[config_section] = matched_section
+    
+    return section_mapping
+
+def get_validation_config_by_sow_type(sow_type):
+    """
+    Returns the appropriate validation configuration based on SOW type, from the prompt plan
+    of the active rules version (see sow_rules.py)
+    
+    Args:
+        sow_type (str): The type of SOW - "T&M" or "Fixed-Fee"
+    
+    Returns:
+        dict: Validation configuration dictionary for the specified SOW type
+    """
+    if sow_type and ("T&M" in str(sow_type).upper() or "TIME" in str(sow_type).upper() or "MATERIAL" in str(sow_type).upper()):
+        return sow_rules.prompt_plan("T&M").validation_config()
+    elif sow_type and ("FIXED" in str(sow_type).upper() or "FEE" in str(sow_type).upper()):
+        return sow_rules.prompt_plan("Fixed-Fee").validation_config()
+    else:
+        # Default to T&M if type cannot be determined
+        logger.warning("Unknown SOW type '%s'. Defaulting to T&M validation config.", sow_type)
+        return sow_rules.prompt_plan("T&M").validation_config()
+
+    
+# When set, complete() calls this instead of snowflake.cortex.Complete (see set_complete_backend)
+_complete_backend = None
+
+def set_complete_backend(backend):
+    """Route complete() through backend(model, prompt, session=...), e.g. a fake for fault injection; None restores Cortex"""
+    global _complete_backend
+    _complete_backend = backend
+
+def complete(session, model, prompt, deadline=None, call_stats=None):
+    if _complete_backend is not None:
+        Complete = _complete_backend
+    else:
+        from snowflake.cortex import Complete
+
+    llm_response = sow_cortex.call_with_deadline(
+        "complete", Complete, model, prompt, session=session, deadline=deadline, call_stats=call_stats
+    )
+    return llm_response.replace("$", "\$")
+
+def resolve_model_routing(routing=None):
+    """Ordered list of Cortex models to try for a routing rule, escalation target last"""
+    routing = routing or SMALL_MODEL_ROUTING
+    first_model = MODEL_TIERS.get(routing.get("tier"), routing.get("tier"))
+    models = [first_model]
+    if routing.get("escalate_on_failure") and first_model != LARGE_MODEL:
+        models.append(LARGE_MODEL)
+    return models
+
+def complete_with_routing(session, prompt, routing, check_result, deadline=None, call_stats=None):
+    """
+    Run a prompt through the routed models, escalating while the parsed output fails check_result.
+    Returns (llm_response, parsed_result, model, escalation_reason).
+    An exception from the last model in the cascade, or a missed deadline, is re-raised.
+    """
+    models = resolve_model_routing(routing)
+    escalation_reason = None
+    for position, model in enumerate(models):
+        is_last = position == len(models) - 1
+        try:
+            llm_response = complete(session, model, prompt, deadline, call_stats)
+        except sow_cortex.CortexDeadlineExceeded:
+            raise
+        except Exception as e:
+            if is_last:
+                raise
+            escalation_reason = f"{model} call failed: {e}"
+            continue
+
+        parsed_result = clean_and_parse_json(llm_response)
+        problems = check_result(parsed_result)
+        if not problems or is_last:
+            return llm_response, parsed_result, model, escalation_reason
+        escalation_reason = f"{model} output failed checks: {'; '.join(problems[:3])}"
+
+def check_validation_result(validation_result, section_name):
+    """Schema and consistency problems in a parsed section validation result (empty if usable)"""
+    if not isinstance(validation_result, dict):
+        return ["response is not a JSON object"]
+    issues = validation_result.get("sow_validation")
+    if not isinstance(issues, list):
+        return ["missing 'sow_validation' list"]
+
+    problems = []
+    for issue in issues:
+        if not isinstance(issue, dict):
+            problems.append("issue is not a JSON object")
+            continue
+        if not str(issue.get("description", "")).strip():
+            problems.append("issue without description")
+        if str(issue.get("severity", "")).lower() not in VALID_SEVERITIES:
+            problems.append(f"invalid severity '{issue.get('severity')}'")
+        if issue.get("section") != section_name:
+            problems.append(f"issue reported for section '{issue.get('section')}'")
+    return problems
+
+def check_sow_type_result(type_result):
+    """Schema problems in a parsed SOW type identification result (empty if usable)"""
+    if not isinstance(type_result, dict):
+        return ["response is not a JSON object"]
+    if type_result.get("sow_type") not in VALID_SOW_TYPES:
+        return [f"unexpected sow_type '{type_result.get('sow_type')}'"]
+    return []
+
+def tag_result_with_model(result, model, escalation_reason=None):
+    """Record which model produced a validation result and each of its issues"""
+    result["model"] = model
+    if escalation_reason:
+        result["escalation_reason"] = escalation_reason
+    for issue in result.get("sow_validation", []):
+        if isinstance(issue, dict):
+            issue["model"] = model
+    return result
+
+def clean_and_parse_json(llm_response):
+    """
+    Robust JSON parsing with multiple fallback strategies
+    """
+    try:
+        # First try: Direct parsing
+        return json.loads(llm_response)
+    except json.JSONDecodeError:
+        pass
+    
+    # Clean the response
+    cleaned_response = llm_response.strip()
+    
+    # Remove any markdown formatting
+    cleaned_response = re.sub(r'```json\s*', '', cleaned_response)
+    cleaned_response = re.sub(r'```\s*$', '', cleaned_response)
+    
+    # Try to find JSON object
+    json_patterns = [
+        r'\{[\s\S]*?"sow_validation"[\s\S]*?\}(?=\s*$)',  # Complete JSON with sow_validation
+        r'\{[\s\S]*?\}(?=\s*$)',  # Any complete JSON object
+        r'\{[\s\S]*?"sow_validation"[\s\S]*?\][\s\S]*?\}',  # JSON with array closure
+    ]
+    
+    for pattern in json_patterns:
+        matches = re.findall(pattern, cleaned_response, re.DOTALL)
+        for match in matches:
+            try:
+                # Clean up common JSON issues
+                json_str = match.strip()
+                # Fix common trailing comma issues
+                json_str = re.sub(r',(\s*[}\]])', r'\1', json_str)
+                # Fix missing quotes around keys
+                json_str = re.sub(r'(\w+):', r'"\1":', json_str)
+                # Already quoted keys should not be double-quoted
+                json_str = re.sub(r'""(\w+)"":', r'"\1":', json_str)
+                
+                return json.loads(json_str)
+            except json.JSONDecodeError:
+                continue
+    
+    # If all fails, return error structure
+    return None
+
+def build_sow_content(sow_chunks):
+    """Concatenate retrieved chunks (list of results or a {'results': [...]} wrapper) into prompt text"""
+    sow_content = ""
+    # Fix: Handle the list of chunks directly since we're not passing 'results' wrapper
+    if isinstance(sow_chunks, list):
+        for chunk in sow_chunks:
+            if 'chunk' in chunk:
+                sow_content += chunk['chunk'] + "\n\n"
+    elif isinstance(sow_chunks, dict) and 'results' in sow_chunks:
+        for result in sow_chunks['results']:
+            if 'chunk' in result:
+                sow_content += result['chunk'] + "\n\n"
+    return sow_content
+
+def prompt_questions(config):
+    """A section's questions as the prompt shows them: pre-rendered by its prompt plan, else the list"""
+    return config.get("prompt_questions") or config["validation_questions"]
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for prompt cost reporting"""
+    return max(1, len(text) // 4) if text else 0
+
+# Questions comparing the SOW with other contract documents get the registered MSA as reference (see sow_msa.py)
+CROSS_DOCUMENT_MARKERS = re.compile(r"other contract documents|\bMSA\b", re.IGNORECASE)
+MSA_CONTEXT_CHUNKS = 3
+
+def is_cross_document_section(config):
+    """True if any of the section's questions compares the SOW with the MSA or other contract documents"""
+    questions = config.get("validation_questions")
+    text = " ".join(questions) if isinstance(questions, list) else str(questions or "")
+    return bool(CROSS_DOCUMENT_MARKERS.search(text))
+
+def msa_reference_context(msa, config, max_chunks=MSA_CONTEXT_CHUNKS):
+    """
+    Reference text from a registered MSA for a cross-document section's prompt: its key terms
+    and the chunks sharing the most words with the section's search query and questions.
+    Empty when there is no MSA or the section does not compare against other documents.
+    """
+    if not msa or not is_cross_document_section(config):
+        return ""
+    questions = config.get("validation_questions")
+    query_words = set(re.findall(r"[a-z]{3,}", " ".join(
+        [config.get("search_query", "")] + (questions if isinstance(questions, list) else [str(questions or "")])
+    ).lower()))
+    ranked_chunks = sorted(
+        msa["chunks"], key=lambda chunk: len(query_words & set(re.findall(r"[a-z]{3,}", chunk.lower()))), reverse=True
+    )
+    key_terms = "\n".join(
+        f"- {term.replace('_', ' ')}: {value}" for term, value in msa["key_terms"].items() if value
+    )
+    excerpts = "\n\n".join(ranked_chunks[:max_chunks])
+    return f"MSA \"{msa['msa_name']}\" key terms:\n{key_terms}\n\nMSA excerpts:\n{excerpts}"
+
+def build_validation_prompt(sow_content, section_name, section_specific_questions, severity_tag, reference_context=None):
+    """
+    Build the Cortex Complete prompt used to validate one section. reference_context (see
+    msa_reference_context) is added as the other contract documents to check consistency against.
+    """
+    tag = severity_tag
+    # Format section-specific questions for better readability
+    formatted_questions = ""
+    if isinstance(section_specific_questions, list):
+        for i, question in enumerate(section_specific_questions, 1):
+            formatted_questions += f"{i}. {question}\n"
+    else:
+        formatted_questions = section_specific_questions
+
+    #st.markdown(sow_content)
+    #st.markdown(formatted_questions)
+    # Updated prompt with better instructions
+    comparison_prompt = f"""You are an expert contract reviewer tasked with validating a Statement of Work (SOW) for completeness, clarity, consistency, and accuracy.
+    You are validating the {section_name} section of a Statement of Work (SOW). You have been provided document content {sow_content}, {formatted_questions} and {tag}
+    as validation criteria for validating the section. 
+
+    ### Validate {section_name} as per {formatted_questions}.
+
+  ### If you do not find relevant document content for {section_name}, then assign severity according to the provided {tag} and you should give output in JSON format as below. 
+    {{
+    "sow_validation": [
+        {{
+            "section": "{section_name}",
+            "description": "Brief specific issue description",
+            "severity": "high/medium/low according to the {tag}",
+            "suggested_resolution": "Specific action needed",
+            "issue_number": 1
+        }}
+    ]
+}}
+
+   
+
+
+
+
+CHECKBOX VALIDATION RULES(if any):
+- "Yes☒No☐" or "Yes X No ☐" (Yes checked, No unchecked) = VALID
+- "Yes☐No☒" or "Yes ☐ No X" (Yes unchecked, No checked) = VALID  
+- "Yes☒No☒" or "Yes X No X"(both checked) = ISSUE
+- "Yes☐No☐" or "Yes ☐ No ☐" (neither checked) = ISSUE
+- If checkboxes are missing, still Issue
+
+INSTRUCTIONS:
+1. Only flag actual issues, not missing optional information
+2. For checkbox sections: Only report issues if both boxes are checked or both are empty
+3. For compensation: Only flag if amounts are contradictory or completely missing
+4. Be objective and focus on clear violations of the criteria
+5. If content appears compliant, return empty validation array
+6. STRICTLY validate the section based on provided questions and rules, DO NOT MAKE YOUR OWN ASSUMPTIONS/QUESTIONS TO VALIDATE. 
+
+REQUIRED JSON FORMAT (respond with ONLY this JSON, no other text):
+{{
+    "sow_validation": [
+        {{
+            "section": "{section_name}",
+            "description": "Brief specific issue description",
+            "severity": "high/medium/low",
+            "suggested_resolution": "Specific action needed",
+            "issue_number": 1
+        }}
+    ]
+}}
+
+If no issues found, return: {{"sow_validation": []}}
+
+
+
+JSON ONLY - NO OTHER TEXT:"""
+    if reference_context:
+        comparison_prompt = comparison_prompt.replace("CHECKBOX VALIDATION RULES(if any):", f"""OTHER CONTRACT DOCUMENTS (reference only - use them to check consistency, do not validate them):
+{reference_context}
+
+CHECKBOX VALIDATION RULES(if any):""", 1)
+    return comparison_prompt
+
+def fallback_validation_result(llm_response, validation_result, section_name):
+    """The parsed validation result, or a result inferred from the raw response when JSON parsing failed"""
+    if validation_result is not None:
+        return validation_result
+    # Fallback: try to determine if section is compliant from response content
+    if any(word in llm_response.lower() for word in ["no issues", "compliant", "valid", "acceptable"]):
+        return {"sow_validation": []}
+    return {
+        "sow_validation": [{
+            "section": section_name,
+            "issue_number": 1,
+            "description": f"JSON parsing failed. Raw response indicates potential issues. Response preview: {llm_response[:200]}...",
+            "severity": "medium",
+            "suggested_resolution": "Review the section manually as automated parsing failed"
+        }]
+    }
+
+def validate_sow_with_llm(session, sow_chunks, section_name, section_specific_questions, severity_tag,
+                          routing=None, deadline=None, call_stats=None, reference_context=None):
+    """
+    Use Cortex Complete to validate SOW content using retrieved document chunks and section-specific questions.
+    reference_context is other contract documents' text to check consistency against (see msa_reference_context).
+    The section's routing rule picks the model; the result and its issues record the model that produced them.
+    If the LLM call misses the deadline the result has status "timed_out" and no issues.
+    Returns LLM-generated analysis of inconsistencies, violations, or alignment.
+    """
+    sow_content = build_sow_content(sow_chunks)
+
+    # If no content found, return empty validation
+    if not sow_content.strip():
+        severity = severity_from_tag(severity_tag)
+        return tag_result_with_model({       "sow_validation": [{
+                "section": section_name,
+                "issue_number": 1,
+                "description": f"Section '{section_name}' is missing from the document",
+                "severity": severity,
+                "suggested_resolution": f"Add the missing '{section_name}' section to the SOW document"
+            }]}, None)
+
+    comparison_prompt = build_validation_prompt(
+        sow_content, section_name, section_specific_questions, severity_tag, reference_context
+    )
+
+    try:
+        llm_response, validation_result, model, escalation_reason = complete_with_routing(
+            session,
+            comparison_prompt,
+            routing,
+            lambda parsed: check_validation_result(parsed, section_name),
+            deadline,
+            call_stats
+        )
+        
+        # Debug: Show the raw response for troubleshooting (optional, can be removed)
+        # st.write(f"**Debug - Raw LLM Response for {section_name}:**")
+        # st.text(llm_response[:500] + "..." if len(llm_response) > 500 else llm_response)
+        
+        return tag_result_with_model(
+            fallback_validation_result(llm_response, validation_result, section_name), model, escalation_reason
+        )
+            
+    except sow_cortex.CortexDeadlineExceeded as e:
+        return tag_result_with_model(
+            {"sow_validation": [], "status": "timed_out", "error": str(e)}, resolve_model_routing(routing)[-1]
+        )
+    except Exception as e:
+        return tag_result_with_model({
+            "sow_validation": [{
+                "section": section_name,
+                "issue_number": 1,
+                "description": f"Error during LLM validation: {str(e)}",
+                "severity": "high",
+                "suggested_resolution": "Check system configuration and try again"
+            }]
+        }, resolve_model_routing(routing)[-1])
+
+def build_sow_type_prompt(sow_content):
+    """Build the Cortex Complete prompt used to classify a SOW as T&M or Fixed-Fee"""
+    identification_prompt = f"""You have been provided document content from a Statement of Work 
+    (SOW). 
+
+Document Content:
+{sow_content}
+
+Analyze this content and determine if the SOW is Time & Materials (T&M) or Fixed-Fee type based on 
+these criteria:
+
+T&M Indicators:
+- Language like "Total Not to Exceed Fee basis"
+- Hourly rates and total hours specified
+- Resource roles with billing rates
+- Payment based on time spent
+
+Fixed-Fee Indicators:
+- Language like "Total Not to Exceed Fixed Fee basis"
+- Deliverables and milestones with specific costs
+- Payment tied to deliverable completion
+- Acceptance criteria for deliverables
+
+Also give the supplier (service provider) name exactly as the Header states it, or null if it
+does not name one.
+
+Provide your analysis in the following JSON format ONLY:
+
+{{
+    "sow_type": "T&M" or "Fixed-Fee",
+    "supplier_name": "..." or null
+}}
+
+JSON ONLY - NO OTHER TEXT:"""
+    return identification_prompt
+
+def identify_sow_type_with_llm(session, sow_content, call_stats=None):
+    """
+    Use Cortex Complete to identify SOW type from content.
+    Returns LLM-generated identification of SOW type.
+    """
+    if not sow_content.strip():
+        return {"sow_type": "Unable to determine - no content found"}
+
+    identification_prompt = build_sow_type_prompt(sow_content)
+
+    try:
+        llm_response, type_result, model, escalation_reason = complete_with_routing(
+            session,
+            identification_prompt,
+            TYPE_IDENTIFICATION_ROUTING,
+            check_sow_type_result,
+            call_stats=call_stats
+        )
+        
+        if type_result is None:
+            return {
+                "sow_type": "Unable to determine - JSON parsing failed",
+                "confidence": "Low",
+               
+                "reasoning": "Failed to parse LLM response",
+                "model": model
+            }
+        
+        type_result["model"] = model
+        if escalation_reason:
+            type_result["escalation_reason"] = escalation_reason
+        return type_result
+            
+    except Exception as e:
+        return {
+            "sow_type": f"Error during analysis: {str(e)}",
+            "confidence": "Low", 
+         
+            "reasoning": "System error occurred",
+            "model": resolve_model_routing(TYPE_IDENTIFICATION_ROUTING)[-1]
+        }
+
+
+
+# Policies compared by the retrieval evaluation. Each maps a section's configured
+# retrieval policy to the policy actually used for that run.
+RETRIEVAL_EVALUATION_POLICIES = {
+    "Fixed top-5 (previous behaviour)": lambda section_policy: DEFAULT_RETRIEVAL_POLICY,
+    "Configured per section": lambda section_policy: section_policy,
+    "Configured, no rerank": lambda section_policy: {**section_policy, "rerank": False},
+    "Configured, no score cutoff": lambda section_policy: {**section_policy, "min_score": None},
+}
+
+def evaluate_retrieval_policies(session, validation_config, section_mapping, policies=None, call_stats=None, document=None):
+    """
+    Re-run retrieval and LLM validation for every mapped section under each retrieval policy.
+    Returns one row per policy with chunks and estimated prompt tokens sent against issues found.
+    """
+    policies = policies or RETRIEVAL_EVALUATION_POLICIES
+    rows = []
+    for policy_name, select_policy in policies.items():
+        sections_run = chunks_sent = tokens_sent = issues_found = high_issues = 0
+        for section_name, config in validation_config.items():
+            if section_name not in section_mapping:
+                continue
+            policy = select_policy(resolve_retrieval_policy(config.get("retrieval")))
+            sow_chunks = query_cortex_search_service(
+                session, config["search_query"], section_mapping[section_name], policy, call_stats, document
+            )
+            sow_content = build_sow_content(sow_chunks)
+            if sow_content.strip():
+                prompt = build_validation_prompt(sow_content, section_name, prompt_questions(config), config["tag"])
+                tokens_sent += estimate_tokens(prompt)
+            result = validate_sow_with_llm(
+                session, sow_chunks, section_name, prompt_questions(config), config["tag"],
+                config.get("routing"), call_stats=call_stats
+            )
+            issues = [issue for issue in result.get("sow_validation", []) if issue.get("section") == section_name]
+            sections_run += 1
+            chunks_sent += len(sow_chunks)
+            issues_found += len(issues)
+            high_issues += sum(1 for issue in issues if issue.get("severity", "").lower() == "high")
+        rows.append({
+            "Policy": policy_name,
+            "Sections": sections_run,
+            "Chunks sent": chunks_sent,
+            "Prompt tokens (est.)": tokens_sent,
+            "Issues found": issues_found,
+            "High issues": high_issues,
+            "Issues per 1K tokens": round(issues_found * 1000 / tokens_sent, 2) if tokens_sent else 0.0,
+        })
+    return rows
+
+# Process-wide pool running section validations and their background retries
+_section_executor = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix="sow-section")
+
+
+def staged_file_name(file_name, file_bytes):
+    """
+    Content-addressed stage file name: the first 16 hex digits of the document's SHA-256, then
+    the file name with anything but letters, digits, ".", "_" and "-" replaced by "_"
+    """
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", file_name.replace("\\", "/").split("/")[-1])
+    return f"{hashlib.sha256(file_bytes).hexdigest()[:16]}_{safe_name}"
+
+def upload_to_stage(session, file_name, file_bytes, stage_name=SOW_STAGE):
+    """PUT the document on the stage under its content-addressed name. Returns the staged file name."""
+    staged_name = staged_file_name(file_name, file_bytes)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_file_path = os.path.join(tmpdir, staged_name)
+        with open(tmp_file_path, "wb") as tmp_file:
+            tmp_file.write(file_bytes)
+
+        # The same bytes always get the same name, so a file already on the stage is left as it is
+        session.file.put(
+            tmp_file_path,
+            stage_name,
+            overwrite=False,
+            auto_compress=False
+        )
+    return staged_name
+
+def find_staged_file(session, uploaded_sow_filename, stage_name=SOW_STAGE):
+    """
+    Look up a staged file by its exact name, listing only the paths that start with it.
+    Returns (staged file name or None, list of the listed paths)
+    """
+    sow_files = [row["name"] for row in session.sql(f"LIST {stage_name}/{uploaded_sow_filename}").collect()]
+    actual_sow_filename = next((f.split('/')[-1] for f in sow_files if f.split('/')[-1] == uploaded_sow_filename), None)
+    return actual_sow_filename, sow_files
+
+def stage_document(session, file_name, file_bytes, stage_name=SOW_STAGE, manifest=None):
+    """
+    Put a document on the stage and return its staged file name. With a manifest (a run store,
+    see sow_stage.py) a document already on the stage is not uploaded again, and its last use is
+    recorded for the retention purge; manifest errors only cost the upload being repeated.
+    """
+    document_digest = hashlib.sha256(file_bytes).hexdigest()
+    staged_name = None
+    if manifest is not None:
+        try:
+            staged_name = manifest.lookup_staged_file(document_digest, stage_name)
+        except Exception as e:
+            logger.warning("Stage manifest lookup failed: %s", e)
+    if staged_name is None:
+        staged_name = upload_to_stage(session, file_name, file_bytes, stage_name)
+    if manifest is not None:
+        try:
+            manifest.record_staged_file(document_digest, stage_name, staged_name, file_name, len(file_bytes))
+        except Exception as e:
+            logger.warning("Could not record %s in the stage manifest: %s", staged_name, e)
+    return staged_name
+
+def staged_file_available(session, staged_name, file_bytes, stage_name=SOW_STAGE, manifest=None):
+    """
+    Whether staged_name is still on the stage. The manifest answers first, as the retention purge
+    (sow_stage.py) forgets the files it removes; without a manifest, or if it has no record of
+    the document, the stage is listed.
+    """
+    if manifest is not None:
+        try:
+            manifest_name = manifest.lookup_staged_file(hashlib.sha256(file_bytes).hexdigest(), stage_name)
+            if manifest_name is not None:
+                return manifest_name == staged_name
+        except Exception as e:
+            logger.warning("Stage manifest lookup failed: %s", e)
+    return find_staged_file(session, staged_name, stage_name)[0] is not None
+
+def build_search_index(session, staged_filename, call_stats=None):
+    """
+    Chunk a staged SOW into doc_chunks_sow and rebuild the Cortex Search Service. Returns the
+    procedure message. Starts a new index version of the document, so its cached searches miss.
+    """
+    result_sow = sow_cortex.call_cortex(
+        "index",
+        lambda: session.sql(
+            f"CALL CREATE_SOW_VALIDATION_CORTEX_SEARCH_LANG_NEW('{staged_filename}')"
+        ).collect(),
+        call_stats=call_stats
+    )
+    retrieval_cache.record_index(staged_filename)
+    return result_sow[0][0]
+
+def build_local_index(session, document_name, file_bytes=None, staged_filename=None, stage_name=SOW_STAGE):
+    """
+    Index a document in process for the "local" retrieval backend. The document is read from
+    file_bytes, or else from staged_filename on the stage. Returns the name it is searched by:
+    its content-addressed stage name, the same name the Cortex backend would stage it under.
+    """
+    if file_bytes is None:
+        file_bytes = session.file.get_stream(f"{stage_name}/{staged_filename}").read()
+    document = staged_filename or staged_file_name(document_name, file_bytes)
+    known_sections = set(CONFIG_SECTIONS)
+    for sow_type in VALID_SOW_TYPES:
+        known_sections.update(get_validation_config_by_sow_type(sow_type))
+    sow_local_retrieval.register_index(
+        document, sow_local_retrieval.index_document(document_name, file_bytes, known_sections)
+    )
+    return document
+
+def type_identification_content(section_content):
+    """SOW type prompt content from {section: text} of the TYPE_IDENTIFICATION_RETRIEVAL sections"""
+    return "\n\n".join(
+        f"{section_name} Section:\n{section_content.get(section_name, '')}" for section_name in TYPE_IDENTIFICATION_RETRIEVAL
+    )
+
+def identify_sow_type(session, section_mapping, call_stats=None, checkpoints=None, document=None):
+    """
+    Classify the indexed SOW from its Compensation and Scope of Services content, and read its
+    supplier name from the Header. Returns (sow_type_result, validation_config); unknown types
+    fall back to the T&M config. With checkpoints, the retrievals are checkpointed so a resumed
+    run does not repeat them.
+    """
+    section_content = {}
+    for section_name, policy in TYPE_IDENTIFICATION_RETRIEVAL.items():
+        if section_name not in section_mapping:
+            continue
+        chunks = checkpointed(checkpoints, f"type_retrieval:{section_name}", lambda: query_cortex_search_service(
+            session,
+            TYPE_IDENTIFICATION_QUERIES[section_name],
+            section_mapping[section_name],
+            policy,
+            call_stats,
+            document
+        ))
+        section_content[section_name] = "".join(chunk.get('chunk', '') + "\n\n" for chunk in chunks)
+
+    sow_type_result = identify_sow_type_with_llm(session, type_identification_content(section_content), call_stats)
+    return sow_type_result, validation_config_for_type_result(sow_type_result)
+
+def validation_config_for_type_result(sow_type_result):
+    """Validation config for an identify_sow_type_with_llm result; unknown types use the T&M config"""
+    sow_type = sow_type_result.get('sow_type', 'Unknown')
+
+    if 'T&M' in sow_type or 'Time' in sow_type:
+        return get_validation_config_by_sow_type("T&M")
+    elif 'Fixed' in sow_type:
+        return get_validation_config_by_sow_type("Fixed-Fee")
+    return get_validation_config_by_sow_type("T&M")
+
+def apply_section_overrides(validation_config, overrides=None):
+    """
+    Copy of validation_config with overrides applied to every section: "top_k" replaces the
+    retrieval policy's k and "routing" replaces the model routing rule. Used to evaluate
+    cheaper configurations against the shipped one (see sow_eval).
+    """
+    if not overrides:
+        return validation_config
+    overridden = {}
+    for section_name, config in validation_config.items():
+        config = dict(config)
+        if overrides.get("top_k") is not None:
+            config["retrieval"] = {**resolve_retrieval_policy(config.get("retrieval")), "k": overrides["top_k"]}
+        if overrides.get("routing") is not None:
+            config["routing"] = overrides["routing"]
+        overridden[section_name] = config
+    return overridden
+
+
+def missing_section_result(section_name, config):
+    severity = config.get("default_severity") or severity_from_tag(config.get("tag", ""))
+    missing_section_issue = {
+        "section": section_name,
+        "issue_number": 1,
+        "description": f"Section '{section_name}' is completely missing from the document",
+        "severity": severity,
+        "suggested_resolution": f"Add the missing '{section_name}' section to the SOW document with all required information",
+        "model": None
+    }
+    return {"section": section_name, "status": "done", "chunks": [], "issues": [missing_section_issue], "model": None}
+
+# Stand-in issues for a failed or unparsed validation; sections reporting them are never carried over
+UNRELIABLE_ISSUE_PREFIXES = ("Error during LLM validation", "JSON parsing failed", "Validation did not finish")
+
+def section_config_digest(config):
+    """Short content hash of one section's config: questions, tag, search query, retrieval policy and routing"""
+    canonical = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+def carried_section_results(previous_run, validation_config, section_digests, msa_id=None):
+    """
+    Section results of a prior version's stored run that still apply, {section: section result}.
+    A section is carried over when its indexed content (section_digests) and its config are
+    unchanged since that run and its result there was not an error; the result records the
+    run in "carried_from". Cross-document sections are only carried over from a run checked
+    against the same MSA (msa_id).
+    """
+    if not previous_run:
+        return {}
+    previous_digests = previous_run.get("section_digests") or {}
+    carried = {}
+    for section_name, config in validation_config.items():
+        previous = previous_digests.get(section_name)
+        if previous is None or section_digests.get(section_name) is None:
+            continue
+        if is_cross_document_section(config) and previous_run.get("msa_id") != msa_id:
+            continue
+        if previous["content"] != section_digests[section_name] or previous["config"] != section_config_digest(config):
+            continue
+        issues = [issue for issue in previous_run["issues"] if issue.get("section") == section_name]
+        if any((issue.get("description") or "").startswith(UNRELIABLE_ISSUE_PREFIXES) for issue in issues):
+            continue
+        carried[section_name] = {
+            "section": section_name,
+            "status": "done",
+            "chunks": previous_run["section_chunks"].get(section_name, []),
+            "issues": issues,
+            "model": (previous_run.get("section_models") or {}).get(section_name),
+            "carried_from": previous_run["run_id"],
+        }
+    return carried
+
+def previous_version_matches(previous_run, sow_type_result, msa_id=None):
+    """
+    True if previous_run, found by document family (the file name), is an earlier version of
+    this document rather than an unrelated upload of the same name. Its MSA (when both runs were
+    checked against one) and its supplier read from the Header (when both are known) must match,
+    and at least one of them must be known; the name alone never decides it.
+    """
+    if not previous_run:
+        return False
+    keys = []
+    if msa_id and previous_run.get("msa_id"):
+        keys.append(msa_id == previous_run["msa_id"])
+    supplier = (sow_type_result.get("supplier_name") or "").strip().upper()
+    previous_supplier = ((previous_run.get("sow_type_result") or {}).get("supplier_name") or "").strip().upper()
+    if supplier and previous_supplier:
+        keys.append(supplier == previous_supplier)
+    return bool(keys) and all(keys)
+
+def sow_type_unchanged(previous_run, section_digests):
+    """True if the sections SOW type identification reads are unchanged since previous_run"""
+    if not previous_run or not previous_run.get("sow_type_result"):
+        return False
+    previous_digests = previous_run.get("section_digests") or {}
+    return all(
+        section_digests.get(section_name) is not None
+        and previous_digests.get(section_name, {}).get("content") == section_digests[section_name]
+        for section_name in TYPE_IDENTIFICATION_RETRIEVAL
+    )
+
+def run_section_validation(session, section_name, config, db_section_name, deadline=None, call_stats=None, sow_chunks=None,
+                           checkpoints=None, document=None, msa=None):
+    """
+    Retrieval (unless sow_chunks are supplied) and LLM validation for one mapped section.
+    Runs on the section executor, so it never raises: errors become issues and missed
+    deadlines come back with status "timed_out". With checkpoints, the retrieved chunks and
+    the finished result are checkpointed as soon as each is available, from this thread.
+    A registered msa (sow_msa.py) is given to cross-document sections as reference.
+    """
+    if checkpoints is not None and sow_chunks is None:
+        sow_chunks = checkpoints.get(f"retrieval:{section_name}")
+    try:
+        if sow_chunks is None:
+            sow_chunks = query_cortex_search_service(
+                session, config["search_query"], db_section_name, config.get("retrieval"), call_stats, document
+            )
+            if checkpoints is not None:
+                checkpoints.save(f"retrieval:{section_name}", sow_chunks)
+        result = validate_sow_with_llm(
+            session,
+            sow_chunks,
+            section_name,
+            prompt_questions(config),
+            config["tag"],
+            config.get("routing"),
+            deadline,
+            call_stats,
+            msa_reference_context(msa, config)
+        )
+    except sow_cortex.CortexDeadlineExceeded:
+        result = {"sow_validation": [], "status": "timed_out"}
+    except Exception as e:
+        result = {"sow_validation": [{
+            "section": section_name,
+            "issue_number": 1,
+            "description": f"Error during LLM validation: {str(e)}",
+            "severity": "high",
+            "suggested_resolution": "Check system configuration and try again",
+            "model": None
+        }]}
+
+    section_result = {
+        "section": section_name,
+        "status": result.get("status", "done"),
+        "chunks": sow_chunks or [],
+        "issues": [issue for issue in result.get("sow_validation", []) if issue.get("section") == section_name],
+        "model": result.get("model"),
+    }
+    if result.get("escalation_reason"):
+        section_result["escalation_reason"] = result["escalation_reason"]
+    if checkpoints is not None and section_result["status"] == "done":
+        checkpoints.save(f"section:{section_name}", section_result)
+    return section_result
+
+def revalidate_section(session, section_name, config, section_mapping, call_stats=None, document=None, msa=None,
+                       sow_chunks=None):
+    """
+    Retrieval (unless sow_chunks are supplied) and LLM validation of one section of an already
+    indexed document, under the SOW type's config: recovers a single failed section without
+    re-running the document. Waits for the LLM without a deadline and skips checkpoints, so the
+    result is always fresh and "done".
+    """
+    if section_name not in section_mapping:
+        return missing_section_result(section_name, config)
+    return run_section_validation(
+        session, section_name, config, section_mapping[section_name], call_stats=call_stats, sow_chunks=sow_chunks,
+        document=document, msa=msa
+    )
+
+def merge_section_result(issues, section_result, categories):
+    """issues with section_result's issues in place of that section's earlier ones, in categories order"""
+    section_name = section_result["section"]
+    by_section = {}
+    for issue in issues:
+        by_section.setdefault(issue.get("section"), []).append(issue)
+    by_section[section_name] = list(section_result["issues"])
+    ordered = [section for section in categories if section in by_section]
+    ordered += [section for section in by_section if section not in ordered]
+    return [issue for section in ordered for issue in by_section[section]]
+
+def store_background_result(runner, background_results, section_name, config, db_section_name, retry_on_timeout, future):
+    """Done-callback recording a section finished in the background for the caller to merge later"""
+    section_result = future.result()
+    if section_result["status"] == "timed_out" and retry_on_timeout:
+        schedule_background_retry(runner, background_results, section_name, config, db_section_name)
+        return
+    background_results[section_name] = section_result
+
+def schedule_background_retry(runner, background_results, section_name, config, db_section_name, running_future=None):
+    """
+    Finish a pending section in the background. A still-running attempt is awaited (and
+    retried if it times out); otherwise a new attempt with the background deadline is started.
+    runner is run_section_validation with the session and call stats bound.
+    """
+    if running_future is not None:
+        running_future.add_done_callback(partial(
+            store_background_result, runner, background_results, section_name, config, db_section_name, True
+        ))
+        return
+    future = _section_executor.submit(
+        runner, section_name, config, db_section_name, BACKGROUND_SECTION_DEADLINE_SECONDS
+    )
+    future.add_done_callback(partial(
+        store_background_result, runner, background_results, section_name, config, db_section_name, False
+    ))
+
+def unfinished_section_result(section_result):
+    """A section whose background retry also missed its deadline, reported as an issue to review by hand"""
+    return {**section_result, "model": None, "issues": [{
+        "section": section_result["section"],
+        "issue_number": 1,
+        "description": "Validation did not finish within its deadline, including a background retry",
+        "severity": "medium",
+        "suggested_resolution": "Re-run validation on this file or review the section manually",
+        "model": None
+    }]}
+
+def wait_for_background_results(background_results, pending_sections, timeout=BACKGROUND_WAIT_SECONDS):
+    """
+    Yield the background results of pending_sections as they arrive in background_results, for at
+    most timeout seconds. Sections whose retry timed out, or still unfinished by then, are yielded
+    as unfinished_section_result.
+    """
+    waiting = set(pending_sections)
+    give_up_at = time.monotonic() + timeout
+    while waiting:
+        for section_name in sorted(waiting):
+            section_result = background_results.pop(section_name, None)
+            if section_result is None:
+                continue
+            waiting.discard(section_name)
+            yield unfinished_section_result(section_result) if section_result["status"] == "timed_out" else section_result
+        if waiting and time.monotonic() >= give_up_at:
+            for section_name in sorted(waiting):
+                yield unfinished_section_result({"section": section_name, "status": "timed_out", "chunks": []})
+            return
+        if waiting:
+            time.sleep(BACKGROUND_POLL_SECONDS)
+
+def iter_section_results(session, validation_config, section_mapping, background_results=None, call_stats=None,
+                         section_deadline=SECTION_DEADLINE_SECONDS, document_deadline=DOCUMENT_DEADLINE_SECONDS,
+                         prefetched_chunks=None, checkpoints=None, document=None, carried_results=None, msa=None):
+    """
+    Validate every configured section and yield each section result as soon as it is ready.
+
+    Missing sections are yielded first, then mapped sections in completion order. Sections whose
+    LLM call missed section_deadline, or that are still running at document_deadline, are
+    yielded with status "pending" (and a "pending_reason"); when background_results is given a
+    background retry is scheduled to fill it. Pass None deadlines to wait for every section.
+    prefetched_chunks ({section: chunks}) skips retrieval for the sections it contains.
+    With checkpoints, sections finished by an earlier, interrupted run are yielded from their
+    checkpoint first and only the remaining sections are validated. carried_results (see
+    carried_section_results) are yielded as they are, without validating those sections.
+    msa (sow_msa.py) is the registered MSA cross-document sections are checked against.
+    """
+    runner = partial(
+        run_section_validation, session, call_stats=call_stats, checkpoints=checkpoints, document=document, msa=msa
+    )
+    prefetched_chunks = prefetched_chunks or {}
+    carried_results = carried_results or {}
+    section_futures = {}
+    for section_name, config in validation_config.items():
+        checkpointed_result = checkpoints.get(f"section:{section_name}") if checkpoints is not None else None
+        if section_name in carried_results:
+            yield carried_results[section_name]
+        elif checkpointed_result is not None:
+            yield checkpointed_result
+        elif section_name in section_mapping:
+            section_futures[_section_executor.submit(
+                runner,
+                section_name,
+                config,
+                section_mapping[section_name],
+                section_deadline,
+                sow_chunks=prefetched_chunks.get(section_name)
+            )] = section_name
+        else:
+            yield missing_section_result(section_name, config)
+
+    finished_sections = set()
+    try:
+        for future in as_completed(section_futures, timeout=document_deadline):
+            section_result = future.result()
+            section_name = section_result["section"]
+            finished_sections.add(section_name)
+            if section_result["status"] == "timed_out":
+                if background_results is not None:
+                    schedule_background_retry(
+                        runner, background_results, section_name,
+                        validation_config[section_name], section_mapping[section_name]
+                    )
+                yield {**section_result, "status": "pending", "pending_reason": "LLM call missed its section deadline"}
+            else:
+                yield section_result
+    except FuturesTimeoutError:
+        pass
+
+    # Still running at the document deadline: keep going in the background, merged later by the caller
+    for future, section_name in section_futures.items():
+        if section_name in finished_sections:
+            continue
+        if background_results is not None:
+            schedule_background_retry(
+                runner, background_results, section_name,
+                validation_config[section_name], section_mapping[section_name], future
+            )
+        yield {
+            "section": section_name,
+            "status": "pending",
+            "pending_reason": "still running at the document deadline",
+            "chunks": [],
+            "issues": [],
+        }
+
+def retrieve_section_chunks(session, validation_config, section_mapping, call_stats=None, checkpoints=None, document=None):
+    """
+    Run every mapped section's Cortex Search concurrently. Returns {section: chunks}.
+    With checkpoints, sections already retrieved (or validated) are skipped and each new
+    retrieval is checkpointed as it completes.
+    """
+    def retrieve(section_name, config):
+        sow_chunks = query_cortex_search_service(
+            session, config["search_query"], section_mapping[section_name], config.get("retrieval"), call_stats, document
+        )
+        if checkpoints is not None:
+            checkpoints.save(f"retrieval:{section_name}", sow_chunks)
+        return sow_chunks
+
+    section_chunks = {}
+    futures = {}
+    for section_name, config in validation_config.items():
+        if section_name not in section_mapping:
+            continue
+        if checkpoints is not None:
+            if checkpoints.get(f"section:{section_name}") is not None:
+                continue
+            checkpointed_chunks = checkpoints.get(f"retrieval:{section_name}")
+            if checkpointed_chunks is not None:
+                section_chunks[section_name] = checkpointed_chunks
+                continue
+        futures[_section_executor.submit(retrieve, section_name, config)] = section_name
+    for future in as_completed(futures):
+        section_chunks[futures[future]] = future.result()
+    return section_chunks
+
+
+@contextmanager
+def _timed(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 3)
+
+def checkpointed(checkpoints, stage, compute):
+    """The checkpointed payload of a pipeline stage, or compute() it and checkpoint the result"""
+    if checkpoints is not None:
+        payload = checkpoints.get(stage)
+        if payload is not None:
+            return payload
+    payload = compute()
+    if checkpoints is not None:
+        checkpoints.save(stage, payload)
+    return payload
+
+def validate_document(session, file_path=None, staged_filename=None, stage_name=SOW_STAGE, index_lock=None, call_stats=None,
+                      checkpoints=None, on_progress=None, index_coordinator=None, section_overrides=None,
+                      previous_run=None, stage_manifest=None, msa=None, section_deadline=SECTION_DEADLINE_SECONDS,
+                      document_deadline=DOCUMENT_DEADLINE_SECONDS):
+    """
+    Validate one SOW end to end without any UI.
+
+    Args:
+        file_path (str): Local PDF/DOCX to upload, or None when staged_filename is already on the stage
+        staged_filename (str): File already on stage_name (used when file_path is None)
+        stage_manifest: Optional run store whose stage manifest says whether the document is
+            already staged (see stage_document)
+        index_lock: Optional lock held from upload through retrieval, because every document
+            shares the single Cortex Search Service and doc_chunks_sow
+        index_coordinator (sow_index.IndexCoordinator): Optional finer-grained alternative to
+            index_lock; the index is rebuilt only if it does not hold this document, and is kept
+            from being replaced from then until retrieval is done
+        call_stats (sow_cortex.CortexCallStats): Optional per-document call statistics
+        checkpoints (sow_checkpoints.PipelineCheckpoints): Optional checkpoints for this document;
+            stages and sections completed by an interrupted earlier run are not repeated
+        on_progress (callable): Optional on_progress(stage, payload), called after "upload",
+            "index" (section mapping), "type_identification" (SOW type result and validation
+            config) and each "section" (section result, including its chunks). A section that
+            missed a deadline is reported with status "pending" first, then again when its
+            background retry finishes
+        section_overrides (dict): Optional "top_k" and/or "routing" applied to every section's config
+        previous_run (dict): Optional stored run of the document's prior version (sow_run_store);
+            sections whose indexed content and config are unchanged are carried over from it
+            instead of being retrieved and validated again, and so is the SOW type when the
+            sections it is identified from are unchanged. It is ignored unless its supplier or MSA
+            matches (previous_version_matches)
+        msa (dict): Optional registered MSA the SOW falls under (sow_msa.load_msa); its key terms
+            and matching excerpts are the other contract documents cross-document questions check
+        section_deadline, document_deadline (float): As in iter_section_results. Sections that
+            miss them are retried in the background and waited for (BACKGROUND_WAIT_SECONDS), so
+            one stuck LLM call cannot hold the document forever. None waits for every section.
+
+    Returns:
+        dict: JSON-serialisable record with the SOW type, sow_validation issues, per-section
+        chunk counts, the sections that missed a deadline, content digests, carried-over
+        sections, the MSA checked against, and per-stage timings (seconds)
+    """
+    timings = {}
+    document_name = staged_filename or file_path.replace("\\", "/").split("/")[-1]
+    started = time.perf_counter()
+    report_progress = on_progress or (lambda stage, payload: None)
+
+    local_backend = RETRIEVAL_BACKEND == "local"
+    if local_backend:
+        # Nothing is staged and no index is shared with other documents
+        index_lock = index_coordinator = None
+        with _timed(timings, "local_index"):
+            file_bytes = None
+            if file_path is not None:
+                with open(file_path, "rb") as f:
+                    file_bytes = f.read()
+            staged_filename = build_local_index(session, document_name, file_bytes, staged_filename, stage_name)
+
+    def upload():
+        with open(file_path, "rb") as f:
+            return {"staged_file": stage_document(session, document_name, f.read(), stage_name, stage_manifest)}
+
+    index_messages = []
+
+    def rebuild():
+        index_messages.append(build_search_index(session, staged_filename, call_stats))
+
+    def index():
+        # With a coordinator the rebuild already happened (if needed) when the document was made searchable
+        if index_coordinator is None and not local_backend:
+            rebuild()
+        section_mapping = get_available_sections_mapping(session, staged_filename)
+        return {
+            "staged_file": staged_filename,
+            "message": index_messages[-1] if index_messages else None,
+            "section_mapping": section_mapping,
+            "section_digests": get_section_content_digests(session, section_mapping, staged_filename),
+        }
+
+    with index_lock if index_lock is not None else nullcontext():
+        if file_path is not None and not local_backend:
+            with _timed(timings, "upload"):
+                staged_filename = checkpointed(checkpoints, "upload", upload)["staged_file"]
+            report_progress("upload", staged_filename)
+
+        index_started = time.perf_counter()
+        indexed_before = checkpoints.get("index") if checkpoints is not None else None
+        if index_coordinator is not None and indexed_before and indexed_before.get("staged_file") == staged_filename:
+            # Indexed before a restart or on another worker; the coordinator only knows this process's builds
+            index_coordinator.mark_indexed(staged_filename)
+        with index_coordinator.searchable(staged_filename, rebuild) if index_coordinator is not None else nullcontext():
+            index_result = checkpointed(checkpoints, "index", index)
+            section_mapping = index_result["section_mapping"]
+            section_digests = index_result.get("section_digests") or {}
+            timings["index"] = round(time.perf_counter() - index_started, 3)
+            report_progress("index", section_mapping)
+
+            with _timed(timings, "type_identification"):
+                if sow_type_unchanged(previous_run, section_digests):
+                    sow_type_result = previous_run["sow_type_result"]
+                else:
+                    sow_type_result = checkpointed(
+                        checkpoints,
+                        "type_identification",
+                        lambda: identify_sow_type(session, section_mapping, call_stats, checkpoints, staged_filename)[0]
+                    )
+                validation_config = apply_section_overrides(
+                    validation_config_for_type_result(sow_type_result), section_overrides
+                )
+            report_progress("type_identification", (sow_type_result, validation_config))
+            if previous_run and not previous_version_matches(previous_run, sow_type_result, msa["msa_id"] if msa else None):
+                logger.info("Run %s shares the file name but not the supplier or MSA; not carrying it over", previous_run["run_id"])
+                previous_run = None
+            carried_results = carried_section_results(
+                previous_run, validation_config, section_digests, msa["msa_id"] if msa else None
+            )
+            changed_config = {
+                section_name: config for section_name, config in validation_config.items()
+                if section_name not in carried_results
+            }
+
+            with _timed(timings, "retrieval"):
+                section_chunks = retrieve_section_chunks(
+                    session, changed_config, section_mapping, call_stats, checkpoints, staged_filename
+                )
+
+    section_results = {}
+    pending_sections = {}
+    background_results = {}
+    with _timed(timings, "validation"):
+        for section_result in iter_section_results(
+            session, validation_config, section_mapping, background_results=background_results,
+            call_stats=call_stats, section_deadline=section_deadline, document_deadline=document_deadline,
+            prefetched_chunks=section_chunks, checkpoints=checkpoints, document=staged_filename,
+            carried_results=carried_results, msa=msa
+        ):
+            if section_result["status"] == "pending":
+                pending_sections[section_result["section"]] = section_result["pending_reason"]
+            else:
+                section_results[section_result["section"]] = section_result
+            report_progress("section", section_result)
+        for section_result in wait_for_background_results(background_results, pending_sections):
+            section_results[section_result["section"]] = section_result
+            report_progress("section", section_result)
+
+    timings["total"] = round(time.perf_counter() - started, 3)
+    return {
+        "document": document_name,
+        "staged_file": staged_filename,
+        "sow_type": sow_type_result.get("sow_type"),
+        "sow_type_model": sow_type_result.get("model"),
+        "sow_validation": [
+            issue for section_name in validation_config for issue in section_results[section_name]["issues"]
+        ],
+        "sections": {
+            section_name: {"status": result["status"], "chunks": len(result["chunks"]), "model": result.get("model")}
+            for section_name, result in section_results.items()
+        },
+        "pending_sections": pending_sections,
+        "section_digests": section_digests,
+        "previous_run_id": previous_run["run_id"] if previous_run else None,
+        "msa_id": msa["msa_id"] if msa else None,
+        "carried_sections": {section_name: result["carried_from"] for section_name, result in carried_results.items()},
+        "timings": timings,
+        "cortex_calls": call_stats.snapshot()["total"] if call_stats is not None else None,
+        "resumed_stages": sorted(checkpoints.resumed_stages) if checkpoints is not None else [],
+    }
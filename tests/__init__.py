@@ -0,0 +1,4 @@
+import os
+
+# benchmarks/ is found from here, so the tests run from any directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,8 @@
+"""
+Shared setup for the harness tests. Everything runs on sow_fakes.FakeCortex, SQLite run stores
+and the recorded fixtures; no Snowflake session is needed.
+"""
+import os
+
+# Hedged requests deliberately duplicate calls; turn them off before sow_cortex is imported
+os.environ["SOW_HEDGED_REQUESTS"] = "0"
@@ -0,0 +1,32 @@
+"""Stage timings from replayed fixtures and the regression comparison (sow_benchmark.py)"""
+import glob
+import os
+
+from sow_benchmark import STAGES, bench_fixture, compare, summarize
+from sow_replay import FIXTURES_DIR
+from tests import REPO_ROOT
+
+
+def test_every_fixture_benchmarks_every_stage():
+    fixture_paths = sorted(glob.glob(os.path.join(REPO_ROOT, FIXTURES_DIR, "*.json")))
+    assert fixture_paths
+    for fixture_path in fixture_paths:
+        samples, problems = bench_fixture(fixture_path, repeat=2, warmup=0, latency_scale=0.0)
+        assert problems == [], fixture_path
+        summary = summarize(samples)
+        assert set(summary) == set(STAGES)
+        assert all(len(values) == 2 for values in samples.values())
+
+
+def test_compare_flags_only_slowdowns_beyond_the_tolerance():
+    baseline = {"tm": {"retrieval": {"median": 1.0}, "validation": {"median": 2.0}, "index": {"median": 0.5}}}
+    results = {"tm": {"retrieval": {"median": 1.05}, "validation": {"median": 2.5}, "index": {"median": 0.2}}}
+    rows, regressions = compare(results, baseline, tolerance=0.10, min_delta=0.005)
+    changes = {stage: change for _, stage, _, _, change in rows}
+    assert changes == {"retrieval": "same", "validation": "regressed", "index": "improved"}
+    assert [stage for _, stage, _, _, _ in regressions] == ["validation"]
+
+
+def test_compare_ignores_stages_missing_from_the_baseline():
+    rows, regressions = compare({"tm": {"upload": {"median": 9.0}}}, {}, tolerance=0.10, min_delta=0.005)
+    assert rows == [] and regressions == []
@@ -0,0 +1,56 @@
+"""Accuracy gate and cost estimate of the configuration evaluation (sow_eval.py)"""
+import json
+import os
+
+from sow_eval import LABELLED_DIR, TokenMeter, gate, main
+from sow_validation_engine import LARGE_MODEL, SMALL_MODEL
+from tests import REPO_ROOT
+
+THRESHOLDS = {"min_precision": 0.8, "min_recall": 0.85, "min_severity_agreement": 0.8, "max_recall_drop": 0.05}
+
+
+def result(name, precision=1.0, recall=1.0, severity_agreement=1.0):
+    return {"name": name, "precision": precision, "recall": recall, "severity_agreement": severity_agreement}
+
+
+def test_gate_passes_configs_at_the_thresholds():
+    assert gate([result("large"), result("small", precision=0.8, recall=0.95, severity_agreement=0.8)], **THRESHOLDS) == []
+
+
+def test_gate_fails_a_config_below_a_threshold():
+    failures = gate([result("large"), result("small", precision=0.7), result("routed", recall=0.8)], **THRESHOLDS)
+    assert [failure.split(":")[0] for failure in failures] == ["small", "routed", "routed"]
+
+
+def test_gate_fails_a_recall_drop_against_the_reference():
+    failures = gate([result("large"), result("small", recall=0.9)], **THRESHOLDS)
+    assert failures == ["small: recall 0.9 is more than 0.05 below large (1.0)"]
+
+
+def test_same_tokens_cost_more_on_the_large_model():
+    small, large = TokenMeter(), TokenMeter()
+    small.add(SMALL_MODEL, "p" * 4000, "c" * 400)
+    large.add(LARGE_MODEL, "p" * 4000, "c" * 400)
+    assert small.prompt_tokens[SMALL_MODEL] == large.prompt_tokens[LARGE_MODEL]
+    assert large.credits() > small.credits() > 0
+    assert TokenMeter().credits() == 0
+    unpriced = TokenMeter()
+    unpriced.add("some-other-model", "p", "c")
+    assert unpriced.credits() is None
+
+
+def run_fake(tmp_path, *extra):
+    configs = tmp_path / "configs.json"
+    configs.write_text(json.dumps([
+        {"name": "large", "model": "large", "top_k": None, "batching": "sections"},
+        {"name": "small", "model": "small", "top_k": None, "batching": "sections"},
+    ]))
+    return main(["--fake", "--labelled", os.path.join(REPO_ROOT, LABELLED_DIR), "--configs", str(configs), *extra])
+
+
+def test_fake_run_passes_when_every_model_recalls_every_finding(tmp_path):
+    assert run_fake(tmp_path, "--fake-recall", "1", "--fake-large-recall", "1") == 0
+
+
+def test_fake_run_fails_when_the_small_model_misses_findings(tmp_path):
+    assert run_fake(tmp_path, "--fake-recall", "0.5", "--fake-large-recall", "1") == 1
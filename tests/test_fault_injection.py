@@ -0,0 +1,38 @@
+"""Crash the pipeline at every Cortex call and resume it from its checkpoints (sow_fault_injection.py)"""
+import pytest
+
+import sow_validation_engine
+from sow_fault_injection import DOCUMENT_BYTES, run_scenario
+
+
+@pytest.fixture
+def document_path(tmp_path):
+    path = tmp_path / "fault_injection_sow.pdf"
+    path.write_bytes(DOCUMENT_BYTES)
+    yield str(path)
+    sow_validation_engine.set_complete_backend(None)
+
+
+@pytest.fixture
+def baseline(document_path):
+    record, fake, attempts = run_scenario(document_path, None)
+    return record, sum(fake.completed.values()), attempts
+
+
+def test_uninterrupted_run_finishes_in_one_attempt(baseline):
+    record, total_calls, attempts = baseline
+    assert attempts == 1
+    assert total_calls > 0
+    assert record["sow_validation"]
+    assert record["resumed_stages"] == []
+
+
+@pytest.mark.parametrize("coordinator", [False, True], ids=["direct", "coordinator"])
+def test_resume_never_repeats_a_completed_call(document_path, baseline, coordinator):
+    """With coordinator, every attempt indexes through a new IndexCoordinator, as after a restart"""
+    baseline_record, total_calls, _ = baseline
+    for crash_at in range(1, total_calls + 1):
+        record, fake, attempts = run_scenario(document_path, crash_at, coordinator)
+        assert attempts > 1, f"crash at call {crash_at} did not interrupt the run"
+        assert not fake.repeated_calls(), f"crash at call {crash_at} repeated completed calls"
+        assert record["sow_validation"] == baseline_record["sow_validation"], f"crash at call {crash_at} changed the report"
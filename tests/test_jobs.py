@@ -0,0 +1,48 @@
+"""Round-robin fairness of the background job queue (sow_jobs)"""
+import time
+
+import sow_jobs
+import sow_validation_engine
+from sow_fakes import FakeCortex
+from sow_index import IndexCoordinator
+from sow_run_store import SQLiteRunStore
+
+# Alice queues three documents before Bob and Carol queue one each
+SUBMISSIONS = [("alice", 1), ("alice", 2), ("alice", 3), ("bob", 1), ("carol", 1)]
+ROUND_ROBIN = [("alice", 1), ("bob", 1), ("carol", 1), ("alice", 2), ("alice", 3)]
+
+
+def submit_all(job_queue):
+    return {
+        (user, n): job_queue.submit(user, f"{user}-{n}.pdf", f"%PDF-1.4 {user} {n}".encode("utf-8"))
+        for user, n in SUBMISSIONS
+    }
+
+
+def test_queue_positions_alternate_between_users():
+    job_queue = sow_jobs.JobQueue(FakeCortex().session(), SQLiteRunStore(":memory:"), workers=0)
+    jobs = submit_all(job_queue)
+
+    assert [job_queue.queue_position(jobs[key]) for key in ROUND_ROBIN] == list(range(len(ROUND_ROBIN)))
+    assert [job_queue._next_job() for _ in ROUND_ROBIN] == [jobs[key] for key in ROUND_ROBIN]
+    assert job_queue._next_job() is None
+
+
+def test_one_worker_starts_jobs_round_robin():
+    fake = FakeCortex()
+    sow_validation_engine.set_complete_backend(fake.complete)
+    try:
+        job_queue = sow_jobs.JobQueue(
+            fake.session(), SQLiteRunStore(":memory:"), workers=1, index_coordinator=IndexCoordinator()
+        )
+        # Nothing starts until every job is queued
+        with job_queue._condition:
+            jobs = submit_all(job_queue)
+        deadline = time.monotonic() + 30
+        while any(job.active for job in jobs.values()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        sow_validation_engine.set_complete_backend(None)
+
+    assert [job.status for job in jobs.values()] == [sow_jobs.DONE] * len(jobs)
+    assert sorted(jobs, key=lambda key: jobs[key].started_at) == ROUND_ROBIN
@@ -0,0 +1,66 @@
+"""BM25 scores of the in-process retrieval backend against the policies' min_score (sow_local_retrieval)"""
+import pytest
+
+import sow_local_retrieval
+from sow_local_retrieval import BM25_SATURATION, LocalIndex
+from sow_validation_engine import STANDARD_RETRIEVAL_POLICY, apply_retrieval_policy, query_cortex_search_service
+
+CHUNKS = [
+    ("SCOPE OF SERVICES", "Acme will design, build and test the billing platform. Deliverables include the design "
+                          "document, the platform release and a test report. Services are delivered remotely."),
+    ("COMPENSATION", "Fees are invoiced monthly in arrears at the hourly rates below. Payment is due within 30 days "
+                     "of invoice. Expenses are reimbursed at cost with receipts."),
+    ("TERMINATION", "Either party may terminate this SOW with 30 days written notice."),
+]
+COMPENSATION_QUERY = "Retrieve all compensation, fees, payment and invoice related sections"
+# One term each chunk mentions in passing
+WEAK_QUERY = "days"
+
+
+@pytest.fixture
+def index():
+    return LocalIndex(CHUNKS, embedding_model=None)
+
+
+def scores(results):
+    return {result["section_name"]: result["@scores"]["cosine_similarity"] for result in results}
+
+
+def test_scores_map_bm25_onto_zero_one_absolutely(index):
+    for query in (COMPENSATION_QUERY, WEAK_QUERY):
+        bm25 = {CHUNKS[chunk_id][0]: score for chunk_id, score in index.bm25_scores(query).items()}
+        assert scores(index.search(query, 3)) == {
+            section_name: round(score / (score + BM25_SATURATION), 4) for section_name, score in bm25.items()
+        }
+    # The best match is not stretched to 1, and a chunk's score ignores the query's other matches
+    assert max(scores(index.search(WEAK_QUERY, 3)).values()) < 0.25
+    assert scores(index.search("days platform", 3))["TERMINATION"] == scores(index.search(WEAK_QUERY, 3))["TERMINATION"]
+
+
+def test_a_bm25_score_of_the_saturation_maps_to_one_half():
+    index = LocalIndex(CHUNKS, embedding_model=None)
+    index.bm25_scores = lambda query: {0: BM25_SATURATION}
+    assert scores(index.search("anything", 1)) == {"SCOPE OF SERVICES": 0.5}
+
+
+def test_min_score_keeps_strong_matches_and_drops_weak_ones(index):
+    policy = STANDARD_RETRIEVAL_POLICY
+    strong = apply_retrieval_policy(index.search(COMPENSATION_QUERY, 5), policy, COMPENSATION_QUERY, "Compensation")
+    assert [result["section_name"] for result in strong] == ["COMPENSATION"]
+    assert scores(strong)["COMPENSATION"] >= policy["min_score"]
+    assert apply_retrieval_policy(index.search(WEAK_QUERY, 5), policy, WEAK_QUERY, "Termination") == []
+
+
+def test_search_service_applies_min_score_to_a_local_index(index):
+    document = "0123456789abcdef_local_retrieval_test.txt"
+    sow_local_retrieval.register_index(document, index)
+    try:
+        strong = query_cortex_search_service(None, COMPENSATION_QUERY, "Compensation", STANDARD_RETRIEVAL_POLICY,
+                                             document=document)
+        weak = query_cortex_search_service(None, WEAK_QUERY, "Termination", STANDARD_RETRIEVAL_POLICY,
+                                           document=document)
+    finally:
+        with sow_local_retrieval._indexes_lock:
+            sow_local_retrieval._indexes.pop(document, None)
+    assert [result["section_name"] for result in strong] == ["COMPENSATION"]
+    assert weak == []
@@ -0,0 +1,39 @@
+"""Record and replay the pipeline's calls (sow_replay.py)"""
+import glob
+import os
+
+import pytest
+
+from sow_fakes import FakeCortex
+from sow_replay import FIXTURES_DIR, read_corpus, record, replay
+from tests import REPO_ROOT
+
+FIXTURES = sorted(glob.glob(os.path.join(REPO_ROOT, FIXTURES_DIR, "*.json")))
+CORPUS = {
+    "tm_sample_sow.txt": "T&M",
+    "fixed_fee_sample_sow.txt": "Fixed-Fee",
+}
+
+
+def test_fixtures_are_shipped():
+    assert len(FIXTURES) == len(CORPUS)
+
+
+@pytest.mark.parametrize("fixture_path", FIXTURES, ids=os.path.basename)
+def test_shipped_fixture_replays_without_misses(fixture_path):
+    result, session, matches = replay(fixture_path)
+    assert session.misses == []
+    assert matches, "issues differ from the recorded report"
+    assert result["sow_validation"]
+
+
+@pytest.mark.parametrize("corpus_name,sow_type", sorted(CORPUS.items()))
+def test_recording_replays_to_the_same_report(tmp_path, corpus_name, sow_type):
+    corpus_path = os.path.join(REPO_ROOT, "benchmarks", "corpus", corpus_name)
+    fake = FakeCortex(sow_type=sow_type, section_text=read_corpus(corpus_path))
+    fixture_path = record(corpus_path, fake.session(), fake.complete, "fake", fixture_path=str(tmp_path / "fixture.json"))
+
+    result, session, matches = replay(fixture_path)
+    assert session.misses == []
+    assert matches
+    assert result["sow_type"] == sow_type
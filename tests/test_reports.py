@@ -0,0 +1,52 @@
+"""Rendered report cache (sow_reports)"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sow_reports import ReportCache, build_report
+
+CATEGORIES = ["Header", "Scope"]
+ISSUES = [
+    {"section": "Header", "severity": "high", "description": "Supplier missing", "suggested_resolution": "Name it"},
+    {"section": "Scope", "severity": "low", "description": "Vague scope", "suggested_resolution": "Be specific"},
+]
+
+
+def report(issues=ISSUES):
+    # Built from scratch each time, as each session that opens the run does
+    return build_report("SOW.pdf", "T&M", CATEGORIES, {"sow_validation": [dict(issue) for issue in issues]})
+
+
+@pytest.mark.parametrize("report_format", ["pdf", "xlsx"])
+def test_same_digest_is_served_from_the_cache(report_format):
+    cache = ReportCache()
+    first = cache.get(report(), report_format)
+    assert cache.cached(report()["digest"], report_format)
+
+    assert cache.get(report(), report_format) is first
+    assert cache.stats["renders"] == 1 and cache.stats["hits"] == 1
+
+    changed = report(ISSUES[:1])
+    assert changed["digest"] != report()["digest"]
+    assert not cache.cached(changed["digest"], report_format)
+    cache.get(changed, report_format)
+    assert cache.stats["renders"] == 2
+
+
+def test_concurrent_requests_render_once():
+    cache = ReportCache()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: cache.get(report(), "xlsx"), range(8)))
+    assert cache.stats["renders"] == 1
+    assert all(data is results[0] for data in results)
+
+
+def test_least_recently_used_report_is_evicted():
+    cache = ReportCache()
+    data = cache.get(report(), "xlsx")
+    cache.max_bytes = len(data) + 1
+    cache.get(report(ISSUES[:1]), "xlsx")
+
+    assert not cache.cached(report()["digest"], "xlsx")
+    assert cache.cached(report(ISSUES[:1])["digest"], "xlsx")
+    assert cache.stats["evictions"] == 1
@@ -0,0 +1,96 @@
+"""Index versions and invalidation of the search result cache (sow_retrieval_cache.py)"""
+import pytest
+
+from sow_retrieval_cache import RetrievalCache, cache_key
+from sow_run_store import SQLiteRunStore
+
+DOCUMENT = "doc.pdf"
+
+
+class CountingStore(SQLiteRunStore):
+    """SQLite run store counting index version lookups"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.version_lookups = 0
+
+    def load_index_version(self, document):
+        self.version_lookups += 1
+        return super().load_index_version(document)
+
+
+def key(index_version, query="q"):
+    return cache_key(DOCUMENT, query, ["chunk"], 5, index_version)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "runs.db")
+
+
+def cached(cache, index_version, query="q", raw_results="[1]"):
+    cache.put(DOCUMENT, index_version, key(index_version, query), raw_results)
+    cache.flush()
+
+
+def test_memory_hit_does_not_read_the_store(store_path):
+    store = CountingStore(store_path)
+    cache = RetrievalCache(store=store)
+    index_version = cache.record_index(DOCUMENT)
+    cached(cache, index_version)
+    for _ in range(3):
+        current = cache.index_version(DOCUMENT)
+        assert cache.get(DOCUMENT, current, key(current)) == "[1]"
+    assert store.version_lookups == 0
+    assert cache.stats()["memory_hits"] == 3
+
+
+def test_disabled_cache_looks_nothing_up(store_path):
+    store = CountingStore(store_path)
+    cache = RetrievalCache(store=store, enabled=False)
+    cache.record_index(DOCUMENT)
+    assert cache.index_version(DOCUMENT) is None
+    assert store.version_lookups == 0
+
+
+def test_record_index_invalidates_cached_results(store_path):
+    cache = RetrievalCache(store=SQLiteRunStore(store_path))
+    first = cache.record_index(DOCUMENT)
+    cached(cache, first)
+    second = cache.record_index(DOCUMENT)
+    assert cache.index_version(DOCUMENT) == second != first
+    assert cache.get(DOCUMENT, second, key(second)) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_reindex_elsewhere_is_seen_once_the_version_expires(store_path):
+    here = RetrievalCache(store=SQLiteRunStore(store_path), version_ttl=0)
+    elsewhere = RetrievalCache(store=SQLiteRunStore(store_path))
+    first = here.record_index(DOCUMENT)
+    cached(here, first)
+    second = elsewhere.record_index(DOCUMENT)
+    assert here.index_version(DOCUMENT) == second
+    assert here.get(DOCUMENT, second, key(second)) is None
+
+
+def test_reindex_elsewhere_is_seen_after_a_miss(store_path):
+    here = RetrievalCache(store=SQLiteRunStore(store_path))
+    elsewhere = RetrievalCache(store=SQLiteRunStore(store_path))
+    first = here.record_index(DOCUMENT)
+    second = elsewhere.record_index(DOCUMENT)
+    # Within the TTL the version recorded here is trusted
+    assert here.index_version(DOCUMENT) == first
+    assert here.get(DOCUMENT, first, key(first, "other")) is None
+    assert here.index_version(DOCUMENT) == second
+
+
+def test_clear_retrievals_gives_every_document_a_new_version(store_path):
+    store = SQLiteRunStore(store_path)
+    cache = RetrievalCache(store=store)
+    first = cache.record_index(DOCUMENT)
+    cached(cache, first)
+    cache.clear_retrievals()
+    current = cache.index_version(DOCUMENT)
+    assert current not in (None, first)
+    assert store.load_retrievals(DOCUMENT, first) == {}
+    assert cache.get(DOCUMENT, current, key(current)) is None
@@ -0,0 +1,51 @@
+"""Refreshing the active rules version (sow_rules.py)"""
+import pytest
+
+import sow_rules
+
+
+class FlakySource(sow_rules.FileRuleSource):
+    """The bundled rules, with lookups that fail on demand and record whether the lock was held"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = False
+        self.lookups = 0
+        self.lock_held = []
+
+    def active_version(self):
+        self.lookups += 1
+        self.lock_held.append(sow_rules._lock.locked())
+        if self.failing:
+            raise ConnectionError("warehouse unavailable")
+        return super().active_version()
+
+
+@pytest.fixture
+def source(monkeypatch):
+    flaky = FlakySource()
+    sow_rules.use_rule_source(flaky)
+    yield flaky
+    sow_rules.use_rule_source(sow_rules.FileRuleSource())
+
+
+def test_lookup_runs_outside_the_lock(source, monkeypatch):
+    sow_rules.active_plans()
+    monkeypatch.setattr(sow_rules, "RULES_REFRESH_SECONDS", -1)
+    sow_rules.active_plans()
+    assert source.lookups == 2
+    assert source.lock_held == [False, False]
+
+
+def test_failed_refresh_keeps_the_last_good_plans(source, monkeypatch):
+    plans = sow_rules.active_plans()
+    monkeypatch.setattr(sow_rules, "RULES_REFRESH_SECONDS", -1)
+    source.failing = True
+    assert sow_rules.active_plans() is plans
+    assert source.lookups == 2
+
+
+def test_first_lookup_failure_is_raised(source):
+    source.failing = True
+    with pytest.raises(ConnectionError):
+        sow_rules.active_plans()
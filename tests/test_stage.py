@@ -0,0 +1,86 @@
+"""Documents on the stage and their manifest (sow_validation_engine, sow_stage)"""
+import time
+
+import sow_run_store
+import sow_stage
+from sow_checkpoints import checkpoint_key
+from sow_fakes import FakeCortex
+from sow_run_store import SQLiteRunStore
+from sow_validation_engine import (
+    SOW_STAGE,
+    find_staged_file,
+    stage_document,
+    staged_file_available,
+    staged_file_name,
+)
+
+DOCUMENT = b"%PDF-1.4 staged document"
+
+
+def test_staged_file_available_asks_the_manifest_first():
+    fake = FakeCortex()
+    session = fake.session()
+    store = SQLiteRunStore(":memory:")
+    staged_name = stage_document(session, "SOW.pdf", DOCUMENT, SOW_STAGE, store)
+    assert staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE, store)
+    assert staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE)
+
+    # Removed behind the manifest's back: only listing the stage notices
+    del fake.staged_files[staged_name]
+    assert staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE, store)
+    assert not staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE)
+
+
+def test_a_purged_document_is_unavailable():
+    fake = FakeCortex()
+    session = fake.session()
+    store = SQLiteRunStore(":memory:")
+    staged_name = stage_document(session, "SOW.pdf", DOCUMENT, SOW_STAGE, store)
+
+    summary = sow_stage.purge_stale_files(session, store, SOW_STAGE, retention_days=-1)
+    assert summary["removed"] == [staged_name]
+    assert not staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE, store)
+    assert not staged_file_available(session, staged_name, DOCUMENT, SOW_STAGE)
+
+
+def test_lookup_matches_the_exact_content_addressed_name():
+    fake = FakeCortex()
+    session = fake.session()
+    store = SQLiteRunStore(":memory:")
+    staged_name = stage_document(session, "SOW.pdf", DOCUMENT, SOW_STAGE, store)
+    assert staged_name == staged_file_name("SOW.pdf", DOCUMENT)
+    # The same bytes under another name are found by their digest, not uploaded again
+    assert stage_document(session, "renamed.pdf", DOCUMENT, SOW_STAGE, store) == staged_name
+    # Names the staged one is a prefix of are listed but never matched or removed with it
+    fake.staged_files[f"{staged_name}.bak"] = time.time()
+    fake.staged_files[f"{staged_name}/page-1.pdf"] = time.time()
+
+    assert find_staged_file(session, staged_name, SOW_STAGE)[0] == staged_name
+    assert find_staged_file(session, staged_name[:-1], SOW_STAGE)[0] is None
+
+    sow_stage.remove_staged_file(session, SOW_STAGE, staged_name)
+    assert sorted(fake.staged_files) == [f"{staged_name}.bak", f"{staged_name}/page-1.pdf"]
+
+
+def test_purge_keeps_recent_and_in_progress_documents(monkeypatch):
+    fake = FakeCortex()
+    session = fake.session()
+    store = SQLiteRunStore(":memory:")
+    stale_days_ago = time.time() - 40 * 86400
+    with monkeypatch.context() as patched:
+        patched.setattr(sow_run_store, "_now", lambda: "2000-01-01 00:00:00.000000")
+        stale = stage_document(session, "stale.pdf", b"%PDF-1.4 stale", SOW_STAGE, store)
+        in_progress = stage_document(session, "in-progress.pdf", b"%PDF-1.4 in progress", SOW_STAGE, store)
+    recent = stage_document(session, "recent.pdf", b"%PDF-1.4 recent", SOW_STAGE, store)
+    store.save_checkpoint(checkpoint_key(b"%PDF-1.4 in progress"), "upload", {"uploaded_file": in_progress})
+    legacy = "tmpab12cd34SOW.pdf"
+    fake.staged_files[legacy] = stale_days_ago
+    fake.staged_files["batch/tmpab12cd34SOW.pdf"] = stale_days_ago
+
+    expected = {"removed": [stale], "legacy_removed": [legacy], "in_progress": [in_progress]}
+    assert sow_stage.purge_stale_files(session, store, SOW_STAGE, retention_days=30, dry_run=True) == expected
+    assert stale in fake.staged_files
+
+    assert sow_stage.purge_stale_files(session, store, SOW_STAGE, retention_days=30) == expected
+    assert sorted(fake.staged_files) == sorted([in_progress, recent, "batch/tmpab12cd34SOW.pdf"])
+    assert [row["STAGED_FILE"] for row in store.list_staged_files(SOW_STAGE)] == [in_progress, recent]
@@ -0,0 +1,83 @@
+"""Maintenance of doc_chunks_sow (sow_table_maintenance)"""
+import pytest
+
+import sow_run_store
+import sow_table_maintenance
+from sow_fakes import FakeCortex, FakeRow
+from sow_run_store import SQLiteRunStore
+from sow_validation_engine import SOW_STAGE, stage_document
+
+
+class ChunkTableSession:
+    """FakeCortex's stage plus doc_chunks_sow as (document, section, chunk) rows; statements that change anything are recorded, not run"""
+
+    def __init__(self, fake, rows):
+        self._stage = fake.session()
+        self.rows = rows
+        self.changes = []
+
+    def sql(self, query, params=None):
+        statement = query.lstrip().upper()
+        if statement.startswith("REMOVE"):
+            self.changes.append(query)
+        if statement.startswith(("LIST", "REMOVE")):
+            return self._stage.sql(query, params)
+        if statement.startswith("SELECT DISTINCT"):
+            return Result([FakeRow(DOCUMENT=document) for document in sorted({row[0] for row in self.rows})])
+        if statement.startswith("SELECT COUNT(*)"):
+            return Result([FakeRow(TOTAL_ROWS=len(self.rows), DISTINCT_ROWS=len(set(self.rows)))])
+        self.changes.append(query)
+        return Result([])
+
+
+class Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def collect(self):
+        return self._rows
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """A recent document with a duplicate chunk, a stale one, and chunks of a document no longer staged"""
+    fake = FakeCortex()
+    store = SQLiteRunStore(":memory:")
+    with monkeypatch.context() as patched:
+        patched.setattr(sow_run_store, "_now", lambda: "2000-01-01 00:00:00.000000")
+        stale = stage_document(fake.session(), "stale.pdf", b"%PDF-1.4 stale", SOW_STAGE, store)
+    recent = stage_document(fake.session(), "recent.pdf", b"%PDF-1.4 recent", SOW_STAGE, store)
+    rows = [
+        (recent, "Header", "Supplier: Acme"), (recent, "Header", "Supplier: Acme"), (recent, "Scope", "Build"),
+        (stale, "Header", "Supplier: Globex"), ("deleted.pdf", "Header", "Supplier: Initech"),
+    ]
+    return fake, store, ChunkTableSession(fake, rows), stale, recent
+
+
+def test_dry_run_counts_orphans_and_duplicates_without_deleting(table):
+    fake, store, session, stale, recent = table
+    staged_before = dict(fake.staged_files)
+
+    summary = sow_table_maintenance.maintain(session, retention_days=30, dry_run=True, run_store=store)
+
+    assert summary["staged_files_removed"] == 1
+    assert summary["documents_purged"] == sorted(["deleted.pdf", stale])
+    assert summary["duplicate_chunks"] == 1
+    assert not summary["search_service_refreshed"]
+    assert session.changes == []
+    assert fake.staged_files == staged_before
+    assert [row["STAGED_FILE"] for row in store.list_staged_files(SOW_STAGE)] == [stale, recent]
+
+
+def test_a_real_run_deletes_what_the_dry_run_counted(table):
+    fake, store, session, stale, recent = table
+    dry_run = sow_table_maintenance.maintain(session, retention_days=30, dry_run=True, run_store=store)
+
+    summary = sow_table_maintenance.maintain(session, retention_days=30, run_store=store)
+
+    assert {**summary, "dry_run": True, "search_service_refreshed": False} == dry_run
+    assert summary["search_service_refreshed"]
+    assert list(fake.staged_files) == [recent]
+    statements = " ".join(session.changes)
+    assert "CLUSTER BY" in statements and "DELETE FROM" in statements and "INSERT OVERWRITE" in statements
+    assert "REFRESH" in statements
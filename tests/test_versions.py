@@ -0,0 +1,54 @@
+"""Carrying sections over from an earlier version of a document (sow_validation_engine)"""
+import pytest
+
+import sow_validation_engine
+from sow_fakes import FAKE_SECTIONS, FakeCortex
+from sow_run_store import build_run
+from sow_validation_engine import previous_version_matches, validation_config_for_type_result
+
+
+def run(supplier=None, msa_id=None):
+    return {"run_id": "r1", "sow_type_result": {"sow_type": "T&M", "supplier_name": supplier}, "msa_id": msa_id}
+
+
+@pytest.mark.parametrize("previous,supplier,msa_id,expected", [
+    (run("Acme Corp"), " ACME corp ", None, True),
+    (run("Acme Corp"), "Globex", None, False),
+    (run(None), None, None, False),
+    (run(None, msa_id="m1"), None, "m1", True),
+    (run("Acme Corp", msa_id="m1"), "Acme Corp", "m2", False),
+    (run("Acme Corp", msa_id="m1"), "Globex", "m1", False),
+    (None, "Acme Corp", None, False),
+])
+def test_previous_version_needs_a_matching_supplier_or_msa(previous, supplier, msa_id, expected):
+    assert previous_version_matches(previous, {"sow_type": "T&M", "supplier_name": supplier}, msa_id) is expected
+
+
+def validate(tmp_path, supplier, previous_run=None):
+    # The Header names the supplier, so a different supplier's document differs there
+    fake = FakeCortex(supplier_name=supplier, sections=FAKE_SECTIONS, section_text={"Header": f"Supplier: {supplier}"})
+    sow_validation_engine.set_complete_backend(fake.complete)
+    path = tmp_path / "SOW.pdf"
+    path.write_bytes(b"%PDF-1.4 same name")
+    try:
+        return sow_validation_engine.validate_document(fake.session(), file_path=str(path), previous_run=previous_run)
+    finally:
+        sow_validation_engine.set_complete_backend(None)
+
+
+def as_previous_run(record, supplier):
+    """The stored run of a validate_document record, as the app and jobs save it"""
+    sow_type_result = {"sow_type": record["sow_type"], "supplier_name": supplier}
+    return build_run(
+        "SOW.pdf", "earlier-digest", sow_type_result, validation_config_for_type_result(sow_type_result),
+        {"sow_validation": record["sow_validation"]}, {}, record["timings"], section_digests=record["section_digests"]
+    )
+
+
+def test_unrelated_upload_with_the_same_name_is_not_carried_over(tmp_path):
+    first = as_previous_run(validate(tmp_path, "Acme Corp"), "Acme Corp")
+    assert validate(tmp_path, "Acme Corp", first)["carried_sections"]
+
+    unrelated = validate(tmp_path, "Globex", first)
+    assert unrelated["carried_sections"] == {}
+    assert unrelated["previous_run_id"] is None